@@ -6,13 +6,21 @@ from flask_cors import CORS
 from flask_login import LoginManager
 import logging
 
-from app.config.config import get_config
+from app.config.config import get_config, config_by_name
 from app.models.user import User
-from app.services.database import DatabaseService
+from app.services.database import DatabaseService, USER_PROFILE_PROJECTION
+from app.services.maintenance import register_jobs
+from app.services.scheduler import Scheduler
+from app.services.warmup import WarmUp
+from app.utils.json_provider import FastJSONProvider
+from app.utils.profiling import get_profiler
 
 # Routes
+from app.routes.admin_routes import admin_bp
 from app.routes.auth_routes import auth_bp
+from app.routes.health_routes import health_bp
 from app.routes.offer_routes import offer_bp
+from app.routes.report_routes import report_bp
 from app.routes.user_routes import user_bp
 
 # Set up logging
@@ -24,20 +32,25 @@ logging.basicConfig(
 login_manager = LoginManager()
 
 
-def create_app(config_name='default'):
+def create_app(config_name=None):
     """
     Create Flask application
     
     Args:
-        config_name: Configuration environment
+        config_name: Configuration environment (defaults to FLASK_ENV)
         
     Returns:
         Flask application
     """
     app = Flask(__name__)
+    # Serialize ObjectId, datetime and Decimal128 fields natively
+    app.json = FastJSONProvider(app)
     
     # Load configuration
-    app.config.from_object(get_config())
+    if config_name:
+        app.config.from_object(config_by_name[config_name])
+    else:
+        app.config.from_object(get_config())
     
     # Set up CORS
     CORS(app, supports_credentials=True)
@@ -50,14 +63,48 @@ def create_app(config_name='default'):
     app.register_blueprint(auth_bp)
     app.register_blueprint(offer_bp)
     app.register_blueprint(user_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(health_bp)
+    app.register_blueprint(report_bp)
     
-    # Initialize database connection
+    # Bind the database service; the connection opens lazily per process
     db_service = DatabaseService()
+    db_service.init_app(app)
+    
+    # Profile requests on an admin's X-Profile header, or every request
+    # into a rolling window with PROFILING_ENABLED
+    get_profiler().init_app(app)
+    
+    # Warm up in the background: ping the database, create the indexes and
+    # load the order book. /readyz reports ready once every step passed
+    warmup = WarmUp(retry_interval=app.config['WARMUP_RETRY_SECONDS'])
+    app.extensions['warmup'] = warmup
+    if app.config.get('WARMUP_ENABLED'):
+        app.before_request(warmup.ensure_started)
+        if app.config.get('WARMUP_ON_START'):
+            warmup.ensure_started()
+    
+    # Run maintenance jobs (offer expiry, ledger snapshots, archiving) on a
+    # scheduler thread, off the request path. Each forked worker starts its
+    # own on its first request, or here with SCHEDULER_ON_START; a leader
+    # lease keeps jobs to one process
+    scheduler = register_jobs(
+        Scheduler(lease_seconds=app.config['SCHEDULER_LEASE_SECONDS']),
+        app.config
+    )
+    app.extensions['scheduler'] = scheduler
+    if app.config.get('SCHEDULER_ENABLED'):
+        app.before_request(scheduler.ensure_started)
+        if app.config.get('SCHEDULER_ON_START'):
+            scheduler.ensure_started()
     
     # Setup login manager user loader
     @login_manager.user_loader
     def load_user(user_id):
-        user_record = db_service.get_user_by_id(user_id)
+        user_record = db_service.get_user_by_id(
+            user_id,
+            projection=USER_PROFILE_PROJECTION
+        )
         if user_record:
             return User(
                 user_id=str(user_record['_id']),
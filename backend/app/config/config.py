@@ -8,14 +8,164 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _env_int(key, default=None):
+    """Read an optional integer setting from the environment"""
+    value = os.getenv(key)
+    if value is None or value == '':
+        return default
+    return int(value)
+
+
+def _env_bool(key, default=None):
+    """Read an optional boolean setting from the environment"""
+    value = os.getenv(key)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_list(key, default=None):
+    """Read an optional comma separated setting from the environment"""
+    value = os.getenv(key)
+    if value is None or value == '':
+        return default
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
 class Config:
     """Base configuration"""
     SECRET_KEY = os.getenv('SECRET_KEY', 'my_precious_secret_key')
     MONGO_URI = os.getenv('MONGO_URI')
     MONGO_DB = os.getenv('MONGO_DB', 'total_records')
+    # Storage backend: MongoDB ('mongo') or process memory ('memory')
+    DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'mongo')
     DEBUG = False
     TESTING = False
 
+    # MongoClient connection pool settings. None keeps the pymongo default.
+    MONGO_MAX_POOL_SIZE = _env_int('MONGO_MAX_POOL_SIZE')
+    MONGO_MIN_POOL_SIZE = _env_int('MONGO_MIN_POOL_SIZE')
+    MONGO_MAX_IDLE_TIME_MS = _env_int('MONGO_MAX_IDLE_TIME_MS')
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+
+    # MongoClient timeouts
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS')
+    MONGO_CONNECT_TIMEOUT_MS = _env_int('MONGO_CONNECT_TIMEOUT_MS')
+    MONGO_SOCKET_TIMEOUT_MS = _env_int('MONGO_SOCKET_TIMEOUT_MS')
+
+    # Retryable operations and wire compression
+    MONGO_RETRY_WRITES = _env_bool('MONGO_RETRY_WRITES')
+    MONGO_RETRY_READS = _env_bool('MONGO_RETRY_READS')
+    MONGO_COMPRESSORS = _env_list('MONGO_COMPRESSORS')
+    MONGO_ZLIB_COMPRESSION_LEVEL = _env_int('MONGO_ZLIB_COMPRESSION_LEVEL')
+
+    # Background job scheduler, started in every process on its first
+    # request; SCHEDULER_ON_START also starts it in create_app (leave it off
+    # when a pre-fork server preloads the app, or the thread runs in the
+    # master). Jobs run in the one process holding the leader lease, renewed
+    # every third of SCHEDULER_LEASE_SECONDS; each delay varies by up to
+    # SCHEDULER_JITTER_PERCENT, and a run over SCHEDULER_JOB_TIMEOUT_SECONDS
+    # is reported as timed out
+    SCHEDULER_ENABLED = _env_bool('SCHEDULER_ENABLED', True)
+    SCHEDULER_ON_START = _env_bool('SCHEDULER_ON_START', False)
+    SCHEDULER_LEASE_SECONDS = _env_int('SCHEDULER_LEASE_SECONDS', 30)
+    SCHEDULER_JITTER_PERCENT = _env_int('SCHEDULER_JITTER_PERCENT', 10)
+    SCHEDULER_JOB_TIMEOUT_SECONDS = _env_int('SCHEDULER_JOB_TIMEOUT_SECONDS', 600)
+
+    # Offer expiry sweep job (0 disables it). A sweep's claim on a batch
+    # lapses after OFFER_SWEEP_CLAIM_LEASE_SECONDS, so offers left by a
+    # sweep that died are expired by a later one
+    OFFER_SWEEP_INTERVAL_SECONDS = _env_int('OFFER_SWEEP_INTERVAL_SECONDS', 30)
+    OFFER_SWEEP_BATCH_SIZE = _env_int('OFFER_SWEEP_BATCH_SIZE', 500)
+    OFFER_SWEEP_CLAIM_LEASE_SECONDS = _env_int('OFFER_SWEEP_CLAIM_LEASE_SECONDS', 600)
+
+    # Warm-up before /readyz reports ready, retried while a step fails.
+    # Each process warms up from its first request; WARMUP_ON_START also
+    # starts it in create_app (turn it off when a pre-fork server preloads
+    # the app)
+    WARMUP_ENABLED = _env_bool('WARMUP_ENABLED', True)
+    WARMUP_ON_START = _env_bool('WARMUP_ON_START', True)
+    WARMUP_RETRY_SECONDS = _env_int('WARMUP_RETRY_SECONDS', 5)
+
+    # Wallet ledger snapshots: entries per wallet between snapshots, how
+    # old an entry must be before a snapshot covers it, and seconds between
+    # runs of the snapshot job (0 disables it)
+    LEDGER_SNAPSHOT_INTERVAL = _env_int('LEDGER_SNAPSHOT_INTERVAL', 100)
+    LEDGER_SNAPSHOT_LAG_SECONDS = _env_int('LEDGER_SNAPSHOT_LAG_SECONDS', 5)
+    LEDGER_SNAPSHOT_JOB_SECONDS = _env_int('LEDGER_SNAPSHOT_JOB_SECONDS', 300)
+
+    # Transaction archive: transactions older than TRANSACTION_ARCHIVE_DAYS
+    # are moved to compressed columnar files under TRANSACTION_ARCHIVE_DIR,
+    # one directory per day, and merged back into transaction listings
+    TRANSACTION_ARCHIVE_DIR = os.getenv('TRANSACTION_ARCHIVE_DIR', 'data/archive/transactions')
+    TRANSACTION_ARCHIVE_DAYS = _env_int('TRANSACTION_ARCHIVE_DAYS', 90)
+    TRANSACTION_ARCHIVE_BATCH_SIZE = _env_int('TRANSACTION_ARCHIVE_BATCH_SIZE', 10000)
+    TRANSACTION_ARCHIVE_CACHE_PARTITIONS = _env_int('TRANSACTION_ARCHIVE_CACHE_PARTITIONS', 64)
+    # Seconds between runs of the archive job (0, the default, leaves
+    # archiving to scripts/archive_transactions.py). The job runs on
+    # whichever host holds the leader lease, so it is only registered once
+    # TRANSACTION_ARCHIVE_SHARED declares the directory shared by every host
+    TRANSACTION_ARCHIVE_INTERVAL_SECONDS = _env_int('TRANSACTION_ARCHIVE_INTERVAL_SECONDS', 0)
+    TRANSACTION_ARCHIVE_SHARED = _env_bool('TRANSACTION_ARCHIVE_SHARED', False)
+
+    # Recent trades kept in each user's transaction summary, and IDs of the
+    # latest applied transactions kept to skip replays. Keep the latter
+    # above the fills one user can have in a persistence batch or in the
+    # journal records after a checkpoint
+    TRANSACTION_SUMMARY_TRADES = _env_int('TRANSACTION_SUMMARY_TRADES', 10)
+    TRANSACTION_SUMMARY_APPLIED_IDS = _env_int('TRANSACTION_SUMMARY_APPLIED_IDS', 1000)
+
+    # Reports: default and longest range in days, and results cached per
+    # process
+    REPORT_DEFAULT_DAYS = _env_int('REPORT_DEFAULT_DAYS', 30)
+    REPORT_MAX_DAYS = _env_int('REPORT_MAX_DAYS', 366)
+    REPORT_CACHE_SIZE = _env_int('REPORT_CACHE_SIZE', 256)
+
+    # Matching engine: 'inline' matches in the request thread, 'sharded'
+    # routes each currency pair to the single worker thread that owns it,
+    # 'journaled' also keeps the book in memory behind a local journal
+    MATCHING_ENGINE_MODE = os.getenv('MATCHING_ENGINE_MODE', 'inline')
+    MATCHING_SHARDS = _env_int('MATCHING_SHARDS', 4)
+    MATCHING_QUEUE_SIZE = _env_int('MATCHING_QUEUE_SIZE', 1000)
+    MATCHING_REQUEST_TIMEOUT_SECONDS = _env_int('MATCHING_REQUEST_TIMEOUT_SECONDS', 10)
+
+    # Trade side effects: 'sync' writes them before responding, 'async'
+    # batches them in a background persistence pipeline
+    PERSISTENCE_MODE = os.getenv('PERSISTENCE_MODE', 'sync')
+    PERSISTENCE_BATCH_SIZE = _env_int('PERSISTENCE_BATCH_SIZE', 500)
+    PERSISTENCE_FLUSH_INTERVAL_MS = _env_int('PERSISTENCE_FLUSH_INTERVAL_MS', 5)
+    PERSISTENCE_QUEUE_SIZE = _env_int('PERSISTENCE_QUEUE_SIZE', 10000)
+
+    # Idempotency-Key support: how long results are kept, how many stay in
+    # memory, and when an unfinished request is considered abandoned
+    IDEMPOTENCY_TTL_SECONDS = _env_int('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60)
+    IDEMPOTENCY_CACHE_SIZE = _env_int('IDEMPOTENCY_CACHE_SIZE', 10000)
+    IDEMPOTENCY_LOCK_SECONDS = _env_int('IDEMPOTENCY_LOCK_SECONDS', 60)
+
+    # Rate limiting: buckets in process memory ('local') or shared ('mongo')
+    RATE_LIMIT_ENABLED = _env_bool('RATE_LIMIT_ENABLED', True)
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+
+    # Compression of large listing responses
+    COMPRESSION_ENABLED = _env_bool('COMPRESSION_ENABLED', True)
+    COMPRESSION_MIN_BYTES = _env_int('COMPRESSION_MIN_BYTES', 1024)
+
+    # Users allowed on admin endpoints
+    ADMIN_EMAILS = _env_list('ADMIN_EMAILS', [])
+
+    # Profiling: admins profile single requests with the X-Profile header;
+    # PROFILING_ENABLED also samples every request into a rolling window
+    PROFILING_ENABLED = _env_bool('PROFILING_ENABLED', False)
+    PROFILING_INTERVAL_MS = _env_int('PROFILING_INTERVAL_MS', 10)
+    PROFILING_WINDOW_SECONDS = _env_int('PROFILING_WINDOW_SECONDS', 300)
+    PROFILING_MAX_PROFILES = _env_int('PROFILING_MAX_PROFILES', 20)
+
+    # Order journal for the journaled matching engine
+    JOURNAL_DIR = os.getenv('JOURNAL_DIR', 'data/journal')
+    JOURNAL_SEGMENT_BYTES = _env_int('JOURNAL_SEGMENT_BYTES', 64 * 1024 * 1024)
+    JOURNAL_GROUP_COMMIT_MS = _env_int('JOURNAL_GROUP_COMMIT_MS', 2)
+    JOURNAL_ACK_TIMEOUT_SECONDS = _env_int('JOURNAL_ACK_TIMEOUT_SECONDS', 5)
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -27,12 +177,31 @@ class TestingConfig(Config):
     TESTING = True
     # Use a test database for tests
     MONGO_DB = 'test_db'
+    # No background work during tests
+    SCHEDULER_ENABLED = False
+    WARMUP_ENABLED = False
+    # Test clients send bursts from a single session
+    RATE_LIMIT_ENABLED = False
 
 
 class ProductionConfig(Config):
     """Production configuration"""
     # Make sure to set SECRET_KEY in environment for production
-    pass
+
+    # Pool sized for a handful of threaded workers per process; fail fast
+    # instead of queueing forever when the pool or the cluster is exhausted
+    MONGO_MAX_POOL_SIZE = _env_int('MONGO_MAX_POOL_SIZE', 50)
+    MONGO_MIN_POOL_SIZE = _env_int('MONGO_MIN_POOL_SIZE', 5)
+    MONGO_MAX_IDLE_TIME_MS = _env_int('MONGO_MAX_IDLE_TIME_MS', 300000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+    MONGO_CONNECT_TIMEOUT_MS = _env_int('MONGO_CONNECT_TIMEOUT_MS', 5000)
+    MONGO_SOCKET_TIMEOUT_MS = _env_int('MONGO_SOCKET_TIMEOUT_MS', 10000)
+    MONGO_RETRY_WRITES = _env_bool('MONGO_RETRY_WRITES', True)
+    MONGO_RETRY_READS = _env_bool('MONGO_RETRY_READS', True)
+    # The server picks the first compressor it also supports; snappy is
+    # left out as python-snappy is not a requirement
+    MONGO_COMPRESSORS = _env_list('MONGO_COMPRESSORS', ['zstd', 'zlib'])
 
 
 # Configuration dictionary
@@ -47,4 +216,44 @@ config_by_name = {
 def get_config():
     """Get configuration based on environment"""
     env = os.getenv('FLASK_ENV', 'default')
-    return config_by_name[env] 
\ No newline at end of file
+    return config_by_name[env]
+
+
+# Config attribute -> MongoClient keyword argument
+MONGO_CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGO_RETRY_WRITES': 'retryWrites',
+    'MONGO_RETRY_READS': 'retryReads',
+    'MONGO_COMPRESSORS': 'compressors',
+    'MONGO_ZLIB_COMPRESSION_LEVEL': 'zlibCompressionLevel',
+}
+
+
+def get_mongo_client_options(config=None):
+    """
+    Build MongoClient keyword arguments from configuration
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Dict of MongoClient options, leaving unset ones to pymongo defaults
+    """
+    config = config or get_config()
+    options = {}
+
+    for attribute, option in MONGO_CLIENT_OPTIONS.items():
+        value = getattr(config, attribute, None)
+        if value is None:
+            continue
+        if option == 'compressors':
+            value = ','.join(value)
+        options[option] = value
+
+    return options
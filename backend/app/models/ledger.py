@@ -0,0 +1,112 @@
+"""
+Ledger entry model
+"""
+from typing import Dict, Any, Optional
+from datetime import datetime
+from bson.objectid import ObjectId
+
+
+class LedgerEntry:
+    """Model for an append-only wallet balance change"""
+
+    # Reasons for a balance change
+    OPEN = 'open'
+    OFFER_LOCK = 'offer_lock'
+    OFFER_CANCEL = 'offer_cancel'
+    OFFER_EXPIRE = 'offer_expire'
+    TRADE = 'trade'
+
+    def __init__(
+        self,
+        user_id: str,
+        deltas: Dict[str, float],
+        reason: str,
+        reference: str = None,
+        entry_id: str = None,
+        date: datetime = None
+    ):
+        """
+        Initialize a ledger entry
+
+        Args:
+            user_id: MongoDB user ID of the wallet owner
+            deltas: Signed balance change per currency code
+            reason: Why the balances changed
+            reference: Related offer ID (optional)
+            entry_id: MongoDB ID (optional, for existing entries)
+            date: Entry date (defaults to now)
+        """
+        self.user_id = str(user_id)
+        self.deltas = {
+            currency: float(amount) for currency, amount in deltas.items()
+        }
+        self.reason = reason
+        self.reference = reference
+        self.entry_id = entry_id
+        self.date = date or datetime.utcnow()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert entry to dictionary for storage
+
+        Returns:
+            Dictionary representation of entry
+        """
+        entry_dict = {
+            'user': self.user_id,
+            'deltas': self.deltas,
+            'reason': self.reason,
+            'date': self.date
+        }
+
+        if self.reference:
+            entry_dict['ref'] = self.reference
+
+        if self.entry_id:
+            entry_dict['_id'] = ObjectId(self.entry_id)
+
+        return entry_dict
+
+    @classmethod
+    def from_dict(cls, entry_dict: Dict[str, Any]) -> 'LedgerEntry':
+        """
+        Create a ledger entry from dictionary
+
+        Args:
+            entry_dict: Dictionary representation of entry
+
+        Returns:
+            LedgerEntry instance
+        """
+        return cls(
+            user_id=entry_dict['user'],
+            deltas=entry_dict['deltas'],
+            reason=entry_dict['reason'],
+            reference=entry_dict.get('ref'),
+            entry_id=str(entry_dict['_id']) if '_id' in entry_dict else None,
+            date=entry_dict.get('date')
+        )
+
+    @staticmethod
+    def apply(
+        balances: Dict[str, float],
+        deltas: Dict[str, float]
+    ) -> Dict[str, float]:
+        """
+        Add deltas to a balance map in place
+
+        Args:
+            balances: Balance per currency code
+            deltas: Signed change per currency code
+
+        Returns:
+            The updated balance map
+        """
+        for currency, amount in deltas.items():
+            balances[currency] = balances.get(currency, 0.0) + amount
+        return balances
+
+    @staticmethod
+    def is_empty(deltas: Optional[Dict[str, float]]) -> bool:
+        """Whether a delta map changes nothing"""
+        return not deltas or all(amount == 0 for amount in deltas.values())
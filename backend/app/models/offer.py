@@ -17,7 +17,8 @@ class Offer:
         to_value: float,
         to_currency: str,
         offer_id: str = None,
-        date: datetime = None
+        date: datetime = None,
+        expires_at: datetime = None
     ):
         """
         Initialize an offer
@@ -30,6 +31,7 @@ class Offer:
             to_currency: Currency code requested
             offer_id: MongoDB ID (optional, for existing offers)
             date: Creation date (defaults to now)
+            expires_at: Expiry time in UTC (optional, good-till-cancelled if None)
         """
         self.from_user = from_user
         self.from_value = float(from_value)
@@ -38,6 +40,7 @@ class Offer:
         self.to_currency = to_currency
         self.offer_id = offer_id
         self.date = date or datetime.utcnow()
+        self.expires_at = expires_at
         
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -55,6 +58,9 @@ class Offer:
             'date': self.date
         }
         
+        if self.expires_at:
+            offer_dict['expires_at'] = self.expires_at
+        
         if self.offer_id:
             offer_dict['_id'] = ObjectId(self.offer_id)
             
@@ -78,15 +84,48 @@ class Offer:
             to_value=offer_dict['to_value'],
             to_currency=offer_dict['to_currency'],
             offer_id=str(offer_dict['_id']) if '_id' in offer_dict else None,
-            date=offer_dict.get('date')
+            date=offer_dict.get('date'),
+            expires_at=offer_dict.get('expires_at')
         )
     
+    def is_expired(self, now: datetime = None) -> bool:
+        """
+        Check whether the offer has expired
+        
+        Args:
+            now: Reference time in UTC (defaults to now)
+            
+        Returns:
+            True if the offer has an expiry time that has passed
+        """
+        if not self.expires_at:
+            return False
+        return self.expires_at <= (now or datetime.utcnow())
+    
+    @staticmethod
+    def is_expired_record(offer_dict: Dict[str, Any], now: datetime = None) -> bool:
+        """
+        Check whether a stored offer has expired
+        
+        Args:
+            offer_dict: Dictionary representation of offer
+            now: Reference time in UTC (defaults to now)
+            
+        Returns:
+            True if the offer has an expiry time that has passed
+        """
+        expires_at = offer_dict.get('expires_at')
+        if not expires_at:
+            return False
+        return expires_at <= (now or datetime.utcnow())
+    
     @staticmethod
     def validate_offer(
         from_value: float,
         from_currency: str,
         to_value: float,
-        to_currency: str
+        to_currency: str,
+        expires_at: datetime = None
     ) -> Dict[str, Any]:
         """
         Validate offer data
@@ -96,6 +135,7 @@ class Offer:
             from_currency: Currency code to exchange
             to_value: Amount of currency requested
             to_currency: Currency code requested
+            expires_at: Expiry time in UTC (optional)
             
         Returns:
             Dict with validation status and errors if any
@@ -119,6 +159,10 @@ class Offer:
         # Same currency check
         if from_currency == to_currency:
             errors['currency'] = 'Cannot exchange the same currency'
+        
+        # Expiry must be in the future
+        if expires_at is not None and expires_at <= datetime.utcnow():
+            errors['expires_at'] = 'Expiry time must be in the future'
             
         return {
             'is_valid': len(errors) == 0,
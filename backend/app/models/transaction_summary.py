@@ -0,0 +1,206 @@
+"""
+Transaction summary model
+"""
+from typing import Dict, Any, List, Optional
+from app.models.transaction import Transaction
+
+# Fields of a transaction kept in a summary's recent trades
+TRADE_FIELDS = (
+    '_id', 'from_user', 'to_user', 'from_value', 'from_currency',
+    'to_value', 'to_currency', 'date'
+)
+
+# Applied transaction IDs kept per summary by default
+APPLIED_IDS = 1000
+
+
+class TransactionSummary:
+    """
+    Running totals of one user's trades
+
+    A summary is keyed by the user's email and updated with every
+    transaction the user takes part in: the trade count, the volume sent
+    and received per currency, rate statistics per currency pair and the
+    most recent trades. Rates are in to_currency per unit of from_currency
+    of the transaction. applied_ids holds the IDs of the latest transactions
+    applied, so a replayed transaction is not counted again.
+    """
+
+    @staticmethod
+    def pair(transaction: Dict[str, Any]) -> str:
+        """Currency pair key of a transaction"""
+        return f"{transaction['from_currency']}/{transaction['to_currency']}"
+
+    @staticmethod
+    def parties(transaction: Dict[str, Any]) -> List[str]:
+        """Emails of the users whose summaries a transaction changes"""
+        if transaction['from_user'] == transaction['to_user']:
+            return [transaction['from_user']]
+        return [transaction['from_user'], transaction['to_user']]
+
+    @staticmethod
+    def trade(transaction: Dict[str, Any]) -> Dict[str, Any]:
+        """The copy of a transaction kept among the recent trades"""
+        return {field: transaction.get(field) for field in TRADE_FIELDS}
+
+    @classmethod
+    def changes(cls, transaction: Dict[str, Any], email: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Field changes one transaction makes to a party's summary
+
+        Args:
+            transaction: Transaction document with an _id
+            email: Email of one of the parties
+
+        Returns:
+            Dotted field paths per update operator ($inc, $min, $max, $set)
+        """
+        # The offer's owner sent from_currency, the accepting user to_currency
+        if email == transaction['from_user']:
+            sent = (transaction['from_currency'], transaction['from_value'])
+            received = (transaction['to_currency'], transaction['to_value'])
+        else:
+            sent = (transaction['to_currency'], transaction['to_value'])
+            received = (transaction['from_currency'], transaction['from_value'])
+
+        rates = f'rates.{cls.pair(transaction)}'
+        rate = Transaction.get_exchange_rate(transaction)
+        return {
+            '$inc': {
+                'trade_count': 1,
+                f'volume.{sent[0]}.sent': sent[1],
+                f'volume.{received[0]}.received': received[1],
+                f'{rates}.count': 1,
+                f'{rates}.sum': rate
+            },
+            '$min': {f'{rates}.min': rate},
+            '$max': {f'{rates}.max': rate},
+            '$set': {f'{rates}.last': rate, 'updated_at': transaction['date']}
+        }
+
+    @classmethod
+    def update(
+        cls,
+        transaction: Dict[str, Any],
+        email: str,
+        trades: int,
+        applied_ids: int = APPLIED_IDS
+    ) -> Dict[str, Any]:
+        """
+        MongoDB update applying a transaction to a party's summary
+
+        Args:
+            transaction: Transaction document with an _id
+            email: Email of one of the parties
+            trades: Number of recent trades kept
+            applied_ids: Number of applied transaction IDs kept
+
+        Returns:
+            Update document
+        """
+        return {
+            **cls.changes(transaction, email),
+            '$push': {
+                'last_trades': {'$each': [cls.trade(transaction)], '$slice': -trades},
+                'applied_ids': {'$each': [transaction['_id']], '$slice': -applied_ids}
+            }
+        }
+
+    @classmethod
+    def apply(
+        cls,
+        summary: Dict[str, Any],
+        transaction: Dict[str, Any],
+        email: str,
+        trades: int,
+        applied_ids: int = APPLIED_IDS
+    ) -> Dict[str, Any]:
+        """
+        Apply a transaction to a summary document in place
+
+        Args:
+            summary: Summary document
+            transaction: Transaction document with an _id
+            email: Email of one of the parties
+            trades: Number of recent trades kept
+            applied_ids: Number of applied transaction IDs kept
+
+        Returns:
+            The updated summary
+        """
+        for operator, fields in cls.changes(transaction, email).items():
+            for path, value in fields.items():
+                *parents, name = path.split('.')
+                target = summary
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                if operator == '$inc':
+                    target[name] = target.get(name, 0) + value
+                elif operator == '$min':
+                    target[name] = min(target.get(name, value), value)
+                elif operator == '$max':
+                    target[name] = max(target.get(name, value), value)
+                else:
+                    target[name] = value
+
+        last_trades = summary.setdefault('last_trades', [])
+        last_trades.append(cls.trade(transaction))
+        del last_trades[:-trades]
+        ids = summary.setdefault('applied_ids', [])
+        ids.append(transaction['_id'])
+        del ids[:-applied_ids]
+        return summary
+
+    @classmethod
+    def build(
+        cls,
+        transactions: List[Dict[str, Any]],
+        trades: int,
+        applied_ids: int = APPLIED_IDS
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Build summaries from a transaction history
+
+        Args:
+            transactions: Transaction documents, oldest first
+            trades: Number of recent trades kept
+            applied_ids: Number of applied transaction IDs kept
+
+        Returns:
+            Summary documents by email
+        """
+        summaries = {}
+        for transaction in transactions:
+            for email in cls.parties(transaction):
+                summary = summaries.setdefault(email, {'_id': email})
+                cls.apply(summary, transaction, email, trades, applied_ids)
+        return summaries
+
+    @staticmethod
+    def present(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Shape a summary for clients, with the average rate per pair
+
+        Args:
+            summary: Summary document, or None for a user without trades
+
+        Returns:
+            Dict with the trade count, volumes, rate statistics and the
+            recent trades, newest first
+        """
+        summary = summary or {}
+        return {
+            'trade_count': summary.get('trade_count', 0),
+            'volume': summary.get('volume', {}),
+            'rates': {
+                pair: {
+                    'count': stats['count'],
+                    'min': stats['min'],
+                    'max': stats['max'],
+                    'avg': stats['sum'] / stats['count'],
+                    'last': stats['last']
+                }
+                for pair, stats in summary.get('rates', {}).items()
+            },
+            'last_trades': list(reversed(summary.get('last_trades', [])))
+        }
@@ -0,0 +1,86 @@
+"""
+Admin routes for profiling and the job scheduler
+"""
+from flask import Blueprint, Response, current_app, request, jsonify
+from app.utils.decorators import admin_required
+from app.utils.profiling import get_profiler, CPROFILE, SAMPLING
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+# Formats a request profile can be served in, per mode
+PROFILE_FORMATS = {
+    CPROFILE: ('text', 'pstats'),
+    SAMPLING: ('collapsed',)
+}
+
+
+@admin_bp.route('/profiling', methods=['GET'])
+@admin_required
+def profiling():
+    """Get the profiler state and the kept request profiles"""
+    profiler = get_profiler()
+    return jsonify({**profiler.stats(), 'requests': profiler.list_profiles()}), 200
+
+
+@admin_bp.route('/profiling', methods=['POST'])
+@admin_required
+def set_profiling():
+    """Turn sampling of every request into the rolling window on or off"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('window'), bool):
+        return jsonify({'message': 'window must be true or false'}), 400
+
+    profiler = get_profiler()
+    profiler.set_window(data['window'])
+    return jsonify(profiler.stats()), 200
+
+
+@admin_bp.route('/profiling/window', methods=['GET'])
+@admin_required
+def profiling_window():
+    """Get the collapsed stacks sampled in the rolling window"""
+    seconds = request.args.get('seconds', type=int)
+    if seconds is not None and seconds < 1:
+        return jsonify({'message': 'seconds must be positive'}), 400
+    return Response(get_profiler().window_collapsed(seconds), mimetype='text/plain')
+
+
+@admin_bp.route('/profiling/requests/<profile_id>', methods=['GET'])
+@admin_required
+def request_profile(profile_id):
+    """
+    Get a request profile: a pstats report ('text') or dump ('pstats') for
+    cProfile, collapsed stacks ('collapsed') for sampling
+    """
+    profile = get_profiler().get_profile(profile_id)
+    if profile is None:
+        return jsonify({'message': 'Profile not found'}), 404
+
+    formats = PROFILE_FORMATS[profile.mode]
+    output = request.args.get('format', formats[0])
+    if output not in formats:
+        return jsonify({
+            'message': f"{profile.mode} profiles are available as: {', '.join(formats)}"
+        }), 400
+
+    if output == 'pstats':
+        return Response(
+            profile.pstats_dump(),
+            mimetype='application/octet-stream',
+            headers={'Content-Disposition': f'attachment; filename={profile_id}.pstats'}
+        )
+    if output == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        limit = request.args.get('limit', 50, type=int)
+        try:
+            return Response(profile.pstats_text(sort, limit), mimetype='text/plain')
+        except KeyError:
+            return jsonify({'message': f'Unknown sort key: {sort}'}), 400
+    return Response(profile.collapsed(), mimetype='text/plain')
+
+
+@admin_bp.route('/scheduler', methods=['GET'])
+@admin_required
+def scheduler():
+    """Get the scheduler's leader state and each job's run metrics"""
+    return jsonify(current_app.extensions['scheduler'].stats()), 200
@@ -2,11 +2,10 @@
 Authentication routes
 """
 from flask import Blueprint, request, jsonify, session
-from app.services.user_service import UserService
+from app.services.user_service import get_user_service
 from app.utils.decorators import login_required
 
 auth_bp = Blueprint('auth', __name__)
-user_service = UserService()
 
 
 @auth_bp.route('/register', methods=['POST'])
@@ -21,7 +20,7 @@ def register():
     password = data.get('password')
     name = data.get('name')
     
-    result = user_service.register(
+    result = get_user_service().register(
         email=email,
         password=password,
         name=name
@@ -47,7 +46,7 @@ def login():
     email = data.get('email')
     password = data.get('password')
     
-    result = user_service.login(
+    result = get_user_service().login(
         email=email,
         password=password
     )
@@ -0,0 +1,22 @@
+"""
+Liveness and readiness probes
+"""
+from flask import Blueprint, current_app, jsonify
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is serving requests"""
+    return jsonify({'status': 'ok'}), 200
+
+
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the database answers, indexes exist and the order book is loaded"""
+    warmup = current_app.extensions['warmup']
+    # A process nobody warmed up yet starts on its first probe
+    warmup.ensure_started()
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
@@ -1,16 +1,61 @@
 """
 Offer and transaction routes
 """
+from datetime import datetime, timedelta
+import math
 from flask import Blueprint, request, jsonify, session
-from app.services.offer_service import OfferService
-from app.utils.decorators import login_required, validate_json
+from app.services.offer_service import get_offer_service
+from app.services.version_service import BOOK_VERSION
+from app.utils.decorators import (
+    login_required,
+    validate_json,
+    idempotent,
+    defer_idempotent,
+    rate_limit,
+    conditional,
+    compressed
+)
+from app.utils.msgpack_response import negotiated_response
 
 offer_bp = Blueprint('offer', __name__)
-offer_service = OfferService()
+
+DEFAULT_BOOK_DEPTH = 10
+MAX_BOOK_DEPTH = 100
+# Longest good-till-time accepted, in seconds
+MAX_OFFER_EXPIRES_IN = 365 * 24 * 3600
+
+
+def _error_status(result):
+    """Status code of a failed service result; transient failures may be retried"""
+    return 503 if result.get('retryable') else 400
+
+
+def _result_body(result, success_status):
+    """JSON body and status code of an order operation result"""
+    if result['success']:
+        return {'message': result['message']}, success_status
+    return {'message': result['message']}, _error_status(result)
+
+
+def _order_response(result, success_status):
+    """
+    Respond with the result of an order operation
+    
+    An operation that ran but is not acknowledged yet is answered 202. It
+    must not be retried, so its Idempotency-Key stays reserved until the
+    outcome is known.
+    """
+    if result.get('pending') is not None:
+        defer_idempotent(result['pending'], lambda outcome: _result_body(outcome, success_status))
+        return jsonify({'message': result['message']}), 202
+    body, status_code = _result_body(result, success_status)
+    return jsonify(body), status_code
 
 
 @offer_bp.route('/add_offer', methods=['POST'])
 @login_required
+@rate_limit(5, burst=10, global_rate=200, global_burst=400)
+@idempotent
 @validate_json(['fromValue', 'fromCurrency', 'toValue', 'toCurrency'])
 def add_offer():
     """Create a new offer"""
@@ -19,57 +64,85 @@ def add_offer():
     # Get user email from session
     from_user_email = session.get('email')
     
-    result = offer_service.create_offer(
+    # Optional good-till-time, in seconds from now
+    expires_at = None
+    if data.get('expiresIn') is not None:
+        try:
+            expires_in = float(data.get('expiresIn'))
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Invalid expiresIn value'}), 400
+        if not math.isfinite(expires_in) or not 0 < expires_in <= MAX_OFFER_EXPIRES_IN:
+            return jsonify({'message': f'expiresIn must be between 0 and {MAX_OFFER_EXPIRES_IN} seconds'}), 400
+        expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+    
+    result = get_offer_service().create_offer(
         from_user_email=from_user_email,
         from_value=float(data.get('fromValue')),
         from_currency=data.get('fromCurrency'),
         to_value=float(data.get('toValue')),
-        to_currency=data.get('toCurrency')
+        to_currency=data.get('toCurrency'),
+        expires_at=expires_at
     )
-    
-    if result['success']:
-        return jsonify({'message': result['message']}), 201
-        
-    return jsonify({'message': result['message']}), 400
+    return _order_response(result, 201)
 
 
 @offer_bp.route('/get_offers', methods=['GET'])
 @login_required
+@rate_limit(10, burst=20, global_rate=500, global_burst=1000)
+@conditional(BOOK_VERSION)
+@compressed(snapshot_version=BOOK_VERSION)
 def get_offers():
     """Get all offers"""
-    offers = offer_service.get_all_offers()
-    return jsonify(offers), 200
+    offers = get_offer_service().get_all_offers()
+    return negotiated_response(offers)
+
+
+@offer_bp.route('/book/<from_currency>/<to_currency>', methods=['GET'])
+@login_required
+@rate_limit(10, burst=20, global_rate=500, global_burst=1000)
+@conditional(BOOK_VERSION)
+def get_book(from_currency, to_currency):
+    """Get the best price levels of a currency pair"""
+    depth = request.args.get('depth', DEFAULT_BOOK_DEPTH, type=int)
+    if not 1 <= depth <= MAX_BOOK_DEPTH:
+        return jsonify({'message': f'depth must be between 1 and {MAX_BOOK_DEPTH}'}), 400
+        
+    result = get_offer_service().get_book_depth(
+        from_currency=from_currency.upper(),
+        to_currency=to_currency.upper(),
+        depth=depth
+    )
+    
+    if result['success']:
+        return negotiated_response(result['book'])
+    
+    return jsonify({'message': result['message']}), _error_status(result)
 
 
 @offer_bp.route('/cancel_offer/<offer_id>', methods=['DELETE'])
 @login_required
+@rate_limit(5, burst=10)
 def cancel_offer(offer_id):
     """Cancel an offer"""
     user_email = session.get('email')
     
-    result = offer_service.cancel_offer(
+    result = get_offer_service().cancel_offer(
         offer_id=offer_id,
         user_email=user_email
     )
-    
-    if result['success']:
-        return jsonify({'message': result['message']}), 200
-        
-    return jsonify({'message': result['message']}), 400
+    return _order_response(result, 200)
 
 
 @offer_bp.route('/make_transaction/<offer_id>', methods=['POST'])
 @login_required
+@rate_limit(5, burst=10, global_rate=200, global_burst=400)
+@idempotent
 def make_transaction(offer_id):
     """Execute a transaction for an offer"""
     user_email = session.get('email')
     
-    result = offer_service.execute_transaction(
+    result = get_offer_service().execute_transaction(
         offer_id=offer_id,
         user_email=user_email
     )
-    
-    if result['success']:
-        return jsonify({'message': result['message']}), 200
-        
-    return jsonify({'message': result['message']}), 400 
\ No newline at end of file
+    return _order_response(result, 200) 
\ No newline at end of file
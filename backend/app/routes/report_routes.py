@@ -0,0 +1,123 @@
+"""
+Reporting routes
+"""
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, current_app, request, jsonify
+from app.services.report_service import get_report_service
+from app.utils.decorators import admin_required, rate_limit
+
+report_bp = Blueprint('report', __name__, url_prefix='/reports')
+
+DEFAULT_TOP_TRADERS = 10
+MAX_TOP_TRADERS = 100
+
+
+def _parse_date(name: str):
+    """
+    Parse an ISO date or datetime query argument as naive UTC
+
+    Returns:
+        The datetime, None if the argument is absent
+
+    Raises:
+        ValueError: If the argument is not an ISO date
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO date or datetime')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_range():
+    """
+    Get the report range from the from and to query arguments
+
+    from defaults to midnight UTC REPORT_DEFAULT_DAYS days ago; without to,
+    the range is open-ended.
+
+    Returns:
+        Tuple of (start, end)
+
+    Raises:
+        ValueError: If the range is invalid
+    """
+    now = datetime.utcnow()
+    start = _parse_date('from')
+    end = _parse_date('to')
+    if start is None:
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=current_app.config['REPORT_DEFAULT_DAYS'])
+    if end is not None and end <= start:
+        raise ValueError('to must be after from')
+    if (end or now) - start > timedelta(days=current_app.config['REPORT_MAX_DAYS']):
+        raise ValueError(f"Reports cover at most {current_app.config['REPORT_MAX_DAYS']} days")
+    return start, end
+
+
+def _report(build):
+    """
+    Run a report over the requested range
+
+    Args:
+        build: Report service method taking the start and end
+
+    Returns:
+        Response with the range, the report rows, and with partial set the
+        time before which transactions may be archived and left out
+    """
+    try:
+        start, end = _parse_range()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    result = build(start, end)
+    if not result['success']:
+        return jsonify({'message': result['message']}), 503
+    return jsonify({
+        'from': result['from'].isoformat() + 'Z',
+        'to': result['to'].isoformat() + 'Z' if result['to'] else None,
+        'rows': result['rows'],
+        'partial': result['partial'],
+        'archived_before': result['archived_before'].isoformat() + 'Z' if result['archived_before'] else None
+    }), 200
+
+
+@report_bp.route('/pair_volume', methods=['GET'])
+@admin_required
+@rate_limit(2, burst=5)
+def pair_volume():
+    """Get the trade count and volume per day and currency pair"""
+    return _report(get_report_service().pair_volume)
+
+
+@report_bp.route('/top_traders', methods=['GET'])
+@admin_required
+@rate_limit(2, burst=5)
+def top_traders():
+    """Get the users with the most trades"""
+    limit = request.args.get('limit', DEFAULT_TOP_TRADERS, type=int)
+    if not 1 <= limit <= MAX_TOP_TRADERS:
+        return jsonify({'message': f'limit must be between 1 and {MAX_TOP_TRADERS}'}), 400
+    return _report(lambda start, end: get_report_service().top_traders(start, end, limit))
+
+
+@report_bp.route('/average_rates', methods=['GET'])
+@admin_required
+@rate_limit(2, burst=5)
+def average_rates():
+    """Get the average rate per currency pair"""
+    return _report(get_report_service().average_rates)
+
+
+@report_bp.route('/fill_ratio', methods=['GET'])
+@admin_required
+@rate_limit(2, burst=5)
+def fill_ratio():
+    """Get the share of posted offers that were filled"""
+    return _report(get_report_service().fill_ratio)
@@ -2,24 +2,26 @@
 User routes for wallet and transaction operations
 """
 from flask import Blueprint, request, jsonify, session
-from app.services.user_service import UserService
-from app.utils.decorators import login_required
+from app.services.user_service import get_user_service
+from app.services.version_service import TRANSACTIONS_VERSION, user_transactions_version
+from app.utils.decorators import login_required, conditional, compressed
+from app.utils.msgpack_response import negotiated_response
 
 user_bp = Blueprint('user', __name__)
-user_service = UserService()
 
 
 @user_bp.route('/wallet', methods=['GET'])
 @login_required
 def wallet():
-    """Get user wallet and transactions"""
+    """Get user wallet, transaction summary and most recent trades"""
     user_id = session.get('user_id')
     
-    result = user_service.get_user_wallet(user_id)
+    result = get_user_service().get_user_wallet(user_id, email=session.get('email'))
     
     if result['success']:
         return jsonify({
             'wallet': result['wallet'],
+            'summary': result['summary'],
             'transactions': result['transactions'],
             'email': result['email']
         }), 200
@@ -29,25 +31,28 @@ def wallet():
 
 @user_bp.route('/all_transactions', methods=['GET'])
 @login_required
+@conditional(TRANSACTIONS_VERSION)
+@compressed()
 def all_transactions():
     """Get all transactions"""
-    result = user_service.get_transactions()
+    result = get_user_service().get_transactions()
     
     if result['success']:
-        return jsonify(result['transactions']), 200
+        return negotiated_response(result['transactions'])
         
     return jsonify({'message': result['message']}), 400
 
 
 @user_bp.route('/my_transactions', methods=['GET'])
 @login_required
+@conditional(lambda: user_transactions_version(session.get('email')))
 def my_transactions():
     """Get user's transactions"""
     user_email = session.get('email')
     
-    result = user_service.get_transactions(user_email=user_email)
+    result = get_user_service().get_transactions(user_email=user_email)
     
     if result['success']:
-        return jsonify(result['transactions']), 200
+        return negotiated_response(result['transactions'])
         
     return jsonify({'message': result['message']}), 400 
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Aggregated price levels of the offer book
+"""
+from typing import Dict, Any, Tuple
+from bisect import bisect_left, insort
+import threading
+import logging
+from app.config.config import get_config
+from app.services.database import DatabaseService
+from app.services.journaled_store import get_journaled_store
+from app.services.persistence_pipeline import get_persistence_pipeline
+from app.services.version_service import VersionService, get_version_service, BOOK_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Decimal places rates are rounded to before offers are grouped into levels
+RATE_PRECISION = 8
+
+DEPTH_PROJECTION = {
+    'from_currency': 1,
+    'to_currency': 1,
+    'from_value': 1,
+    'to_value': 1
+}
+
+
+class _PairLevels:
+    """Levels of the offers giving one currency for another, best rate first"""
+
+    def __init__(self):
+        self.rates = []
+        # rate -> [sum of from_value, sum of to_value, offer count]
+        self.levels = {}
+
+    def add(self, rate: float, from_value: float, to_value: float):
+        level = self.levels.get(rate)
+        if level is None:
+            insort(self.rates, rate)
+            level = self.levels[rate] = [0.0, 0.0, 0]
+        level[0] += from_value
+        level[1] += to_value
+        level[2] += 1
+
+    def remove(self, rate: float, from_value: float, to_value: float):
+        level = self.levels[rate]
+        level[2] -= 1
+        if level[2] == 0:
+            del self.levels[rate]
+            del self.rates[bisect_left(self.rates, rate)]
+            return
+        level[0] -= from_value
+        level[1] -= to_value
+
+
+class BookDepth:
+    """
+    Aggregated price levels of the offer book, maintained in memory
+
+    Offers are grouped by rate per direction of a currency pair. The offer
+    service reports every offer it opens or closes, so reading the best N
+    levels costs O(N) however large the book is. With a single writer
+    process the levels are loaded once and then kept current. When several
+    processes share the book (inline mode), the levels are reloaded once per
+    book version instead, since other processes' changes are not reported.
+
+    Offers past their expiry stay in the levels until the sweeper removes them.
+    """
+
+    def __init__(self, db: DatabaseService = None, versions: VersionService = None):
+        """
+        Initialize the book
+
+        Args:
+            db: Database service holding the offers
+            versions: Version service telling when the book changed
+        """
+        self.db = db or DatabaseService()
+        self.versions = versions or get_version_service()
+        self._pairs = {}
+        self._offers = {}
+        self._loaded = False
+        self._loaded_tag = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry(offer: Dict[str, Any]) -> Tuple[Tuple[str, str], float, float, float]:
+        """Pair, rounded rate and values of an offer"""
+        from_value = float(offer['from_value'])
+        to_value = float(offer['to_value'])
+        rate = round(to_value / from_value, RATE_PRECISION)
+        return (offer['from_currency'], offer['to_currency']), rate, from_value, to_value
+
+    def _index(self, offer_id: str, offer: Dict[str, Any]):
+        """Add an offer to the levels, replacing a previous version of it"""
+        self._unindex(offer_id)
+        entry = self._entry(offer)
+        pair, rate, from_value, to_value = entry
+        self._pairs.setdefault(pair, _PairLevels()).add(rate, from_value, to_value)
+        self._offers[offer_id] = entry
+
+    def _unindex(self, offer_id: str):
+        """Remove an offer from the levels, if it is there"""
+        entry = self._offers.pop(offer_id, None)
+        if entry is None:
+            return
+        pair, rate, from_value, to_value = entry
+        levels = self._pairs[pair]
+        levels.remove(rate, from_value, to_value)
+        if not levels.rates:
+            del self._pairs[pair]
+
+    def add(self, offer_id: str, offer: Dict[str, Any]):
+        """
+        Record an offer opened on the book
+
+        Args:
+            offer_id: Offer ID
+            offer: Offer document
+        """
+        with self._lock:
+            if self._loaded:
+                self._index(str(offer_id), offer)
+
+    def remove(self, *offer_ids: Any):
+        """
+        Record offers closed by a match, a cancellation or expiry
+
+        Args:
+            *offer_ids: Offer IDs
+        """
+        with self._lock:
+            if self._loaded:
+                for offer_id in offer_ids:
+                    self._unindex(str(offer_id))
+
+    def _sync(self):
+        """Load the levels if they are missing or were changed elsewhere"""
+        if self._loaded and not self.versions.shared:
+            return
+
+        tag = self.versions.etag(BOOK_VERSION)
+        if self._loaded and (tag is None or tag == self._loaded_tag):
+            return
+
+        offers = self.db.get_all_offers(projection=DEPTH_PROJECTION)
+        self._pairs = {}
+        self._offers = {}
+        for offer in offers:
+            self._index(str(offer['_id']), offer)
+        self._loaded = True
+        self._loaded_tag = tag
+
+    def warm(self):
+        """Load the levels now instead of on the first read"""
+        with self._lock:
+            self._sync()
+
+    def levels(self, from_currency: str, to_currency: str, depth: int) -> Dict[str, Any]:
+        """
+        Get the best levels on each side of a pair
+
+        Rates are in to_currency per unit of from_currency, and volumes in
+        from_currency. Asks are the offers giving from_currency, lowest rate
+        first. Bids are the offers asking for it, highest rate first.
+
+        Args:
+            from_currency: Base currency code
+            to_currency: Quote currency code
+            depth: Number of levels per side
+
+        Returns:
+            Dict with the pair and its asks and bids
+        """
+        with self._lock:
+            self._sync()
+            asks = self._pairs.get((from_currency, to_currency))
+            bids = self._pairs.get((to_currency, from_currency))
+            return {
+                'from_currency': from_currency,
+                'to_currency': to_currency,
+                'asks': [
+                    {'rate': rate, 'volume': asks.levels[rate][0], 'count': asks.levels[rate][2]}
+                    for rate in asks.rates[:depth]
+                ] if asks else [],
+                # A bid's rate is the inverse of its own, its volume what it asks for
+                'bids': [
+                    {
+                        'rate': round(1 / rate, RATE_PRECISION),
+                        'volume': bids.levels[rate][1],
+                        'count': bids.levels[rate][2]
+                    }
+                    for rate in bids.rates[:depth]
+                ] if bids else []
+            }
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of pairs and offers in the levels"""
+        with self._lock:
+            return {'pairs': len(self._pairs), 'offers': len(self._offers)}
+
+
+_depth = None
+_depth_lock = threading.Lock()
+
+
+def get_book_depth(config=None) -> BookDepth:
+    """
+    Get the process-wide book depth
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared BookDepth instance, reading the offers the offer service writes
+    """
+    global _depth
+    if _depth is None:
+        with _depth_lock:
+            if _depth is None:
+                config = config or get_config()
+                if config.MATCHING_ENGINE_MODE == 'journaled':
+                    db = get_journaled_store()
+                elif config.PERSISTENCE_MODE == 'async':
+                    db = get_persistence_pipeline()
+                else:
+                    db = DatabaseService()
+                _depth = BookDepth(db)
+    return _depth
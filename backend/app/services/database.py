@@ -1,41 +1,162 @@
 """
 Database service for MongoDB interactions
 """
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReplaceOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from bson.objectid import ObjectId
 from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
 import os
-from dotenv import load_dotenv
+import atexit
+import threading
 import logging
-
-# Load environment variables
-load_dotenv()
+from app.config.config import get_config, get_mongo_client_options
+from app.models.ledger import LedgerEntry
+from app.models.transaction_summary import TransactionSummary
+from app.services.pool_monitor import PoolGauges
+from app.services.storage_backend import StorageBackend
 
 logger = logging.getLogger(__name__)
 
+# Projections for hot paths, so reads only decode the fields they use
+USER_ID_PROJECTION = {"_id": 1}
+USER_IDENTITY_PROJECTION = {"_id": 1, "email": 1}
+USER_PROFILE_PROJECTION = {"_id": 1, "email": 1, "name": 1}
+USER_AUTH_PROJECTION = {"_id": 1, "email": 1, "name": 1, "password": 1}
+WALLET_BALANCES_PROJECTION = {"_id": 0, "user": 1, "currencies": 1}
+
+# Indexes ensure_indexes creates, per collection attribute
+REQUIRED_INDEXES = {
+    'wallets': ('wallets_user',),
+    'offers': ('offers_expires_at',),
+    'transactions': ('transactions_date_id',),
+    'ledger': ('ledger_user_id', 'ledger_reason_date'),
+    'wallet_snapshots': ('wallet_snapshots_user_cutoff',),
+    'idempotency_keys': ('idempotency_keys_ttl',),
+    'rate_limits': ('rate_limits_ttl',)
+}
+
+
+def live_offer_filter(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Filter matching offers that have no expiry or have not expired yet"""
+    return {
+        "$or": [
+            {"expires_at": None},
+            {"expires_at": {"$gt": now or datetime.utcnow()}}
+        ]
+    }
 
-class DatabaseService:
-    """Service for MongoDB database operations"""
+
+def date_range(start: datetime, end: Optional[datetime]) -> Dict[str, Any]:
+    """Filter on a date field matching [start, end), or from start on if end is None"""
+    if end is None:
+        return {"$gte": start}
+    return {"$gte": start, "$lt": end}
+
+
+class DatabaseService(StorageBackend):
+    """
+    Service for MongoDB database operations
+    
+    DatabaseService() returns the process-wide storage backend: this
+    MongoDB service, or MemoryStorage when DATABASE_BACKEND is 'memory'
+    or another backend was installed with use_backend().
+    """
     
     _instance = None
     
+    # Attributes that only exist once a connection has been made
+    _CONNECTION_ATTRIBUTES = (
+        'client', 'db', 'users', 'offers', 'wallets', 'transactions',
+        'ledger', 'wallet_snapshots', 'idempotency_keys', 'rate_limits',
+        'versions', 'transaction_summaries', 'leases', 'job_state'
+    )
+    
+    # Shared connection pool gauges, fed by pymongo CMAP events
+    pool_gauges = PoolGauges()
+    
     def __new__(cls):
         """Ensure singleton pattern for database connections"""
+        if cls._instance is None and get_config().DATABASE_BACKEND == 'memory':
+            from app.services.memory_storage import MemoryStorage
+            cls._instance = MemoryStorage()
         if cls._instance is None:
-            cls._instance = super(DatabaseService, cls).__new__(cls)
-            cls._instance._init_db()
+            instance = super().__new__(cls)
+            instance._lock = threading.Lock()
+            instance._pid = None
+            cls._instance = instance
         return cls._instance
     
+    @classmethod
+    def use_backend(cls, backend: Optional[StorageBackend]) -> Optional[StorageBackend]:
+        """
+        Install the storage backend DatabaseService() returns from now on
+        
+        Args:
+            backend: Storage backend, or None to pick one from config again
+            
+        Returns:
+            The previously installed backend
+        """
+        previous = cls._instance
+        cls._instance = backend
+        return previous
+    
+    def __getattr__(self, name):
+        """Connect lazily the first time a connection attribute is used"""
+        if name in self._CONNECTION_ATTRIBUTES:
+            self.connect()
+            return self.__dict__[name]
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{name}'"
+        )
+    
+    @property
+    def is_connected(self) -> bool:
+        """Whether this process holds an open client"""
+        return 'client' in self.__dict__ and self._pid == os.getpid()
+    
+    def connect(self):
+        """Open the connection for the current process if not yet open"""
+        with self._lock:
+            if self.is_connected:
+                return
+            if 'client' in self.__dict__:
+                # Inherited from a parent process, never reuse its sockets
+                self._drop_connection()
+            self._init_db()
+            self._pid = os.getpid()
+    
+    def init_app(self, app):
+        """
+        Bind the service to a Flask application
+        
+        The connection is opened per process on first use and closed when
+        the process exits, so nothing is created in a pre-fork master.
+        
+        Args:
+            app: Flask application
+        """
+        app.extensions['database'] = self
+        if not getattr(self, '_exit_hook', False):
+            atexit.register(self.close)
+            self._exit_hook = True
+    
     def _init_db(self):
         """Initialize database connection"""
         try:
             # Get MongoDB URI from environment or use default
             mongo_uri = os.getenv('MONGO_URI')
             
+            # Pool, timeout, retry and compression settings from config
+            options = get_mongo_client_options()
+            options['event_listeners'] = [self.pool_gauges]
+            
             if not mongo_uri:
                 logger.warning("MONGO_URI not set, using localhost")
-                self.client = MongoClient('localhost', 27017)
+                self.client = MongoClient('localhost', 27017, **options)
             else:
-                self.client = MongoClient(mongo_uri)
+                self.client = MongoClient(mongo_uri, **options)
                 
             self.db = self.client.get_database(os.getenv('MONGO_DB', 'total_records'))
             
@@ -44,28 +165,132 @@ class DatabaseService:
             self.offers = self.db.offers
             self.wallets = self.db.wallets  
             self.transactions = self.db.transactions
+            self.ledger = self.db.ledger
+            self.wallet_snapshots = self.db.wallet_snapshots
+            self.idempotency_keys = self.db.idempotency_keys
+            self.rate_limits = self.db.rate_limits
+            self.versions = self.db.versions
+            self.transaction_summaries = self.db.transaction_summaries
+            self.leases = self.db.leases
+            self.job_state = self.db.job_state
             
-            logger.info("Database connection established")
+            logger.info(f"Database connection established (pid {os.getpid()})")
             
         except Exception as e:
             logger.error(f"Database connection error: {str(e)}")
             raise
     
+    def _drop_connection(self):
+        """Forget the client and collections without touching the sockets"""
+        for name in self._CONNECTION_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        self._pid = None
+    
+    @classmethod
+    def _reset_after_fork(cls):
+        """Discard the connection inherited from the parent process"""
+        instance = cls._instance
+        if not isinstance(instance, DatabaseService):
+            return
+        instance._lock = threading.Lock()
+        instance._drop_connection()
+        cls.pool_gauges.reset()
+    
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get connection pool usage gauges per server"""
+        return self.pool_gauges.snapshot()
+    
     def close(self):
         """Close the database connection"""
-        if hasattr(self, 'client'):
+        if 'client' in self.__dict__:
             self.client.close()
+            self._drop_connection()
             logger.info("Database connection closed")
     
+    def ping(self):
+        """Check the server answers, raising an error if it does not"""
+        self.client.admin.command('ping')
+    
+    # Index management
+    def ensure_indexes(self):
+        """Create the indexes the query paths rely on"""
+        # Only offers with an expiry are indexed, for the expiry sweeper
+        self.offers.create_index(
+            [("expires_at", ASCENDING)],
+            name="offers_expires_at",
+            sparse=True
+        )
+        # Archival scans the oldest transactions first
+        self.transactions.create_index(
+            [("date", ASCENDING), ("_id", ASCENDING)],
+            name="transactions_date_id"
+        )
+        # /wallet reads a wallet by its owner
+        self.wallets.create_index(
+            [("user", ASCENDING)],
+            name="wallets_user"
+        )
+        # Per-wallet replay in insertion order
+        self.ledger.create_index(
+            [("user", ASCENDING), ("_id", ASCENDING)],
+            name="ledger_user_id"
+        )
+        # The offer outcome report scans a few reasons over a date range
+        self.ledger.create_index(
+            [("reason", ASCENDING), ("date", ASCENDING)],
+            name="ledger_reason_date"
+        )
+        self.wallet_snapshots.create_index(
+            [("user", ASCENDING), ("cutoff", DESCENDING)],
+            name="wallet_snapshots_user_cutoff"
+        )
+        # Stored request results expire on their own
+        self.idempotency_keys.create_index(
+            [("created_at", ASCENDING)],
+            name="idempotency_keys_ttl",
+            expireAfterSeconds=get_config().IDEMPOTENCY_TTL_SECONDS
+        )
+        # Idle rate limit buckets are full again, drop them
+        self.rate_limits.create_index(
+            [("updated", ASCENDING)],
+            name="rate_limits_ttl",
+            expireAfterSeconds=3600
+        )
+    
+    def missing_indexes(self) -> List[str]:
+        """Get the names of required indexes that do not exist"""
+        missing = []
+        for collection, names in REQUIRED_INDEXES.items():
+            existing = getattr(self, collection).index_information()
+            missing.extend(
+                f"{collection}.{name}" for name in names if name not in existing
+            )
+        return missing
+    
     # User operations
-    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """Get user by email"""
-        return self.users.find_one({"email": email})
+    def get_user_by_email(
+        self,
+        email: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get user by email, optionally limited to a projection"""
+        return self.users.find_one({"email": email}, projection)
+    
+    def get_user_by_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get user by ID, optionally limited to a projection"""
+        return self.users.find_one({"_id": ObjectId(user_id)}, projection)
     
-    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get user by ID"""
-        from bson.objectid import ObjectId
-        return self.users.find_one({"_id": ObjectId(user_id)})
+    def get_user_ids_by_email(self, emails: List[str]) -> Dict[str, str]:
+        """Map user emails to user IDs in a single query"""
+        users = self.users.find(
+            {"email": {"$in": list(emails)}},
+            {"_id": 1, "email": 1}
+        )
+        return {user["email"]: str(user["_id"]) for user in users}
     
     def create_user(self, user_data: Dict[str, Any]) -> str:
         """Create a new user"""
@@ -73,9 +298,13 @@ class DatabaseService:
         return str(result.inserted_id)
     
     # Wallet operations
-    def get_wallet_by_user_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get wallet by user ID"""
-        return self.wallets.find_one({"user": user_id})
+    def get_wallet_by_user_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get wallet by user ID, optionally limited to a projection"""
+        return self.wallets.find_one({"user": user_id}, projection)
     
     def create_wallet(self, wallet_data: Dict[str, Any]) -> str:
         """Create a new wallet"""
@@ -90,15 +319,85 @@ class DatabaseService:
         )
         return result.modified_count > 0
     
+    def update_wallets(self, wallets: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Update several wallets in one round trip
+        
+        Args:
+            wallets: Fields to set, keyed by user ID
+            
+        Returns:
+            Number of wallets matched
+        """
+        if not wallets:
+            return 0
+        result = self.wallets.bulk_write([
+            UpdateOne({"user": user_id}, {"$set": wallet_data})
+            for user_id, wallet_data in wallets.items()
+        ], ordered=False)
+        return result.matched_count
+    
+    def increment_wallet_balances(
+        self,
+        increments: Dict[str, Dict[str, float]]
+    ) -> int:
+        """
+        Atomically add amounts to several wallets in one round trip
+        
+        Args:
+            increments: Amounts to add per currency, keyed by user ID
+            
+        Returns:
+            Number of wallets modified
+        """
+        operations = []
+        
+        for user_id, amounts in increments.items():
+            inc = {}
+            array_filters = []
+            for index, (currency, amount) in enumerate(amounts.items()):
+                inc[f"currencies.$[c{index}].value"] = amount
+                array_filters.append({f"c{index}.currency": currency})
+            operations.append(UpdateOne(
+                {"user": user_id},
+                {"$inc": inc},
+                array_filters=array_filters
+            ))
+            
+        if not operations:
+            return 0
+            
+        result = self.wallets.bulk_write(operations, ordered=False)
+        return result.modified_count
+    
     # Offer operations
-    def get_offer_by_id(self, offer_id: str) -> Optional[Dict[str, Any]]:
-        """Get offer by ID"""
-        from bson.objectid import ObjectId
-        return self.offers.find_one({"_id": ObjectId(offer_id)})
+    def get_offer_by_id(
+        self,
+        offer_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get offer by ID, optionally limited to a projection"""
+        return self.offers.find_one({"_id": ObjectId(offer_id)}, projection)
     
-    def get_all_offers(self) -> List[Dict[str, Any]]:
-        """Get all offers"""
-        return list(self.offers.find())
+    def get_all_offers(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all offers that have not expired"""
+        return list(self.offers.find(live_offer_filter(), projection))
+    
+    def get_next_offer_expiry(self, after: datetime) -> Optional[datetime]:
+        """Get the earliest expiry of the offers still live after a time"""
+        offer = self.offers.find_one(
+            {"expires_at": {"$gt": after}},
+            {"expires_at": 1},
+            sort=[("expires_at", 1)]
+        )
+        return offer["expires_at"] if offer else None
+    
+    def get_book_offers(self) -> List[Dict[str, Any]]:
+        """Get every stored offer, including expired ones awaiting a sweep"""
+        return list(self.offers.find({}))
     
     def create_offer(self, offer_data: Dict[str, Any]) -> str:
         """Create a new offer"""
@@ -107,38 +406,486 @@ class DatabaseService:
     
     def delete_offer(self, offer_id: str) -> bool:
         """Delete an offer"""
-        from bson.objectid import ObjectId
         result = self.offers.delete_one({"_id": ObjectId(offer_id)})
         return result.deleted_count > 0
     
+    def delete_offers(self, offer_ids: List[Any]) -> int:
+        """Delete several offers by ID"""
+        if not offer_ids:
+            return 0
+        result = self.offers.delete_many({"_id": {"$in": list(offer_ids)}})
+        return result.deleted_count
+    
+    def claim_expired_offers(
+        self,
+        now: datetime,
+        limit: int,
+        claim: str,
+        lease_seconds: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Claim a batch of expired offers so only one sweeper refunds them
+        
+        A claim lapses after lease_seconds, so offers left behind by a sweep
+        that died before deleting them are picked up again.
+        
+        Args:
+            now: Reference time in UTC
+            limit: Maximum number of offers to claim
+            claim: Unique token for this sweep
+            lease_seconds: Seconds before another sweep may take over a claim
+            
+        Returns:
+            List of claimed offers
+        """
+        # Matches unclaimed offers (no claim time) and lapsed claims
+        claimable = {"expiry_claimed_at": {"$not": {"$gt": now - timedelta(seconds=lease_seconds)}}}
+        candidates = self.offers.find(
+            {"expires_at": {"$lte": now}, **claimable},
+            {"_id": 1}
+        ).sort([("expires_at", 1)]).limit(limit)
+        
+        offer_ids = [offer["_id"] for offer in candidates]
+        if not offer_ids:
+            return []
+            
+        self.offers.update_many(
+            {"_id": {"$in": offer_ids}, **claimable},
+            {"$set": {"expiry_claim": claim, "expiry_claimed_at": now}}
+        )
+        return list(self.offers.find({"_id": {"$in": offer_ids}, "expiry_claim": claim}))
+    
+    def set_expiry_claim(self, offer_ids: List[Any], claim: str, claimed_at: datetime) -> int:
+        """Mark offers as claimed by an expiry sweep"""
+        if not offer_ids:
+            return 0
+        result = self.offers.update_many(
+            {"_id": {"$in": list(offer_ids)}},
+            {"$set": {"expiry_claim": claim, "expiry_claimed_at": claimed_at}}
+        )
+        return result.matched_count
+    
     def find_matching_offers(
         self,
         to_currency: str,
         from_currency: str,
-        from_value: float
+        from_value: float,
+        projection: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """Find offers matching the given criteria"""
         return list(self.offers.find({
             "from_currency": to_currency,
             "to_currency": from_currency,
-            "to_value": {"$lte": from_value}
-        }).sort([("to_value", -1)]))
+            "to_value": {"$lte": from_value},
+            **live_offer_filter()
+        }, projection).sort([("to_value", -1)]))
     
     # Transaction operations
     def create_transaction(self, transaction_data: Dict[str, Any]) -> str:
-        """Create a new transaction"""
+        """Create a new transaction and update both parties' summaries"""
         result = self.transactions.insert_one(transaction_data)
+        self.record_transaction_summaries([{**transaction_data, "_id": result.inserted_id}])
         return str(result.inserted_id)
     
-    def get_all_transactions(self) -> List[Dict[str, Any]]:
-        """Get all transactions"""
-        return list(self.transactions.find())
+    def get_all_transactions(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all transactions, optionally limited to a projection"""
+        return list(self.transactions.find({}, projection))
     
-    def get_user_transactions(self, email: str) -> List[Dict[str, Any]]:
+    def get_user_transactions(
+        self,
+        email: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """Get transactions for a specific user"""
         return list(self.transactions.find({
             "$or": [
                 {"from_user": email},
                 {"to_user": email}
             ]
-        })) 
\ No newline at end of file
+        }, projection)) 
+    
+    def get_transactions_before(self, before: datetime, limit: int) -> List[Dict[str, Any]]:
+        """Get up to limit transactions dated before a time, oldest first"""
+        return list(self.transactions.find(
+            {"date": {"$lt": before}}
+        ).sort([("date", ASCENDING), ("_id", ASCENDING)]).limit(limit))
+    
+    def delete_transactions(self, transaction_ids: List[Any]) -> int:
+        """Delete several transactions by ID"""
+        if not transaction_ids:
+            return 0
+        result = self.transactions.delete_many({"_id": {"$in": transaction_ids}})
+        return result.deleted_count
+    
+    # Transaction summary operations
+    def record_transaction_summaries(self, transactions: List[Dict[str, Any]]):
+        """Apply transactions to their parties' summaries, once per transaction"""
+        config = get_config()
+        updates = [
+            (
+                {"_id": email, "applied_ids": {"$ne": transaction["_id"]}},
+                TransactionSummary.update(
+                    transaction,
+                    email,
+                    config.TRANSACTION_SUMMARY_TRADES,
+                    config.TRANSACTION_SUMMARY_APPLIED_IDS
+                )
+            )
+            for transaction in transactions
+            for email in TransactionSummary.parties(transaction)
+        ]
+        
+        # Ordered, so each summary's recent trades stay in date order
+        while updates:
+            try:
+                self.transaction_summaries.bulk_write(
+                    [UpdateOne(summary_filter, update, upsert=True) for summary_filter, update in updates],
+                    ordered=True
+                )
+                return
+            except BulkWriteError as e:
+                error = e.details['writeErrors'][0]
+                if error.get('code') != 11000:
+                    raise
+                # The upsert collided with an existing summary: either the
+                # transaction was already applied, or a concurrent first
+                # upsert created the summary. Only the latter matches now.
+                index = error['index']
+                self.transaction_summaries.update_one(*updates[index])
+                updates = updates[index + 1:]
+    
+    def get_transaction_summary(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get a user's transaction summary"""
+        return self.transaction_summaries.find_one({"_id": email})
+    
+    # Report operations
+    # Each pipeline starts with a $match on an indexed date range and may
+    # spill its $group stages to disk
+    def _aggregate(self, collection, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run an aggregation pipeline, allowing it to use disk"""
+        return list(collection.aggregate(pipeline, allowDiskUse=True))
+    
+    def get_pair_volume_by_day(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """Get the trade count and volume per UTC day and currency pair"""
+        return self._aggregate(self.transactions, [
+            {"$match": {"date": date_range(start, end)}},
+            {"$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+                    "from_currency": "$from_currency",
+                    "to_currency": "$to_currency"
+                },
+                "trades": {"$sum": 1},
+                "from_volume": {"$sum": "$from_value"},
+                "to_volume": {"$sum": "$to_value"}
+            }},
+            {"$sort": {"_id.day": 1, "_id.from_currency": 1, "_id.to_currency": 1}},
+            {"$project": {
+                "_id": 0,
+                "day": "$_id.day",
+                "from_currency": "$_id.from_currency",
+                "to_currency": "$_id.to_currency",
+                "trades": 1,
+                "from_volume": 1,
+                "to_volume": 1
+            }}
+        ])
+    
+    def get_top_traders(
+        self,
+        start: datetime,
+        end: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Get the users with the most trades, with the volume each sent per currency"""
+        return self._aggregate(self.transactions, [
+            {"$match": {"date": date_range(start, end)}},
+            # One leg per party: the offer's owner sent from_currency, the
+            # accepting user to_currency
+            {"$project": {"_id": 0, "legs": [
+                {"user": "$from_user", "currency": "$from_currency", "value": "$from_value"},
+                {"user": "$to_user", "currency": "$to_currency", "value": "$to_value"}
+            ]}},
+            {"$unwind": "$legs"},
+            {"$group": {
+                "_id": {"user": "$legs.user", "currency": "$legs.currency"},
+                "trades": {"$sum": 1},
+                "sent": {"$sum": "$legs.value"}
+            }},
+            {"$group": {
+                "_id": "$_id.user",
+                "trades": {"$sum": "$trades"},
+                "sent": {"$push": {"k": "$_id.currency", "v": "$sent"}}
+            }},
+            {"$sort": {"trades": -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "email": "$_id", "trades": 1, "sent": {"$arrayToObject": "$sent"}}}
+        ])
+    
+    def get_pair_rates(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """Get the average, volume-weighted, min and max rate per currency pair"""
+        rate = {"$divide": ["$to_value", "$from_value"]}
+        return self._aggregate(self.transactions, [
+            {"$match": {"date": date_range(start, end)}},
+            {"$group": {
+                "_id": {"from_currency": "$from_currency", "to_currency": "$to_currency"},
+                "trades": {"$sum": 1},
+                "avg_rate": {"$avg": rate},
+                "min_rate": {"$min": rate},
+                "max_rate": {"$max": rate},
+                "from_volume": {"$sum": "$from_value"},
+                "to_volume": {"$sum": "$to_value"}
+            }},
+            {"$sort": {"_id.from_currency": 1, "_id.to_currency": 1}},
+            {"$project": {
+                "_id": 0,
+                "from_currency": "$_id.from_currency",
+                "to_currency": "$_id.to_currency",
+                "trades": 1,
+                "avg_rate": 1,
+                "weighted_rate": {"$divide": ["$to_volume", "$from_volume"]},
+                "min_rate": 1,
+                "max_rate": 1
+            }}
+        ])
+    
+    def get_offer_outcomes(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> Dict[str, int]:
+        """Count the offers posted, filled and cancelled, from the ledger"""
+        counts = self._aggregate(self.ledger, [
+            {"$match": {
+                "reason": {"$in": [LedgerEntry.OFFER_LOCK, LedgerEntry.TRADE, LedgerEntry.OFFER_CANCEL]},
+                "date": date_range(start, end),
+                "ref": {"$exists": True}
+            }},
+            # An offer counts once per reason, however many entries it has
+            {"$group": {"_id": {"reason": "$reason", "ref": "$ref"}}},
+            {"$group": {"_id": "$_id.reason", "offers": {"$sum": 1}}}
+        ])
+        offers = {count["_id"]: count["offers"] for count in counts}
+        return {
+            'posted': offers.get(LedgerEntry.OFFER_LOCK, 0),
+            'filled': offers.get(LedgerEntry.TRADE, 0),
+            'cancelled': offers.get(LedgerEntry.OFFER_CANCEL, 0)
+        }
+    
+    # Ledger operations
+    def append_ledger_entries(self, entries: List[Dict[str, Any]]) -> List[str]:
+        """Append balance change entries to the ledger"""
+        if not entries:
+            return []
+        result = self.ledger.insert_many(entries, ordered=True)
+        return [str(entry_id) for entry_id in result.inserted_ids]
+    
+    def get_ledger_entries(
+        self,
+        user_id: str,
+        since_id: Any = None
+    ) -> List[Dict[str, Any]]:
+        """Get a wallet's ledger entries in insertion order, from since_id on"""
+        query = {"user": user_id}
+        if since_id is not None:
+            query["_id"] = {"$gte": since_id}
+        return list(self.ledger.find(query).sort([("_id", ASCENDING)]))
+    
+    def get_latest_wallet_snapshot(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the most recent balance snapshot of a wallet"""
+        return self.wallet_snapshots.find_one(
+            {"user": user_id},
+            sort=[("cutoff", DESCENDING)]
+        )
+    
+    def create_wallet_snapshot(self, snapshot_data: Dict[str, Any]) -> str:
+        """Store a wallet balance snapshot"""
+        result = self.wallet_snapshots.insert_one(snapshot_data)
+        return str(result.inserted_id)
+    
+    def get_ledger_user_ids(self, since_id: Any = None) -> List[str]:
+        """Get the IDs of the wallets with ledger entries, from since_id on"""
+        query = {"_id": {"$gte": since_id}} if since_id is not None else {}
+        return list(self.ledger.distinct("user", query))
+    
+    def get_ledger_snapshot_watermark(self) -> Optional[Any]:
+        """Get the ledger entry ID the last snapshot run covered wallets up to"""
+        state = self.job_state.find_one({"_id": "ledger_snapshots"})
+        return state["watermark"] if state else None
+    
+    def set_ledger_snapshot_watermark(self, watermark: Any):
+        """Store the ledger entry ID a snapshot run covered wallets up to"""
+        self.job_state.update_one(
+            {"_id": "ledger_snapshots"},
+            {"$set": {"watermark": watermark}},
+            upsert=True
+        )
+    
+    # Idempotency key operations
+    def reserve_idempotency_key(self, record: Dict[str, Any]) -> bool:
+        """Store a pending idempotency record unless one already exists"""
+        try:
+            self.idempotency_keys.insert_one(record)
+            return True
+        except DuplicateKeyError:
+            return False
+    
+    def get_idempotency_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get an idempotency record by ID"""
+        return self.idempotency_keys.find_one({"_id": record_id})
+    
+    def take_over_idempotency_key(
+        self,
+        record_id: str,
+        stale_before: datetime,
+        now: datetime
+    ) -> bool:
+        """Claim a pending idempotency record abandoned before stale_before"""
+        result = self.idempotency_keys.update_one(
+            {"_id": record_id, "status": "pending", "created_at": {"$lt": stale_before}},
+            {"$set": {"created_at": now}}
+        )
+        return result.modified_count > 0
+    
+    def complete_idempotency_key(self, record_id: str, response: Dict[str, Any]) -> bool:
+        """Store the response of a finished request"""
+        result = self.idempotency_keys.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "done", **response}}
+        )
+        return result.modified_count > 0
+    
+    def delete_idempotency_key(self, record_id: str) -> bool:
+        """Forget an idempotency record so the request can be retried"""
+        result = self.idempotency_keys.delete_one({"_id": record_id})
+        return result.deleted_count > 0
+    
+    # Rate limit operations
+    def consume_rate_limit_tokens(
+        self,
+        key: str,
+        rate: float,
+        burst: float,
+        cost: float,
+        now: datetime
+    ) -> Dict[str, Any]:
+        """
+        Refill a token bucket and take tokens from it in one atomic update
+        
+        Args:
+            key: Bucket key
+            rate: Tokens added per second
+            burst: Bucket capacity
+            cost: Tokens to take
+            now: Current time in UTC
+            
+        Returns:
+            Bucket with the remaining tokens and whether the request is allowed
+        """
+        elapsed_seconds = {"$divide": [
+            {"$subtract": [now, {"$ifNull": ["$updated", now]}]},
+            1000
+        ]}
+        return self.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [
+                        burst,
+                        {"$add": [
+                            {"$ifNull": ["$tokens", burst]},
+                            {"$multiply": [elapsed_seconds, rate]}
+                        ]}
+                    ]},
+                    "updated": now
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": [
+                    "$allowed",
+                    {"$subtract": ["$tokens", cost]},
+                    "$tokens"
+                ]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    # Version operations
+    def bump_versions(self, keys: List[str]) -> int:
+        """Increment several listing versions in one round trip"""
+        if not keys:
+            return 0
+        result = self.versions.bulk_write([
+            UpdateOne({"_id": key}, {"$inc": {"value": 1}}, upsert=True)
+            for key in keys
+        ], ordered=False)
+        return result.modified_count + result.upserted_count
+    
+    def get_version(self, key: str) -> int:
+        """Get a listing version, 0 if it never changed"""
+        version = self.versions.find_one({"_id": key}, {"value": 1})
+        return version["value"] if version else 0
+    
+    # Lease operations
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease, timed by the server's clock"""
+        try:
+            self.leases.update_one(
+                {"_id": name, "$or": [
+                    {"owner": owner},
+                    {"$expr": {"$lte": ["$expires_at", "$$NOW"]}}
+                ]},
+                [{"$set": {
+                    "owner": owner,
+                    "expires_at": {"$add": ["$$NOW", int(ttl_seconds * 1000)]}
+                }}],
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Held by another owner: the filter missed and the upsert collided
+            return False
+    
+    def release_lease(self, name: str, owner: str) -> bool:
+        """Give up a lease the owner holds"""
+        result = self.leases.delete_one({"_id": name, "owner": owner})
+        return result.deleted_count == 1
+    
+    # Replay operations
+    def upsert_documents(self, collection: str, documents: List[Dict[str, Any]]) -> int:
+        """
+        Store documents by _id, replacing any earlier copy
+        
+        Replaying the same documents twice leaves the same state, which
+        makes journal replay safe after a crash.
+        
+        Args:
+            collection: Collection name
+            documents: Documents with an _id
+            
+        Returns:
+            Number of documents inserted or replaced
+        """
+        if not documents:
+            return 0
+        result = getattr(self, collection).bulk_write([
+            ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+            for document in documents
+        ], ordered=False)
+        return result.upserted_count + result.matched_count
+
+
+# Workers forked from a pre-fork master must open their own client
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=DatabaseService._reset_after_fork)
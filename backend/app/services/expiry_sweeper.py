@@ -0,0 +1,52 @@
+"""
+Sweeper for expired offers, run as a scheduled job
+"""
+import threading
+from app.services.offer_service import OfferService, get_offer_service
+
+
+class OfferExpirySweeper:
+    """Expire offers and refund their locked funds, batch by batch"""
+
+    def __init__(
+        self,
+        offer_service: OfferService = None,
+        batch_size: int = 500
+    ):
+        """
+        Initialize the sweeper
+
+        Args:
+            offer_service: Service used to expire offers (defaults to the
+                shared one, resolved on the first sweep)
+            batch_size: Maximum number of offers expired per batch
+        """
+        self._offer_service = offer_service
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+
+    @property
+    def offer_service(self) -> OfferService:
+        """Service used to expire offers"""
+        if self._offer_service is None:
+            self._offer_service = get_offer_service()
+        return self._offer_service
+
+    def stop(self):
+        """Stop a sweep between batches"""
+        self._stop_event.set()
+
+    def run_once(self) -> int:
+        """
+        Expire offers batch by batch until the backlog is drained
+
+        Returns:
+            Number of offers expired
+        """
+        total = 0
+        while not self._stop_event.is_set():
+            expired = self.offer_service.expire_offers(batch_size=self.batch_size)
+            total += expired
+            if expired < self.batch_size:
+                break
+        return total
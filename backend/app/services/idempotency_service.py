@@ -0,0 +1,166 @@
+"""
+Idempotency service for safely retried requests
+"""
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import threading
+import logging
+from app.config.config import get_config
+from app.services.database import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of IdempotencyService.begin
+PROCEED = 'proceed'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+class IdempotencyService:
+    """Remember request results by Idempotency-Key so retries replay them"""
+
+    def __init__(
+        self,
+        db: DatabaseService = None,
+        cache_size: int = None,
+        lock_seconds: int = None,
+        ttl_seconds: int = None
+    ):
+        """
+        Initialize with a database service
+
+        Args:
+            db: Database service holding the records (TTL indexed)
+            cache_size: Finished results kept in memory
+            lock_seconds: Age after which an unfinished request is abandoned
+            ttl_seconds: How long finished results are replayed
+        """
+        config = get_config()
+        self.db = db or DatabaseService()
+        self.cache_size = cache_size or config.IDEMPOTENCY_CACHE_SIZE
+        self.lock_time = timedelta(seconds=lock_seconds or config.IDEMPOTENCY_LOCK_SECONDS)
+        self.ttl = timedelta(seconds=ttl_seconds or config.IDEMPOTENCY_TTL_SECONDS)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def record_id(user_id: str, scope: str, key: str) -> str:
+        """Build the record ID; keys are private to a user and an endpoint"""
+        return f'{user_id}:{scope}:{key}'
+
+    @staticmethod
+    def fingerprint(method: str, path: str, body: bytes) -> str:
+        """Hash a request so a key reused for a different request is caught"""
+        digest = hashlib.sha256()
+        digest.update(method.encode('utf-8'))
+        digest.update(path.encode('utf-8'))
+        digest.update(body or b'')
+        return digest.hexdigest()
+
+    def begin(self, record_id: str, fingerprint: str) -> Dict[str, Any]:
+        """
+        Reserve a key before running a request
+
+        Args:
+            record_id: Record ID from record_id()
+            fingerprint: Request fingerprint
+
+        Returns:
+            Dict with the outcome, plus the stored response when replaying
+        """
+        record = self._cache_get(record_id)
+        if record is None:
+            now = datetime.utcnow()
+            if self.db.reserve_idempotency_key({
+                '_id': record_id,
+                'fingerprint': fingerprint,
+                'status': 'pending',
+                'created_at': now
+            }):
+                return {'outcome': PROCEED}
+
+            record = self.db.get_idempotency_record(record_id)
+            if record is None:
+                # Expired between the two calls, try once more
+                return self.begin(record_id, fingerprint)
+
+        if record['fingerprint'] != fingerprint:
+            return {'outcome': MISMATCH}
+
+        if record['status'] == 'done':
+            self._cache_put(record_id, record)
+            return {
+                'outcome': REPLAY,
+                'status_code': record['status_code'],
+                'body': record['body']
+            }
+
+        now = datetime.utcnow()
+        if self.db.take_over_idempotency_key(record_id, now - self.lock_time, now):
+            logger.warning(f"Taking over abandoned idempotency key {record_id}")
+            return {'outcome': PROCEED}
+        return {'outcome': IN_PROGRESS}
+
+    def complete(self, record_id: str, fingerprint: str, status_code: int, body: Any):
+        """
+        Store the response of a finished request
+
+        Args:
+            record_id: Record ID from record_id()
+            fingerprint: Request fingerprint
+            status_code: HTTP status code
+            body: JSON response body
+        """
+        response = {'status_code': status_code, 'body': body}
+        self.db.complete_idempotency_key(record_id, response)
+        self._cache_put(record_id, {
+            'fingerprint': fingerprint,
+            'status': 'done',
+            'created_at': datetime.utcnow(),
+            **response
+        })
+
+    def release(self, record_id: str):
+        """Drop a reservation whose request did not finish, allowing a retry"""
+        try:
+            self.db.delete_idempotency_key(record_id)
+        except Exception as e:
+            logger.error(f"Error releasing idempotency key {record_id}: {str(e)}")
+
+    def _cache_get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get a finished record from the in-memory LRU"""
+        with self._cache_lock:
+            record = self._cache.get(record_id)
+            if record is None:
+                return None
+            # Match the database TTL, so a cached result never outlives it
+            if record['created_at'] <= datetime.utcnow() - self.ttl:
+                del self._cache[record_id]
+                return None
+            self._cache.move_to_end(record_id)
+            return record
+
+    def _cache_put(self, record_id: str, record: Dict[str, Any]):
+        """Add a finished record to the in-memory LRU"""
+        with self._cache_lock:
+            self._cache[record_id] = record
+            self._cache.move_to_end(record_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_idempotency_service() -> IdempotencyService:
+    """Get the process-wide idempotency service"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = IdempotencyService()
+    return _service
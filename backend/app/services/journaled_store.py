@@ -0,0 +1,502 @@
+"""
+In-memory order book and wallets backed by the order journal
+"""
+from typing import Dict, Any, List, Optional, Callable
+from datetime import datetime, timedelta
+import os
+import copy
+import queue
+import atexit
+import threading
+import time
+import logging
+from bson.objectid import ObjectId
+from app.config.config import get_config
+from app.models.offer import Offer
+from app.services.database import DatabaseService
+from app.services.order_journal import OrderJournal
+
+logger = logging.getLogger(__name__)
+
+# Journal event types
+WALLET_EVENT = 'wallet'
+OFFER_OPEN_EVENT = 'offer_open'
+OFFER_CLAIM_EVENT = 'offer_claim'
+OFFER_CLOSE_EVENT = 'offer_close'
+FILL_EVENT = 'fill'
+LEDGER_EVENT = 'ledger'
+
+
+def _project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Copy a document, keeping only the fields of an inclusion projection"""
+    if projection is None:
+        return copy.deepcopy(document)
+
+    result = {
+        field: copy.deepcopy(document[field])
+        for field, include in projection.items()
+        if include and field != '_id' and field in document
+    }
+    if projection.get('_id', 1) and '_id' in document:
+        result['_id'] = document['_id']
+    return result
+
+
+def _as_object_id(offer_id: Any) -> ObjectId:
+    """Convert an offer ID to an ObjectId"""
+    return offer_id if isinstance(offer_id, ObjectId) else ObjectId(offer_id)
+
+
+class JournaledStore:
+    """
+    Drop-in for the DatabaseService order paths, serving offers and wallets
+    from memory
+
+    Every change is appended to the order journal; a persister thread
+    applies durable journal records to MongoDB in order. Reads and writes
+    that do not involve offers or wallets go straight to MongoDB.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseService = None,
+        journal: OrderJournal = None,
+        ack_timeout: float = 5
+    ):
+        """
+        Initialize the store
+
+        Args:
+            db: Database service records are persisted to
+            journal: Order journal (defaults to one built from configuration)
+            ack_timeout: Seconds to wait for the journal before failing a request
+        """
+        config = get_config()
+        self.db = db or DatabaseService()
+        self.journal = journal or OrderJournal(
+            directory=config.JOURNAL_DIR,
+            segment_bytes=config.JOURNAL_SEGMENT_BYTES,
+            group_commit_ms=config.JOURNAL_GROUP_COMMIT_MS
+        )
+        self.journal.on_durable = self._enqueue
+        self.ack_timeout = ack_timeout
+        self.persisted_seq = 0
+
+        self._offers = {}
+        self._book = {}
+        self._wallets = {}
+        self._lock = threading.RLock()
+        self._persist_queue = queue.Queue()
+        self._persisted_callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self._persister = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        """Serve everything else straight from the database"""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.db, name)
+
+    # Lifecycle
+    def start(self):
+        """Recover the book once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.recover()
+            self._pid = os.getpid()
+
+    def recover(self):
+        """
+        Rebuild state from the last checkpoint plus a journal replay
+
+        The database holds every record up to the checkpoint. Records after
+        it are applied again (every record is idempotent), then the book is
+        loaded from the caught-up database.
+        """
+        self.journal.open()
+
+        started = time.perf_counter()
+        last_seq = self.journal.checkpointed_seq
+        replayed = 0
+        for record in self.journal.read_after(last_seq):
+            self._apply(record)
+            last_seq = record['seq']
+            replayed += 1
+        if replayed:
+            self.journal.checkpoint(last_seq)
+        self.persisted_seq = last_seq
+
+        with self._lock:
+            self._offers = {}
+            self._book = {}
+            self._wallets = {}
+            for offer in self.db.get_book_offers():
+                self._index_offer(offer)
+        with self._callbacks_lock:
+            self._persisted_callbacks = []
+
+        self._persister = threading.Thread(
+            target=self._run_persister,
+            name='order-journal-persister',
+            daemon=True
+        )
+        self._persister.start()
+        logger.info(
+            f"Recovered {len(self._offers)} offers, replayed {replayed} journal "
+            f"records in {time.perf_counter() - started:.3f}s"
+        )
+
+    def close(self, timeout: float = None):
+        """Flush the journal and persist every durable record"""
+        if self._pid != os.getpid():
+            return
+        self.journal.close(timeout)
+        self._persist_queue.put(None)
+        if self._persister is not None:
+            self._persister.join(timeout)
+            self._persister = None
+        self._pid = None
+
+    # Durability
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the latest journaled change"""
+        return self.journal.last_seq
+
+    def wait_durable(self, seq: int, timeout: float = None) -> bool:
+        """Wait until every change up to seq is on disk"""
+        return self.journal.wait_durable(
+            seq,
+            self.ack_timeout if timeout is None else timeout
+        )
+
+    def when_persisted(self, callback: Callable[[], None]):
+        """Run a callback once every change journaled so far is in MongoDB"""
+        seq = self.last_seq
+        with self._callbacks_lock:
+            if self.persisted_seq < seq:
+                self._persisted_callbacks.append((seq, callback))
+                return
+        callback()
+
+    def _run_persisted_callbacks(self):
+        """Run the callbacks waiting for records that are now persisted"""
+        with self._callbacks_lock:
+            due = [callback for seq, callback in self._persisted_callbacks if seq <= self.persisted_seq]
+            self._persisted_callbacks = [
+                (seq, callback) for seq, callback in self._persisted_callbacks
+                if seq > self.persisted_seq
+            ]
+        for callback in due:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error running persisted callback: {str(e)}")
+
+    def _append(self, event_type: str, data: Dict[str, Any]) -> int:
+        """Journal a change; data must not be mutated afterwards"""
+        return self.journal.append(event_type, data)
+
+    # Wallet operations
+    def _wallet(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the cached wallet, loading it on first use"""
+        wallet = self._wallets.get(user_id)
+        if wallet is None:
+            loaded = self.db.get_wallet_by_user_id(user_id)
+            if loaded is None:
+                return None
+            with self._lock:
+                wallet = self._wallets.setdefault(user_id, loaded)
+        return wallet
+
+    def get_wallet_by_user_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get wallet by user ID, optionally limited to a projection"""
+        self.start()
+        wallet = self._wallet(user_id)
+        if wallet is None:
+            return None
+        with self._lock:
+            return _project(wallet, projection)
+
+    def update_wallet(self, user_id: str, wallet_data: Dict[str, Any]) -> bool:
+        """Update a wallet"""
+        self.start()
+        wallet = self._wallet(user_id)
+        if wallet is None:
+            return False
+        with self._lock:
+            wallet.update(copy.deepcopy(wallet_data))
+            self._append(WALLET_EVENT, {
+                'user': user_id,
+                'wallet': copy.deepcopy(wallet_data)
+            })
+        return True
+
+    def increment_wallet_balances(
+        self,
+        increments: Dict[str, Dict[str, float]]
+    ) -> int:
+        """Add amounts to existing currencies of several wallets"""
+        self.start()
+        wallets = {user_id: self._wallet(user_id) for user_id in increments}
+
+        modified = 0
+        with self._lock:
+            for user_id, amounts in increments.items():
+                wallet = wallets[user_id]
+                if wallet is None:
+                    continue
+                for currency in wallet.get('currencies', []):
+                    if currency['currency'] in amounts:
+                        currency['value'] += amounts[currency['currency']]
+                self._append(WALLET_EVENT, {
+                    'user': user_id,
+                    'wallet': {'currencies': copy.deepcopy(wallet['currencies'])}
+                })
+                modified += 1
+        return modified
+
+    # Offer operations
+    def _index_offer(self, offer: Dict[str, Any]):
+        """Add an offer to the book"""
+        self._offers[offer['_id']] = offer
+        pair = (offer['from_currency'], offer['to_currency'])
+        self._book.setdefault(pair, {})[offer['_id']] = offer
+
+    def _unindex_offer(self, offer_id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Remove an offer from the book"""
+        offer = self._offers.pop(offer_id, None)
+        if offer is not None:
+            pair = (offer['from_currency'], offer['to_currency'])
+            self._book.get(pair, {}).pop(offer_id, None)
+        return offer
+
+    def get_offer_by_id(
+        self,
+        offer_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get offer by ID, optionally limited to a projection"""
+        self.start()
+        offer_id = _as_object_id(offer_id)
+        with self._lock:
+            offer = self._offers.get(offer_id)
+            return _project(offer, projection) if offer is not None else None
+
+    def get_all_offers(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all offers that have not expired"""
+        self.start()
+        now = datetime.utcnow()
+        with self._lock:
+            return [
+                _project(offer, projection)
+                for offer in self._offers.values()
+                if not Offer.is_expired_record(offer, now)
+            ]
+
+    def create_offer(self, offer_data: Dict[str, Any]) -> str:
+        """Create a new offer"""
+        self.start()
+        offer = copy.deepcopy(offer_data)
+        offer.setdefault('_id', ObjectId())
+        with self._lock:
+            self._index_offer(offer)
+            self._append(OFFER_OPEN_EVENT, {'offer': copy.deepcopy(offer)})
+        return str(offer['_id'])
+
+    def delete_offer(self, offer_id: str) -> bool:
+        """Delete an offer"""
+        return self.delete_offers([_as_object_id(offer_id)]) > 0
+
+    def delete_offers(self, offer_ids: List[Any]) -> int:
+        """Delete several offers by ID"""
+        self.start()
+        with self._lock:
+            removed = [
+                offer['_id'] for offer in (
+                    self._unindex_offer(_as_object_id(offer_id))
+                    for offer_id in offer_ids
+                )
+                if offer is not None
+            ]
+            if removed:
+                self._append(OFFER_CLOSE_EVENT, {'ids': removed})
+        return len(removed)
+
+    def claim_expired_offers(
+        self,
+        now: datetime,
+        limit: int,
+        claim: str,
+        lease_seconds: float
+    ) -> List[Dict[str, Any]]:
+        """Claim a batch of expired offers so only one sweep refunds them"""
+        self.start()
+        stale_before = now - timedelta(seconds=lease_seconds)
+        with self._lock:
+            expired = sorted(
+                (
+                    offer for offer in self._offers.values()
+                    if Offer.is_expired_record(offer, now)
+                    and (offer.get('expiry_claimed_at') is None or offer['expiry_claimed_at'] <= stale_before)
+                ),
+                key=lambda offer: offer['expires_at']
+            )[:limit]
+            if not expired:
+                return []
+
+            for offer in expired:
+                offer['expiry_claim'] = claim
+                offer['expiry_claimed_at'] = now
+            self._append(OFFER_CLAIM_EVENT, {
+                'ids': [offer['_id'] for offer in expired],
+                'claim': claim,
+                'claimed_at': now
+            })
+            return [copy.deepcopy(offer) for offer in expired]
+
+    def find_matching_offers(
+        self,
+        to_currency: str,
+        from_currency: str,
+        from_value: float,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Find offers matching the given criteria"""
+        self.start()
+        now = datetime.utcnow()
+        with self._lock:
+            matches = [
+                offer
+                for offer in self._book.get((to_currency, from_currency), {}).values()
+                if offer['to_value'] <= from_value and not Offer.is_expired_record(offer, now)
+            ]
+            matches.sort(key=lambda offer: offer['to_value'], reverse=True)
+            return [_project(offer, projection) for offer in matches]
+
+    # Transaction operations
+    def create_transaction(self, transaction_data: Dict[str, Any]) -> str:
+        """Record a fill, its parties' summaries follow when it is persisted"""
+        self.start()
+        transaction = copy.deepcopy(transaction_data)
+        transaction.setdefault('_id', ObjectId())
+        self._append(FILL_EVENT, {'transaction': transaction})
+        return str(transaction['_id'])
+
+    # Ledger operations
+    def append_ledger_entries(self, entries: List[Dict[str, Any]]) -> List[str]:
+        """Append balance change entries to the ledger"""
+        if not entries:
+            return []
+        self.start()
+        entries = copy.deepcopy(entries)
+        for entry in entries:
+            entry.setdefault('_id', ObjectId())
+        self._append(LEDGER_EVENT, {'entries': entries})
+        return [str(entry['_id']) for entry in entries]
+
+    # Persistence
+    def _enqueue(self, records: List[Dict[str, Any]]):
+        """Hand durable records to the persister"""
+        self._persist_queue.put(records)
+
+    def _apply(self, record: Dict[str, Any]):
+        """Apply one journal record to the database"""
+        event_type, data = record['type'], record['data']
+        if event_type == WALLET_EVENT:
+            self.db.update_wallet(data['user'], data['wallet'])
+        elif event_type == OFFER_OPEN_EVENT:
+            self.db.upsert_documents('offers', [data['offer']])
+        elif event_type == OFFER_CLAIM_EVENT:
+            self.db.set_expiry_claim(data['ids'], data['claim'], data.get('claimed_at'))
+        elif event_type == OFFER_CLOSE_EVENT:
+            self.db.delete_offers(data['ids'])
+        elif event_type == FILL_EVENT:
+            self.db.upsert_documents('transactions', [data['transaction']])
+            self.db.record_transaction_summaries([data['transaction']])
+        elif event_type == LEDGER_EVENT:
+            self.db.upsert_documents('ledger', data['entries'])
+        else:
+            logger.warning(f"Skipping unknown journal record type {event_type}")
+
+    def _run_persister(self, checkpoint_interval: float = 1.0):
+        """Persister thread body: apply durable records in journal order"""
+        last_checkpoint = time.monotonic()
+        while True:
+            records = self._persist_queue.get()
+            if records is None:
+                break
+
+            for record in records:
+                delay = 0.1
+                while True:
+                    try:
+                        self._apply(record)
+                        break
+                    except Exception as e:
+                        # Later records depend on this one, keep retrying it
+                        logger.error(f"Error persisting journal record {record['seq']}: {str(e)}")
+                        time.sleep(delay)
+                        delay = min(delay * 2, 5.0)
+                self.persisted_seq = record['seq']
+            self._run_persisted_callbacks()
+
+            if self._persist_queue.empty() or time.monotonic() - last_checkpoint >= checkpoint_interval:
+                self._checkpoint()
+                last_checkpoint = time.monotonic()
+
+        self._checkpoint()
+
+    def _checkpoint(self):
+        """Store the persisted sequence number"""
+        try:
+            self.journal.checkpoint(self.persisted_seq)
+        except Exception as e:
+            logger.error(f"Error writing journal checkpoint: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get journal and persistence counters"""
+        stats = self.journal.stats()
+        stats.update({
+            'persisted_seq': self.persisted_seq,
+            'persist_lag': stats['durable_seq'] - self.persisted_seq,
+            'offers': len(self._offers),
+            'cached_wallets': len(self._wallets)
+        })
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_journaled_store(config=None) -> JournaledStore:
+    """
+    Get the process-wide journaled store
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared JournaledStore instance
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = config or get_config()
+                _store = JournaledStore(ack_timeout=config.JOURNAL_ACK_TIMEOUT_SECONDS)
+                atexit.register(_store.close)
+    return _store
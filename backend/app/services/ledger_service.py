@@ -0,0 +1,220 @@
+"""
+Ledger service for event-sourced wallet balances
+"""
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import logging
+from bson.objectid import ObjectId
+from app.config.config import get_config
+from app.models.ledger import LedgerEntry
+from app.services.database import DatabaseService, WALLET_BALANCES_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerService:
+    """Service for recording and replaying wallet balance changes"""
+
+    def __init__(
+        self,
+        db: DatabaseService = None,
+        snapshot_interval: int = None,
+        snapshot_lag_seconds: int = None
+    ):
+        """
+        Initialize with a database service
+
+        Args:
+            db: Database service (defaults to the shared one)
+            snapshot_interval: Entries a wallet needs since its last
+                snapshot before snapshot_wallets takes another
+            snapshot_lag_seconds: Age an entry needs before a snapshot covers it
+        """
+        config = get_config()
+        self.db = db or DatabaseService()
+        self.snapshot_interval = snapshot_interval or config.LEDGER_SNAPSHOT_INTERVAL
+        self.snapshot_lag = timedelta(seconds=(
+            config.LEDGER_SNAPSHOT_LAG_SECONDS
+            if snapshot_lag_seconds is None else snapshot_lag_seconds
+        ))
+
+    def record(
+        self,
+        user_id: str,
+        deltas: Dict[str, float],
+        reason: str,
+        reference: str = None
+    ) -> Optional[str]:
+        """
+        Append one wallet's balance change to the ledger
+
+        Args:
+            user_id: Wallet owner
+            deltas: Signed change per currency code
+            reason: Why the balances changed
+            reference: Related offer ID (optional)
+
+        Returns:
+            ID of the ledger entry, or None if nothing changed
+        """
+        entry_ids = self.record_many([
+            LedgerEntry(
+                user_id=user_id,
+                deltas=deltas,
+                reason=reason,
+                reference=reference
+            )
+        ])
+        return entry_ids[0] if entry_ids else None
+
+    def record_many(self, entries: List[LedgerEntry]) -> List[str]:
+        """
+        Append several balance changes in one round trip
+
+        Args:
+            entries: Ledger entries to append
+
+        Returns:
+            IDs of the appended entries
+        """
+        entries = [entry for entry in entries if not LedgerEntry.is_empty(entry.deltas)]
+        if not entries:
+            return []
+
+        return self.db.append_ledger_entries(
+            [entry.to_dict() for entry in entries]
+        )
+
+    def replay(self, user_id: str, until: ObjectId = None) -> Dict[str, Any]:
+        """
+        Rebuild a wallet from its latest snapshot and later entries
+
+        Args:
+            user_id: Wallet owner
+            until: Only replay entries with a lower ID (optional)
+
+        Returns:
+            Dict with rebuilt balances and replay details
+        """
+        snapshot = self.db.get_latest_wallet_snapshot(user_id)
+        balances = dict(snapshot['balances']) if snapshot else {}
+        since = snapshot['cutoff'] if snapshot else None
+
+        replayed = 0
+        for entry in self.db.get_ledger_entries(user_id, since_id=since):
+            if until is not None and entry['_id'] >= until:
+                break
+            LedgerEntry.apply(balances, entry['deltas'])
+            replayed += 1
+
+        return {
+            'user': user_id,
+            'balances': balances,
+            'snapshot_cutoff': since,
+            'replayed': replayed
+        }
+
+    def snapshot_wallet(
+        self,
+        user_id: str,
+        now: datetime = None,
+        min_entries: int = 1
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Store a snapshot covering entries older than the snapshot lag
+
+        Entries are ordered by ObjectId, which is only roughly ordered
+        across processes; leaving recent entries out of the snapshot keeps
+        a late insert from falling behind the cutoff.
+
+        Args:
+            user_id: Wallet owner
+            now: Reference time in UTC (defaults to now)
+            min_entries: Entries the snapshot must cover beyond the last one
+
+        Returns:
+            The stored snapshot, or None if there was not enough new to cover
+        """
+        now = now or datetime.utcnow()
+        cutoff = ObjectId.from_datetime(now - self.snapshot_lag)
+        state = self.replay(user_id, until=cutoff)
+
+        previous = state['snapshot_cutoff']
+        if state['replayed'] < max(min_entries, 1) or (previous is not None and previous >= cutoff):
+            return None
+
+        snapshot = {
+            'user': user_id,
+            'balances': state['balances'],
+            'cutoff': cutoff,
+            'date': now
+        }
+        self.db.create_wallet_snapshot(snapshot)
+        return snapshot
+
+    def verify_wallet(self, user_id: str, tolerance: float = 1e-6) -> Dict[str, Any]:
+        """
+        Compare a stored wallet with its ledger replay
+
+        Args:
+            user_id: Wallet owner
+            tolerance: Largest difference treated as rounding noise
+
+        Returns:
+            Dict with both balance maps and any differences
+        """
+        rebuilt = self.replay(user_id)['balances']
+        wallet = self.db.get_wallet_by_user_id(
+            user_id,
+            projection=WALLET_BALANCES_PROJECTION
+        )
+        stored = {
+            currency['currency']: currency['value']
+            for currency in (wallet or {}).get('currencies', [])
+        }
+
+        differences = {}
+        for currency in set(stored) | set(rebuilt):
+            difference = stored.get(currency, 0.0) - rebuilt.get(currency, 0.0)
+            if abs(difference) > tolerance:
+                differences[currency] = difference
+
+        return {
+            'user': user_id,
+            'balances': rebuilt,
+            'stored': stored,
+            'differences': differences,
+            'consistent': not differences
+        }
+
+    def snapshot_wallets(self, now: datetime = None) -> int:
+        """
+        Snapshot every wallet with snapshot_interval new entries
+
+        Run as a scheduled job, so requests never pay for a snapshot. Only
+        wallets with entries from the previous run's cutoff on can have
+        gained any, so the others are not replayed.
+
+        Args:
+            now: Reference time in UTC (defaults to now)
+
+        Returns:
+            Number of snapshots stored
+        """
+        now = now or datetime.utcnow()
+        cutoff = ObjectId.from_datetime(now - self.snapshot_lag)
+        stored = 0
+        failed = False
+        for user_id in self.db.get_ledger_user_ids(since_id=self.db.get_ledger_snapshot_watermark()):
+            try:
+                if self.snapshot_wallet(user_id, now=now, min_entries=self.snapshot_interval):
+                    stored += 1
+            except Exception as e:
+                failed = True
+                logger.error(f"Error snapshotting wallet {user_id}: {str(e)}")
+        # Keep the watermark after a failure, so the next run retries the wallet
+        if not failed:
+            self.db.set_ledger_snapshot_watermark(cutoff)
+        if stored:
+            logger.info(f"Stored {stored} wallet snapshots")
+        return stored
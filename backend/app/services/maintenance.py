@@ -0,0 +1,64 @@
+"""
+Maintenance jobs run by the scheduler
+"""
+import logging
+from app.services.database import DatabaseService
+from app.services.expiry_sweeper import OfferExpirySweeper
+from app.services.ledger_service import LedgerService
+from app.services.scheduler import Scheduler
+from app.services.transaction_archive import archive_old_transactions
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_wallets() -> int:
+    """Snapshot the wallets with enough new ledger entries"""
+    return LedgerService().snapshot_wallets()
+
+
+def archive_transactions() -> dict:
+    """Move transactions past the archive age to the archive"""
+    return archive_old_transactions(DatabaseService())
+
+
+def register_jobs(scheduler: Scheduler, config) -> Scheduler:
+    """
+    Register the maintenance jobs enabled in a configuration
+
+    Every job is leader-only: with several instances, each runs in one
+    process at a time.
+
+    Args:
+        scheduler: Scheduler to register with
+        config: Application config with the job settings
+
+    Returns:
+        The scheduler
+    """
+    settings = {
+        'jitter': config['SCHEDULER_JITTER_PERCENT'] / 100,
+        'timeout': config['SCHEDULER_JOB_TIMEOUT_SECONDS']
+    }
+
+    if config['OFFER_SWEEP_INTERVAL_SECONDS']:
+        sweeper = OfferExpirySweeper(batch_size=config['OFFER_SWEEP_BATCH_SIZE'])
+        scheduler.register('offer_expiry', sweeper.run_once, config['OFFER_SWEEP_INTERVAL_SECONDS'], **settings)
+
+    if config['LEDGER_SNAPSHOT_JOB_SECONDS']:
+        scheduler.register('ledger_snapshots', snapshot_wallets, config['LEDGER_SNAPSHOT_JOB_SECONDS'], **settings)
+
+    if config['TRANSACTION_ARCHIVE_INTERVAL_SECONDS'] and not config.get('TRANSACTION_ARCHIVE_SHARED'):
+        # The leader's host would hold files the other hosts cannot read
+        logger.warning(
+            "Not scheduling transaction_archive: set TRANSACTION_ARCHIVE_SHARED once "
+            "TRANSACTION_ARCHIVE_DIR is shared by every host"
+        )
+    elif config['TRANSACTION_ARCHIVE_INTERVAL_SECONDS']:
+        scheduler.register(
+            'transaction_archive',
+            archive_transactions,
+            config['TRANSACTION_ARCHIVE_INTERVAL_SECONDS'],
+            **settings
+        )
+
+    return scheduler
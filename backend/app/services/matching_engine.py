@@ -0,0 +1,271 @@
+"""
+Single-writer matching engine sharded by currency pair
+"""
+from typing import Dict, Any, Callable, List, Tuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import os
+import queue
+import threading
+import time
+import zlib
+import logging
+from app.config.config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Marks shard threads, so nested calls run inline instead of deadlocking
+_shard_context = threading.local()
+
+
+class EngineBusyError(Exception):
+    """Raised when a request was not run, as its shard was too busy"""
+
+
+class EngineTimeoutError(Exception):
+    """Raised when a request started on a shard but did not finish in time"""
+
+    def __init__(self, future: Future):
+        """
+        Initialize the error
+
+        Args:
+            future: Future of the request, resolved once it finishes
+        """
+        super().__init__('Matching request is still running')
+        self.future = future
+
+
+class MatchingShard:
+    """Worker thread that owns every currency pair hashed to it"""
+
+    def __init__(self, index: int, queue_size: int = 1000):
+        """
+        Initialize a shard
+
+        Args:
+            index: Shard number
+            queue_size: Maximum number of queued requests
+        """
+        self.index = index
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread"""
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'matching-shard-{self.index}',
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Drain queued requests, then stop the worker thread"""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def is_alive(self) -> bool:
+        """Whether the worker thread is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, fn: Callable, args: Tuple, kwargs: Dict[str, Any], timeout: float) -> Future:
+        """
+        Queue a request for this shard
+
+        Args:
+            fn: Function to run on the shard thread
+            args: Positional arguments
+            kwargs: Keyword arguments
+            timeout: Seconds to wait for room in the queue
+
+        Returns:
+            Future resolved with the function result
+        """
+        future = Future()
+        try:
+            self.queue.put((future, fn, args, kwargs), timeout=timeout)
+        except queue.Full:
+            raise EngineBusyError(f'Matching shard {self.index} queue is full')
+        return future
+
+    def _run(self):
+        """Process requests one at a time, in arrival order"""
+        _shard_context.index = self.index
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+
+            future, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = time.perf_counter()
+            try:
+                future.set_result(fn(*args, **kwargs))
+                self.processed += 1
+            except BaseException as e:
+                self.failed += 1
+                future.set_exception(e)
+            finally:
+                self.busy_seconds += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Get shard counters"""
+        return {
+            'shard': self.index,
+            'queued': self.queue.qsize(),
+            'processed': self.processed,
+            'failed': self.failed,
+            'busy_seconds': round(self.busy_seconds, 6)
+        }
+
+
+class MatchingEngine:
+    """Route order operations to the single shard that owns their pair"""
+
+    def __init__(
+        self,
+        shards: int = 4,
+        queue_size: int = 1000,
+        submit_timeout: float = 1.0,
+        request_timeout: float = 10.0
+    ):
+        """
+        Initialize the engine
+
+        Args:
+            shards: Number of shard worker threads
+            queue_size: Maximum queued requests per shard
+            submit_timeout: Seconds to wait for room in a full shard queue
+            request_timeout: Seconds to wait for a routed request to finish
+        """
+        self.shard_count = max(1, shards)
+        self.queue_size = queue_size
+        self.submit_timeout = submit_timeout
+        self.request_timeout = request_timeout
+        self._shards = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def pair_key(currency_a: str, currency_b: str) -> str:
+        """
+        Get the shard routing key of a currency pair
+
+        Both directions of a pair share a key, since orders on either side
+        match against each other.
+        """
+        return '/'.join(sorted((currency_a or '', currency_b or '')))
+
+    def shard_index(self, currency_a: str, currency_b: str) -> int:
+        """Get the index of the shard owning a currency pair"""
+        key = self.pair_key(currency_a, currency_b).encode('utf-8')
+        return zlib.crc32(key) % self.shard_count
+
+    @staticmethod
+    def on_shard() -> bool:
+        """Whether the current thread is a shard worker"""
+        return getattr(_shard_context, 'index', None) is not None
+
+    def start(self):
+        """Start the shard workers for this process"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads never survive a fork, start fresh ones in this process
+            self._shards = [
+                MatchingShard(index, self.queue_size)
+                for index in range(self.shard_count)
+            ]
+            for shard in self._shards:
+                shard.start()
+            self._pid = os.getpid()
+            logger.info(f"Matching engine started with {self.shard_count} shards")
+
+    def stop(self, timeout: float = None):
+        """Drain and stop every shard"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for shard in self._shards:
+                shard.stop(timeout)
+            self._shards = []
+            self._pid = None
+
+    def call(
+        self,
+        pair: Tuple[str, str],
+        fn: Callable,
+        *args,
+        **kwargs
+    ) -> Any:
+        """
+        Run a function on the shard owning a pair and wait for its result
+
+        Args:
+            pair: Currency codes of the pair
+            fn: Function to run
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            Result of fn
+
+        Raises:
+            EngineBusyError: If the request was not run
+            EngineTimeoutError: If the request is still running
+        """
+        if self.on_shard():
+            return fn(*args, **kwargs)
+
+        if self._pid != os.getpid():
+            self.start()
+
+        shard = self._shards[self.shard_index(*pair)]
+        future = shard.submit(fn, args, kwargs, self.submit_timeout)
+        try:
+            return future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            # A request still queued is dropped, so it can safely be retried
+            if future.cancel():
+                raise EngineBusyError(f'Matching shard {shard.index} did not start the request in time')
+            raise EngineTimeoutError(future)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Get counters for every shard"""
+        return [shard.stats() for shard in self._shards]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_matching_engine(config=None) -> MatchingEngine:
+    """
+    Get the process-wide matching engine
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared MatchingEngine instance
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                config = config or get_config()
+                _engine = MatchingEngine(
+                    shards=config.MATCHING_SHARDS,
+                    queue_size=config.MATCHING_QUEUE_SIZE,
+                    request_timeout=config.MATCHING_REQUEST_TIMEOUT_SECONDS
+                )
+    return _engine
@@ -0,0 +1,885 @@
+"""
+In-memory storage backend for tests and benchmarks
+"""
+from typing import Dict, Any, List, Optional
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+import threading
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from app.config.config import get_config
+from app.models.ledger import LedgerEntry
+from app.models.transaction_summary import TransactionSummary
+from app.services.storage_backend import StorageBackend
+
+COLLECTIONS = (
+    'users', 'wallets', 'offers', 'transactions', 'ledger', 'wallet_snapshots',
+    'idempotency_keys', 'rate_limits', 'versions', 'transaction_summaries',
+    'leases', 'job_state'
+)
+
+# Fields the secondary indexes of each collection are built from
+INDEXED_FIELDS = {
+    'users': {'email'},
+    'wallets': {'user'},
+    'offers': {'from_currency', 'to_currency', 'to_value', 'expires_at'},
+    'transactions': {'from_user', 'to_user'},
+    'ledger': {'user'},
+    'wallet_snapshots': {'user'}
+}
+
+# Idle rate limit buckets are dropped after this long, like the TTL index
+RATE_LIMIT_TTL_SECONDS = 3600
+
+_MISSING = object()
+
+
+def _store(value):
+    """Copy a value the way BSON round-trips it"""
+    if isinstance(value, dict):
+        return {key: _store(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_store(item) for item in value]
+    if isinstance(value, datetime):
+        # BSON dates are UTC with millisecond precision
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _copy(value):
+    """Copy a stored document, like a driver returning a fresh one per read"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply an inclusion or exclusion projection to a copy of a document"""
+    if not projection:
+        return _copy(document)
+    inclusion = any(value for key, value in projection.items() if key != '_id') \
+        or (len(projection) == 1 and projection.get('_id'))
+    if inclusion:
+        return {
+            key: _copy(value) for key, value in document.items()
+            if projection.get(key) or (key == '_id' and projection.get('_id', 1))
+        }
+    return {key: _copy(value) for key, value in document.items() if projection.get(key, 1)}
+
+
+def _in_range(value: Any, start: datetime, end: Optional[datetime]) -> bool:
+    """Whether a date lies in [start, end), or from start on if end is None"""
+    return isinstance(value, datetime) and value >= start and (end is None or value < end)
+
+
+def _is_live(offer: Dict[str, Any], now: datetime) -> bool:
+    """Whether an offer has no expiry or has not expired yet"""
+    expires_at = offer.get('expires_at')
+    return expires_at is None or (isinstance(expires_at, datetime) and expires_at > now)
+
+
+class MemoryStorage(StorageBackend):
+    """
+    Storage backend over dicts in process memory
+
+    Each method behaves like its DatabaseService counterpart, including
+    result ordering, and is answered from secondary indexes rather than
+    scans: users by email, wallets by user, offers by pair and to_value and
+    by expiry, transactions by participant and ledger entries by user and
+    _id. Reads return copies, so callers cannot change stored documents
+    without writing them back. A single lock makes every method atomic.
+    """
+
+    def __init__(self):
+        """Initialize empty collections"""
+        self._lock = threading.RLock()
+        self._idempotency_ttl = timedelta(seconds=get_config().IDEMPOTENCY_TTL_SECONDS)
+        self._rate_limit_ttl = timedelta(seconds=RATE_LIMIT_TTL_SECONDS)
+        self.clear()
+
+    def clear(self):
+        """Drop every document"""
+        with self._lock:
+            # Documents by _id, in insertion order like a natural-order scan
+            self._collections = {name: {} for name in COLLECTIONS}
+            # Insertion sequence per _id, kept when a document is replaced
+            self._sequences = {name: {} for name in COLLECTIONS}
+            self._next_sequence = 0
+
+            self._user_by_email = {}
+            self._wallet_by_user = {}
+            # (from_currency, to_currency) -> sorted [(-to_value, seq, _id)]
+            self._offers_by_pair = {}
+            # Sorted [(expires_at, seq, _id)] of offers with an expiry
+            self._offers_by_expiry = []
+            # email -> {_id: seq}
+            self._transactions_by_participant = {}
+            # user -> sorted [_id]
+            self._ledger_by_user = {}
+            # user -> [_id]
+            self._snapshots_by_user = {}
+
+    def count(self, collection: str) -> int:
+        """Number of documents in a collection"""
+        with self._lock:
+            return len(self._collections[collection])
+
+    def document_ids(self, collection: str) -> List[Any]:
+        """IDs of the documents in a collection, in insertion order"""
+        with self._lock:
+            return list(self._collections[collection])
+
+    # Index maintenance
+    def _index(self, collection: str, document: Dict[str, Any]):
+        """Add a stored document to the secondary indexes"""
+        document_id = document['_id']
+        seq = self._sequences[collection][document_id]
+
+        if collection == 'users':
+            if 'email' in document:
+                self._user_by_email.setdefault(document['email'], document_id)
+        elif collection == 'wallets':
+            if 'user' in document:
+                self._wallet_by_user.setdefault(document['user'], document_id)
+        elif collection == 'offers':
+            pair = (document.get('from_currency'), document.get('to_currency'))
+            insort(
+                self._offers_by_pair.setdefault(pair, []),
+                (-document.get('to_value', 0), seq, document_id)
+            )
+            if isinstance(document.get('expires_at'), datetime):
+                insort(self._offers_by_expiry, (document['expires_at'], seq, document_id))
+        elif collection == 'transactions':
+            for email in (document.get('from_user'), document.get('to_user')):
+                if email is not None:
+                    self._transactions_by_participant.setdefault(email, {})[document_id] = seq
+        elif collection == 'ledger':
+            insort(self._ledger_by_user.setdefault(document.get('user'), []), document_id)
+        elif collection == 'wallet_snapshots':
+            self._snapshots_by_user.setdefault(document.get('user'), []).append(document_id)
+
+    def _unindex(self, collection: str, document: Dict[str, Any]):
+        """Remove a stored document from the secondary indexes"""
+        document_id = document['_id']
+        seq = self._sequences[collection][document_id]
+
+        if collection == 'users':
+            if self._user_by_email.get(document.get('email')) == document_id:
+                del self._user_by_email[document['email']]
+                self._reindex_first('users', 'email', document, self._user_by_email)
+        elif collection == 'wallets':
+            if self._wallet_by_user.get(document.get('user')) == document_id:
+                del self._wallet_by_user[document['user']]
+                self._reindex_first('wallets', 'user', document, self._wallet_by_user)
+        elif collection == 'offers':
+            pair = (document.get('from_currency'), document.get('to_currency'))
+            self._remove_sorted(
+                self._offers_by_pair, pair, (-document.get('to_value', 0), seq, document_id)
+            )
+            if isinstance(document.get('expires_at'), datetime):
+                entries = self._offers_by_expiry
+                del entries[bisect_left(entries, (document['expires_at'], seq, document_id))]
+        elif collection == 'transactions':
+            for email in (document.get('from_user'), document.get('to_user')):
+                ids = self._transactions_by_participant.get(email)
+                if ids is not None:
+                    ids.pop(document_id, None)
+                    if not ids:
+                        del self._transactions_by_participant[email]
+        elif collection == 'ledger':
+            self._remove_sorted(self._ledger_by_user, document.get('user'), document_id)
+        elif collection == 'wallet_snapshots':
+            ids = self._snapshots_by_user[document.get('user')]
+            ids.remove(document_id)
+            if not ids:
+                del self._snapshots_by_user[document.get('user')]
+
+    @staticmethod
+    def _remove_sorted(index: Dict[Any, list], key: Any, entry: Any):
+        """Remove an entry from a sorted list in an index, dropping empty lists"""
+        entries = index[key]
+        del entries[bisect_left(entries, entry)]
+        if not entries:
+            del index[key]
+
+    def _reindex_first(
+        self,
+        collection: str,
+        field: str,
+        removed: Dict[str, Any],
+        index: Dict[Any, Any]
+    ):
+        """Point a lookup index at the next document sharing a removed one's value"""
+        value = removed[field]
+        for document_id, document in self._collections[collection].items():
+            if document_id != removed['_id'] and document.get(field) == value:
+                index[value] = document_id
+                return
+
+    # Document storage
+    def _insert(self, collection: str, document: Dict[str, Any]) -> Any:
+        """
+        Store a new document, setting its _id on the caller's copy like
+        insert_one does
+
+        Raises:
+            DuplicateKeyError: If a document with the same _id exists
+        """
+        document_id = document.setdefault('_id', ObjectId())
+        documents = self._collections[collection]
+        if document_id in documents:
+            raise DuplicateKeyError(f'E11000 duplicate key error collection: {collection}')
+        stored = _store(document)
+        documents[document_id] = stored
+        self._sequences[collection][document_id] = self._next_sequence
+        self._next_sequence += 1
+        self._index(collection, stored)
+        return document_id
+
+    def _replace(self, collection: str, document: Dict[str, Any]) -> bool:
+        """Store a document by _id, returning whether it replaced one"""
+        documents = self._collections[collection]
+        existing = documents.get(document['_id'])
+        if existing is None:
+            self._insert(collection, dict(document))
+            return False
+        self._unindex(collection, existing)
+        stored = _store(document)
+        documents[document['_id']] = stored
+        self._index(collection, stored)
+        return True
+
+    def _set(self, collection: str, document: Dict[str, Any], fields: Dict[str, Any]) -> bool:
+        """Apply a $set to a stored document, returning whether it changed"""
+        fields = _store(fields)
+        changed = {key for key, value in fields.items() if document.get(key, _MISSING) != value}
+        if not changed:
+            return False
+        if INDEXED_FIELDS.get(collection, set()).isdisjoint(changed):
+            document.update(fields)
+            return True
+        self._unindex(collection, document)
+        document.update(fields)
+        self._index(collection, document)
+        return True
+
+    def _delete(self, collection: str, document_id: Any) -> bool:
+        """Delete a document by _id, returning whether it existed"""
+        document = self._collections[collection].get(document_id)
+        if document is None:
+            return False
+        self._unindex(collection, document)
+        del self._collections[collection][document_id]
+        del self._sequences[collection][document_id]
+        return True
+
+    # User operations
+    def get_user_by_email(
+        self,
+        email: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get user by email, optionally limited to a projection"""
+        with self._lock:
+            user_id = self._user_by_email.get(email)
+            if user_id is None:
+                return None
+            return _project(self._collections['users'][user_id], projection)
+
+    def get_user_by_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get user by ID, optionally limited to a projection"""
+        user_id = ObjectId(user_id)
+        with self._lock:
+            user = self._collections['users'].get(user_id)
+            return _project(user, projection) if user is not None else None
+
+    def get_user_ids_by_email(self, emails: List[str]) -> Dict[str, str]:
+        """Map user emails to user IDs"""
+        with self._lock:
+            return {
+                email: str(self._user_by_email[email])
+                for email in emails
+                if email in self._user_by_email
+            }
+
+    def create_user(self, user_data: Dict[str, Any]) -> str:
+        """Create a new user"""
+        with self._lock:
+            return str(self._insert('users', user_data))
+
+    # Wallet operations
+    def _wallet(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Stored wallet of a user"""
+        wallet_id = self._wallet_by_user.get(user_id)
+        return self._collections['wallets'][wallet_id] if wallet_id is not None else None
+
+    def get_wallet_by_user_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get wallet by user ID, optionally limited to a projection"""
+        with self._lock:
+            wallet = self._wallet(user_id)
+            return _project(wallet, projection) if wallet is not None else None
+
+    def create_wallet(self, wallet_data: Dict[str, Any]) -> str:
+        """Create a new wallet"""
+        with self._lock:
+            return str(self._insert('wallets', wallet_data))
+
+    def update_wallet(self, user_id: str, wallet_data: Dict[str, Any]) -> bool:
+        """Update a wallet, returning whether anything changed"""
+        with self._lock:
+            wallet = self._wallet(user_id)
+            return wallet is not None and self._set('wallets', wallet, wallet_data)
+
+    def update_wallets(self, wallets: Dict[str, Dict[str, Any]]) -> int:
+        """Update several wallets, returning the number matched"""
+        matched = 0
+        with self._lock:
+            for user_id, wallet_data in wallets.items():
+                wallet = self._wallet(user_id)
+                if wallet is not None:
+                    self._set('wallets', wallet, wallet_data)
+                    matched += 1
+        return matched
+
+    def increment_wallet_balances(self, increments: Dict[str, Dict[str, float]]) -> int:
+        """Add amounts to several wallets, returning the number modified"""
+        modified = 0
+        with self._lock:
+            for user_id, amounts in increments.items():
+                wallet = self._wallet(user_id)
+                if wallet is None:
+                    continue
+                changed = False
+                for currency in wallet.get('currencies', []):
+                    amount = amounts.get(currency.get('currency'))
+                    if amount:
+                        currency['value'] += amount
+                        changed = True
+                modified += changed
+        return modified
+
+    # Offer operations
+    def get_offer_by_id(
+        self,
+        offer_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get offer by ID, optionally limited to a projection"""
+        offer_id = ObjectId(offer_id)
+        with self._lock:
+            offer = self._collections['offers'].get(offer_id)
+            return _project(offer, projection) if offer is not None else None
+
+    def get_all_offers(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all offers that have not expired"""
+        now = datetime.utcnow()
+        with self._lock:
+            return [
+                _project(offer, projection)
+                for offer in self._collections['offers'].values()
+                if _is_live(offer, now)
+            ]
+
+    def get_next_offer_expiry(self, after: datetime) -> Optional[datetime]:
+        """Get the earliest expiry of the offers still live after a time"""
+        with self._lock:
+            entries = self._offers_by_expiry
+            index = bisect_right(entries, (after, float('inf')))
+            return entries[index][0] if index < len(entries) else None
+
+    def get_book_offers(self) -> List[Dict[str, Any]]:
+        """Get every stored offer, including expired ones awaiting a sweep"""
+        with self._lock:
+            return [_copy(offer) for offer in self._collections['offers'].values()]
+
+    def create_offer(self, offer_data: Dict[str, Any]) -> str:
+        """Create a new offer"""
+        with self._lock:
+            return str(self._insert('offers', offer_data))
+
+    def delete_offer(self, offer_id: str) -> bool:
+        """Delete an offer"""
+        offer_id = ObjectId(offer_id)
+        with self._lock:
+            return self._delete('offers', offer_id)
+
+    def delete_offers(self, offer_ids: List[Any]) -> int:
+        """Delete several offers by ID"""
+        with self._lock:
+            return sum(self._delete('offers', offer_id) for offer_id in set(offer_ids))
+
+    def claim_expired_offers(
+        self,
+        now: datetime,
+        limit: int,
+        claim: str,
+        lease_seconds: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Claim a batch of expired offers so only one sweeper refunds them
+
+        Args:
+            now: Reference time in UTC
+            limit: Maximum number of offers to claim
+            claim: Unique token for this sweep
+            lease_seconds: Seconds before another sweep may take over a claim
+
+        Returns:
+            List of claimed offers
+        """
+        stale_before = now - timedelta(seconds=lease_seconds)
+        with self._lock:
+            offers = self._collections['offers']
+            claimed = []
+            for expires_at, seq, offer_id in self._offers_by_expiry:
+                if expires_at > now or len(claimed) >= limit:
+                    break
+                claimed_at = offers[offer_id].get('expiry_claimed_at')
+                if claimed_at is None or claimed_at <= stale_before:
+                    claimed.append((seq, offer_id))
+            for _, offer_id in claimed:
+                offers[offer_id]['expiry_claim'] = claim
+                offers[offer_id]['expiry_claimed_at'] = now
+            # Read back in natural order, as the driver's follow-up find does
+            return [_copy(offers[offer_id]) for _, offer_id in sorted(claimed)]
+
+    def set_expiry_claim(self, offer_ids: List[Any], claim: str, claimed_at: datetime) -> int:
+        """Mark offers as claimed by an expiry sweep"""
+        matched = 0
+        with self._lock:
+            offers = self._collections['offers']
+            for offer_id in set(offer_ids):
+                if offer_id in offers:
+                    offers[offer_id]['expiry_claim'] = claim
+                    offers[offer_id]['expiry_claimed_at'] = claimed_at
+                    matched += 1
+        return matched
+
+    def find_matching_offers(
+        self,
+        to_currency: str,
+        from_currency: str,
+        from_value: float,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find live offers giving to_currency for from_currency whose to_value
+        is at most from_value
+
+        Offers come largest to_value first, and in insertion order among
+        equal values, as MongoDB returns them from a sorted natural scan.
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            offers = self._collections['offers']
+            entries = self._offers_by_pair.get((to_currency, from_currency), [])
+            start = bisect_left(entries, (-from_value,))
+            return [
+                _project(offers[offer_id], projection)
+                for _, _, offer_id in entries[start:]
+                if _is_live(offers[offer_id], now)
+            ]
+
+    # Transaction operations
+    def create_transaction(self, transaction_data: Dict[str, Any]) -> str:
+        """Create a new transaction and update both parties' summaries"""
+        with self._lock:
+            transaction_id = self._insert('transactions', transaction_data)
+            self.record_transaction_summaries([transaction_data])
+            return str(transaction_id)
+
+    def get_all_transactions(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all transactions, optionally limited to a projection"""
+        with self._lock:
+            return [
+                _project(transaction, projection)
+                for transaction in self._collections['transactions'].values()
+            ]
+
+    def get_user_transactions(
+        self,
+        email: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get transactions for a specific user"""
+        with self._lock:
+            transactions = self._collections['transactions']
+            ids = self._transactions_by_participant.get(email, {})
+            return [
+                _project(transactions[transaction_id], projection)
+                for transaction_id in sorted(ids, key=ids.get)
+            ]
+
+    def get_transactions_before(self, before: datetime, limit: int) -> List[Dict[str, Any]]:
+        """Get up to limit transactions dated before a time, oldest first"""
+        with self._lock:
+            older = sorted(
+                (
+                    transaction for transaction in self._collections['transactions'].values()
+                    if isinstance(transaction.get('date'), datetime) and transaction['date'] < before
+                ),
+                key=lambda transaction: (transaction['date'], transaction['_id'])
+            )
+            return [_copy(transaction) for transaction in older[:limit]]
+
+    def delete_transactions(self, transaction_ids: List[Any]) -> int:
+        """Delete several transactions by ID"""
+        with self._lock:
+            return sum(
+                self._delete('transactions', transaction_id)
+                for transaction_id in set(transaction_ids)
+            )
+
+    # Transaction summary operations
+    def record_transaction_summaries(self, transactions: List[Dict[str, Any]]):
+        """Apply transactions to their parties' summaries, once per transaction"""
+        config = get_config()
+        with self._lock:
+            summaries = self._collections['transaction_summaries']
+            for transaction in transactions:
+                for email in TransactionSummary.parties(transaction):
+                    summary = summaries.get(email)
+                    if summary is None:
+                        summary = {'_id': email}
+                    elif transaction['_id'] in summary.get('applied_ids', []):
+                        continue
+                    self._replace(
+                        'transaction_summaries',
+                        TransactionSummary.apply(
+                            _copy(summary),
+                            transaction,
+                            email,
+                            config.TRANSACTION_SUMMARY_TRADES,
+                            config.TRANSACTION_SUMMARY_APPLIED_IDS
+                        )
+                    )
+
+    def get_transaction_summary(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get a user's transaction summary"""
+        with self._lock:
+            summary = self._collections['transaction_summaries'].get(email)
+            return _copy(summary) if summary is not None else None
+
+    # Report operations, computed by scanning the collection like the
+    # MongoDB pipelines scan a date range
+    def _transactions_between(self, start: datetime, end: Optional[datetime]) -> List[Dict[str, Any]]:
+        """Transactions dated in a range, caller holds the lock"""
+        return [
+            transaction for transaction in self._collections['transactions'].values()
+            if _in_range(transaction.get('date'), start, end)
+        ]
+
+    def get_pair_volume_by_day(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """Get the trade count and volume per UTC day and currency pair"""
+        groups = {}
+        with self._lock:
+            for transaction in self._transactions_between(start, end):
+                key = (
+                    transaction['date'].strftime('%Y-%m-%d'),
+                    transaction['from_currency'],
+                    transaction['to_currency']
+                )
+                group = groups.setdefault(key, {'trades': 0, 'from_volume': 0, 'to_volume': 0})
+                group['trades'] += 1
+                group['from_volume'] += transaction['from_value']
+                group['to_volume'] += transaction['to_value']
+        return [
+            {'day': day, 'from_currency': from_currency, 'to_currency': to_currency, **group}
+            for (day, from_currency, to_currency), group in sorted(groups.items())
+        ]
+
+    def get_top_traders(
+        self,
+        start: datetime,
+        end: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Get the users with the most trades, with the volume each sent per currency"""
+        traders = {}
+        with self._lock:
+            for transaction in self._transactions_between(start, end):
+                # One leg per party, as in the MongoDB pipeline
+                for user, currency, value in (
+                    (transaction['from_user'], transaction['from_currency'], transaction['from_value']),
+                    (transaction['to_user'], transaction['to_currency'], transaction['to_value'])
+                ):
+                    trader = traders.setdefault(user, {'trades': 0, 'sent': {}})
+                    trader['trades'] += 1
+                    trader['sent'][currency] = trader['sent'].get(currency, 0) + value
+        ranked = sorted(traders.items(), key=lambda item: (-item[1]['trades'], item[0]))
+        return [{'email': email, **trader} for email, trader in ranked[:limit]]
+
+    def get_pair_rates(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """Get the average, volume-weighted, min and max rate per currency pair"""
+        pairs = {}
+        with self._lock:
+            for transaction in self._transactions_between(start, end):
+                key = (transaction['from_currency'], transaction['to_currency'])
+                pairs.setdefault(key, []).append(
+                    (transaction['from_value'], transaction['to_value'])
+                )
+        rows = []
+        for (from_currency, to_currency), values in sorted(pairs.items()):
+            rates = [to_value / from_value for from_value, to_value in values]
+            rows.append({
+                'from_currency': from_currency,
+                'to_currency': to_currency,
+                'trades': len(values),
+                'avg_rate': sum(rates) / len(rates),
+                'weighted_rate': sum(to_value for _, to_value in values)
+                / sum(from_value for from_value, _ in values),
+                'min_rate': min(rates),
+                'max_rate': max(rates)
+            })
+        return rows
+
+    def get_offer_outcomes(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> Dict[str, int]:
+        """Count the offers posted, filled and cancelled, from the ledger"""
+        offers = {
+            LedgerEntry.OFFER_LOCK: set(),
+            LedgerEntry.TRADE: set(),
+            LedgerEntry.OFFER_CANCEL: set()
+        }
+        with self._lock:
+            for entry in self._collections['ledger'].values():
+                if entry.get('reason') in offers and 'ref' in entry \
+                        and _in_range(entry.get('date'), start, end):
+                    offers[entry['reason']].add(entry['ref'])
+        return {
+            'posted': len(offers[LedgerEntry.OFFER_LOCK]),
+            'filled': len(offers[LedgerEntry.TRADE]),
+            'cancelled': len(offers[LedgerEntry.OFFER_CANCEL])
+        }
+
+    # Ledger operations
+    def append_ledger_entries(self, entries: List[Dict[str, Any]]) -> List[str]:
+        """Append balance change entries to the ledger"""
+        with self._lock:
+            return [str(self._insert('ledger', entry)) for entry in entries]
+
+    def get_ledger_entries(self, user_id: str, since_id: Any = None) -> List[Dict[str, Any]]:
+        """Get a wallet's ledger entries in insertion order, from since_id on"""
+        with self._lock:
+            ledger = self._collections['ledger']
+            entry_ids = self._ledger_by_user.get(user_id, [])
+            start = bisect_left(entry_ids, since_id) if since_id is not None else 0
+            return [_copy(ledger[entry_id]) for entry_id in entry_ids[start:]]
+
+    def get_latest_wallet_snapshot(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the most recent balance snapshot of a wallet"""
+        with self._lock:
+            snapshots = self._collections['wallet_snapshots']
+            snapshot_ids = self._snapshots_by_user.get(user_id)
+            if not snapshot_ids:
+                return None
+            latest = max(snapshot_ids, key=lambda snapshot_id: snapshots[snapshot_id]['cutoff'])
+            return _copy(snapshots[latest])
+
+    def create_wallet_snapshot(self, snapshot_data: Dict[str, Any]) -> str:
+        """Store a wallet balance snapshot"""
+        with self._lock:
+            return str(self._insert('wallet_snapshots', snapshot_data))
+
+    def get_ledger_user_ids(self, since_id: Any = None) -> List[str]:
+        """Get the IDs of the wallets with ledger entries, from since_id on"""
+        with self._lock:
+            return [
+                user_id for user_id, entry_ids in self._ledger_by_user.items()
+                if since_id is None or entry_ids[-1] >= since_id
+            ]
+
+    def get_ledger_snapshot_watermark(self) -> Optional[Any]:
+        """Get the ledger entry ID the last snapshot run covered wallets up to"""
+        with self._lock:
+            state = self._collections['job_state'].get('ledger_snapshots')
+            return state['watermark'] if state else None
+
+    def set_ledger_snapshot_watermark(self, watermark: Any):
+        """Store the ledger entry ID a snapshot run covered wallets up to"""
+        with self._lock:
+            self._replace('job_state', {'_id': 'ledger_snapshots', 'watermark': watermark})
+
+    # Idempotency key operations
+    def _idempotency_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Stored idempotency record, dropped once its TTL has passed"""
+        record = self._collections['idempotency_keys'].get(record_id)
+        if record is not None and isinstance(record.get('created_at'), datetime) \
+                and record['created_at'] + self._idempotency_ttl < datetime.utcnow():
+            self._delete('idempotency_keys', record_id)
+            return None
+        return record
+
+    def reserve_idempotency_key(self, record: Dict[str, Any]) -> bool:
+        """Store a pending idempotency record unless one already exists"""
+        with self._lock:
+            if self._idempotency_record(record.get('_id')) is not None:
+                return False
+            self._insert('idempotency_keys', record)
+            return True
+
+    def get_idempotency_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get an idempotency record by ID"""
+        with self._lock:
+            record = self._idempotency_record(record_id)
+            return _copy(record) if record is not None else None
+
+    def take_over_idempotency_key(
+        self,
+        record_id: str,
+        stale_before: datetime,
+        now: datetime
+    ) -> bool:
+        """Claim a pending idempotency record abandoned before stale_before"""
+        with self._lock:
+            record = self._idempotency_record(record_id)
+            if record is None or record.get('status') != 'pending' \
+                    or not record.get('created_at', stale_before) < stale_before:
+                return False
+            return self._set('idempotency_keys', record, {'created_at': now})
+
+    def complete_idempotency_key(self, record_id: str, response: Dict[str, Any]) -> bool:
+        """Store the response of a finished request"""
+        with self._lock:
+            record = self._idempotency_record(record_id)
+            return record is not None and self._set(
+                'idempotency_keys', record, {'status': 'done', **response}
+            )
+
+    def delete_idempotency_key(self, record_id: str) -> bool:
+        """Forget an idempotency record so the request can be retried"""
+        with self._lock:
+            return self._idempotency_record(record_id) is not None \
+                and self._delete('idempotency_keys', record_id)
+
+    # Rate limit operations
+    def consume_rate_limit_tokens(
+        self,
+        key: str,
+        rate: float,
+        burst: float,
+        cost: float,
+        now: datetime
+    ) -> Dict[str, Any]:
+        """
+        Refill a token bucket and take tokens from it in one atomic update
+
+        Args:
+            key: Bucket key
+            rate: Tokens added per second
+            burst: Bucket capacity
+            cost: Tokens to take
+            now: Current time in UTC
+
+        Returns:
+            Bucket with the remaining tokens and whether the request is allowed
+        """
+        now = _store(now)
+        with self._lock:
+            buckets = self._collections['rate_limits']
+            bucket = buckets.get(key)
+            if bucket is not None and bucket['updated'] + self._rate_limit_ttl < now:
+                self._delete('rate_limits', key)
+                bucket = None
+            if bucket is None:
+                tokens = burst
+            else:
+                elapsed_seconds = (now - bucket['updated']) / timedelta(milliseconds=1) / 1000
+                tokens = min(burst, bucket['tokens'] + elapsed_seconds * rate)
+            allowed = tokens >= cost
+            self._replace('rate_limits', {
+                '_id': key,
+                'tokens': tokens - cost if allowed else tokens,
+                'updated': now,
+                'allowed': allowed
+            })
+            return _copy(buckets[key])
+
+    # Version operations
+    def bump_versions(self, keys: List[str]) -> int:
+        """Increment several listing versions"""
+        with self._lock:
+            versions = self._collections['versions']
+            for key in keys:
+                if key in versions:
+                    versions[key]['value'] += 1
+                else:
+                    self._insert('versions', {'_id': key, 'value': 1})
+        return len(keys)
+
+    def get_version(self, key: str) -> int:
+        """Get a listing version, 0 if it never changed"""
+        with self._lock:
+            version = self._collections['versions'].get(key)
+            return version['value'] if version is not None else 0
+
+    # Lease operations
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease, unless another owner holds it unexpired"""
+        now = datetime.utcnow()
+        with self._lock:
+            lease = self._collections['leases'].get(name)
+            if lease is not None and lease['owner'] != owner and lease['expires_at'] > now:
+                return False
+            self._replace('leases', {
+                '_id': name,
+                'owner': owner,
+                'expires_at': now + timedelta(seconds=ttl_seconds)
+            })
+            return True
+
+    def release_lease(self, name: str, owner: str) -> bool:
+        """Give up a lease the owner holds"""
+        with self._lock:
+            lease = self._collections['leases'].get(name)
+            if lease is None or lease['owner'] != owner:
+                return False
+            return self._delete('leases', name)
+
+    # Replay operations
+    def upsert_documents(self, collection: str, documents: List[Dict[str, Any]]) -> int:
+        """
+        Store documents by _id, replacing any earlier copy
+
+        Args:
+            collection: Collection name
+            documents: Documents with an _id
+
+        Returns:
+            Number of documents inserted or replaced
+        """
+        if collection not in self._collections:
+            raise AttributeError(f"'{type(self).__name__}' has no collection '{collection}'")
+        with self._lock:
+            for document in documents:
+                self._replace(collection, document)
+        return len(documents)
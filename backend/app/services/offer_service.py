@@ -1,22 +1,215 @@
 """
 Offer service for business logic related to offers
 """
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable, Iterable
+from concurrent.futures import Future
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
 import logging
+import threading
+import uuid
+import zlib
+from app.config.config import get_config
+from app.models.ledger import LedgerEntry
 from app.models.offer import Offer
 from app.models.transaction import Transaction
 from app.models.wallet import Wallet
-from app.services.database import DatabaseService
+from app.services.database import (
+    DatabaseService,
+    USER_IDENTITY_PROJECTION,
+    WALLET_BALANCES_PROJECTION
+)
+from app.services.book_depth import BookDepth, get_book_depth
+from app.services.journaled_store import get_journaled_store
+from app.services.ledger_service import LedgerService
+from app.services.persistence_pipeline import get_persistence_pipeline
+from app.services.version_service import (
+    VersionService,
+    get_version_service,
+    BOOK_VERSION,
+    TRANSACTIONS_VERSION,
+    user_transactions_version
+)
+from app.services.matching_engine import (
+    MatchingEngine,
+    EngineBusyError,
+    EngineTimeoutError,
+    get_matching_engine
+)
 
 logger = logging.getLogger(__name__)
 
+# Wallet updates are serialized per user through a fixed set of locks
+WALLET_LOCK_STRIPES = 64
+
 
 class OfferService:
     """Service for offer-related operations"""
     
-    def __init__(self):
-        """Initialize with a database service"""
-        self.db = DatabaseService()
+    def __init__(self, engine: MatchingEngine = None, db: DatabaseService = None):
+        """
+        Initialize with a database service
+        
+        Args:
+            engine: Matching engine to route order operations through
+                (defaults to the shared one in sharded modes, else inline)
+            db: Database to use instead of the configured one, with its own
+                listing versions and book depth (for benchmarks)
+        """
+        config = get_config()
+        mode = config.MATCHING_ENGINE_MODE
+        
+        self.db = db or DatabaseService()
+        self.claim_lease_seconds = config.OFFER_SWEEP_CLAIM_LEASE_SECONDS
+        # Past this, a retry with the same Idempotency-Key runs anyway, so
+        # an operation still settling is no longer waited for
+        self.settle_timeout = config.IDEMPOTENCY_LOCK_SECONDS
+        self._wallet_locks = [threading.Lock() for _ in range(WALLET_LOCK_STRIPES)]
+        # Offers and wallets live in memory, changes are acknowledged once
+        # they are in the local journal
+        self.store = get_journaled_store() if db is None and mode == 'journaled' else None
+        if self.store is not None:
+            self.db = self.store
+        elif db is None and config.PERSISTENCE_MODE == 'async':
+            self.db = get_persistence_pipeline()
+        self.ledger = LedgerService(self.db)
+        if db is None:
+            self.versions = get_version_service()
+            self.depth = get_book_depth()
+        else:
+            self.versions = VersionService(self.db, shared=False)
+            self.depth = BookDepth(self.db, self.versions)
+        
+        if engine is None and mode in ('sharded', 'journaled'):
+            engine = get_matching_engine()
+        self.engine = engine
+    
+    def _route(self, pair: Optional[Tuple[str, str]], fn: Callable, **kwargs) -> Dict[str, Any]:
+        """
+        Run an order operation on the shard owning its currency pair
+        
+        Operations on one pair are serialized on a single worker, so two
+        requests can never fill the same resting offer. Without an engine,
+        or without a known pair, the operation runs in the calling thread.
+        
+        Args:
+            pair: Currency codes of the pair, or None
+            fn: Operation to run
+            **kwargs: Operation arguments
+            
+        Returns:
+            Operation result. Only an operation that was not run is
+            retryable; one that outlived the wait is still pending, with a
+            future of its acknowledged result.
+        """
+        try:
+            if self.engine is None or pair is None:
+                result = fn(**kwargs)
+            else:
+                result = self.engine.call(pair, fn, **kwargs)
+        except EngineBusyError as e:
+            logger.warning(f"Rejecting order operation: {str(e)}")
+            return {
+                'success': False,
+                'message': 'Matching engine busy, please retry',
+                'retryable': True
+            }
+        except EngineTimeoutError as e:
+            logger.error(f"Order operation on {pair} timed out")
+            return self._pending(lambda: e.future.result(timeout=self.settle_timeout))
+            
+        return self._acknowledge(result)
+    
+    def _acknowledge(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Hold a result until the changes behind it are in the journal
+        
+        Args:
+            result: Operation result
+            
+        Returns:
+            The result, or a pending result if the journal did not catch
+            up in time
+        """
+        if self.store is None:
+            return result
+            
+        # Waiting for the latest record also covers this operation's records
+        if not self.store.wait_durable(self.store.last_seq):
+            logger.error("Timed out waiting for the order journal")
+            return self._pending(lambda: result)
+        return result
+    
+    def _pending(self, outcome: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Result of an operation that ran, or is running, but is not yet
+        acknowledged
+        
+        The operation must not be run again, so the result is not
+        retryable: it carries a future resolved on a background thread
+        once the operation has finished and its changes are durable.
+        
+        Args:
+            outcome: Waits for and returns the operation result
+            
+        Returns:
+            Dict with status, message and the pending future
+        """
+        pending = Future()
+        
+        def settle():
+            try:
+                result = outcome()
+                if self.store is not None and \
+                        not self.store.wait_durable(self.store.last_seq, self.settle_timeout):
+                    raise TimeoutError('Order journal did not catch up')
+                pending.set_result(result)
+            except BaseException as e:
+                logger.error(f"Order operation did not settle: {str(e)}")
+                pending.set_exception(e)
+                
+        threading.Thread(target=settle, name='order-settle', daemon=True).start()
+        return {
+            'success': False,
+            'message': 'Request accepted, still being processed',
+            'pending': pending
+        }
+    
+    @contextmanager
+    def _wallets_locked(self, user_ids: Iterable[str]):
+        """
+        Hold the wallet locks of several users
+        
+        Shards serialize by currency pair only, so a user trading on two
+        pairs at once has their wallet read and written from two threads.
+        Every read-modify-write of a wallet runs under its user's lock.
+        A section locks one user at a time; sections locking several take
+        their locks in a fixed order, so they cannot deadlock.
+        
+        Args:
+            user_ids: IDs of the users whose wallets are updated
+        """
+        stripes = sorted({zlib.crc32(user_id.encode()) % WALLET_LOCK_STRIPES for user_id in user_ids})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._wallet_locks[stripe])
+            yield
+    
+    def _get_offer_pair(self, offer_id: str) -> Optional[Tuple[str, str]]:
+        """Look up the currency pair of an offer for routing"""
+        if self.engine is None:
+            return None
+        try:
+            offer = self.db.get_offer_by_id(
+                offer_id,
+                projection={'from_currency': 1, 'to_currency': 1}
+            )
+        except Exception:
+            # Invalid IDs are reported by the operation itself
+            return None
+        if not offer:
+            return None
+        return (offer['from_currency'], offer['to_currency'])
     
     def create_offer(
         self,
@@ -24,7 +217,8 @@ class OfferService:
         from_value: float,
         from_currency: str,
         to_value: float,
-        to_currency: str
+        to_currency: str,
+        expires_at: datetime = None
     ) -> Dict[str, Any]:
         """
         Create a new offer and handle automatic matching
@@ -35,6 +229,41 @@ class OfferService:
             from_currency: Currency code offered
             to_value: Amount of currency requested
             to_currency: Currency code requested
+            expires_at: Expiry time in UTC (optional, good-till-cancelled if None)
+            
+        Returns:
+            Dict with status and message
+        """
+        return self._route(
+            (from_currency, to_currency),
+            self._create_offer,
+            from_user_email=from_user_email,
+            from_value=from_value,
+            from_currency=from_currency,
+            to_value=to_value,
+            to_currency=to_currency,
+            expires_at=expires_at
+        )
+    
+    def _create_offer(
+        self,
+        from_user_email: str,
+        from_value: float,
+        from_currency: str,
+        to_value: float,
+        to_currency: str,
+        expires_at: datetime = None
+    ) -> Dict[str, Any]:
+        """
+        Create a new offer and handle automatic matching
+        
+        Args:
+            from_user_email: Email of user creating the offer
+            from_value: Amount of currency offered
+            from_currency: Currency code offered
+            to_value: Amount of currency requested
+            to_currency: Currency code requested
+            expires_at: Expiry time in UTC (optional, good-till-cancelled if None)
             
         Returns:
             Dict with status and message
@@ -44,7 +273,8 @@ class OfferService:
             from_value=from_value,
             from_currency=from_currency,
             to_value=to_value,
-            to_currency=to_currency
+            to_currency=to_currency,
+            expires_at=expires_at
         )
         
         if not validation['is_valid']:
@@ -55,35 +285,49 @@ class OfferService:
             }
         
         # Find user 
-        from_user = self.db.get_user_by_email(from_user_email)
+        from_user = self.db.get_user_by_email(
+            from_user_email,
+            projection=USER_IDENTITY_PROJECTION
+        )
         if not from_user:
             return {
                 'success': False,
                 'message': 'User not found'
             }
         
-        # Get user wallet
-        from_user_wallet_data = self.db.get_wallet_by_user_id(str(from_user['_id']))
-        if not from_user_wallet_data:
-            return {
-                'success': False,
-                'message': 'Wallet not found'
-            }
-        
-        # Check if user has enough balance
-        has_enough = False
-        for currency in from_user_wallet_data['currencies']:
-            if currency['currency'] == from_currency and currency['value'] >= from_value:
-                has_enough = True
-                # Deduct the offered value
-                currency['value'] -= from_value
-                break
-                
-        if not has_enough:
-            return {
-                'success': False,
-                'message': f'Not enough {from_currency} in wallet'
-            }
+        with self._wallets_locked([str(from_user['_id'])]):
+            # Get user wallet
+            from_user_wallet_data = self.db.get_wallet_by_user_id(
+                str(from_user['_id']),
+                projection=WALLET_BALANCES_PROJECTION
+            )
+            if not from_user_wallet_data:
+                return {
+                    'success': False,
+                    'message': 'Wallet not found'
+                }
+            
+            # Check if user has enough balance
+            has_enough = False
+            for currency in from_user_wallet_data['currencies']:
+                if currency['currency'] == from_currency and currency['value'] >= from_value:
+                    has_enough = True
+                    # Deduct the offered value
+                    currency['value'] -= from_value
+                    break
+                    
+            if not has_enough:
+                return {
+                    'success': False,
+                    'message': f'Not enough {from_currency} in wallet'
+                }
+            
+            # Lock the offered funds before matching, which may update
+            # other wallets
+            self.db.update_wallet(
+                user_id=str(from_user['_id']),
+                wallet_data=from_user_wallet_data
+            )
         
         # Find matching offers
         matching_offers = self.db.find_matching_offers(
@@ -96,17 +340,16 @@ class OfferService:
         result = self._match_with_existing_offers(
             matching_offers=matching_offers,
             from_user=from_user,
-            from_user_wallet_data=from_user_wallet_data,
             from_currency=from_currency,
             to_currency=to_currency,
             to_value=to_value
         )
         
         if result['matched']:
-            # Update wallet
-            self.db.update_wallet(
+            self.ledger.record(
                 user_id=str(from_user['_id']),
-                wallet_data=from_user_wallet_data
+                deltas={from_currency: -from_value},
+                reason=LedgerEntry.TRADE
             )
             return {
                 'success': True,
@@ -119,19 +362,24 @@ class OfferService:
             from_value=from_value,
             from_currency=from_currency,
             to_value=to_value,
-            to_currency=to_currency
+            to_currency=to_currency,
+            expires_at=expires_at
         )
         
         try:
-            # Update wallet to reflect locked funds
-            self.db.update_wallet(
+            # Create the offer
+            offer_data = offer.to_dict()
+            offer_id = self.db.create_offer(offer_data)
+            self.depth.add(offer_id, offer_data)
+            self._bump_versions(BOOK_VERSION)
+            
+            self.ledger.record(
                 user_id=str(from_user['_id']),
-                wallet_data=from_user_wallet_data
+                deltas={from_currency: -from_value},
+                reason=LedgerEntry.OFFER_LOCK,
+                reference=offer_id
             )
             
-            # Create the offer
-            self.db.create_offer(offer.to_dict())
-            
             return {
                 'success': True,
                 'message': 'Offer added successfully'
@@ -147,7 +395,6 @@ class OfferService:
         self,
         matching_offers: List[Dict[str, Any]],
         from_user: Dict[str, Any],
-        from_user_wallet_data: Dict[str, Any],
         from_currency: str,
         to_currency: str,
         to_value: float
@@ -158,7 +405,6 @@ class OfferService:
         Args:
             matching_offers: List of potentially matching offers
             from_user: User creating the offer
-            from_user_wallet_data: User's wallet data
             from_currency: Currency code offered
             to_currency: Currency code requested
             to_value: Amount of currency requested
@@ -171,9 +417,14 @@ class OfferService:
             
         total_to_value = 0
         offers_to_use = []
+        now = datetime.utcnow()
         
         # Find combination of offers that matches or is more beneficial
         for offer in matching_offers:
+            # Stale liquidity never matches, even before the sweeper runs
+            if Offer.is_expired_record(offer, now):
+                continue
+                
             offers_to_use.append(offer)
             total_to_value += offer['to_value']
             
@@ -188,43 +439,53 @@ class OfferService:
         
         for offer in offers_to_use:
             to_user_email = offer['from_user']
-            to_user = self.db.get_user_by_email(to_user_email)
+            to_user = self.db.get_user_by_email(
+                to_user_email,
+                projection=USER_IDENTITY_PROJECTION
+            )
             
             if not to_user:
                 continue
                 
-            to_user_wallet_data = self.db.get_wallet_by_user_id(str(to_user['_id']))
-            if not to_user_wallet_data:
-                continue
+            with self._wallets_locked([str(to_user['_id'])]):
+                to_user_wallet_data = self.db.get_wallet_by_user_id(
+                    str(to_user['_id']),
+                    projection=WALLET_BALANCES_PROJECTION
+                )
+                if not to_user_wallet_data:
+                    continue
+                    
+                to_wallet = Wallet(
+                    user_id=str(to_user['_id']),
+                    currencies=to_user_wallet_data['currencies']
+                )
                 
-            # Add/subtract values to wallets
-            from_wallet = Wallet(
-                user_id=str(from_user['_id']),
-                currencies=from_user_wallet_data['currencies']
-            )
-            
-            to_wallet = Wallet(
-                user_id=str(to_user['_id']),
-                currencies=to_user_wallet_data['currencies']
-            )
-            
-            # Update wallets
-            to_wallet.update_currency_balance(
-                currency_code=to_currency,
-                amount=offer['to_value'],
-                operation='add'
-            )
-            
-            to_wallet.update_currency_balance(
-                currency_code=from_currency,
-                amount=offer['from_value'],
-                operation='subtract'
-            )
-            
-            # Update wallets in database
-            self.db.update_wallet(
+                # Update wallets
+                to_wallet.update_currency_balance(
+                    currency_code=to_currency,
+                    amount=offer['to_value'],
+                    operation='add'
+                )
+                deltas = {to_currency: offer['to_value']}
+                
+                if to_wallet.update_currency_balance(
+                    currency_code=from_currency,
+                    amount=offer['from_value'],
+                    operation='subtract'
+                ):
+                    deltas[from_currency] = -offer['from_value']
+                
+                # Update wallets in database
+                self.db.update_wallet(
+                    user_id=str(to_user['_id']),
+                    wallet_data=to_wallet.to_dict()
+                )
+                
+            self.ledger.record(
                 user_id=str(to_user['_id']),
-                wallet_data=to_wallet.to_dict()
+                deltas=deltas,
+                reason=LedgerEntry.TRADE,
+                reference=str(offer['_id'])
             )
             
             # Create transaction
@@ -238,12 +499,94 @@ class OfferService:
             
             # Remove the matched offer
             self.db.delete_offer(str(offer['_id']))
+            self.depth.remove(offer['_id'])
+            self._bump_trade_versions(offer['from_user'], from_user['email'])
         
         return {
             'matched': True,
             'transactions': transactions_created
         }
     
+    def expire_offers(self, batch_size: int = 500, now: datetime = None) -> int:
+        """
+        Remove one batch of expired offers and refund the locked funds
+        
+        Refunds are aggregated per wallet and currency, so a batch costs
+        one bulk wallet update however many offers a user had expire.
+        
+        Args:
+            batch_size: Maximum number of offers to expire
+            now: Reference time in UTC (defaults to now)
+            
+        Returns:
+            Number of offers expired
+        """
+        now = now or datetime.utcnow()
+        expired = self.db.claim_expired_offers(
+            now=now,
+            limit=batch_size,
+            claim=uuid.uuid4().hex,
+            lease_seconds=self.claim_lease_seconds
+        )
+        
+        if not expired:
+            return 0
+            
+        # Aggregate refunds per owner and currency
+        refunds_by_email = {}
+        for offer in expired:
+            amounts = refunds_by_email.setdefault(offer['from_user'], {})
+            currency = offer['from_currency']
+            amounts[currency] = amounts.get(currency, 0.0) + offer['from_value']
+            
+        user_ids = self.db.get_user_ids_by_email(list(refunds_by_email))
+        
+        refunds = {}
+        for email, amounts in refunds_by_email.items():
+            user_id = user_ids.get(email)
+            if not user_id:
+                logger.warning(f"Cannot refund expired offers, user not found: {email}")
+                continue
+            refunds[user_id] = amounts
+            
+        # A $inc landing between a shard's wallet read and write would be lost
+        with self._wallets_locked(refunds):
+            self.db.increment_wallet_balances(refunds)
+        expired_ids = [offer['_id'] for offer in expired]
+        self.db.delete_offers(expired_ids)
+        self.depth.remove(*expired_ids)
+        self._bump_versions(BOOK_VERSION)
+        self.ledger.record_many([
+            LedgerEntry(
+                user_id=user_id,
+                deltas=amounts,
+                reason=LedgerEntry.OFFER_EXPIRE
+            )
+            for user_id, amounts in refunds.items()
+        ])
+        
+        logger.info(f"Expired {len(expired)} offers, refunded {len(refunds)} wallets")
+        return len(expired)
+    
+    def _bump_versions(self, *keys: str):
+        """
+        Mark listings as changed once the writes behind them are in the
+        database
+
+        Transaction listings are read from the database, so a version bumped
+        while writes are still queued would tag a stale body.
+        """
+        self.db.when_persisted(lambda: self.versions.bump(*keys))
+    
+    def _bump_trade_versions(self, from_user_email: str, to_user_email: str):
+        """Mark the book and both parties' transaction lists as changed"""
+        self._bump_versions(
+            BOOK_VERSION,
+            TRANSACTIONS_VERSION,
+            user_transactions_version(from_user_email),
+            user_transactions_version(to_user_email)
+        )
+    
     def get_all_offers(self) -> List[Dict[str, Any]]:
         """
         Get all active offers
@@ -252,21 +595,70 @@ class OfferService:
             List of offer dictionaries
         """
         try:
-            offers = self.db.get_all_offers()
-            
-            # Convert ObjectId to string
-            for offer in offers:
-                offer['_id'] = str(offer['_id'])
-                
-            return offers
+            return self.db.get_all_offers()
         except Exception as e:
             logger.error(f"Error getting offers: {str(e)}")
             return []
     
+    def get_book_depth(self, from_currency: str, to_currency: str, depth: int) -> Dict[str, Any]:
+        """
+        Get the aggregated price levels of a currency pair
+        
+        Args:
+            from_currency: Base currency code
+            to_currency: Quote currency code
+            depth: Number of levels per side
+            
+        Returns:
+            Dict with status and the levels of the pair
+        """
+        if from_currency not in Wallet.DEFAULT_CURRENCIES or to_currency not in Wallet.DEFAULT_CURRENCIES:
+            return {
+                'success': False,
+                'message': 'Unknown currency'
+            }
+            
+        if from_currency == to_currency:
+            return {
+                'success': False,
+                'message': 'Cannot exchange the same currency'
+            }
+            
+        try:
+            return {
+                'success': True,
+                'book': self.depth.levels(from_currency, to_currency, depth)
+            }
+        except Exception as e:
+            logger.error(f"Error getting book depth: {str(e)}")
+            return {
+                'success': False,
+                'message': 'Internal server error',
+                'retryable': True
+            }
+    
     def cancel_offer(self, offer_id: str, user_email: str) -> Dict[str, Any]:
         """
         Cancel an offer and refund the locked funds
         
+        Args:
+            offer_id: ID of the offer to cancel
+            user_email: Email of user cancelling the offer
+            
+        Returns:
+            Dict with status and message
+        """
+        return self._route(
+            self._get_offer_pair(offer_id),
+            self._cancel_offer,
+            offer_id=offer_id,
+            user_email=user_email
+        )
+    
+    def _cancel_offer(self, offer_id: str, user_email: str) -> Dict[str, Any]:
+        """
+        Cancel an offer and refund the locked funds
+        
         Args:
             offer_id: ID of the offer to cancel
             user_email: Email of user cancelling the offer
@@ -291,40 +683,63 @@ class OfferService:
                     'message': 'Not authorized to cancel this offer'
                 }
                 
-            # Get user and wallet
-            user = self.db.get_user_by_email(user_email)
-            if not user:
+            # Expired offers are refunded by the expiry sweeper
+            if Offer.is_expired_record(offer_data):
                 return {
                     'success': False,
-                    'message': 'User not found'
+                    'message': 'Offer has expired, funds will be returned'
                 }
                 
-            wallet_data = self.db.get_wallet_by_user_id(str(user['_id']))
-            if not wallet_data:
+            # Get user and wallet
+            user = self.db.get_user_by_email(
+                user_email,
+                projection=USER_IDENTITY_PROJECTION
+            )
+            if not user:
                 return {
                     'success': False,
-                    'message': 'Wallet not found'
+                    'message': 'User not found'
                 }
                 
-            # Refund the locked funds
-            wallet = Wallet(
-                user_id=str(user['_id']),
-                currencies=wallet_data['currencies']
-            )
-            
-            wallet.update_currency_balance(
-                currency_code=offer_data['from_currency'],
-                amount=offer_data['from_value'],
-                operation='add'
-            )
-            
-            # Update wallet and delete offer
-            self.db.update_wallet(
+            with self._wallets_locked([str(user['_id'])]):
+                wallet_data = self.db.get_wallet_by_user_id(
+                    str(user['_id']),
+                    projection=WALLET_BALANCES_PROJECTION
+                )
+                if not wallet_data:
+                    return {
+                        'success': False,
+                        'message': 'Wallet not found'
+                    }
+                    
+                # Refund the locked funds
+                wallet = Wallet(
+                    user_id=str(user['_id']),
+                    currencies=wallet_data['currencies']
+                )
+                
+                wallet.update_currency_balance(
+                    currency_code=offer_data['from_currency'],
+                    amount=offer_data['from_value'],
+                    operation='add'
+                )
+                
+                # Update wallet and delete offer
+                self.db.update_wallet(
+                    user_id=str(user['_id']),
+                    wallet_data=wallet.to_dict()
+                )
+                
+            self.ledger.record(
                 user_id=str(user['_id']),
-                wallet_data=wallet.to_dict()
+                deltas={offer_data['from_currency']: offer_data['from_value']},
+                reason=LedgerEntry.OFFER_CANCEL,
+                reference=offer_id
             )
             
             self.db.delete_offer(offer_id)
+            self.depth.remove(offer_id)
+            self._bump_versions(BOOK_VERSION)
             
             return {
                 'success': True,
@@ -341,6 +756,24 @@ class OfferService:
         """
         Execute a transaction based on an offer
         
+        Args:
+            offer_id: ID of the offer to execute
+            user_email: Email of user executing the transaction
+            
+        Returns:
+            Dict with status and message
+        """
+        return self._route(
+            self._get_offer_pair(offer_id),
+            self._execute_transaction,
+            offer_id=offer_id,
+            user_email=user_email
+        )
+    
+    def _execute_transaction(self, offer_id: str, user_email: str) -> Dict[str, Any]:
+        """
+        Execute a transaction based on an offer
+        
         Args:
             offer_id: ID of the offer to execute
             user_email: Email of user executing the transaction
@@ -365,9 +798,21 @@ class OfferService:
                     'message': 'Cannot execute your own offer'
                 }
                 
+            if Offer.is_expired_record(offer_data):
+                return {
+                    'success': False,
+                    'message': 'Offer has expired'
+                }
+                
             # Get both users and wallets
-            from_user = self.db.get_user_by_email(offer_data['from_user'])
-            to_user = self.db.get_user_by_email(user_email)
+            from_user = self.db.get_user_by_email(
+                offer_data['from_user'],
+                projection=USER_IDENTITY_PROJECTION
+            )
+            to_user = self.db.get_user_by_email(
+                user_email,
+                projection=USER_IDENTITY_PROJECTION
+            )
             
             if not from_user or not to_user:
                 return {
@@ -375,53 +820,75 @@ class OfferService:
                     'message': 'User not found'
                 }
                 
-            from_wallet_data = self.db.get_wallet_by_user_id(str(from_user['_id']))
-            to_wallet_data = self.db.get_wallet_by_user_id(str(to_user['_id']))
-            
-            if not from_wallet_data or not to_wallet_data:
+            from_wallet_data = self.db.get_wallet_by_user_id(
+                str(from_user['_id']),
+                projection=WALLET_BALANCES_PROJECTION
+            )
+            if not from_wallet_data:
                 return {
                     'success': False,
                     'message': 'Wallet not found'
                 }
                 
-            # Check if to_user has enough of the requested currency
-            has_enough = False
-            for currency in to_wallet_data['currencies']:
-                if (currency['currency'] == offer_data['to_currency'] and 
-                    currency['value'] >= offer_data['to_value']):
-                    has_enough = True
-                    break
+            with self._wallets_locked([str(to_user['_id'])]):
+                to_wallet_data = self.db.get_wallet_by_user_id(
+                    str(to_user['_id']),
+                    projection=WALLET_BALANCES_PROJECTION
+                )
+                if not to_wallet_data:
+                    return {
+                        'success': False,
+                        'message': 'Wallet not found'
+                    }
                     
-            if not has_enough:
-                return {
-                    'success': False,
-                    'message': f'Not enough {offer_data["to_currency"]} in your wallet'
-                }
+                # Check if to_user has enough of the requested currency
+                has_enough = False
+                for currency in to_wallet_data['currencies']:
+                    if (currency['currency'] == offer_data['to_currency'] and 
+                        currency['value'] >= offer_data['to_value']):
+                        has_enough = True
+                        break
+                        
+                if not has_enough:
+                    return {
+                        'success': False,
+                        'message': f'Not enough {offer_data["to_currency"]} in your wallet'
+                    }
+                    
+                # Update wallets
+                to_wallet = Wallet(
+                    user_id=str(to_user['_id']),
+                    currencies=to_wallet_data['currencies']
+                )
                 
-            # Update wallets
-            to_wallet = Wallet(
-                user_id=str(to_user['_id']),
-                currencies=to_wallet_data['currencies']
-            )
-            
-            # Subtract to_currency from to_user
-            to_wallet.update_currency_balance(
-                currency_code=offer_data['to_currency'],
-                amount=offer_data['to_value'],
-                operation='subtract'
-            )
-            
-            # Add from_currency to to_user
-            to_wallet.update_currency_balance(
-                currency_code=offer_data['from_currency'],
-                amount=offer_data['from_value'],
-                operation='add'
-            )
-            
-            # Save the updated wallet
-            self.db.update_wallet(
+                # Subtract to_currency from to_user
+                to_wallet.update_currency_balance(
+                    currency_code=offer_data['to_currency'],
+                    amount=offer_data['to_value'],
+                    operation='subtract'
+                )
+                
+                # Add from_currency to to_user
+                to_wallet.update_currency_balance(
+                    currency_code=offer_data['from_currency'],
+                    amount=offer_data['from_value'],
+                    operation='add'
+                )
+                
+                # Save the updated wallet
+                self.db.update_wallet(
+                    user_id=str(to_user['_id']),
+                    wallet_data=to_wallet.to_dict()
+                )
+                
+            self.ledger.record(
                 user_id=str(to_user['_id']),
-                wallet_data=to_wallet.to_dict()
+                deltas={
+                    offer_data['to_currency']: -offer_data['to_value'],
+                    offer_data['from_currency']: offer_data['from_value']
+                },
+                reason=LedgerEntry.TRADE,
+                reference=offer_id
             )
             
             # Create transaction
@@ -438,6 +905,8 @@ class OfferService:
             
             # Delete the offer
             self.db.delete_offer(offer_id)
+            self.depth.remove(offer_id)
+            self._bump_trade_versions(offer_data['from_user'], user_email)
             
             return {
                 'success': True,
@@ -448,4 +917,22 @@ class OfferService:
             return {
                 'success': False,
                 'message': 'Internal server error'
-            } 
\ No newline at end of file
+            } 
+
+_offer_service = None
+_offer_service_lock = threading.Lock()
+
+
+def get_offer_service() -> OfferService:
+    """
+    Get the process-wide offer service, built on first use
+
+    Returns:
+        Shared OfferService instance
+    """
+    global _offer_service
+    if _offer_service is None:
+        with _offer_service_lock:
+            if _offer_service is None:
+                _offer_service = OfferService()
+    return _offer_service
@@ -0,0 +1,319 @@
+"""
+Write-ahead journal for order and fill events
+"""
+from typing import Dict, Any, List, Callable, Iterator
+import os
+import json
+import threading
+import time
+import logging
+from bson import json_util
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+CHECKPOINT_FILE = 'checkpoint.json'
+LOCK_FILE = 'journal.lock'
+
+
+class JournalLockedError(Exception):
+    """Raised when another process already owns the journal directory"""
+
+
+class OrderJournal:
+    """
+    Append-only, fsync-batched event log split into segment files
+
+    Appends only buffer a record; a flusher thread writes and fsyncs every
+    buffered record at once (group commit), so many concurrent requests
+    share a single fsync. Callers wait for durability with wait_durable.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        group_commit_ms: float = 2,
+        on_durable: Callable[[List[Dict[str, Any]]], None] = None
+    ):
+        """
+        Initialize the journal
+
+        Args:
+            directory: Directory holding segments and the checkpoint
+            segment_bytes: Size after which a new segment is started
+            group_commit_ms: Time to gather more records before an fsync
+            on_durable: Called with each batch of records once it is durable
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.group_commit = group_commit_ms / 1000.0
+        self.on_durable = on_durable
+        self.last_seq = 0
+        self.durable_seq = 0
+        self.fsyncs = 0
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._file = None
+        self._lock_file = None
+        self._thread = None
+        self._stopping = False
+
+    # Lifecycle
+    def open(self):
+        """Lock the directory, repair a torn tail and start the flusher"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._acquire_lock()
+
+        segments = self._segments()
+        if segments:
+            self.last_seq = self._repair_tail(segments[-1])
+        else:
+            self.last_seq = self.checkpointed_seq
+        self.durable_seq = self.last_seq
+
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name='order-journal-flusher',
+            daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout: float = None):
+        """Flush buffered records and stop the flusher"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # Writing
+    def append(self, event_type: str, data: Dict[str, Any]) -> int:
+        """
+        Buffer an event for the next group commit
+
+        Args:
+            event_type: Kind of event
+            data: Event payload (BSON types allowed)
+
+        Returns:
+            Sequence number of the event
+        """
+        with self._cond:
+            self.last_seq += 1
+            self._buffer.append({'seq': self.last_seq, 'type': event_type, 'data': data})
+            self._cond.notify_all()
+            return self.last_seq
+
+    def wait_durable(self, seq: int, timeout: float = None) -> bool:
+        """
+        Wait until every event up to seq is fsynced
+
+        Args:
+            seq: Sequence number to wait for
+            timeout: Seconds to wait (None waits forever)
+
+        Returns:
+            True if the event is durable
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self.durable_seq >= seq, timeout)
+
+    def _run(self):
+        """Flusher thread body"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._stopping)
+                if not self._buffer and self._stopping:
+                    return
+
+            # Let concurrent requests join this commit
+            if self.group_commit and not self._stopping:
+                time.sleep(self.group_commit)
+
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Records stay unacknowledged; retry them before newer ones
+                logger.error(f"Error writing order journal: {str(e)}")
+                with self._cond:
+                    self._buffer = batch + self._buffer
+                time.sleep(0.1)
+                continue
+
+            with self._cond:
+                self.durable_seq = batch[-1]['seq']
+                self._cond.notify_all()
+
+            if self.on_durable is not None:
+                self.on_durable(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """Write and fsync a batch of records"""
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self._start_segment(batch[0]['seq'])
+
+        payload = ''.join(json_util.dumps(record) + '\n' for record in batch)
+        self._file.write(payload.encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+
+    def _start_segment(self, first_seq: int):
+        """Close the current segment and open a new one"""
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(
+            self.directory,
+            f'{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}'
+        )
+        self._file = open(path, 'ab')
+        self._fsync_directory()
+
+    # Reading
+    def read_after(self, seq: int) -> Iterator[Dict[str, Any]]:
+        """
+        Read durable records with a sequence number above seq
+
+        Args:
+            seq: Last sequence number already applied
+
+        Returns:
+            Iterator of records in sequence order
+        """
+        segments = self._segments()
+        for index, (first_seq, path) in enumerate(segments):
+            next_first = segments[index + 1][0] if index + 1 < len(segments) else None
+            if next_first is not None and next_first <= seq + 1:
+                continue
+            for record in self._read_segment(path):
+                if record['seq'] > seq:
+                    yield record
+
+    # Checkpoints
+    @property
+    def checkpointed_seq(self) -> int:
+        """Sequence number of the last event persisted to the database"""
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                return int(json.load(f)['seq'])
+        except FileNotFoundError:
+            return 0
+
+    def checkpoint(self, seq: int):
+        """
+        Record that every event up to seq is persisted, and drop old segments
+
+        Args:
+            seq: Last persisted sequence number
+        """
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'seq': seq, 'time': time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self._fsync_directory()
+
+        # A segment is obsolete once the next one starts at or before seq
+        segments = self._segments()
+        for index, (first_seq, segment_path) in enumerate(segments[:-1]):
+            if segments[index + 1][0] <= seq + 1:
+                os.remove(segment_path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get journal counters"""
+        return {
+            'last_seq': self.last_seq,
+            'durable_seq': self.durable_seq,
+            'fsyncs': self.fsyncs,
+            'segments': len(self._segments())
+        }
+
+    # Helpers
+    def _segments(self) -> List[tuple]:
+        """List (first_seq, path) of segment files in order"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                first_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((first_seq, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[Dict[str, Any]]:
+        """Read the complete records of a segment"""
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    return
+                yield json_util.loads(line)
+
+    def _repair_tail(self, segment: tuple) -> int:
+        """
+        Cut a partially written record off the last segment
+
+        A torn record was never acknowledged, so dropping it is safe.
+
+        Returns:
+            Last complete sequence number
+        """
+        first_seq, path = segment
+        last_seq = first_seq - 1
+        good_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    last_seq = json_util.loads(line)['seq']
+                except ValueError:
+                    break
+                good_bytes += len(line)
+
+        if good_bytes < os.path.getsize(path):
+            logger.warning(f"Truncating torn record at the end of {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(good_bytes)
+                os.fsync(f.fileno())
+        return max(last_seq, self.checkpointed_seq)
+
+    def _acquire_lock(self):
+        """Make sure a single process writes the journal"""
+        if fcntl is None:
+            return
+        self._lock_file = open(os.path.join(self.directory, LOCK_FILE), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise JournalLockedError(f'Order journal {self.directory} is in use')
+
+    def _fsync_directory(self):
+        """Make created, renamed and removed files durable"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,372 @@
+"""
+Asynchronous, batched persistence of trade side effects
+"""
+from typing import Dict, Any, List, Optional, Callable
+import os
+import copy
+import queue
+import atexit
+import threading
+import time
+import logging
+from bson.objectid import ObjectId
+from app.config.config import get_config
+from app.services.database import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Queued write kinds
+WALLET_WRITE = 'wallet'
+OFFER_DELETE_WRITE = 'offer_delete'
+TRANSACTION_WRITE = 'transaction'
+LEDGER_WRITE = 'ledger'
+PERSISTED_CALLBACK = 'persisted_callback'
+
+
+def _as_object_id(offer_id: Any) -> ObjectId:
+    """Convert an offer ID to an ObjectId"""
+    return offer_id if isinstance(offer_id, ObjectId) else ObjectId(offer_id)
+
+
+class PersistencePipeline:
+    """
+    Drop-in for DatabaseService that queues trade side effects
+
+    Wallet updates, offer deletions, transactions and ledger entries are
+    queued and written by a background thread in batches, once a batch is
+    full or the flush interval has passed. Queued changes are overlaid on
+    reads in this process, so a request always sees the effects of earlier
+    ones. Everything else goes straight to the database.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseService = None,
+        batch_size: int = 500,
+        flush_interval_ms: float = 5,
+        queue_size: int = 10000
+    ):
+        """
+        Initialize the pipeline
+
+        Args:
+            db: Database service the batches are written to
+            batch_size: Maximum writes per batch
+            flush_interval_ms: Longest time a write waits for its batch to fill
+            queue_size: Queued writes before producers block (back-pressure)
+        """
+        self.db = db or DatabaseService()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.queue_size = queue_size
+        self.batches = 0
+        self.writes = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending_wallets = {}
+        self._pending_deletes = set()
+        self._version = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def __getattr__(self, name):
+        """Serve everything else straight from the database"""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.db, name)
+
+    # Lifecycle
+    def start(self):
+        """Start the writer thread once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Writes queued before a fork belong to the parent
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pending_wallets = {}
+            self._pending_deletes = set()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='persistence-pipeline',
+                daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def flush(self):
+        """Wait until every queued write is in the database"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout: float = None):
+        """Write everything still queued, then stop the writer thread"""
+        if self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+        self._pid = None
+
+    def when_persisted(self, callback: Callable[[], None]):
+        """Run a callback once every write queued so far is in the database"""
+        self._enqueue(PERSISTED_CALLBACK, callback)
+
+    def _enqueue(self, kind: str, payload: Any):
+        """Queue a write, blocking while the queue is full"""
+        self.start()
+        self._queue.put((kind, payload))
+
+    # Wallet operations
+    def get_wallet_by_user_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get wallet by user ID, with queued updates applied"""
+        wallet = self.db.get_wallet_by_user_id(user_id, projection=projection)
+        pending = self._pending_wallets.get(user_id)
+        if wallet is not None and pending is not None:
+            wallet.update({
+                field: copy.deepcopy(value)
+                for field, value in pending[1].items()
+                if projection is None or projection.get(field)
+            })
+        return wallet
+
+    def update_wallet(self, user_id: str, wallet_data: Dict[str, Any]) -> bool:
+        """Queue a wallet update"""
+        self.start()
+        wallet_data = copy.deepcopy(wallet_data)
+        with self._lock:
+            self._version += 1
+            version = self._version
+            self._pending_wallets[user_id] = (version, wallet_data)
+        self._enqueue(WALLET_WRITE, (user_id, version, wallet_data))
+        return True
+
+    def increment_wallet_balances(
+        self,
+        increments: Dict[str, Dict[str, float]]
+    ) -> int:
+        """Add amounts to several wallets once queued updates are written"""
+        # A queued $set written after the $inc would undo it
+        self.flush()
+        return self.db.increment_wallet_balances(increments)
+
+    # Offer operations
+    def get_offer_by_id(
+        self,
+        offer_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get offer by ID, hiding offers queued for deletion"""
+        if _as_object_id(offer_id) in self._pending_deletes:
+            return None
+        return self.db.get_offer_by_id(offer_id, projection=projection)
+
+    def get_all_offers(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all live offers, hiding offers queued for deletion"""
+        return self._without_deleted(self.db.get_all_offers(projection=projection))
+
+    def find_matching_offers(
+        self,
+        to_currency: str,
+        from_currency: str,
+        from_value: float,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Find matching offers, hiding offers queued for deletion"""
+        return self._without_deleted(self.db.find_matching_offers(
+            to_currency,
+            from_currency,
+            from_value,
+            projection=projection
+        ))
+
+    def claim_expired_offers(
+        self,
+        now,
+        limit: int,
+        claim: str,
+        lease_seconds: float
+    ) -> List[Dict[str, Any]]:
+        """Claim expired offers, skipping offers already filled or cancelled"""
+        return self._without_deleted(self.db.claim_expired_offers(now, limit, claim, lease_seconds))
+
+    def delete_offer(self, offer_id: str) -> bool:
+        """Queue an offer deletion"""
+        self.start()
+        offer_id = _as_object_id(offer_id)
+        with self._lock:
+            self._pending_deletes.add(offer_id)
+        self._enqueue(OFFER_DELETE_WRITE, offer_id)
+        return True
+
+    def _without_deleted(self, offers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop offers queued for deletion"""
+        if not self._pending_deletes:
+            return offers
+        return [offer for offer in offers if offer['_id'] not in self._pending_deletes]
+
+    # Transaction operations
+    def create_transaction(self, transaction_data: Dict[str, Any]) -> str:
+        """Queue a new transaction, its parties' summaries follow when it is written"""
+        transaction = copy.deepcopy(transaction_data)
+        transaction.setdefault('_id', ObjectId())
+        self._enqueue(TRANSACTION_WRITE, transaction)
+        return str(transaction['_id'])
+
+    # Ledger operations
+    def append_ledger_entries(self, entries: List[Dict[str, Any]]) -> List[str]:
+        """Queue balance change entries for the ledger"""
+        if not entries:
+            return []
+        entries = copy.deepcopy(entries)
+        for entry in entries:
+            entry.setdefault('_id', ObjectId())
+        self._enqueue(LEDGER_WRITE, entries)
+        return [str(entry['_id']) for entry in entries]
+
+    # Writer
+    def _run(self):
+        """Writer thread body: gather writes until a batch is full or due"""
+        stopping = False
+        while not stopping:
+            write = self._queue.get()
+            if write is None:
+                self._queue.task_done()
+                break
+
+            batch = [write]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    write = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if write is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(write)
+
+            self._write_with_retry(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_with_retry(self, batch: List[tuple]):
+        """Write a batch, retrying until the database accepts it"""
+        delay = 0.1
+        while True:
+            try:
+                self._write(batch)
+                return
+            except Exception as e:
+                # Producers block on the full queue meanwhile
+                logger.error(f"Error writing {len(batch)} queued writes: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    def _write(self, batch: List[tuple]):
+        """
+        Write a batch with one bulk call per kind
+
+        Wallet updates set the whole balance list, so only the latest one
+        per wallet is written. Every write is idempotent, so a retried batch
+        that partly succeeded leaves the same state.
+        """
+        wallets = {}
+        offer_ids = []
+        transactions = []
+        ledger_entries = []
+        callbacks = []
+
+        for kind, payload in batch:
+            if kind == WALLET_WRITE:
+                user_id, version, wallet_data = payload
+                wallets[user_id] = (version, wallet_data)
+            elif kind == OFFER_DELETE_WRITE:
+                offer_ids.append(payload)
+            elif kind == TRANSACTION_WRITE:
+                transactions.append(payload)
+            elif kind == LEDGER_WRITE:
+                ledger_entries.extend(payload)
+            elif kind == PERSISTED_CALLBACK:
+                callbacks.append(payload)
+
+        if wallets:
+            self.db.update_wallets({
+                user_id: wallet_data for user_id, (version, wallet_data) in wallets.items()
+            })
+        if offer_ids:
+            self.db.delete_offers(offer_ids)
+        if transactions:
+            self.db.upsert_documents('transactions', transactions)
+            self.db.record_transaction_summaries(transactions)
+        if ledger_entries:
+            self.db.upsert_documents('ledger', ledger_entries)
+
+        # Stop overlaying what the database now holds, unless newer writes are queued
+        with self._lock:
+            for user_id, (version, _) in wallets.items():
+                pending = self._pending_wallets.get(user_id)
+                if pending is not None and pending[0] == version:
+                    del self._pending_wallets[user_id]
+            self._pending_deletes.difference_update(offer_ids)
+
+        # Callbacks never fail the batch, or a retry would write it again
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error running persisted callback: {str(e)}")
+
+        self.batches += 1
+        self.writes += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pipeline counters"""
+        return {
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'writes': self.writes,
+            'pending_wallets': len(self._pending_wallets),
+            'pending_deletes': len(self._pending_deletes)
+        }
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_persistence_pipeline(config=None) -> PersistencePipeline:
+    """
+    Get the process-wide persistence pipeline
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared PersistencePipeline instance
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                config = config or get_config()
+                _pipeline = PersistencePipeline(
+                    batch_size=config.PERSISTENCE_BATCH_SIZE,
+                    flush_interval_ms=config.PERSISTENCE_FLUSH_INTERVAL_MS,
+                    queue_size=config.PERSISTENCE_QUEUE_SIZE
+                )
+                atexit.register(_pipeline.close)
+    return _pipeline
@@ -0,0 +1,95 @@
+"""
+Connection pool gauges for the MongoDB client
+"""
+from typing import Dict, Any
+import threading
+import logging
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class PoolGauges(monitoring.ConnectionPoolListener):
+    """Track connection pool usage per server through CMAP events"""
+
+    def __init__(self):
+        """Initialize empty gauges"""
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, address) -> Dict[str, Any]:
+        """Get (or create) the gauges for a server address"""
+        key = '%s:%s' % address
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                'open': 0,
+                'checked_out': 0,
+                'max_checked_out': 0,
+                'waiting': 0,
+                'checkouts': 0,
+                'checkout_failures': 0,
+                'cleared': 0
+            }
+        return pool
+
+    def _update(self, address, **changes):
+        """Apply counter changes for a server address"""
+        with self._lock:
+            pool = self._pool(address)
+            for name, delta in changes.items():
+                pool[name] += delta
+            if pool['checked_out'] > pool['max_checked_out']:
+                pool['max_checked_out'] = pool['checked_out']
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get a copy of the current gauges
+
+        Returns:
+            Dict of gauges keyed by server address
+        """
+        with self._lock:
+            return {key: dict(pool) for key, pool in self._pools.items()}
+
+    def reset(self):
+        """Drop all gauges"""
+        with self._lock:
+            self._pools = {}
+
+    # Pool events
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop('%s:%s' % event.address, None)
+
+    # Connection events
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        logger.warning(f"Connection checkout failed for {event.address}: {event.reason}")
+        self._update(event.address, waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
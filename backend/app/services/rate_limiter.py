@@ -0,0 +1,163 @@
+"""
+Token bucket rate limiting with pluggable bucket storage
+"""
+from typing import Dict, List, Tuple
+from abc import ABC, abstractmethod
+from datetime import datetime
+import threading
+import time
+import logging
+from app.config.config import get_config
+from app.services.database import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitBackend(ABC):
+    """Storage for token buckets"""
+
+    @abstractmethod
+    def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        """
+        Take tokens from a bucket, refilling it first
+
+        Args:
+            key: Bucket key
+            rate: Tokens added per second
+            burst: Bucket capacity
+            cost: Tokens taken by this request (negative to give them back)
+
+        Returns:
+            Tuple of (allowed, seconds until enough tokens are available)
+        """
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """Buckets in process memory; limits apply per process"""
+
+    def __init__(self, max_keys: int = 100000):
+        """
+        Initialize the backend
+
+        Args:
+            max_keys: Buckets kept before refilled ones are pruned
+        """
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        """Take tokens from an in-memory bucket"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _, _ = self._buckets.get(key, (burst, now, rate, burst))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, rate, burst)
+
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def _prune(self, now: float):
+        """Drop buckets that have refilled, they behave like missing ones"""
+        self._buckets = {
+            key: bucket
+            for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """Buckets in MongoDB, shared by every process"""
+
+    def __init__(self, db: DatabaseService = None):
+        """Initialize with a database service"""
+        self.db = db or DatabaseService()
+
+    def consume(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        """Take tokens from a shared bucket in one atomic update"""
+        bucket = self.db.consume_rate_limit_tokens(key, rate, burst, cost, datetime.utcnow())
+        allowed = bucket['allowed']
+        return allowed, 0.0 if allowed else (cost - bucket['tokens']) / rate
+
+
+class RateLimiter:
+    """Check requests against token buckets"""
+
+    def __init__(self, backend: RateLimitBackend = None):
+        """
+        Initialize the limiter
+
+        Args:
+            backend: Bucket storage (defaults to process memory)
+        """
+        self.backend = backend or LocalRateLimitBackend()
+        self.rejected = 0
+
+    def check(self, limits: Dict[str, Tuple[float, float]]) -> Tuple[bool, float]:
+        """
+        Take a token from every bucket, stopping at the first empty one
+
+        A rejected request gives back the tokens it took from the buckets
+        before, so it does not count against them.
+
+        Args:
+            limits: (rate, burst) keyed by bucket key
+
+        Returns:
+            Tuple of (allowed, seconds to wait before retrying)
+        """
+        taken = []
+        for key, (rate, burst) in limits.items():
+            try:
+                allowed, retry_after = self.backend.consume(key, rate, burst)
+            except Exception as e:
+                # Fail open, an unavailable backend must not take the API down
+                logger.error(f"Error checking rate limit {key}: {str(e)}")
+                continue
+            if not allowed:
+                self.rejected += 1
+                self._refund(taken)
+                return False, retry_after
+            taken.append((key, rate, burst))
+        return True, 0.0
+
+    def _refund(self, buckets: List[Tuple[str, float, float]]):
+        """Give a token back to each bucket"""
+        for key, rate, burst in buckets:
+            try:
+                self.backend.consume(key, rate, burst, cost=-1)
+            except Exception as e:
+                logger.error(f"Error refunding rate limit {key}: {str(e)}")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(config=None) -> RateLimiter:
+    """
+    Get the process-wide rate limiter
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared RateLimiter instance
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                config = config or get_config()
+                if config.RATE_LIMIT_BACKEND == 'mongo':
+                    backend = MongoRateLimitBackend()
+                else:
+                    backend = LocalRateLimitBackend()
+                _limiter = RateLimiter(backend)
+    return _limiter
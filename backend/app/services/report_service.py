@@ -0,0 +1,226 @@
+"""
+Reporting over transactions and offer outcomes
+"""
+from typing import Dict, Any, Callable, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import threading
+import logging
+from app.config.config import get_config
+from app.services.database import DatabaseService
+from app.services.storage_backend import StorageBackend
+from app.services.version_service import (
+    VersionService,
+    BOOK_VERSION,
+    TRANSACTIONS_VERSION,
+    get_version_service
+)
+
+logger = logging.getLogger(__name__)
+
+# A range that ended longer ago than this no longer changes
+SETTLE_TIME = timedelta(minutes=1)
+
+
+class ReportService:
+    """
+    Reports aggregated by the storage backend, cached by time range
+
+    The storage backend does the grouping, next to the data, so only the
+    summary rows travel. Results are cached per report, range and
+    parameters. A range that ended before SETTLE_TIME ago never changes,
+    so its result stays cached until evicted. A range still open is
+    cached under the current versions of the listings it reads: the next
+    trade or offer change makes it recompute.
+
+    Transactions older than TRANSACTION_ARCHIVE_DAYS may have moved to the
+    archive, which the aggregations do not read. Transaction reports over a
+    range starting before that horizon are marked partial and never cached,
+    since archiving keeps removing rows from them.
+    """
+
+    def __init__(
+        self,
+        db: StorageBackend = None,
+        versions: VersionService = None,
+        cache_size: int = None
+    ):
+        """
+        Initialize the service
+
+        Args:
+            db: Storage backend to aggregate in (defaults to the shared one)
+            versions: Version service of the listings (defaults to the shared one)
+            cache_size: Results kept in memory (defaults to REPORT_CACHE_SIZE)
+        """
+        self.db = db or DatabaseService()
+        self.versions = versions or get_version_service()
+        config = get_config()
+        self.cache_size = cache_size or config.REPORT_CACHE_SIZE
+        self.archive_age = timedelta(days=config.TRANSACTION_ARCHIVE_DAYS)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(
+        self,
+        key: Tuple,
+        start: datetime,
+        end: Optional[datetime],
+        version_keys: Tuple[str, ...],
+        compute: Callable[[], Any],
+        archived: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Get a report from the cache, or compute and cache it
+
+        Args:
+            key: Report name and parameters
+            start: Start of the range
+            end: End of the range, None if open-ended
+            version_keys: Listings the report reads
+            compute: Builds the report rows
+            archived: The report reads transactions, which get archived
+
+        Returns:
+            Dict with the range, the report rows, and whether rows may be
+            missing because they were archived
+        """
+        try:
+            now = datetime.utcnow()
+            horizon = now - self.archive_age if archived else None
+            partial = horizon is not None and start < horizon
+            if end is None or end > now - SETTLE_TIME:
+                key += tuple(self.versions.get(version_key) for version_key in version_keys)
+            key += (start, end)
+
+            with self._lock:
+                rows = None if partial else self._cache.get(key)
+                if rows is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+            if rows is None:
+                rows = compute()
+                if not partial:
+                    with self._lock:
+                        self._cache[key] = rows
+                        while len(self._cache) > self.cache_size:
+                            self._cache.popitem(last=False)
+
+            return {
+                'success': True,
+                'from': start,
+                'to': end,
+                'rows': rows,
+                'partial': partial,
+                'archived_before': horizon if partial else None
+            }
+        except Exception as e:
+            logger.error(f"Error building report {key[0]}: {str(e)}")
+            return {
+                'success': False,
+                'message': 'Internal server error'
+            }
+
+    def pair_volume(self, start: datetime, end: Optional[datetime]) -> Dict[str, Any]:
+        """
+        Get the trade count and volume per UTC day and currency pair
+
+        Args:
+            start: Start of the range
+            end: End of the range, None if open-ended
+
+        Returns:
+            Dict with one row per day and pair, oldest day first
+        """
+        return self._cached(
+            ('pair_volume',), start, end, (TRANSACTIONS_VERSION,),
+            lambda: self.db.get_pair_volume_by_day(start, end),
+            archived=True
+        )
+
+    def top_traders(self, start: datetime, end: Optional[datetime], limit: int) -> Dict[str, Any]:
+        """
+        Get the users with the most trades
+
+        Args:
+            start: Start of the range
+            end: End of the range, None if open-ended
+            limit: Number of users
+
+        Returns:
+            Dict with one row per user, most trades first
+        """
+        return self._cached(
+            ('top_traders', limit), start, end, (TRANSACTIONS_VERSION,),
+            lambda: self.db.get_top_traders(start, end, limit),
+            archived=True
+        )
+
+    def average_rates(self, start: datetime, end: Optional[datetime]) -> Dict[str, Any]:
+        """
+        Get the average rate per currency pair
+
+        Args:
+            start: Start of the range
+            end: End of the range, None if open-ended
+
+        Returns:
+            Dict with one row per pair
+        """
+        return self._cached(
+            ('average_rates',), start, end, (TRANSACTIONS_VERSION,),
+            lambda: self.db.get_pair_rates(start, end),
+            archived=True
+        )
+
+    def fill_ratio(self, start: datetime, end: Optional[datetime]) -> Dict[str, Any]:
+        """
+        Get how many of the offers posted in a range were filled
+
+        Offers matched on arrival never rest in the book and are not
+        counted. Fills and cancellations are counted in the range too, so
+        an offer posted just before the range can be filled within it.
+
+        Args:
+            start: Start of the range
+            end: End of the range, None if open-ended
+
+        Returns:
+            Dict with the offers posted, filled and cancelled, and the
+            filled share of the posted ones (None if none were posted)
+        """
+        def compute():
+            outcomes = self.db.get_offer_outcomes(start, end)
+            posted = outcomes['posted']
+            return {
+                **outcomes,
+                'fill_ratio': outcomes['filled'] / posted if posted else None
+            }
+
+        # Offers are posted and cancelled under the book version, fills
+        # bump it too
+        return self._cached(('fill_ratio',), start, end, (BOOK_VERSION,), compute)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache size and hit and miss counts"""
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_report_service() -> ReportService:
+    """Get the process-wide report service"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ReportService()
+    return _service
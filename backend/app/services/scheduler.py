@@ -0,0 +1,338 @@
+"""
+In-process scheduler for background maintenance jobs
+"""
+from typing import Dict, Any, Callable, List, Optional
+from datetime import datetime
+import atexit
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+import logging
+from app.services.database import DatabaseService
+from app.services.storage_backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Name of the lease the leader holds in the database
+LEADER_LEASE = 'scheduler'
+
+
+class Job:
+    """A function run every interval, with its run metrics"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        interval: float,
+        jitter: float = 0.1,
+        timeout: Optional[float] = None,
+        leader_only: bool = True
+    ):
+        """
+        Initialize a job
+
+        Args:
+            name: Job name
+            func: Function to run, without arguments
+            interval: Seconds between runs
+            jitter: Share of the interval each delay varies by, at random,
+                so instances started together do not run in step
+            timeout: Seconds after which a run is reported as timed out
+                (optional)
+            leader_only: Only run in the process holding the leader lease
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.leader_only = leader_only
+
+        self.next_run = None
+        self.started = None
+        self.timed_out = False
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether a run has started and not finished"""
+        return self.started is not None
+
+    def delay(self) -> float:
+        """Seconds until the next run, with jitter"""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        """Get the run metrics"""
+        return {
+            'interval': self.interval,
+            'leader_only': self.leader_only,
+            'running': self.is_running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'skipped': self.skipped,
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'next_run_in': max(0.0, self.next_run - now) if self.next_run is not None else None
+        }
+
+
+class Scheduler:
+    """
+    Runs registered jobs on a background thread, off the request path
+
+    Each due job runs on a thread of its own, so a slow job delays neither
+    the others nor the leader lease renewal. A job is never run twice at
+    once: while a run is still going, its next turn is skipped. A run past
+    its timeout is reported, but cannot be interrupted; it keeps its job
+    from running again until it returns.
+
+    With several instances, leader-only jobs run in one process only: the
+    one holding a lease in the database, renewed every third of its
+    duration. Another process takes over once the lease lapses.
+    """
+
+    def __init__(
+        self,
+        db: StorageBackend = None,
+        lease_seconds: float = 30,
+        tick: float = 1.0
+    ):
+        """
+        Initialize the scheduler
+
+        Args:
+            db: Storage backend holding the leader lease (defaults to the
+                configured one, resolved on first use)
+            lease_seconds: Seconds a leader lease lasts without renewal
+            tick: Seconds between checks for due jobs
+        """
+        self._db = db
+        self.lease_seconds = lease_seconds
+        self.tick = tick
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._owner = None
+        self._owner_pid = None
+        self._leader = False
+        self._lease_checked = None
+        self._exit_registered = False
+
+    @property
+    def db(self) -> StorageBackend:
+        """Storage backend holding the leader lease"""
+        if self._db is None:
+            self._db = DatabaseService()
+        return self._db
+
+    @property
+    def owner(self) -> str:
+        """Identity of this process in the leader lease"""
+        if self._owner is None or self._owner_pid != os.getpid():
+            self._owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+            self._owner_pid = os.getpid()
+        return self._owner
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the scheduler thread is alive in this process"""
+        return (
+            self._thread is not None
+            and self._pid == os.getpid()
+            and self._thread.is_alive()
+        )
+
+    def register(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        interval: float,
+        jitter: float = 0.1,
+        timeout: Optional[float] = None,
+        leader_only: bool = True
+    ) -> Job:
+        """
+        Register a job
+
+        Args:
+            name: Job name
+            func: Function to run, without arguments
+            interval: Seconds between runs
+            jitter: Share of the interval each delay varies by
+            timeout: Seconds after which a run is reported as timed out
+            leader_only: Only run in the process holding the leader lease
+
+        Returns:
+            The registered job
+        """
+        job = Job(name, func, interval, jitter=jitter, timeout=timeout, leader_only=leader_only)
+        with self._lock:
+            if name in self._jobs:
+                raise ValueError(f'Job already registered: {name}')
+            self._jobs[name] = job
+        return job
+
+    @property
+    def jobs(self) -> List[Job]:
+        """Registered jobs"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def ensure_started(self):
+        """Start the scheduler thread once per process"""
+        if self.is_running:
+            return
+        with self._lock:
+            if self.is_running:
+                return
+            self._stop_event = threading.Event()
+            self._leader = False
+            self._lease_checked = None
+            for job in self._jobs.values():
+                job.next_run = None
+                # A parent's runs did not come with the fork
+                if self._pid != os.getpid():
+                    job.started = None
+            self._thread = threading.Thread(
+                target=self._run,
+                name='scheduler',
+                daemon=True
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+            if not self._exit_registered:
+                # Hand the lease over at once on a clean shutdown
+                atexit.register(self.stop, 1)
+                self._exit_registered = True
+            logger.info(f"Scheduler started with {len(self._jobs)} jobs")
+
+    def stop(self, timeout: float = None):
+        """Stop the scheduler thread and give up the leader lease"""
+        self._stop_event.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self._leader:
+            self._leader = False
+            try:
+                self.db.release_lease(LEADER_LEASE, self.owner)
+            except Exception as e:
+                logger.error(f"Error releasing the scheduler lease: {str(e)}")
+
+    def is_leader(self, now: float = None) -> bool:
+        """
+        Whether this process holds the leader lease, renewing it when due
+
+        Args:
+            now: Monotonic reference time (defaults to now)
+
+        Returns:
+            True if leader-only jobs may run here
+        """
+        now = time.monotonic() if now is None else now
+        if self._lease_checked is not None and now - self._lease_checked < self.lease_seconds / 3:
+            return self._leader
+
+        try:
+            leader = self.db.acquire_lease(LEADER_LEASE, self.owner, self.lease_seconds)
+        except Exception as e:
+            logger.error(f"Error acquiring the scheduler lease: {str(e)}")
+            leader = False
+        if leader != self._leader:
+            logger.info(f"Scheduler {'became' if leader else 'is no longer'} leader")
+        self._leader = leader
+        self._lease_checked = now
+        return leader
+
+    def run_pending(self, now: float = None) -> List[str]:
+        """
+        Start the jobs that are due
+
+        Args:
+            now: Monotonic reference time (defaults to now)
+
+        Returns:
+            Names of the jobs started
+        """
+        now = time.monotonic() if now is None else now
+        jobs = self.jobs
+        # Hold the lease between runs too, so leadership stays put
+        leader = any(job.leader_only for job in jobs) and self.is_leader(now)
+        started = []
+        for job in jobs:
+            if job.next_run is None:
+                job.next_run = now + job.delay()
+                continue
+            if job.is_running and job.timeout is not None and not job.timed_out \
+                    and now - job.started > job.timeout:
+                job.timed_out = True
+                job.timeouts += 1
+                logger.warning(f"Job {job.name} has run for over {job.timeout}s")
+            if now < job.next_run:
+                continue
+
+            job.next_run = now + job.delay()
+            if job.is_running or (job.leader_only and not leader):
+                job.skipped += 1
+                continue
+
+            job.started = now
+            job.timed_out = False
+            threading.Thread(
+                target=self._execute,
+                args=(job,),
+                name=f'job-{job.name}',
+                daemon=True
+            ).start()
+            started.append(job.name)
+        return started
+
+    def _execute(self, job: Job):
+        """Run a job once and record the outcome"""
+        start = time.monotonic()
+        job.last_run = datetime.utcnow()
+        try:
+            job.last_result = job.func()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.error(f"Error running job {job.name}: {str(e)}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.monotonic() - start
+            job.started = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the leader state and each job's run metrics"""
+        now = time.monotonic()
+        return {
+            'running': self.is_running,
+            'leader': self._leader,
+            'owner': self._owner,
+            'jobs': {job.name: job.stats(now) for job in self.jobs}
+        }
+
+    def _run(self):
+        """Scheduler thread body"""
+        while not self._stop_event.wait(self.tick):
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Error running scheduled jobs: {str(e)}")
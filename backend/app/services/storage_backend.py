@@ -0,0 +1,325 @@
+"""
+Storage backend interface of the database service
+"""
+from typing import Dict, Any, List, Optional, Callable
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+
+class StorageBackend(ABC):
+    """
+    Operations every storage backend provides
+
+    DatabaseService implements them on MongoDB and MemoryStorage in process
+    memory. Services only call these methods, never a driver directly.
+    """
+
+    # Lifecycle
+    def init_app(self, app):
+        """Bind the backend to a Flask application"""
+        app.extensions['database'] = self
+
+    def ping(self):
+        """Check the backend is reachable, raising an error if it is not"""
+
+    def ensure_indexes(self):
+        """Create the indexes the query paths rely on"""
+
+    def missing_indexes(self) -> List[str]:
+        """Get the names of required indexes that do not exist"""
+        return []
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get connection pool usage gauges per server"""
+        return {}
+
+    def close(self):
+        """Release the backend's resources"""
+
+    def when_persisted(self, callback: Callable[[], None]):
+        """Run a callback once every change made so far is stored"""
+        callback()
+
+    # User operations
+    @abstractmethod
+    def get_user_by_email(
+        self,
+        email: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get user by email, optionally limited to a projection"""
+
+    @abstractmethod
+    def get_user_by_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get user by ID, optionally limited to a projection"""
+
+    @abstractmethod
+    def get_user_ids_by_email(self, emails: List[str]) -> Dict[str, str]:
+        """Map user emails to user IDs in a single query"""
+
+    @abstractmethod
+    def create_user(self, user_data: Dict[str, Any]) -> str:
+        """Create a new user"""
+
+    # Wallet operations
+    @abstractmethod
+    def get_wallet_by_user_id(
+        self,
+        user_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get wallet by user ID, optionally limited to a projection"""
+
+    @abstractmethod
+    def create_wallet(self, wallet_data: Dict[str, Any]) -> str:
+        """Create a new wallet"""
+
+    @abstractmethod
+    def update_wallet(self, user_id: str, wallet_data: Dict[str, Any]) -> bool:
+        """Update a wallet"""
+
+    @abstractmethod
+    def update_wallets(self, wallets: Dict[str, Dict[str, Any]]) -> int:
+        """Update several wallets, returning the number matched"""
+
+    @abstractmethod
+    def increment_wallet_balances(self, increments: Dict[str, Dict[str, float]]) -> int:
+        """Add amounts to several wallets, returning the number modified"""
+
+    # Offer operations
+    @abstractmethod
+    def get_offer_by_id(
+        self,
+        offer_id: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get offer by ID, optionally limited to a projection"""
+
+    @abstractmethod
+    def get_all_offers(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all offers that have not expired"""
+
+    @abstractmethod
+    def get_next_offer_expiry(self, after: datetime) -> Optional[datetime]:
+        """Get the earliest expiry of the offers still live after a time"""
+
+    @abstractmethod
+    def get_book_offers(self) -> List[Dict[str, Any]]:
+        """Get every stored offer, including expired ones awaiting a sweep"""
+
+    @abstractmethod
+    def create_offer(self, offer_data: Dict[str, Any]) -> str:
+        """Create a new offer"""
+
+    @abstractmethod
+    def delete_offer(self, offer_id: str) -> bool:
+        """Delete an offer"""
+
+    @abstractmethod
+    def delete_offers(self, offer_ids: List[Any]) -> int:
+        """Delete several offers by ID"""
+
+    @abstractmethod
+    def claim_expired_offers(
+        self,
+        now: datetime,
+        limit: int,
+        claim: str,
+        lease_seconds: float
+    ) -> List[Dict[str, Any]]:
+        """Claim a batch of expired offers, or ones whose claim lapsed"""
+
+    @abstractmethod
+    def set_expiry_claim(self, offer_ids: List[Any], claim: str, claimed_at: datetime) -> int:
+        """Mark offers as claimed by an expiry sweep"""
+
+    @abstractmethod
+    def find_matching_offers(
+        self,
+        to_currency: str,
+        from_currency: str,
+        from_value: float,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find live offers giving to_currency for from_currency whose to_value
+        is at most from_value, largest to_value first
+        """
+
+    # Transaction operations
+    @abstractmethod
+    def create_transaction(self, transaction_data: Dict[str, Any]) -> str:
+        """Create a new transaction and update both parties' summaries"""
+
+    @abstractmethod
+    def get_all_transactions(
+        self,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all transactions, optionally limited to a projection"""
+
+    @abstractmethod
+    def get_user_transactions(
+        self,
+        email: str,
+        projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get transactions for a specific user"""
+
+    @abstractmethod
+    def get_transactions_before(self, before: datetime, limit: int) -> List[Dict[str, Any]]:
+        """Get up to limit transactions dated before a time, oldest first"""
+
+    @abstractmethod
+    def delete_transactions(self, transaction_ids: List[Any]) -> int:
+        """Delete several transactions by ID"""
+
+    # Transaction summary operations
+    @abstractmethod
+    def record_transaction_summaries(self, transactions: List[Dict[str, Any]]):
+        """
+        Apply transactions to their parties' summaries
+
+        A transaction among a summary's applied_ids was already applied and
+        is skipped, so replayed transactions count once, in any order.
+        """
+
+    @abstractmethod
+    def get_transaction_summary(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get a user's transaction summary"""
+
+    # Report operations, over [start, end), end None meaning open-ended
+    @abstractmethod
+    def get_pair_volume_by_day(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """Get the trade count and volume per UTC day and currency pair"""
+
+    @abstractmethod
+    def get_top_traders(
+        self,
+        start: datetime,
+        end: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Get the users with the most trades, with the volume each sent per currency"""
+
+    @abstractmethod
+    def get_pair_rates(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        """Get the average, volume-weighted, min and max rate per currency pair"""
+
+    @abstractmethod
+    def get_offer_outcomes(
+        self,
+        start: datetime,
+        end: Optional[datetime]
+    ) -> Dict[str, int]:
+        """Count the offers posted, filled and cancelled, from the ledger"""
+
+    # Ledger operations
+    @abstractmethod
+    def append_ledger_entries(self, entries: List[Dict[str, Any]]) -> List[str]:
+        """Append balance change entries to the ledger"""
+
+    @abstractmethod
+    def get_ledger_entries(self, user_id: str, since_id: Any = None) -> List[Dict[str, Any]]:
+        """Get a wallet's ledger entries in insertion order, from since_id on"""
+
+    @abstractmethod
+    def get_latest_wallet_snapshot(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the most recent balance snapshot of a wallet"""
+
+    @abstractmethod
+    def create_wallet_snapshot(self, snapshot_data: Dict[str, Any]) -> str:
+        """Store a wallet balance snapshot"""
+
+    @abstractmethod
+    def get_ledger_user_ids(self, since_id: Any = None) -> List[str]:
+        """Get the IDs of the wallets with ledger entries, from since_id on"""
+
+    @abstractmethod
+    def get_ledger_snapshot_watermark(self) -> Optional[Any]:
+        """Get the ledger entry ID the last snapshot run covered wallets up to"""
+
+    @abstractmethod
+    def set_ledger_snapshot_watermark(self, watermark: Any):
+        """Store the ledger entry ID a snapshot run covered wallets up to"""
+
+    # Idempotency key operations
+    @abstractmethod
+    def reserve_idempotency_key(self, record: Dict[str, Any]) -> bool:
+        """Store a pending idempotency record unless one already exists"""
+
+    @abstractmethod
+    def get_idempotency_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get an idempotency record by ID"""
+
+    @abstractmethod
+    def take_over_idempotency_key(
+        self,
+        record_id: str,
+        stale_before: datetime,
+        now: datetime
+    ) -> bool:
+        """Claim a pending idempotency record abandoned before stale_before"""
+
+    @abstractmethod
+    def complete_idempotency_key(self, record_id: str, response: Dict[str, Any]) -> bool:
+        """Store the response of a finished request"""
+
+    @abstractmethod
+    def delete_idempotency_key(self, record_id: str) -> bool:
+        """Forget an idempotency record so the request can be retried"""
+
+    # Rate limit operations
+    @abstractmethod
+    def consume_rate_limit_tokens(
+        self,
+        key: str,
+        rate: float,
+        burst: float,
+        cost: float,
+        now: datetime
+    ) -> Dict[str, Any]:
+        """Refill a token bucket and take tokens from it in one atomic update"""
+
+    # Version operations
+    @abstractmethod
+    def bump_versions(self, keys: List[str]) -> int:
+        """Increment several listing versions"""
+
+    @abstractmethod
+    def get_version(self, key: str) -> int:
+        """Get a listing version, 0 if it never changed"""
+
+    # Lease operations
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Take or renew a named lease, unless another owner holds it unexpired
+
+        Returns:
+            True if the owner now holds the lease for ttl_seconds
+        """
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str) -> bool:
+        """Give up a lease the owner holds"""
+
+    # Replay operations
+    @abstractmethod
+    def upsert_documents(self, collection: str, documents: List[Dict[str, Any]]) -> int:
+        """Store documents by _id, replacing any earlier copy"""
@@ -0,0 +1,492 @@
+"""
+Cold storage of old transactions in compressed columnar files
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+import logging
+from bson.objectid import ObjectId
+from app.config.config import get_config
+from app.services.storage_backend import StorageBackend
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, header length (uint32 LE), JSON header, then one
+# separately compressed section per column. The header lists every user
+# in the file, so reads for one user skip the other files undecoded.
+MAGIC = b'TXC1'
+EXTENSION = '.txc'
+
+# Column kinds
+OBJECT_ID = 'objectid'
+TIMESTAMP = 'timestamp'
+STRING = 'string'
+FLOAT = 'float'
+
+# Transaction fields, in file order
+COLUMNS = (
+    ('_id', OBJECT_ID),
+    ('date', TIMESTAMP),
+    ('from_user', STRING),
+    ('to_user', STRING),
+    ('from_value', FLOAT),
+    ('from_currency', STRING),
+    ('to_value', FLOAT),
+    ('to_currency', STRING)
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_millis(value: datetime) -> int:
+    """Milliseconds since the epoch of a naive UTC datetime"""
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def _little_endian(values: array) -> array:
+    """Put array items in little-endian byte order, in place"""
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=12).compress(data)
+    return zlib.compress(data, 9)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is needed to read this archive')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _encode_column(kind: str, values: List[Any]) -> bytes:
+    """Encode one column's values"""
+    if kind == OBJECT_ID:
+        return b''.join(ObjectId(value).binary for value in values)
+    if kind == TIMESTAMP:
+        # Rows are sorted by date, so the deltas are small and compress well
+        millis = [_to_millis(value) for value in values]
+        deltas = array('q', [b - a for a, b in zip([0] + millis, millis)])
+        return _little_endian(deltas).tobytes()
+    if kind == FLOAT:
+        return _little_endian(array('d', values)).tobytes()
+    # Strings are dictionary encoded: distinct values, then one code per row
+    codes = {}
+    indexes = array('I', [codes.setdefault(value, len(codes)) for value in values])
+    dictionary = json.dumps(list(codes)).encode()
+    return struct.pack('<I', len(dictionary)) + dictionary + _little_endian(indexes).tobytes()
+
+
+def _decode_column(kind: str, data: bytes) -> Any:
+    """
+    Decode one column
+
+    Returns:
+        The values, or for strings a (dictionary, codes) pair
+    """
+    if kind == OBJECT_ID:
+        return [ObjectId(data[offset:offset + 12]) for offset in range(0, len(data), 12)]
+    if kind == TIMESTAMP:
+        deltas = array('q')
+        deltas.frombytes(data)
+        _little_endian(deltas)
+        values = []
+        millis = 0
+        for delta in deltas:
+            millis += delta
+            values.append(EPOCH + timedelta(milliseconds=millis))
+        return values
+    if kind == FLOAT:
+        values = array('d')
+        values.frombytes(data)
+        return _little_endian(values).tolist()
+    (size,) = struct.unpack_from('<I', data)
+    dictionary = json.loads(data[4:4 + size])
+    codes = array('I')
+    codes.frombytes(data[4 + size:])
+    return dictionary, _little_endian(codes)
+
+
+def encode_partition(transactions: List[Dict[str, Any]], codec: Optional[str] = None) -> bytes:
+    """
+    Encode transactions as a columnar file
+
+    Args:
+        transactions: Transaction documents, oldest first
+        codec: 'zstd' or 'zlib' (defaults to zstd when it is installed)
+
+    Returns:
+        File contents
+    """
+    codec = codec or ('zstd' if zstandard is not None else 'zlib')
+    sections = []
+    body = []
+    for name, kind in COLUMNS:
+        section = _compress(_encode_column(kind, [transaction[name] for transaction in transactions]), codec)
+        sections.append({'column': name, 'kind': kind, 'size': len(section)})
+        body.append(section)
+
+    participants = {transaction['from_user'] for transaction in transactions}
+    participants.update(transaction['to_user'] for transaction in transactions)
+    header = json.dumps({
+        'codec': codec,
+        'rows': len(transactions),
+        'participants': sorted(participants),
+        'sections': sections
+    }).encode()
+    return MAGIC + struct.pack('<I', len(header)) + header + b''.join(body)
+
+
+def read_header(archive_file) -> Dict[str, Any]:
+    """
+    Read the header of a columnar file, leaving the columns unread
+
+    Args:
+        archive_file: File opened in binary mode, at its start
+
+    Returns:
+        Header dict
+    """
+    prefix = archive_file.read(8)
+    if prefix[:4] != MAGIC:
+        raise ValueError('Not a transaction archive file')
+    (size,) = struct.unpack_from('<I', prefix, 4)
+    return json.loads(archive_file.read(size))
+
+
+class Partition:
+    """Columns of one archive file, each decoded when first used"""
+
+    def __init__(self, data: bytes):
+        """
+        Split a columnar file into its compressed columns
+
+        Args:
+            data: File contents
+        """
+        if data[:4] != MAGIC:
+            raise ValueError('Not a transaction archive file')
+        (size,) = struct.unpack_from('<I', data, 4)
+        header = json.loads(data[8:8 + size])
+        self.rows = header['rows']
+        self.codec = header['codec']
+        self.columns = {}
+        self._sections = {}
+        offset = 8 + size
+        for section in header['sections']:
+            self._sections[section['column']] = (section['kind'], data[offset:offset + section['size']])
+            offset += section['size']
+
+    def _column(self, name: str) -> Tuple[str, Any]:
+        """Get a column's kind and values, decoding it on first use"""
+        column = self.columns.get(name)
+        if column is None:
+            kind, raw = self._sections[name]
+            column = self.columns[name] = (kind, _decode_column(kind, _decompress(raw, self.codec)))
+        return column
+
+    def _value(self, name: str, row: int) -> Any:
+        kind, values = self._column(name)
+        if kind == STRING:
+            dictionary, codes = values
+            return dictionary[codes[row]]
+        return values[row]
+
+    def _rows_with(self, name: str, value: str) -> List[int]:
+        """Rows whose string column holds a value"""
+        dictionary, codes = self._column(name)[1]
+        try:
+            code = dictionary.index(value)
+        except ValueError:
+            return []
+        return [row for row, row_code in enumerate(codes) if row_code == code]
+
+    def documents(self, user_email: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Rebuild the transaction documents
+
+        With user_email, only the user columns are decoded unless the user
+        has transactions in this file.
+
+        Args:
+            user_email: Only transactions this user sent or received
+
+        Returns:
+            Transaction documents in file order
+        """
+        if user_email is None:
+            rows = range(self.rows)
+        else:
+            rows = sorted(set(self._rows_with('from_user', user_email))
+                          | set(self._rows_with('to_user', user_email)))
+            if not rows:
+                return []
+        return [
+            {name: self._value(name, row) for name, _ in COLUMNS}
+            for row in rows
+        ]
+
+
+class TransactionArchive:
+    """
+    Transactions moved out of MongoDB, in date-partitioned columnar files
+
+    Each archive run writes one file per day it covers, under
+    date=YYYY-MM-DD/. Files are never changed once written, so decoded
+    files are cached in memory, the most recently used first, and so are
+    the users each file holds, which lets a read for one user open only
+    the files that user appears in.
+    """
+
+    def __init__(self, directory: str, cache_partitions: int = 64, codec: Optional[str] = None):
+        """
+        Initialize the archive
+
+        Args:
+            directory: Root directory of the archive
+            cache_partitions: Decoded files kept in memory
+            codec: Compression of new files (defaults to zstd when installed)
+        """
+        self.directory = directory
+        self.cache_partitions = cache_partitions
+        self.codec = codec
+        self._cache = OrderedDict()
+        self._participants = {}
+        self._lock = threading.Lock()
+
+    def _paths(self) -> List[str]:
+        """Archive files, oldest day first"""
+        if not os.path.isdir(self.directory):
+            return []
+        paths = []
+        for day in sorted(os.listdir(self.directory)):
+            day_directory = os.path.join(self.directory, day)
+            if not day.startswith('date=') or not os.path.isdir(day_directory):
+                continue
+            paths.extend(
+                os.path.join(day_directory, name)
+                for name in sorted(os.listdir(day_directory))
+                if name.endswith(EXTENSION)
+            )
+        return paths
+
+    def _partition(self, path: str) -> Partition:
+        """Decode a file, or take it from the cache"""
+        with self._lock:
+            partition = self._cache.get(path)
+            if partition is not None:
+                self._cache.move_to_end(path)
+                return partition
+
+        with open(path, 'rb') as archive_file:
+            partition = Partition(archive_file.read())
+
+        with self._lock:
+            self._cache[path] = partition
+            while len(self._cache) > self.cache_partitions:
+                self._cache.popitem(last=False)
+        return partition
+
+    def _has_participant(self, path: str, user_email: str) -> bool:
+        """Check whether a file may hold a user's transactions, from its header"""
+        with self._lock:
+            cached = path in self._participants
+            participants = self._participants.get(path)
+        if not cached:
+            with open(path, 'rb') as archive_file:
+                header = read_header(archive_file)
+            # Files written before headers listed users may hold anyone
+            if 'participants' in header:
+                participants = frozenset(header['participants'])
+            with self._lock:
+                self._participants[path] = participants
+        return participants is None or user_email in participants
+
+    def read(self, user_email: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Read archived transactions
+
+        Args:
+            user_email: Only transactions this user sent or received
+
+        Returns:
+            Transaction documents, oldest day first
+        """
+        transactions = []
+        for path in self._paths():
+            if user_email is not None and not self._has_participant(path, user_email):
+                continue
+            transactions.extend(self._partition(path).documents(user_email))
+        return transactions
+
+    def write(self, transactions: List[Dict[str, Any]]) -> List[str]:
+        """
+        Write transactions to one new file per day
+
+        Files appear atomically and are synced to disk before this returns,
+        so the transactions can then be deleted from the database.
+
+        Args:
+            transactions: Transaction documents, oldest first
+
+        Returns:
+            Paths of the written files
+        """
+        days = OrderedDict()
+        for transaction in transactions:
+            days.setdefault(transaction['date'].strftime('%Y-%m-%d'), []).append(transaction)
+
+        paths = []
+        for day, day_transactions in days.items():
+            day_directory = os.path.join(self.directory, f'date={day}')
+            os.makedirs(day_directory, exist_ok=True)
+            # Named after the first row, so files sort in date order
+            first = day_transactions[0]
+            name = f"part-{_to_millis(first['date']):013d}-{first['_id']}{EXTENSION}"
+            path = os.path.join(day_directory, name)
+
+            temporary = path + '.tmp'
+            with open(temporary, 'wb') as archive_file:
+                archive_file.write(encode_partition(day_transactions, self.codec))
+                archive_file.flush()
+                os.fsync(archive_file.fileno())
+            os.replace(temporary, path)
+            directory_fd = os.open(day_directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+            paths.append(path)
+        return paths
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number and total size of the archive files"""
+        paths = self._paths()
+        with self._lock:
+            cached = len(self._cache)
+        return {
+            'files': len(paths),
+            'bytes': sum(os.path.getsize(path) for path in paths),
+            'cached_files': cached
+        }
+
+
+def merge_transactions(
+    archived: List[Dict[str, Any]],
+    hot: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Put archived transactions before the ones still in the database
+
+    A transaction archived by a run that stopped before deleting it is in
+    both; the database copy is kept.
+
+    Args:
+        archived: Transactions read from the archive
+        hot: Transactions read from the database
+
+    Returns:
+        Merged transactions, oldest first
+    """
+    if not archived:
+        return hot
+    hot_ids = {transaction['_id'] for transaction in hot}
+    return [transaction for transaction in archived if transaction['_id'] not in hot_ids] + hot
+
+
+def archive_transactions(
+    db: StorageBackend,
+    archive: TransactionArchive,
+    before: datetime,
+    batch_size: int = 10000
+) -> Dict[str, int]:
+    """
+    Move transactions older than a cutoff from the database to the archive
+
+    Args:
+        db: Storage backend holding the transactions
+        archive: Archive to write to
+        before: Transactions dated before this UTC time are moved
+        batch_size: Transactions moved per batch
+
+    Returns:
+        Dict with the number of transactions moved and files written
+    """
+    moved = 0
+    files = 0
+    while True:
+        batch = db.get_transactions_before(before, batch_size)
+        if not batch:
+            break
+        files += len(archive.write(batch))
+        # Delete only once the files are on disk
+        moved += db.delete_transactions([transaction['_id'] for transaction in batch])
+        if len(batch) < batch_size:
+            break
+
+    if moved:
+        logger.info(f"Archived {moved} transactions dated before {before.isoformat()} in {files} files")
+    return {'transactions': moved, 'files': files}
+
+
+def archive_old_transactions(db: StorageBackend, config=None) -> Dict[str, int]:
+    """
+    Archive the transactions older than TRANSACTION_ARCHIVE_DAYS
+
+    Args:
+        db: Storage backend holding the transactions
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Dict with the number of transactions moved and files written
+    """
+    config = config or get_config()
+    return archive_transactions(
+        db,
+        get_transaction_archive(config),
+        datetime.utcnow() - timedelta(days=config.TRANSACTION_ARCHIVE_DAYS),
+        config.TRANSACTION_ARCHIVE_BATCH_SIZE
+    )
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_transaction_archive(config=None) -> TransactionArchive:
+    """
+    Get the process-wide transaction archive
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared TransactionArchive instance
+    """
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                config = config or get_config()
+                _archive = TransactionArchive(
+                    config.TRANSACTION_ARCHIVE_DIR,
+                    cache_partitions=config.TRANSACTION_ARCHIVE_CACHE_PARTITIONS
+                )
+    return _archive
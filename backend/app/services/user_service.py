@@ -1,11 +1,25 @@
 """
 User service for authentication and user operations
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
+import threading
+from app.config.config import get_config
+from app.models.ledger import LedgerEntry
+from app.models.transaction_summary import TransactionSummary
 from app.models.user import User
 from app.models.wallet import Wallet
-from app.services.database import DatabaseService
+from app.services.database import (
+    DatabaseService,
+    USER_ID_PROJECTION,
+    USER_IDENTITY_PROJECTION,
+    USER_AUTH_PROJECTION,
+    WALLET_BALANCES_PROJECTION
+)
+from app.services.journaled_store import get_journaled_store
+from app.services.ledger_service import LedgerService
+from app.services.persistence_pipeline import get_persistence_pipeline
+from app.services.transaction_archive import get_transaction_archive, merge_transactions
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +29,22 @@ class UserService:
     
     def __init__(self):
         """Initialize with a database service"""
+        config = get_config()
         self.db = DatabaseService()
+        # Wallet reads must see changes the order paths have not written yet
+        if config.MATCHING_ENGINE_MODE == 'journaled':
+            self.db = get_journaled_store()
+        elif config.PERSISTENCE_MODE == 'async':
+            self.db = get_persistence_pipeline()
+        self.ledger = LedgerService(self.db)
+        self.archive = get_transaction_archive()
+    
+    def _user_transactions(self, email: str) -> List[Dict[str, Any]]:
+        """Get a user's archived and recent transactions, oldest first"""
+        return merge_transactions(
+            self.archive.read(user_email=email),
+            self.db.get_user_transactions(email)
+        )
     
     def register(
         self,
@@ -49,7 +78,10 @@ class UserService:
             }
         
         # Check if user already exists
-        existing_user = self.db.get_user_by_email(email)
+        existing_user = self.db.get_user_by_email(
+            email,
+            projection=USER_ID_PROJECTION
+        )
         if existing_user:
             return {
                 'success': False,
@@ -72,6 +104,16 @@ class UserService:
             wallet = Wallet.create_default_wallet(user_id)
             self.db.create_wallet(wallet.to_dict())
             
+            # Opening balances are the first ledger entry of every wallet
+            self.ledger.record(
+                user_id=user_id,
+                deltas={
+                    currency['currency']: currency['value']
+                    for currency in wallet.currencies
+                },
+                reason=LedgerEntry.OPEN
+            )
+            
             return {
                 'success': True,
                 'message': 'User created successfully',
@@ -100,7 +142,10 @@ class UserService:
             Dict with login status and user info if successful
         """
         # Get user
-        user_data = self.db.get_user_by_email(email)
+        user_data = self.db.get_user_by_email(
+            email,
+            projection=USER_AUTH_PROJECTION
+        )
         
         if not user_data:
             return {
@@ -128,18 +173,22 @@ class UserService:
             }
         }
     
-    def get_user_wallet(self, user_id: str) -> Dict[str, Any]:
+    def get_user_wallet(self, user_id: str, email: str = None) -> Dict[str, Any]:
         """
-        Get a user's wallet
+        Get a user's wallet and transaction summary
         
         Args:
             user_id: User ID
+            email: User email, if known (saves looking the user up)
             
         Returns:
-            Dict with wallet data
+            Dict with wallet data, the summary and the most recent trades
         """
         try:
-            wallet_data = self.db.get_wallet_by_user_id(user_id)
+            wallet_data = self.db.get_wallet_by_user_id(
+                user_id,
+                projection=WALLET_BALANCES_PROJECTION
+            )
             
             if not wallet_data:
                 return {
@@ -147,27 +196,29 @@ class UserService:
                     'message': 'Wallet not found'
                 }
                 
-            user_data = self.db.get_user_by_id(user_id)
-            
-            if not user_data:
-                return {
-                    'success': False,
-                    'message': 'User not found'
-                }
+            if email is None:
+                user_data = self.db.get_user_by_id(
+                    user_id,
+                    projection=USER_IDENTITY_PROJECTION
+                )
                 
-            # Get user transactions
-            transactions = self.db.get_user_transactions(user_data['email'])
+                if not user_data:
+                    return {
+                        'success': False,
+                        'message': 'User not found'
+                    }
+                email = user_data['email']
+                
+            # Totals and recent trades are kept current on every trade, so
+            # the full history is left to the transaction listings
+            summary = TransactionSummary.present(self.db.get_transaction_summary(email))
             
-            # Convert ObjectId to string
-            for transaction in transactions:
-                if '_id' in transaction:
-                    transaction['_id'] = str(transaction['_id'])
-                    
             return {
                 'success': True,
                 'wallet': wallet_data,
-                'transactions': transactions,
-                'email': user_data['email']
+                'summary': summary,
+                'transactions': summary['last_trades'],
+                'email': email
             }
         except Exception as e:
             logger.error(f"Error getting wallet: {str(e)}")
@@ -187,16 +238,15 @@ class UserService:
             Dict with transactions
         """
         try:
+            # Old transactions live in the archive, recent ones in the database
             if user_email:
-                transactions = self.db.get_user_transactions(user_email)
+                transactions = self._user_transactions(user_email)
             else:
-                transactions = self.db.get_all_transactions()
+                transactions = merge_transactions(
+                    self.archive.read(),
+                    self.db.get_all_transactions()
+                )
                 
-            # Convert ObjectId to string
-            for transaction in transactions:
-                if '_id' in transaction:
-                    transaction['_id'] = str(transaction['_id'])
-                    
             return {
                 'success': True,
                 'transactions': transactions
@@ -206,4 +256,22 @@ class UserService:
             return {
                 'success': False,
                 'message': 'Internal server error'
-            } 
\ No newline at end of file
+            } 
+
+_user_service = None
+_user_service_lock = threading.Lock()
+
+
+def get_user_service() -> UserService:
+    """
+    Get the process-wide user service, built on first use
+
+    Returns:
+        Shared UserService instance
+    """
+    global _user_service
+    if _user_service is None:
+        with _user_service_lock:
+            if _user_service is None:
+                _user_service = UserService()
+    return _user_service
@@ -0,0 +1,133 @@
+"""
+Version counters for cache validation of listings
+"""
+from typing import Optional
+from datetime import datetime
+import threading
+import uuid
+import logging
+from app.config.config import get_config
+from app.services.database import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Version keys
+BOOK_VERSION = 'book'
+TRANSACTIONS_VERSION = 'transactions'
+
+
+def user_transactions_version(email: str) -> str:
+    """Version key of one user's transactions"""
+    return f'{TRANSACTIONS_VERSION}:{email}'
+
+
+class VersionService:
+    """
+    Monotonic counters bumped whenever a listing changes
+
+    With a single writer process the counters live in memory, and checking
+    a version costs nothing. Otherwise they are kept in MongoDB, and checking
+    one is a single lookup by _id.
+
+    Offers also leave the book when they expire, which bumps nothing until a
+    sweep removes them, so the book's tag carries the next expiry as well.
+    """
+
+    def __init__(self, db: DatabaseService = None, shared: bool = None):
+        """
+        Initialize the service
+
+        Args:
+            db: Database service for shared counters
+            shared: Keep counters in MongoDB (defaults to True in inline mode,
+                where several processes may write)
+        """
+        if shared is None:
+            shared = get_config().MATCHING_ENGINE_MODE == 'inline'
+        self.db = db or DatabaseService()
+        self.shared = shared
+        # In-memory counters restart at 0, the epoch keeps old tags from matching
+        self.epoch = 'shared' if shared else uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._next_expiry = None
+        self._lock = threading.Lock()
+
+    def bump(self, *keys: str):
+        """
+        Advance the versions of changed listings
+
+        Args:
+            *keys: Version keys
+        """
+        if self.shared:
+            try:
+                self.db.bump_versions(list(keys))
+            except Exception as e:
+                logger.error(f"Error bumping versions {keys}: {str(e)}")
+            return
+
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def get(self, key: str) -> int:
+        """Get the current version of a listing"""
+        if self.shared:
+            return self.db.get_version(key)
+        return self._versions.get(key, 0)
+
+    def etag(self, key: str) -> Optional[str]:
+        """
+        Get the entity tag of a listing
+
+        Args:
+            key: Version key
+
+        Returns:
+            Tag value, or None if the version could not be read
+        """
+        try:
+            version = self.get(key)
+            if key != BOOK_VERSION:
+                return f'{self.epoch}-{version}'
+            next_expiry = self._get_next_expiry(version)
+            if next_expiry is None:
+                return f'{self.epoch}-{version}'
+            return f'{self.epoch}-{version}-{next_expiry:%Y%m%d%H%M%S%f}'
+        except Exception as e:
+            logger.error(f"Error reading version {key}: {str(e)}")
+            return None
+
+    def _get_next_expiry(self, version: int) -> Optional[datetime]:
+        """
+        Get the next expiry in the book, looked up again only once the book
+        changes or that expiry has passed
+
+        Args:
+            version: Current book version
+
+        Returns:
+            Earliest expiry of a live offer, or None if no live offer expires
+        """
+        now = datetime.utcnow()
+        cached = self._next_expiry
+        if cached is not None and cached[0] == version and (cached[1] is None or cached[1] > now):
+            return cached[1]
+
+        next_expiry = self.db.get_next_offer_expiry(now)
+        self._next_expiry = (version, next_expiry)
+        return next_expiry
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_version_service() -> VersionService:
+    """Get the process-wide version service"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = VersionService()
+    return _service
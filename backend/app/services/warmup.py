@@ -0,0 +1,195 @@
+"""
+Warm-up of a process before it takes traffic
+"""
+from typing import Dict, Any, Callable, List, Tuple
+import os
+import threading
+import time
+import logging
+from app.services.database import DatabaseService
+from app.services.offer_service import OfferService, get_offer_service
+from app.services.storage_backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Brings a process to readiness in the background
+
+    The steps run in order: the database answers a ping, the required
+    indexes exist, and the order book is loaded (journal recovery and
+    matching workers in the journaled and sharded modes, then the depth
+    levels). A failed step is retried with every later one until all pass.
+    Readiness is per process, so a forked worker warms up on its own.
+    """
+
+    def __init__(
+        self,
+        db: StorageBackend = None,
+        offer_service: OfferService = None,
+        retry_interval: float = 5
+    ):
+        """
+        Initialize the warm-up
+
+        Args:
+            db: Storage backend to check (defaults to the configured one)
+            offer_service: Service whose order book is loaded (defaults to
+                the shared one)
+            retry_interval: Seconds between attempts while a step fails
+        """
+        self._db = db
+        self._offer_service = offer_service
+        self.retry_interval = retry_interval
+        self.steps: List[Tuple[str, Callable[[], Any]]] = [
+            ('database', self._ping),
+            ('indexes', self._indexes),
+            ('order_book', self._order_book)
+        ]
+        self._results = {}
+        self._ready = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def db(self) -> StorageBackend:
+        """Storage backend checked by the warm-up"""
+        if self._db is None:
+            self._db = DatabaseService()
+        return self._db
+
+    @property
+    def offer_service(self) -> OfferService:
+        """Service whose order book is loaded"""
+        if self._offer_service is None:
+            self._offer_service = get_offer_service()
+        return self._offer_service
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether every step passed in this process"""
+        return self._ready and self._pid == os.getpid()
+
+    # Steps
+    def _ping(self):
+        """Check the database answers"""
+        self.db.ping()
+
+    def _indexes(self):
+        """Create the required indexes and check they exist"""
+        self.db.ensure_indexes()
+        missing = self.db.missing_indexes()
+        if missing:
+            raise RuntimeError(f"Missing indexes: {', '.join(missing)}")
+
+    def _order_book(self) -> Dict[str, int]:
+        """Load the order book and its depth levels"""
+        service = self.offer_service
+        if service.store is not None:
+            service.store.start()
+        if service.engine is not None:
+            service.engine.start()
+        service.depth.warm()
+        return service.depth.stats()
+
+    def _claim_process(self):
+        """Forget results inherited from a parent process"""
+        if self._pid != os.getpid():
+            self._results = {}
+            self._ready = False
+            self._pid = os.getpid()
+
+    def run_once(self) -> bool:
+        """
+        Run the steps in order, stopping at the first failure
+
+        Returns:
+            Whether every step passed
+        """
+        with self._lock:
+            self._claim_process()
+
+        ready = True
+        for name, step in self.steps:
+            started = time.perf_counter()
+            result = {'ok': True}
+            try:
+                details = step()
+                if details:
+                    result['details'] = details
+            except Exception as e:
+                result = {'ok': False, 'error': str(e)}
+                ready = False
+            result['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            with self._lock:
+                self._results[name] = result
+            if not ready:
+                logger.warning(f"Warm-up step {name} failed: {result['error']}")
+                break
+
+        with self._lock:
+            self._ready = ready
+        return ready
+
+    # Background thread
+    def _running(self) -> bool:
+        """Whether the warm-up thread is alive in this process"""
+        return (
+            self._thread is not None
+            and self._pid == os.getpid()
+            and self._thread.is_alive()
+        )
+
+    def ensure_started(self):
+        """Start warming up once per process, unless already ready"""
+        if self.is_ready or self._running():
+            return
+        with self._lock:
+            if self._running():
+                return
+            self._claim_process()
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Stop retrying"""
+        self._stop_event.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Warm-up thread body"""
+        started = time.perf_counter()
+        while not self.run_once():
+            if self._stop_event.wait(self.retry_interval):
+                return
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.3f}s (pid {os.getpid()})")
+
+    # Probes
+    def status(self) -> Dict[str, Any]:
+        """
+        Readiness of this process
+
+        Once warmed up, the database is pinged again on every call, so a
+        process that loses its database stops reporting ready.
+
+        Returns:
+            Dict with the readiness and the result of each step
+        """
+        with self._lock:
+            current = self._pid == os.getpid()
+            ready = self._ready and current
+            steps = dict(self._results) if current else {}
+
+        if ready:
+            try:
+                self.db.ping()
+            except Exception as e:
+                ready = False
+                steps['database'] = {'ok': False, 'error': str(e)}
+
+        return {'ready': ready, 'steps': steps}
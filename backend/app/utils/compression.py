@@ -0,0 +1,181 @@
+"""
+Response compression and shared compressed snapshots
+"""
+from typing import Dict, Optional, Tuple, Callable
+import gzip
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression levels: (per request, snapshot). Snapshots are built once per
+# version and served many times, so they can afford a slower level.
+LEVELS = {
+    'zstd': (3, 12),
+    'br': (4, 9),
+    'gzip': (6, 9)
+}
+
+
+def _compress_zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _compress_br(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)
+
+
+def _compress_gzip(data: bytes, level: int) -> bytes:
+    # Fixed mtime, so equal bodies compress to equal bytes
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Encodings usable in this process, preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return tuple(encodings)
+
+
+_COMPRESSORS = {
+    'zstd': _compress_zstd,
+    'br': _compress_br,
+    'gzip': _compress_gzip
+}
+
+
+def choose_encoding(accept_encodings) -> Optional[str]:
+    """
+    Pick the content encoding for a response
+
+    Args:
+        accept_encodings: Parsed Accept-Encoding header of the request
+
+    Returns:
+        Encoding with the highest quality, ties going to the better
+        compressor, or None to send the body as is
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str, snapshot: bool = False) -> bytes:
+    """
+    Compress a response body
+
+    Args:
+        data: Body to compress
+        encoding: Content encoding from choose_encoding()
+        snapshot: Use the slower level meant for shared snapshots
+
+    Returns:
+        Compressed body
+    """
+    level = LEVELS[encoding][1 if snapshot else 0]
+    return _COMPRESSORS[encoding](data, level)
+
+
+class SnapshotCache:
+    """
+    Finished response bodies of one listing, shared by every client
+
+    Entries are keyed by the listing's version tag and a variant (response
+    format and encoding). Only the newest tag is kept: the first body stored
+    for a new version drops the bodies of the previous one.
+    """
+
+    def __init__(self):
+        """Initialize an empty cache"""
+        self._tag = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tag: str, variant: Tuple) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """
+        Get a stored body
+
+        Args:
+            tag: Listing version tag
+            variant: Response variant
+
+        Returns:
+            Tuple of (body, headers), or None if it was not built yet
+        """
+        with self._lock:
+            entry = self._entries.get(variant) if tag == self._tag else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(
+        self,
+        tag: str,
+        variant: Tuple,
+        body: bytes,
+        headers: Dict[str, str],
+        current_tag: Callable[[], Optional[str]] = None
+    ):
+        """
+        Store a body built for a version
+
+        Args:
+            tag: Listing version tag the body was built for
+            variant: Response variant
+            body: Response body
+            headers: Response headers describing the body
+            current_tag: Reads the listing's current tag (optional); a body
+                built for a tag that has moved on is dropped rather than
+                replacing the newer version's bodies. It is read before
+                taking the lock, since it may query the database
+        """
+        current = current_tag() if current_tag is not None else tag
+        with self._lock:
+            if current != tag:
+                return
+            if tag != self._tag:
+                self._tag = tag
+                self._entries = {}
+            self._entries[variant] = (body, headers)
+
+    def clear(self):
+        """Drop every stored body"""
+        with self._lock:
+            self._tag = None
+            self._entries = {}
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit and miss counts"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+_snapshot_caches = {}
+_snapshot_caches_lock = threading.Lock()
+
+
+def get_snapshot_cache(name: str) -> SnapshotCache:
+    """Get the process-wide snapshot cache of a listing"""
+    with _snapshot_caches_lock:
+        cache = _snapshot_caches.get(name)
+        if cache is None:
+            cache = _snapshot_caches[name] = SnapshotCache()
+        return cache
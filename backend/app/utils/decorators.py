@@ -1,9 +1,23 @@
 """
 Custom decorators
 """
+from typing import Dict, Any, Callable, Tuple
+from concurrent.futures import Future
 from functools import wraps
-from flask import session, jsonify, request
+from flask import session, jsonify, request, make_response, current_app, g
 import logging
+import math
+from app.services.idempotency_service import (
+    get_idempotency_service,
+    IdempotencyService,
+    REPLAY,
+    IN_PROGRESS,
+    MISMATCH
+)
+from app.services.rate_limiter import get_rate_limiter
+from app.services.version_service import get_version_service
+from app.utils.compression import choose_encoding, compress, get_snapshot_cache
+from app.utils.msgpack_response import wants_msgpack, MSGPACK_MIMETYPE
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +41,12 @@ def login_required(f):
     return decorated_function
 
 
+def is_admin() -> bool:
+    """Whether the logged in user is listed in ADMIN_EMAILS"""
+    return 'user_id' in session and \
+        session.get('email') in current_app.config.get('ADMIN_EMAILS', ())
+
+
 def admin_required(f):
     """
     Decorator to require admin access for routes
@@ -43,11 +63,9 @@ def admin_required(f):
             logger.warning(f"Unauthorized access attempt to {request.path}")
             return jsonify({'message': 'Unauthorized, please login'}), 401
             
-        # This would need to be expanded with actual admin checking logic
-        # For now, we'll assume no admin functionality
-        # if not is_admin(session['user_id']):
-        #     logger.warning(f"Non-admin access attempt to {request.path}")
-        #     return jsonify({'message': 'Admin access required'}), 403
+        if not is_admin():
+            logger.warning(f"Non-admin access attempt to {request.path}")
+            return jsonify({'message': 'Admin access required'}), 403
             
         return f(*args, **kwargs)
     return decorated_function
@@ -81,4 +99,239 @@ def validate_json(required_fields):
                 
             return f(*args, **kwargs)
         return decorated_function
-    return decorator 
\ No newline at end of file
+    return decorator
+
+
+def rate_limit(rate, burst=None, global_rate=None, global_burst=None):
+    """
+    Decorator to limit how often a route is called, with token buckets
+    
+    Every user (or client address when logged out) gets a bucket per route;
+    an optional global bucket caps the route for everyone together.
+    
+    Args:
+        rate: Requests per second allowed per user
+        burst: Requests a user may make at once (defaults to rate)
+        global_rate: Requests per second allowed for all users (optional)
+        global_burst: Requests all users may make at once (defaults to global_rate)
+        
+    Returns:
+        Decorated function that rejects excess requests with 429
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+                return f(*args, **kwargs)
+                
+            client = session.get('user_id') or request.remote_addr
+            limits = {f'user:{client}:{request.endpoint}': (rate, burst or rate)}
+            if global_rate:
+                limits[f'global:{request.endpoint}'] = (global_rate, global_burst or global_rate)
+                
+            allowed, retry_after = get_rate_limiter().check(limits)
+            if not allowed:
+                logger.warning(f"Rate limit exceeded for {client} on {request.path}")
+                response = jsonify({'message': 'Too many requests, please slow down'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+                
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+
+def defer_idempotent(
+    pending: Future,
+    respond: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]]
+):
+    """
+    Keep the current request's Idempotency-Key reserved until an operation
+    still running has finished
+    
+    Retries are answered 409 in the meantime, then replay the outcome.
+    Without an Idempotency-Key this does nothing.
+    
+    Args:
+        pending: Future of the operation result
+        respond: Builds the JSON body and status code of the result
+    """
+    g.idempotency_pending = (pending, respond)
+
+
+def idempotent(f):
+    """
+    Decorator to replay the stored result of a request retried with the
+    same Idempotency-Key header
+    
+    Keys are scoped to the logged-in user and the endpoint. Requests
+    without the header run as usual. Server errors are not stored, so
+    they can be retried. A route whose operation is still running calls
+    defer_idempotent, and the outcome is stored once it is known.
+    
+    Args:
+        f: Function to wrap
+        
+    Returns:
+        Wrapped function that deduplicates retries
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+            
+        if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return jsonify({'message': 'Idempotency-Key is too long'}), 400
+            
+        service = get_idempotency_service()
+        record_id = IdempotencyService.record_id(session.get('user_id'), request.endpoint, key)
+        fingerprint = IdempotencyService.fingerprint(
+            request.method,
+            request.path,
+            request.get_data()
+        )
+        
+        started = service.begin(record_id, fingerprint)
+        if started['outcome'] == REPLAY:
+            response = make_response(jsonify(started['body']), started['status_code'])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if started['outcome'] == IN_PROGRESS:
+            return jsonify({
+                'message': 'A request with this Idempotency-Key is still in progress'
+            }), 409
+        if started['outcome'] == MISMATCH:
+            return jsonify({
+                'message': 'Idempotency-Key was already used for a different request'
+            }), 422
+            
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            service.release(record_id)
+            raise
+            
+        pending = g.pop('idempotency_pending', None)
+        if pending is not None:
+            future, respond = pending
+            
+            def finish(done: Future):
+                # A lost outcome leaves the key reserved: after
+                # IDEMPOTENCY_LOCK_SECONDS a retry may take it over
+                if done.exception() is not None:
+                    return
+                try:
+                    body, status_code = respond(done.result())
+                    if status_code >= 500:
+                        service.release(record_id)
+                    else:
+                        service.complete(record_id, fingerprint, status_code, body)
+                except Exception as e:
+                    logger.error(f"Error storing the outcome of {record_id}: {str(e)}")
+                    
+            future.add_done_callback(finish)
+            return response
+            
+        if response.status_code >= 500:
+            service.release(record_id)
+        else:
+            service.complete(record_id, fingerprint, response.status_code, response.get_json())
+        return response
+    return decorated_function
+
+
+def conditional(version_key):
+    """
+    Decorator to answer 304 Not Modified while a listing is unchanged
+    
+    The listing version is sent as a weak ETag; a request whose
+    If-None-Match carries it again skips the view entirely.
+    
+    Args:
+        version_key: Version key, or a function returning it for the request
+        
+    Returns:
+        Decorated function that supports conditional GET
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = version_key() if callable(version_key) else version_key
+            # Read before the view runs, so a concurrent change makes the tag stale
+            etag = get_version_service().etag(key)
+            if etag is None:
+                return f(*args, **kwargs)
+                
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+
+def compressed(snapshot_version=None):
+    """
+    Decorator to compress large responses with the client's preferred encoding
+    
+    Bodies of at least COMPRESSION_MIN_BYTES are sent with zstd, brotli or
+    gzip, as negotiated through Accept-Encoding. With snapshot_version, the
+    listing must be the same for every client: its finished bodies are kept
+    per version and format, so the query and compression run once per
+    version instead of once per request.
+    
+    Args:
+        snapshot_version: Version key of a listing shared by all clients (optional)
+        
+    Returns:
+        Decorated function that compresses its responses
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config.get('COMPRESSION_ENABLED', True):
+                return f(*args, **kwargs)
+                
+            encoding = choose_encoding(request.accept_encodings)
+            tag = get_version_service().etag(snapshot_version) if snapshot_version else None
+            if tag is not None:
+                cache = get_snapshot_cache(snapshot_version)
+                variant = (MSGPACK_MIMETYPE if wants_msgpack() else 'application/json', encoding)
+                entry = cache.get(tag, variant)
+                if entry is not None:
+                    body, headers = entry
+                    return current_app.response_class(body, headers=headers)
+                    
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+                return response
+                
+            response.vary.add('Accept-Encoding')
+            body = response.get_data()
+            if encoding and len(body) >= current_app.config.get('COMPRESSION_MIN_BYTES', 1024):
+                body = compress(body, encoding, snapshot=tag is not None)
+                response.set_data(body)
+                response.headers['Content-Encoding'] = encoding
+                
+            if tag is not None:
+                cache.put(
+                    tag,
+                    variant,
+                    body,
+                    dict(response.headers),
+                    current_tag=lambda: get_version_service().etag(snapshot_version)
+                )
+            return response
+        return decorated_function
+    return decorator
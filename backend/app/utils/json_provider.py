@@ -0,0 +1,85 @@
+"""
+Fast JSON provider with native BSON type handling
+"""
+from datetime import datetime, date
+from decimal import Decimal
+import json
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(obj):
+    """
+    Encode types the JSON encoders do not handle themselves
+
+    Args:
+        obj: Object to encode
+
+    Returns:
+        JSON-compatible value
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, datetime):
+        # Stored times are naive UTC
+        if obj.tzinfo is None:
+            return obj.isoformat() + 'Z'
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider serializing MongoDB documents as they come
+
+    ObjectId, Decimal128 and datetime values are encoded directly, so
+    services no longer convert documents field by field. Uses orjson when
+    it is installed and the standard library otherwise, with the same output
+    format either way (datetimes as ISO 8601 UTC).
+    """
+
+    default = staticmethod(encode_default)
+
+    def _orjson_options(self) -> int:
+        """orjson flags matching the provider settings"""
+        options = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        """Serialize data as JSON"""
+        if orjson is None or kwargs:
+            kwargs.setdefault('default', encode_default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=encode_default, option=self._orjson_options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        """Deserialize data as JSON"""
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Serialize data as a JSON response, without an intermediate str"""
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        data = orjson.dumps(obj, default=encode_default, option=self._orjson_options())
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
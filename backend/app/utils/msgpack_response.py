@@ -0,0 +1,76 @@
+"""
+MessagePack responses for clients that ask for them
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from flask import request, jsonify, current_app
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+def encode_default(obj):
+    """
+    Encode types MessagePack does not handle itself
+
+    ObjectIds become their raw 12 bytes and datetimes the MessagePack
+    timestamp extension type.
+
+    Args:
+        obj: Object to encode
+
+    Returns:
+        MessagePack-compatible value
+    """
+    if isinstance(obj, ObjectId):
+        return obj.binary
+    if isinstance(obj, datetime):
+        # Stored times are naive UTC
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not MessagePack serializable')
+
+
+def packb(data) -> bytes:
+    """Serialize data as MessagePack"""
+    return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+def wants_msgpack() -> bool:
+    """Whether the request prefers MessagePack over JSON"""
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
+
+
+def negotiated_response(data, status: int = 200):
+    """
+    Build a JSON or MessagePack response, following the Accept header
+
+    Args:
+        data: Response data
+        status: HTTP status code
+
+    Returns:
+        Flask response
+    """
+    if wants_msgpack():
+        response = current_app.response_class(packb(data), status=status, mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(data)
+        response.status_code = status
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,417 @@
+"""
+Request profiling with cProfile or a stack sampler
+"""
+from typing import Dict, Any, List, Optional
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+import uuid
+from flask import g, request
+from app.config.config import get_config
+from app.utils.decorators import is_admin
+
+logger = logging.getLogger(__name__)
+
+# Profiling modes
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+MODES = (CPROFILE, SAMPLING)
+
+# An admin sends X-Profile: <mode> and gets the profile ID back
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+
+def frame_name(frame) -> str:
+    """Name of a stack frame as module:function"""
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def collapse_stack(frame) -> str:
+    """Collapse a stack into one line, outermost frame first"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """Format sampled stacks as collapsed stack lines for flame graph tools"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """
+    Background thread sampling the stacks of request threads
+
+    Every interval it reads the current frame of each tracked thread, so the
+    sampled code runs at full speed. Threads can be tracked into their own
+    counter, for a single request, and while the window is enabled every
+    request thread is also counted into per-second buckets covering the last
+    window_seconds.
+    """
+
+    def __init__(self, interval: float = 0.01, window_seconds: int = 300):
+        """
+        Initialize the sampler
+
+        Args:
+            interval: Seconds between samples
+            window_seconds: Length of the rolling window
+        """
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.window_enabled = False
+        self.samples = 0
+        # Thread ident -> counter of one request's samples
+        self._tracked = {}
+        # Idents of threads currently handling a request
+        self._request_threads = set()
+        # (second, counter) buckets of the rolling window, oldest first
+        self._window = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self):
+        """Start the sampling thread on first use"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='stack-sampler', daemon=True
+            )
+            self._thread.start()
+        self._wake.set()
+
+    def _busy(self) -> bool:
+        """Whether any thread needs sampling"""
+        return bool(self._tracked) or (self.window_enabled and bool(self._request_threads))
+
+    def _run(self):
+        """Sample while there is something to sample, otherwise sleep"""
+        while True:
+            self._wake.clear()
+            if not self._busy():
+                self._wake.wait()
+                continue
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        """Take one sample of the tracked and request threads"""
+        frames = sys._current_frames()
+        now = int(time.monotonic())
+        with self._lock:
+            self.samples += 1
+            for ident, stacks in self._tracked.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[collapse_stack(frame)] += 1
+            if not self.window_enabled or not self._request_threads:
+                return
+            if not self._window or self._window[-1][0] != now:
+                self._window.append((now, Counter()))
+            bucket = self._window[-1][1]
+            for ident in self._request_threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    bucket[collapse_stack(frame)] += 1
+            self._expire(now)
+
+    def _expire(self, now: int):
+        """Drop window buckets older than window_seconds"""
+        while self._window and self._window[0][0] <= now - self.window_seconds:
+            self._window.popleft()
+
+    def track(self, ident: int) -> Counter:
+        """Start counting samples of a thread into its own counter"""
+        stacks = Counter()
+        with self._lock:
+            self._tracked[ident] = stacks
+        self._ensure_started()
+        return stacks
+
+    def untrack(self, ident: int):
+        """Stop counting samples of a thread"""
+        with self._lock:
+            self._tracked.pop(ident, None)
+
+    def request_started(self, ident: int):
+        """Count a thread into the window while it handles a request"""
+        with self._lock:
+            self._request_threads.add(ident)
+        if self.window_enabled:
+            self._ensure_started()
+
+    def request_finished(self, ident: int):
+        """Stop counting a thread into the window"""
+        with self._lock:
+            self._request_threads.discard(ident)
+
+    def set_window(self, enabled: bool):
+        """Turn the rolling window on or off, clearing it when turned off"""
+        with self._lock:
+            self.window_enabled = enabled
+            if not enabled:
+                self._window.clear()
+        if enabled:
+            self._ensure_started()
+
+    def window(self, seconds: Optional[int] = None) -> Counter:
+        """
+        Stacks sampled in the rolling window
+
+        Args:
+            seconds: Only the most recent seconds (defaults to the whole window)
+
+        Returns:
+            Counter of collapsed stacks
+        """
+        now = int(time.monotonic())
+        since = now - min(seconds or self.window_seconds, self.window_seconds)
+        stacks = Counter()
+        with self._lock:
+            self._expire(now)
+            for second, bucket in self._window:
+                if second > since:
+                    stacks.update(bucket)
+        return stacks
+
+
+class RequestProfile:
+    """Profile of a single request"""
+
+    def __init__(self, mode: str, method: str, path: str):
+        """
+        Initialize the profile
+
+        Args:
+            mode: One of MODES
+            method: HTTP method
+            path: Request path
+        """
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.status = None
+        self.duration_ms = None
+        self.stats = None
+        self.stacks = None
+        self._profile = None
+        self._started = None
+
+    def summary(self) -> Dict[str, Any]:
+        """Describe the profile without its data"""
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'method': self.method,
+            'path': self.path,
+            'started_at': self.started_at,
+            'status': self.status,
+            'duration_ms': self.duration_ms,
+            'samples': sum(self.stacks.values()) if self.stacks is not None else None
+        }
+
+    def pstats_dump(self) -> bytes:
+        """The cProfile data in the format pstats.Stats loads from a file"""
+        return marshal.dumps(self.stats.stats)
+
+    def pstats_text(self, sort: str = 'cumulative', limit: int = 50) -> str:
+        """The cProfile data as a pstats report"""
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def collapsed(self) -> str:
+        """The sampled stacks as collapsed stack lines"""
+        return format_collapsed(self.stacks)
+
+
+class Profiler:
+    """
+    Profiles requests an admin asks for, and keeps the latest profiles
+
+    A request sent by an admin with the X-Profile header set to 'cprofile'
+    or 'sampling' is profiled on its own; the response carries the profile
+    ID in X-Profile-Id. With the window enabled, the sampler also counts
+    every request into a rolling window of collapsed stacks.
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = 10,
+        window_seconds: int = 300,
+        max_profiles: int = 20,
+        window_enabled: bool = False
+    ):
+        """
+        Initialize the profiler
+
+        Args:
+            interval_ms: Milliseconds between stack samples
+            window_seconds: Length of the rolling window
+            max_profiles: Request profiles kept, oldest dropped first
+            window_enabled: Sample every request into the rolling window
+        """
+        self.sampler = StackSampler(interval_ms / 1000, window_seconds)
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        if window_enabled:
+            self.sampler.set_window(True)
+
+    def init_app(self, app):
+        """
+        Register the request hooks on a Flask application
+
+        Args:
+            app: Flask application
+        """
+        app.extensions['profiler'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # Request profiles
+    def start(self, mode: str, method: str, path: str) -> Optional[RequestProfile]:
+        """
+        Start profiling the current thread
+
+        Args:
+            mode: One of MODES
+            method: HTTP method
+            path: Request path
+
+        Returns:
+            Running profile, or None if cProfile is busy in this thread
+        """
+        profile = RequestProfile(mode, method, path)
+        profile._started = time.perf_counter()
+        if mode == CPROFILE:
+            profile._profile = cProfile.Profile()
+            try:
+                profile._profile.enable()
+            except ValueError as e:
+                logger.warning(f"Cannot profile {method} {path}: {str(e)}")
+                return None
+        else:
+            profile.stacks = self.sampler.track(threading.get_ident())
+        return profile
+
+    def finish(self, profile: RequestProfile, status: Optional[int] = None) -> str:
+        """
+        Stop a running profile and keep it
+
+        Args:
+            profile: Profile returned by start
+            status: Response status code
+
+        Returns:
+            Profile ID
+        """
+        if profile.mode == CPROFILE:
+            profile._profile.disable()
+            profile.stats = pstats.Stats(profile._profile)
+        else:
+            self.sampler.untrack(threading.get_ident())
+        profile.duration_ms = round((time.perf_counter() - profile._started) * 1000, 3)
+        profile.status = status
+
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile.id
+
+    def get_profile(self, profile_id: str) -> Optional[RequestProfile]:
+        """Get a kept profile by ID"""
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Summaries of the kept profiles, newest first"""
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [profile.summary() for profile in reversed(profiles)]
+
+    # Rolling window
+    def set_window(self, enabled: bool):
+        """Turn sampling of every request on or off"""
+        self.sampler.set_window(enabled)
+
+    def window_collapsed(self, seconds: Optional[int] = None) -> str:
+        """Collapsed stacks of the rolling window"""
+        return format_collapsed(self.sampler.window(seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        """Profiler state"""
+        with self._lock:
+            profiles = len(self._profiles)
+        return {
+            'window_enabled': self.sampler.window_enabled,
+            'window_seconds': self.sampler.window_seconds,
+            'interval_ms': round(self.sampler.interval * 1000, 3),
+            'samples': self.sampler.samples,
+            'profiles': profiles
+        }
+
+    # Flask hooks
+    def _before_request(self):
+        """Start the profile an admin asked for and join the window"""
+        self.sampler.request_started(threading.get_ident())
+        mode = request.headers.get(PROFILE_HEADER, '').strip().lower()
+        if mode in MODES and is_admin():
+            g.request_profile = self.start(mode, request.method, request.path)
+
+    def _after_request(self, response):
+        """Finish the request's profile and return its ID"""
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            response.headers[PROFILE_ID_HEADER] = self.finish(profile, response.status_code)
+        return response
+
+    def _teardown_request(self, exception=None):
+        """Leave the window, and keep a profile cut short by an error"""
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            self.finish(profile, 500)
+        self.sampler.request_finished(threading.get_ident())
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler(config=None) -> Profiler:
+    """
+    Get the process-wide profiler
+
+    Args:
+        config: Configuration class (defaults to the active one)
+
+    Returns:
+        Shared Profiler instance
+    """
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                config = config or get_config()
+                _profiler = Profiler(
+                    interval_ms=config.PROFILING_INTERVAL_MS,
+                    window_seconds=config.PROFILING_WINDOW_SECONDS,
+                    max_profiles=config.PROFILING_MAX_PROFILES,
+                    window_enabled=config.PROFILING_ENABLED
+                )
+    return _profiler
@@ -0,0 +1,50 @@
+"""
+Move old transactions from MongoDB to the columnar archive
+
+Usage:
+    python scripts/archive_transactions.py
+    python scripts/archive_transactions.py --days 30 --batch-size 5000
+    python scripts/archive_transactions.py --stats
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config.config import get_config
+from app.services.database import DatabaseService
+from app.services.transaction_archive import archive_transactions, get_transaction_archive
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    config = get_config()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=config.TRANSACTION_ARCHIVE_DAYS,
+                        help='Archive transactions older than this many days')
+    parser.add_argument('--batch-size', type=int, default=config.TRANSACTION_ARCHIVE_BATCH_SIZE,
+                        help='Transactions moved per batch')
+    parser.add_argument('--stats', action='store_true', help='Only print the archive size')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Archive transactions and print the result as JSON"""
+    args = parse_args(argv)
+    archive = get_transaction_archive()
+
+    if not args.stats:
+        before = datetime.utcnow() - timedelta(days=args.days)
+        result = archive_transactions(DatabaseService(), archive, before, args.batch_size)
+        print(json.dumps({'before': before.isoformat() + 'Z', **result}, sort_keys=True))
+
+    print(json.dumps(archive.stats(), sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Rebuild, verify and snapshot wallets from the balance ledger
+
+Usage:
+    python scripts/ledger_replay.py <user_id> [<user_id> ...]
+    python scripts/ledger_replay.py --all --verify
+    python scripts/ledger_replay.py --all --snapshot
+"""
+import argparse
+import json
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.database import DatabaseService
+from app.services.ledger_service import LedgerService
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('user_ids', nargs='*', help='Wallet owner IDs')
+    parser.add_argument('--all', action='store_true', help='Every wallet with ledger history')
+    parser.add_argument('--verify', action='store_true', help='Compare with the stored wallet')
+    parser.add_argument('--snapshot', action='store_true', help='Store a fresh snapshot')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Replay the requested wallets and print one JSON line per wallet"""
+    args = parse_args(argv)
+    db = DatabaseService()
+    ledger = LedgerService(db)
+
+    user_ids = db.get_ledger_user_ids() if args.all else args.user_ids
+    if not user_ids:
+        print('No wallets given, use --all or pass user IDs', file=sys.stderr)
+        return 2
+
+    inconsistent = 0
+    for user_id in user_ids:
+        if args.snapshot:
+            ledger.snapshot_wallet(user_id)
+
+        if args.verify:
+            result = ledger.verify_wallet(user_id)
+            inconsistent += not result['consistent']
+        else:
+            result = ledger.replay(user_id)
+            result['snapshot_cutoff'] = (
+                str(result['snapshot_cutoff']) if result['snapshot_cutoff'] else None
+            )
+
+        print(json.dumps(result, sort_keys=True))
+
+    return 1 if inconsistent else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
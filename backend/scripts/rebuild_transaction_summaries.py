@@ -0,0 +1,44 @@
+"""
+Rebuild the per-user transaction summaries from the full history
+
+Summaries are kept current as transactions are stored; run this once to
+backfill transactions stored before summaries existed, with trading stopped.
+
+Usage:
+    python scripts/rebuild_transaction_summaries.py
+"""
+import argparse
+import json
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config.config import get_config
+from app.models.transaction_summary import TransactionSummary
+from app.services.database import DatabaseService
+from app.services.transaction_archive import get_transaction_archive, merge_transactions
+
+
+def main(argv=None):
+    """Rebuild every summary and print the counts as JSON"""
+    argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]).parse_args(argv)
+    db = DatabaseService()
+
+    transactions = merge_transactions(get_transaction_archive().read(), db.get_all_transactions())
+    transactions.sort(key=lambda transaction: transaction['date'])
+    config = get_config()
+    summaries = TransactionSummary.build(
+        transactions,
+        config.TRANSACTION_SUMMARY_TRADES,
+        config.TRANSACTION_SUMMARY_APPLIED_IDS
+    )
+    db.upsert_documents('transaction_summaries', list(summaries.values()))
+
+    print(json.dumps({'transactions': len(transactions), 'summaries': len(summaries)}, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
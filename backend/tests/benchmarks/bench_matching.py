@@ -0,0 +1,252 @@
+"""
+Micro-benchmark of the offer service on synthetic order flow
+
+Usage:
+    python tests/benchmarks/bench_matching.py --operations 20000
+    python tests/benchmarks/bench_matching.py --pair-skew 2 --cancel-ratio 0.3 --output results.jsonl
+
+Prints one JSON object per run; with --output it is also appended to a
+JSON lines file, so results can be compared across commits.
+"""
+from typing import Dict, Any
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.config.config import get_config
+from app.services.memory_storage import MemoryStorage
+from app.services.offer_service import OfferService
+from tests.benchmarks.order_flow import OrderFlow, RATE_DISTRIBUTIONS, CREATE, CANCEL, EXECUTE
+from tests.benchmarks.stats import summarize
+
+
+class MatchingBenchmark:
+    """Drive an offer service over in-memory storage with an order flow"""
+
+    def __init__(self, flow: OrderFlow):
+        """
+        Set up users with funded wallets and a fresh service
+
+        Args:
+            flow: Order flow to run
+        """
+        self.flow = flow
+        self.db = MemoryStorage()
+        self.service = OfferService(db=self.db)
+        self.emails = []
+        for index in range(flow.users):
+            email = f'bench{index}@example.com'
+            user_id = self.db.create_user({'email': email, 'name': f'Bench {index}', 'password': ''})
+            self.db.create_wallet({'user': user_id, 'currencies': flow.wallet_currencies()})
+            self.emails.append(email)
+
+    def _open_offer(self, pick: float):
+        """Map a pick in [0, 1) onto an open offer"""
+        offer_ids = self.db.document_ids('offers')
+        if not offer_ids:
+            return None
+        return self.db.get_offer_by_id(str(offer_ids[int(pick * len(offer_ids))]))
+
+    def prepare(self, operation: Dict[str, Any]):
+        """
+        Turn an operation into a service call, outside the timed section
+
+        Returns:
+            Tuple of (function, keyword arguments), or None if there is no
+            open offer to cancel or take
+        """
+        if operation['op'] == CREATE:
+            return self.service.create_offer, {
+                'from_user_email': self.emails[operation['user']],
+                'from_value': operation['from_value'],
+                'from_currency': operation['from_currency'],
+                'to_value': operation['to_value'],
+                'to_currency': operation['to_currency']
+            }
+
+        offer = self._open_offer(operation['pick'])
+        if offer is None:
+            return None
+
+        if operation['op'] == CANCEL:
+            return self.service.cancel_offer, {
+                'offer_id': str(offer['_id']),
+                'user_email': offer['from_user']
+            }
+
+        email = self.emails[operation['user']]
+        if email == offer['from_user']:
+            email = self.emails[(operation['user'] + 1) % len(self.emails)]
+        return self.service.execute_transaction, {
+            'offer_id': str(offer['_id']),
+            'user_email': email
+        }
+
+
+def run(flow: OrderFlow, operations: int, warmup: int) -> Dict[str, Any]:
+    """
+    Time each operation of a flow
+
+    Args:
+        flow: Order flow
+        operations: Operations measured after the warm-up
+        warmup: Operations run first without measuring
+
+    Returns:
+        Latencies in nanoseconds and outcome counts per operation type
+    """
+    benchmark = MatchingBenchmark(flow)
+    latencies = {CREATE: [], CANCEL: [], EXECUTE: []}
+    succeeded = {CREATE: 0, CANCEL: 0, EXECUTE: 0}
+    skipped = 0
+
+    elapsed = 0
+    for index, operation in enumerate(flow.operations(warmup + operations)):
+        call = benchmark.prepare(operation)
+        if call is None:
+            skipped += index >= warmup
+            continue
+        fn, kwargs = call
+
+        start = time.perf_counter_ns()
+        result = fn(**kwargs)
+        duration = time.perf_counter_ns() - start
+
+        if index >= warmup:
+            elapsed += duration
+            latencies[operation['op']].append(duration)
+            succeeded[operation['op']] += bool(result.get('success'))
+
+    return {
+        'latencies': latencies,
+        'succeeded': succeeded,
+        'skipped': skipped,
+        'elapsed_ns': elapsed,
+        'open_offers': benchmark.db.count('offers'),
+        'transactions': benchmark.db.count('transactions')
+    }
+
+
+def measure_allocations(flow: OrderFlow, operations: int, warmup: int) -> Dict[str, Any]:
+    """
+    Trace memory allocated by each operation, in a separate untimed run
+
+    Returns:
+        Peak bytes allocated during an operation, and bytes still held after
+        the run
+    """
+    benchmark = MatchingBenchmark(flow)
+    peaks = []
+    retained_before = None
+
+    tracemalloc.start()
+    try:
+        for index, operation in enumerate(flow.operations(warmup + operations)):
+            call = benchmark.prepare(operation)
+            if call is None:
+                continue
+            fn, kwargs = call
+
+            if retained_before is None and index >= warmup:
+                retained_before = tracemalloc.get_traced_memory()[0]
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(**kwargs)
+            if index >= warmup:
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - retained_before if peaks else 0
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'peak_bytes_per_op': summarize(peaks),
+        'retained_bytes': retained,
+        'retained_bytes_per_op': round(retained / len(peaks), 1) if peaks else 0.0
+    }
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--operations', type=int, default=10000, help='Measured operations')
+    parser.add_argument('--warmup', type=int, default=1000, help='Operations run before measuring')
+    parser.add_argument('--users', type=int, default=100, help='Users placing orders')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the order flow')
+    parser.add_argument('--pair-skew', type=float, default=1.0, help='Zipf exponent of pair popularity')
+    parser.add_argument('--rate-distribution', choices=RATE_DISTRIBUTIONS, default='normal')
+    parser.add_argument('--rate-spread', type=float, default=0.02, help='Relative spread of rates')
+    parser.add_argument('--cancel-ratio', type=float, default=0.1, help='Share of cancellations')
+    parser.add_argument('--execute-ratio', type=float, default=0.1, help='Share of direct executions')
+    parser.add_argument('--no-allocations', action='store_true', help='Skip the allocation run')
+    parser.add_argument('--output', help='JSON lines file to append the result to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and print the result as JSON"""
+    args = parse_args(argv)
+    flow = OrderFlow(
+        users=args.users,
+        seed=args.seed,
+        pair_skew=args.pair_skew,
+        rate_distribution=args.rate_distribution,
+        rate_spread=args.rate_spread,
+        cancel_ratio=args.cancel_ratio,
+        execute_ratio=args.execute_ratio
+    )
+
+    timing = run(flow, args.operations, args.warmup)
+    measured = sum(len(values) for values in timing['latencies'].values())
+    report = {
+        'benchmark': 'matching',
+        'date': datetime.utcnow().isoformat() + 'Z',
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'engine_mode': get_config().MATCHING_ENGINE_MODE
+        },
+        'flow': flow.settings(),
+        'operations': measured,
+        'warmup': args.warmup,
+        'skipped': timing['skipped'],
+        'elapsed_seconds': round(timing['elapsed_ns'] / 1e9, 6),
+        'throughput_ops_per_second': round(measured / (timing['elapsed_ns'] / 1e9), 1)
+        if timing['elapsed_ns'] else 0.0,
+        'latency_us': summarize(
+            [value for values in timing['latencies'].values() for value in values], 1000
+        ),
+        'by_operation': {
+            op: {
+                'count': len(values),
+                'succeeded': timing['succeeded'][op],
+                'latency_us': summarize(values, 1000)
+            }
+            for op, values in timing['latencies'].items()
+        },
+        'book': {
+            'open_offers': timing['open_offers'],
+            'transactions': timing['transactions']
+        }
+    }
+    if not args.no_allocations:
+        report['allocations'] = measure_allocations(flow, args.operations, args.warmup)
+
+    line = json.dumps(report, sort_keys=True)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as output:
+            output.write(line + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
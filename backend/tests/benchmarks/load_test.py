@@ -0,0 +1,427 @@
+"""
+HTTP load test with session-aware virtual users
+
+Usage:
+    python tests/benchmarks/load_test.py --users 20 --duration 30
+    python tests/benchmarks/load_test.py --url http://localhost:5000 --mix add_offer=2,get_offers=5
+    python tests/benchmarks/load_test.py --no-rate-limit --output load.jsonl
+    DATABASE_BACKEND=memory python tests/benchmarks/load_test.py --no-rate-limit
+
+Every virtual user registers through /register, logs in to hold a session
+cookie and then calls the API in a loop, picking endpoints by the weights of
+--mix. Without --url the app runs in this process behind the Flask test
+client, using the configured database (DATABASE_BACKEND=memory measures the
+app without MongoDB). Prints one JSON object with latency percentiles,
+status codes and error rates per endpoint.
+"""
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+from http.client import HTTPConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import uuid
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from tests.benchmarks.order_flow import OrderFlow
+from tests.benchmarks.stats import summarize
+
+ENDPOINTS = ('add_offer', 'get_offers', 'make_transaction', 'cancel_offer', 'wallet')
+SIGN_UP_ENDPOINTS = ('register', 'login')
+
+DEFAULT_MIX = {
+    'add_offer': 3,
+    'get_offers': 4,
+    'make_transaction': 1,
+    'cancel_offer': 1,
+    'wallet': 1
+}
+
+
+class InProcessClient:
+    """Requests through the Flask test client, one cookie jar per user"""
+
+    def __init__(self, app):
+        """Initialize with a Flask application"""
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, body: Dict[str, Any] = None) -> Tuple[int, Any]:
+        """
+        Send a request
+
+        Returns:
+            Tuple of (status code, decoded JSON body or None)
+        """
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Requests over a kept-alive HTTP connection, with the session cookie"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        """Initialize with the base URL of a running server"""
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method: str, path: str, body: Dict[str, Any] = None) -> Tuple[int, Any]:
+        """
+        Send a request, reconnecting once if the connection was dropped
+
+        Returns:
+            Tuple of (status code, decoded JSON body or None)
+        """
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, self.prefix + path, body=data, headers=headers)
+                response = self.connection.getresponse()
+                payload = response.read()
+                break
+            except (ConnectionError, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+
+        try:
+            return response.status, json.loads(payload) if payload else None
+        except ValueError:
+            return response.status, None
+
+
+def _rate(count: int, seconds: float) -> float:
+    """Requests per second"""
+    return round(count / seconds, 1) if seconds else 0.0
+
+
+class EndpointStats:
+    """Latencies and outcomes of the requests to each endpoint"""
+
+    def __init__(self):
+        """Initialize empty statistics"""
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int]):
+        """
+        Record a request
+
+        Args:
+            endpoint: Endpoint name
+            seconds: Request latency
+            status: HTTP status code, or None if the request failed
+        """
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            statuses = self.statuses.setdefault(endpoint, {})
+            key = str(status) if status is not None else 'exception'
+            statuses[key] = statuses.get(key, 0) + 1
+            if status is None or status >= 500:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed: float, sign_up_elapsed: float) -> Dict[str, Any]:
+        """
+        Summarize every endpoint
+
+        Args:
+            elapsed: Seconds the users ran the mix
+            sign_up_elapsed: Seconds the users took to register and log in
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': len(latencies),
+                    'requests_per_second': _rate(
+                        len(latencies),
+                        sign_up_elapsed if endpoint in SIGN_UP_ENDPOINTS else elapsed
+                    ),
+                    'latency_ms': summarize(latencies, 0.001),
+                    'statuses': dict(sorted(self.statuses[endpoint].items())),
+                    'errors': self.errors.get(endpoint, 0),
+                    'error_rate': round(self.errors.get(endpoint, 0) / len(latencies), 4)
+                }
+                for endpoint, latencies in sorted(self.latencies.items())
+            }
+
+
+class VirtualUser:
+    """
+    One simulated client
+
+    It remembers the offers it last saw on /get_offers, so it can cancel its
+    own and take other users' ones.
+    """
+
+    def __init__(self, client, stats: EndpointStats, index: int, run_id: str, mix: Dict[str, float], seed: int):
+        """
+        Initialize the user
+
+        Args:
+            client: InProcessClient or HttpClient of this user
+            stats: Shared statistics
+            index: Number of the user
+            run_id: Identifier making emails unique to this run
+            mix: Weight of each endpoint
+            seed: Random seed
+        """
+        self.client = client
+        self.stats = stats
+        self.email = f'load-{run_id}-{index}@example.com'
+        self.password = f'load-{run_id}-password'
+        self.endpoints = list(mix)
+        self.weights = [mix[endpoint] for endpoint in self.endpoints]
+        self.rng = random.Random(seed * 100003 + index)
+        # Small amounts, so the random opening balances last
+        flow = OrderFlow(seed=seed * 100003 + index, cancel_ratio=0, execute_ratio=0, min_value=1, max_value=20)
+        self.orders = flow.operations(sys.maxsize)
+        self.own_offers = []
+        self.other_offers = []
+
+    def call(self, endpoint: str, method: str, path: str, body: Dict[str, Any] = None) -> Tuple[Optional[int], Any]:
+        """Send a request and record it under an endpoint name"""
+        start = time.perf_counter()
+        try:
+            status, payload = self.client.request(method, path, body)
+        except Exception:
+            status, payload = None, None
+        self.stats.record(endpoint, time.perf_counter() - start, status)
+        return status, payload
+
+    def sign_up(self) -> bool:
+        """Register and log in"""
+        self.call('register', 'POST', '/register', {
+            'email': self.email,
+            'password': self.password,
+            'name': self.email.split('@')[0]
+        })
+        status, _ = self.call('login', 'POST', '/login', {'email': self.email, 'password': self.password})
+        return status == 200
+
+    def step(self):
+        """Call one endpoint picked by the mix"""
+        endpoint = self.rng.choices(self.endpoints, weights=self.weights)[0]
+        getattr(self, endpoint)()
+
+    def add_offer(self):
+        """Offer currency from the order flow"""
+        order = next(self.orders)
+        self.call('add_offer', 'POST', '/add_offer', {
+            'fromValue': order['from_value'],
+            'fromCurrency': order['from_currency'],
+            'toValue': order['to_value'],
+            'toCurrency': order['to_currency']
+        })
+
+    def get_offers(self):
+        """Refresh the offers this user can cancel or take"""
+        status, offers = self.call('get_offers', 'GET', '/get_offers')
+        if status == 200 and isinstance(offers, list):
+            self.own_offers = [offer['_id'] for offer in offers if offer.get('from_user') == self.email]
+            self.other_offers = [offer['_id'] for offer in offers if offer.get('from_user') != self.email]
+
+    def make_transaction(self):
+        """Take an offer of another user"""
+        if not self.other_offers:
+            return self.get_offers()
+        offer_id = self.other_offers.pop(self.rng.randrange(len(self.other_offers)))
+        self.call('make_transaction', 'POST', f'/make_transaction/{offer_id}')
+
+    def cancel_offer(self):
+        """Cancel an own offer"""
+        if not self.own_offers:
+            return self.get_offers()
+        offer_id = self.own_offers.pop(self.rng.randrange(len(self.own_offers)))
+        self.call('cancel_offer', 'DELETE', f'/cancel_offer/{offer_id}')
+
+    def wallet(self):
+        """Read the wallet"""
+        self.call('wallet', 'GET', '/wallet')
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse a mix like 'add_offer=3,get_offers=4'"""
+    mix = {}
+    for item in value.split(','):
+        endpoint, _, weight = item.partition('=')
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'Unknown endpoint {endpoint}, use one of {", ".join(ENDPOINTS)}')
+        mix[endpoint] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('At least one endpoint needs a positive weight')
+    return mix
+
+
+def run(
+    make_client,
+    users: int,
+    duration: float = None,
+    requests_per_user: int = None,
+    mix: Dict[str, float] = None,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Run virtual users, one thread each
+
+    Args:
+        make_client: Function returning a new client (and cookie jar)
+        users: Number of virtual users
+        duration: Seconds to run after every user has logged in
+        requests_per_user: Requests each user makes instead of a duration
+        mix: Weight of each endpoint (defaults to DEFAULT_MIX)
+        seed: Random seed
+
+    Returns:
+        Report with per-endpoint statistics
+    """
+    stats = EndpointStats()
+    run_id = uuid.uuid4().hex[:8]
+    virtual_users = [
+        VirtualUser(make_client(), stats, index, run_id, mix or DEFAULT_MIX, seed)
+        for index in range(users)
+    ]
+    signed_up = []
+    ready = threading.Barrier(users + 1)
+    stop = threading.Event()
+
+    def work(user: VirtualUser):
+        logged_in = user.sign_up()
+        if logged_in:
+            signed_up.append(user)
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            return
+        if not logged_in:
+            return
+        count = 0
+        while not stop.is_set() and (requests_per_user is None or count < requests_per_user):
+            user.step()
+            count += 1
+
+    threads = [threading.Thread(target=work, args=(user,), daemon=True) for user in virtual_users]
+    sign_up_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    sign_up_seconds = start - sign_up_start
+
+    if requests_per_user is None:
+        time.sleep(duration or 10)
+        stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = stats.report(elapsed, sign_up_seconds)
+    total = sum(item['requests'] for name, item in endpoints.items() if name not in SIGN_UP_ENDPOINTS)
+    errors = sum(item['errors'] for name, item in endpoints.items() if name not in SIGN_UP_ENDPOINTS)
+    return {
+        'users': users,
+        'logged_in': len(signed_up),
+        'sign_up_seconds': round(sign_up_seconds, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'requests': total,
+        'requests_per_second': _rate(total, elapsed),
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'endpoints': endpoints
+    }
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Base URL of a running server (default: in-process app)')
+    parser.add_argument('--config', default=None, help='Configuration name of the in-process app')
+    parser.add_argument('--users', type=int, default=10, help='Virtual users')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+    parser.add_argument('--requests', type=int, help='Requests per user, instead of a duration')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='Endpoint weights, e.g. add_offer=3,wallet=1')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--no-rate-limit', action='store_true', help='Disable rate limiting of the in-process app')
+    parser.add_argument('--output', help='JSON lines file to append the result to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the load test and print the result as JSON"""
+    args = parse_args(argv)
+
+    if args.url:
+        target = args.url
+
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        from app import create_app
+        app = create_app(args.config)
+        if args.no_rate_limit:
+            app.config['RATE_LIMIT_ENABLED'] = False
+        target = 'in-process'
+
+        def make_client():
+            return InProcessClient(app)
+
+    result = run(
+        make_client,
+        users=args.users,
+        duration=args.duration,
+        requests_per_user=args.requests,
+        mix=args.mix,
+        seed=args.seed
+    )
+    report = {
+        'benchmark': 'load',
+        'date': datetime.utcnow().isoformat() + 'Z',
+        'target': target,
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine()
+        },
+        'mix': args.mix,
+        'seed': args.seed,
+        **result
+    }
+
+    line = json.dumps(report, sort_keys=True)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as output:
+            output.write(line + '\n')
+    return 0 if result['logged_in'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
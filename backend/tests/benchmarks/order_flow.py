@@ -0,0 +1,148 @@
+"""
+Reproducible synthetic order flow
+"""
+from typing import Dict, Any, Iterator, List, Tuple
+from itertools import permutations
+import random
+from app.models.wallet import Wallet
+
+# Rough units of each currency per USD, the centre of generated rates
+REFERENCE_RATES = {
+    'USD': 1.0,
+    'EUR': 0.92,
+    'GBP': 0.79,
+    'JPY': 150.0,
+    'CHF': 0.88,
+    'PLN': 4.0
+}
+
+RATE_DISTRIBUTIONS = ('normal', 'lognormal', 'uniform')
+
+# Operation types
+CREATE = 'create'
+CANCEL = 'cancel'
+EXECUTE = 'execute'
+
+
+class OrderFlow:
+    """
+    Stream of create, cancel and execute operations over the default currencies
+
+    The same seed always gives the same stream. Cancel and execute operations
+    do not name an offer, since offer IDs only exist once the flow runs:
+    they carry a number in [0, 1) the runner maps onto the open offers.
+    """
+
+    def __init__(
+        self,
+        users: int = 100,
+        seed: int = 0,
+        pair_skew: float = 1.0,
+        rate_distribution: str = 'normal',
+        rate_spread: float = 0.02,
+        cancel_ratio: float = 0.1,
+        execute_ratio: float = 0.1,
+        min_value: float = 10.0,
+        max_value: float = 1000.0
+    ):
+        """
+        Initialize the flow
+
+        Args:
+            users: Number of users placing orders
+            seed: Random seed
+            pair_skew: Zipf exponent of pair popularity (0 for uniform pairs)
+            rate_distribution: How rates spread around the reference rate,
+                one of RATE_DISTRIBUTIONS
+            rate_spread: Relative spread of rates
+            cancel_ratio: Share of operations cancelling an open offer
+            execute_ratio: Share of operations taking an open offer
+            min_value: Smallest amount offered, in USD
+            max_value: Largest amount offered, in USD
+        """
+        if rate_distribution not in RATE_DISTRIBUTIONS:
+            raise ValueError(f'Unknown rate distribution: {rate_distribution}')
+        if cancel_ratio < 0 or execute_ratio < 0 or cancel_ratio + execute_ratio > 1:
+            raise ValueError('Cancel and execute ratios must be positive and sum to at most 1')
+
+        self.users = users
+        self.seed = seed
+        self.pair_skew = pair_skew
+        self.rate_distribution = rate_distribution
+        self.rate_spread = rate_spread
+        self.cancel_ratio = cancel_ratio
+        self.execute_ratio = execute_ratio
+        self.min_value = min_value
+        self.max_value = max_value
+
+        # Which pairs are popular depends on the seed too
+        self.pairs = list(permutations(Wallet.DEFAULT_CURRENCIES, 2))
+        random.Random(seed).shuffle(self.pairs)
+        self.pair_weights = [1 / (rank + 1) ** pair_skew for rank in range(len(self.pairs))]
+
+    def settings(self) -> Dict[str, Any]:
+        """Get the parameters of the flow, for reports"""
+        return {
+            'users': self.users,
+            'seed': self.seed,
+            'pair_skew': self.pair_skew,
+            'rate_distribution': self.rate_distribution,
+            'rate_spread': self.rate_spread,
+            'cancel_ratio': self.cancel_ratio,
+            'execute_ratio': self.execute_ratio,
+            'min_value': self.min_value,
+            'max_value': self.max_value
+        }
+
+    def _rate_factor(self, rng: random.Random) -> float:
+        """Draw a rate relative to the reference rate"""
+        if self.rate_distribution == 'normal':
+            return max(0.01, rng.gauss(1.0, self.rate_spread))
+        if self.rate_distribution == 'lognormal':
+            return rng.lognormvariate(0.0, self.rate_spread)
+        return 1.0 + rng.uniform(-self.rate_spread, self.rate_spread)
+
+    def _pair(self, rng: random.Random) -> Tuple[str, str]:
+        """Draw a currency pair by popularity"""
+        return rng.choices(self.pairs, weights=self.pair_weights)[0]
+
+    def operations(self, count: int) -> Iterator[Dict[str, Any]]:
+        """
+        Generate operations
+
+        Args:
+            count: Number of operations
+
+        Yields:
+            Operation dicts with an 'op' type and its arguments
+        """
+        rng = random.Random(self.seed)
+        for _ in range(count):
+            draw = rng.random()
+            user = rng.randrange(self.users)
+            if draw < self.cancel_ratio:
+                yield {'op': CANCEL, 'pick': rng.random()}
+            elif draw < self.cancel_ratio + self.execute_ratio:
+                yield {'op': EXECUTE, 'user': user, 'pick': rng.random()}
+            else:
+                from_currency, to_currency = self._pair(rng)
+                usd_value = rng.uniform(self.min_value, self.max_value)
+                from_value = round(usd_value * REFERENCE_RATES[from_currency], 2)
+                to_value = round(
+                    usd_value * REFERENCE_RATES[to_currency] * self._rate_factor(rng), 2
+                )
+                yield {
+                    'op': CREATE,
+                    'user': user,
+                    'from_currency': from_currency,
+                    'to_currency': to_currency,
+                    'from_value': from_value,
+                    'to_value': to_value
+                }
+
+    def wallet_currencies(self, balance_usd: float = 1e9) -> List[Dict[str, Any]]:
+        """Starting balances large enough for the flow to never run out"""
+        return [
+            {'currency': currency, 'value': balance_usd * REFERENCE_RATES[currency]}
+            for currency in Wallet.DEFAULT_CURRENCIES
+        ]
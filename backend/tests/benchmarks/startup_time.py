@@ -0,0 +1,181 @@
+"""
+Cold start time of the app, with a per-module import breakdown
+
+Usage:
+    python tests/benchmarks/startup_time.py
+    python tests/benchmarks/startup_time.py --runs 10 --budget-ms 400 --output startup.jsonl
+
+Each run starts a fresh interpreter that imports the app, creates it, builds
+the shared services and serves one request. One extra run under
+-X importtime attributes the import time to packages and modules. Prints one
+JSON object; exits with 1 when the median import plus create_app time is
+over the budget, so CI can catch startup regressions.
+
+Measure with compiled bytecode, as the Docker image ships it: with
+PYTHONDONTWRITEBYTECODE set, run python -m compileall app first.
+"""
+from typing import Dict, Any, List
+from collections import defaultdict
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+# Add the project root to the path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+from tests.benchmarks.stats import summarize
+
+# Median milliseconds allowed for importing and creating the app
+STARTUP_BUDGET_MS = 500
+
+# Runs in the fresh interpreter; prints the phase durations as JSON
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(sys.argv[1] or None)
+created = time.perf_counter()
+from app.services.offer_service import get_offer_service
+from app.services.user_service import get_user_service
+get_offer_service()
+get_user_service()
+services = time.perf_counter()
+application.test_client().get('/get_offers')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'services_ms': (services - created) * 1000,
+    'first_request_ms': (served - services) * 1000
+}))
+'''
+
+PHASES = ('import_ms', 'create_app_ms', 'services_ms', 'first_request_ms')
+
+
+def run_probe(config: str = '', importtime: bool = False) -> Dict[str, Any]:
+    """
+    Start the app in a fresh interpreter
+
+    Args:
+        config: Configuration name (defaults to FLASK_ENV)
+        importtime: Run under -X importtime
+
+    Returns:
+        Phase durations, plus the -X importtime report as 'importtime'
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', PROBE, config]
+    completed = subprocess.run(
+        command, cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    phases = json.loads(completed.stdout.strip().splitlines()[-1])
+    phases['importtime'] = completed.stderr
+    return phases
+
+
+def parse_importtime(report: str) -> List[Dict[str, Any]]:
+    """
+    Parse the -X importtime report
+
+    Args:
+        report: stderr of an interpreter run with -X importtime
+
+    Returns:
+        One entry per module with its own and cumulative microseconds
+    """
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        modules.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_us': int(fields[0]),
+            'cumulative_us': int(fields[1])
+        })
+    return modules
+
+
+def by_package(modules: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Own import time per top-level package, in milliseconds, slowest first"""
+    totals = defaultdict(int)
+    for module in modules:
+        totals[module['module'].split('.')[0]] += module['self_us']
+    return {
+        package: round(us / 1000, 2)
+        for package, us in sorted(totals.items(), key=lambda item: -item[1])
+    }
+
+
+def slowest(modules: List[Dict[str, Any]], top: int, prefix: str = '') -> Dict[str, float]:
+    """Modules with the most own import time, in milliseconds"""
+    matching = [module for module in modules if module['module'].startswith(prefix)]
+    matching.sort(key=lambda module: -module['self_us'])
+    return {module['module']: round(module['self_us'] / 1000, 2) for module in matching[:top]}
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Timed cold starts')
+    parser.add_argument('--config', default='', help='Configuration name of the app')
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules listed')
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                        help='Median import plus create_app milliseconds allowed')
+    parser.add_argument('--output', help='JSON lines file to append the result to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Measure cold starts and print the result as JSON"""
+    args = parse_args(argv)
+
+    runs = [run_probe(args.config) for _ in range(args.runs)]
+    modules = parse_importtime(run_probe(args.config, importtime=True)['importtime'])
+
+    startup = [run['import_ms'] + run['create_app_ms'] for run in runs]
+    median_startup = summarize(startup)['p50']
+    report = {
+        'benchmark': 'startup',
+        'date': datetime.utcnow().isoformat() + 'Z',
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            # Without cached bytecode every start compiles edited modules
+            'write_bytecode': not sys.dont_write_bytecode
+        },
+        'runs': args.runs,
+        'phases_ms': {phase: summarize([run[phase] for run in runs]) for phase in PHASES},
+        'startup_ms': median_startup,
+        'budget_ms': args.budget_ms,
+        'within_budget': median_startup <= args.budget_ms,
+        'modules_imported': len(modules),
+        'import_by_package_ms': by_package(modules),
+        'slowest_modules_ms': slowest(modules, args.top),
+        'slowest_app_modules_ms': slowest(modules, args.top, prefix='app.')
+    }
+
+    line = json.dumps(report)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as output:
+            output.write(line + '\n')
+    return 0 if report['within_budget'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
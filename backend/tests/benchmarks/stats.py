@@ -0,0 +1,24 @@
+"""
+Latency statistics for benchmark reports
+"""
+from typing import Dict, List
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def summarize(values: List[float], scale: float = 1.0) -> Dict[str, float]:
+    """Percentiles of a sample, divided by scale"""
+    values = sorted(values)
+    return {
+        'p50': round(percentile(values, 0.50) / scale, 3),
+        'p90': round(percentile(values, 0.90) / scale, 3),
+        'p99': round(percentile(values, 0.99) / scale, 3),
+        'max': round(values[-1] / scale, 3) if values else 0.0,
+        'mean': round(sum(values) / len(values) / scale, 3) if values else 0.0
+    }
@@ -21,6 +21,8 @@ class TestAPI(unittest.TestCase):
         # Create a patcher for the DatabaseService
         self.db_patcher = patch('app.services.database.DatabaseService')
         self.mock_db_class = self.db_patcher.start()
+        # Stopped even when setUp fails, so the patch never leaks into other tests
+        self.addCleanup(self.db_patcher.stop)
         
         # Create a mock instance
         self.mock_db = MagicMock()
@@ -36,10 +38,6 @@ class TestAPI(unittest.TestCase):
         self.app = create_app('testing')
         self.client = self.app.test_client()
     
-    def tearDown(self):
-        """Clean up after tests"""
-        self.db_patcher.stop()
-    
     def test_register_route(self):
         """Test register route"""
         # Mock responses
@@ -13,9 +13,32 @@ from tests.unit.test_user_model import TestUserModel
 from tests.unit.test_wallet_model import TestWalletModel
 from tests.unit.test_offer_model import TestOfferModel
 from tests.unit.test_transaction_model import TestTransactionModel
+from tests.unit.test_ledger_model import TestLedgerEntryModel
 from tests.unit.test_user_service import TestUserService
-from tests.unit.test_offer_service import TestOfferService
+from tests.unit.test_offer_service import TestOfferService, TestOfferRoutes
 from tests.unit.test_database_service import TestDatabaseService
+from tests.unit.test_config import TestConfig
+from tests.unit.test_expiry_sweeper import TestOfferExpirySweeper
+from tests.unit.test_ledger_service import TestLedgerService
+from tests.unit.test_matching_engine import TestMatchingEngine
+from tests.unit.test_order_journal import TestOrderJournal
+from tests.unit.test_journaled_store import TestJournaledStore
+from tests.unit.test_persistence_pipeline import TestPersistencePipeline
+from tests.unit.test_idempotency_service import TestIdempotencyService, TestIdempotentDecorator
+from tests.unit.test_rate_limiter import TestRateLimiter, TestRateLimitDecorator
+from tests.unit.test_version_service import TestVersionService, TestConditionalDecorator
+from tests.unit.test_json_provider import TestFastJSONProvider
+from tests.unit.test_msgpack_response import TestMsgpackResponse
+from tests.unit.test_compression import TestCompression, TestCompressedDecorator
+from tests.unit.test_book_depth import TestBookDepth
+from tests.unit.test_benchmarks import TestOrderFlow, TestMatchingBenchmark, TestLoadTest, TestStartupTime
+from tests.unit.test_memory_storage import TestMemoryStorage
+from tests.unit.test_profiling import TestProfiler
+from tests.unit.test_warmup import TestWarmUp
+from tests.unit.test_transaction_archive import TestTransactionArchive
+from tests.unit.test_transaction_summary import TestTransactionSummary
+from tests.unit.test_report_service import TestReportService
+from tests.unit.test_scheduler import TestScheduler
 
 
 def create_test_suite():
@@ -28,11 +51,44 @@ def create_test_suite():
     test_suite.addTest(test_loader.loadTestsFromTestCase(TestWalletModel))
     test_suite.addTest(test_loader.loadTestsFromTestCase(TestOfferModel))
     test_suite.addTest(test_loader.loadTestsFromTestCase(TestTransactionModel))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestLedgerEntryModel))
     
     # Add service tests
     test_suite.addTest(test_loader.loadTestsFromTestCase(TestUserService))
     test_suite.addTest(test_loader.loadTestsFromTestCase(TestOfferService))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestOfferRoutes))
     test_suite.addTest(test_loader.loadTestsFromTestCase(TestDatabaseService))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestOfferExpirySweeper))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestLedgerService))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestMatchingEngine))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestOrderJournal))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestJournaledStore))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestPersistencePipeline))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestIdempotencyService))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestIdempotentDecorator))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestRateLimiter))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestRateLimitDecorator))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestVersionService))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestConditionalDecorator))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestFastJSONProvider))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestMsgpackResponse))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestCompression))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestCompressedDecorator))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestBookDepth))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestOrderFlow))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestMatchingBenchmark))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestLoadTest))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestStartupTime))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestMemoryStorage))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestProfiler))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestWarmUp))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestTransactionArchive))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestTransactionSummary))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestReportService))
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestScheduler))
+    
+    # Add configuration tests
+    test_suite.addTest(test_loader.loadTestsFromTestCase(TestConfig))
     
     return test_suite
 
@@ -0,0 +1,182 @@
+"""
+Unit tests for the benchmark order flow and harness
+"""
+import unittest
+import threading
+from flask import Flask, jsonify, request, session
+from werkzeug.serving import make_server
+from app.models.wallet import Wallet
+from tests.benchmarks.bench_matching import run
+from tests.benchmarks import load_test, startup_time
+from tests.benchmarks.load_test import InProcessClient, HttpClient, parse_mix
+from tests.benchmarks.order_flow import OrderFlow, CREATE, CANCEL, EXECUTE
+from tests.benchmarks.stats import percentile
+
+
+class TestOrderFlow(unittest.TestCase):
+    def test_same_seed_same_flow(self):
+        """Test flows are reproducible and depend on the seed"""
+        first = list(OrderFlow(seed=7).operations(200))
+        
+        self.assertEqual(first, list(OrderFlow(seed=7).operations(200)))
+        self.assertNotEqual(first, list(OrderFlow(seed=8).operations(200)))
+    
+    def test_operation_mix(self):
+        """Test operations follow the ratios and stay on default currencies"""
+        flow = OrderFlow(cancel_ratio=0.2, execute_ratio=0.3, pair_skew=2.0)
+        operations = list(flow.operations(5000))
+        counts = {op: sum(1 for item in operations if item['op'] == op) for op in (CREATE, CANCEL, EXECUTE)}
+        
+        self.assertAlmostEqual(counts[CANCEL] / 5000, 0.2, delta=0.03)
+        self.assertAlmostEqual(counts[EXECUTE] / 5000, 0.3, delta=0.03)
+        for item in operations:
+            if item['op'] == CREATE:
+                self.assertIn(item['from_currency'], Wallet.DEFAULT_CURRENCIES)
+                self.assertNotEqual(item['from_currency'], item['to_currency'])
+                self.assertGreater(item['to_value'], 0)
+    
+    def test_invalid_settings(self):
+        """Test unknown distributions and impossible ratios are rejected"""
+        with self.assertRaises(ValueError):
+            OrderFlow(rate_distribution='pareto')
+        with self.assertRaises(ValueError):
+            OrderFlow(cancel_ratio=0.6, execute_ratio=0.6)
+
+
+class TestMatchingBenchmark(unittest.TestCase):
+    def test_run_reports_every_operation(self):
+        """Test a short run drives the service without failures"""
+        timing = run(OrderFlow(users=10, seed=3), operations=300, warmup=50)
+        measured = sum(len(values) for values in timing['latencies'].values())
+        
+        self.assertEqual(measured + timing['skipped'], 300)
+        self.assertEqual(sum(timing['succeeded'].values()), measured)
+        self.assertGreater(timing['transactions'], 0)
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+
+
+def make_stub_app():
+    """Flask app answering the load test endpoints without a database"""
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    calls = []
+    
+    @app.route('/register', methods=['POST'])
+    def register():
+        return jsonify({'message': 'User created successfully'}), 201
+    
+    @app.route('/login', methods=['POST'])
+    def login():
+        session['email'] = request.get_json()['email']
+        return jsonify({'message': 'Login successful'}), 200
+    
+    @app.route('/get_offers')
+    def get_offers():
+        if 'email' not in session:
+            return jsonify({'message': 'Unauthorized, please login'}), 401
+        return jsonify([
+            {'_id': 'own', 'from_user': session['email']},
+            {'_id': 'other', 'from_user': 'someone@example.com'}
+        ]), 200
+    
+    @app.route('/add_offer', methods=['POST'])
+    @app.route('/make_transaction/<offer_id>', methods=['POST'])
+    @app.route('/cancel_offer/<offer_id>', methods=['DELETE'])
+    @app.route('/wallet')
+    def other(offer_id=None):
+        if 'email' not in session:
+            return jsonify({'message': 'Unauthorized, please login'}), 401
+        calls.append((request.path, offer_id))
+        return jsonify({'message': 'ok'}), 200
+    
+    return app, calls
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_parse_mix(self):
+        """Test endpoint weights are parsed and checked"""
+        self.assertEqual(parse_mix('add_offer=2,wallet'), {'add_offer': 2.0, 'wallet': 1.0})
+        with self.assertRaises(Exception):
+            parse_mix('login=1')
+    
+    def test_in_process_run(self):
+        """Test virtual users log in, follow the mix and report per endpoint"""
+        app, calls = make_stub_app()
+        
+        report = load_test.run(lambda: InProcessClient(app), users=3, requests_per_user=30)
+        
+        self.assertEqual(report['logged_in'], 3)
+        self.assertEqual(report['error_rate'], 0.0)
+        self.assertEqual(report['endpoints']['login']['statuses'], {'200': 3})
+        self.assertEqual(set(report['endpoints']), {'register', 'login', *load_test.ENDPOINTS})
+        self.assertIn(('/cancel_offer/own', 'own'), calls)
+        self.assertIn(('/make_transaction/other', 'other'), calls)
+    
+    def test_http_client_keeps_session(self):
+        """Test the HTTP client sends the session cookie back"""
+        app, _ = make_stub_app()
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = HttpClient(f'http://127.0.0.1:{server.server_port}')
+            self.assertEqual(client.request('GET', '/wallet')[0], 401)
+            client.request('POST', '/login', {'email': 'a@example.com'})
+            status, offers = client.request('GET', '/get_offers')
+        finally:
+            server.shutdown()
+        
+        self.assertEqual(status, 200)
+        self.assertEqual(offers[0]['from_user'], 'a@example.com')
+
+
+IMPORTTIME_REPORT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _io
+import time:       300 |        500 |   pymongo.errors
+import time:       900 |       1400 | pymongo
+import time:       200 |        200 |   app.config.config
+import time:        50 |       1650 | app
+"""
+
+
+class TestStartupTime(unittest.TestCase):
+    def test_parse_importtime(self):
+        """Test the -X importtime report is parsed per module"""
+        modules = startup_time.parse_importtime(IMPORTTIME_REPORT)
+        
+        self.assertEqual(len(modules), 5)
+        self.assertEqual(
+            modules[1],
+            {'module': 'pymongo.errors', 'depth': 1, 'self_us': 300, 'cumulative_us': 500}
+        )
+        self.assertEqual(modules[2]['depth'], 0)
+    
+    def test_breakdown(self):
+        """Test own time adds up per package and the slowest modules come first"""
+        modules = startup_time.parse_importtime(IMPORTTIME_REPORT)
+        
+        self.assertEqual(startup_time.by_package(modules), {'pymongo': 1.2, 'app': 0.25, '_io': 0.12})
+        self.assertEqual(startup_time.slowest(modules, 1), {'pymongo': 0.9})
+        self.assertEqual(startup_time.slowest(modules, 5, prefix='app.'), {'app.config.config': 0.2})
+    
+    def test_cold_start(self):
+        """Test a fresh interpreter reports every startup phase"""
+        phases = startup_time.run_probe('testing', importtime=True)
+        
+        for phase in startup_time.PHASES:
+            self.assertGreater(phases[phase], 0)
+        modules = startup_time.parse_importtime(phases['importtime'])
+        self.assertIn('app.services.database', {module['module'] for module in modules})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Unit tests for the aggregated book depth
+"""
+import unittest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from app.services.book_depth import BookDepth
+from app.services.version_service import VersionService, BOOK_VERSION
+
+
+def make_offer(from_currency, to_currency, from_value, to_value):
+    """Build an offer document"""
+    return {
+        '_id': ObjectId(),
+        'from_currency': from_currency,
+        'to_currency': to_currency,
+        'from_value': from_value,
+        'to_value': to_value
+    }
+
+
+class TestBookDepth(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.offers = [
+            make_offer('USD', 'EUR', 100.0, 90.0),
+            make_offer('USD', 'EUR', 50.0, 45.0),
+            make_offer('USD', 'EUR', 100.0, 85.0),
+            make_offer('EUR', 'USD', 80.0, 100.0),
+            make_offer('EUR', 'USD', 100.0, 100.0)
+        ]
+        self.mock_db = MagicMock()
+        self.mock_db.get_all_offers.return_value = self.offers
+        self.versions = VersionService(db=MagicMock(), shared=False)
+        self.depth = BookDepth(db=self.mock_db, versions=self.versions)
+    
+    def test_levels_are_aggregated_best_first(self):
+        """Test offers at one rate share a level, asks ascend and bids descend"""
+        book = self.depth.levels('USD', 'EUR', depth=10)
+        
+        self.assertEqual(book['asks'], [
+            {'rate': 0.85, 'volume': 100.0, 'count': 1},
+            {'rate': 0.9, 'volume': 150.0, 'count': 2}
+        ])
+        # Bids give EUR for USD, rates and volumes are per USD
+        self.assertEqual(book['bids'], [
+            {'rate': 1.0, 'volume': 100.0, 'count': 1},
+            {'rate': 0.8, 'volume': 100.0, 'count': 1}
+        ])
+    
+    def test_depth_limits_levels(self):
+        """Test only the best N levels are returned"""
+        book = self.depth.levels('USD', 'EUR', depth=1)
+        
+        self.assertEqual(len(book['asks']), 1)
+        self.assertEqual(book['asks'][0]['rate'], 0.85)
+        self.assertEqual(self.depth.levels('GBP', 'JPY', depth=5)['asks'], [])
+    
+    def test_incremental_updates(self):
+        """Test opened and closed offers update the loaded levels without a reload"""
+        self.depth.levels('USD', 'EUR', depth=10)
+        
+        offer = make_offer('USD', 'EUR', 20.0, 17.0)
+        self.depth.add(offer['_id'], offer)
+        self.depth.remove(self.offers[0]['_id'], self.offers[2]['_id'])
+        book = self.depth.levels('USD', 'EUR', depth=10)
+        
+        self.assertEqual(book['asks'], [
+            {'rate': 0.85, 'volume': 20.0, 'count': 1},
+            {'rate': 0.9, 'volume': 50.0, 'count': 1}
+        ])
+        self.mock_db.get_all_offers.assert_called_once()
+    
+    def test_updates_before_load_are_ignored(self):
+        """Test the first read loads the book, so earlier reports are not needed"""
+        offer = make_offer('GBP', 'PLN', 10.0, 50.0)
+        self.depth.add(offer['_id'], offer)
+        self.depth.remove(self.offers[0]['_id'])
+        
+        self.assertEqual(self.depth.stats(), {'pairs': 0, 'offers': 0})
+        self.depth.levels('USD', 'EUR', depth=10)
+        self.assertEqual(self.depth.stats(), {'pairs': 2, 'offers': 5})
+    
+    def test_shared_book_reloads_on_version_change(self):
+        """Test changes made by other processes are picked up once per version"""
+        versions = MagicMock(shared=True)
+        versions.etag.return_value = 'shared-1'
+        depth = BookDepth(db=self.mock_db, versions=versions)
+        
+        depth.levels('USD', 'EUR', depth=10)
+        depth.levels('USD', 'EUR', depth=10)
+        versions.etag.return_value = 'shared-2'
+        depth.levels('USD', 'EUR', depth=10)
+        
+        self.assertEqual(self.mock_db.get_all_offers.call_count, 2)
+        versions.etag.assert_called_with(BOOK_VERSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
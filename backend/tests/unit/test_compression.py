@@ -0,0 +1,160 @@
+"""
+Unit tests for response compression
+"""
+import unittest
+import gzip
+from unittest.mock import patch
+from flask import Flask, jsonify
+from werkzeug.http import parse_accept_header
+from app.services.memory_storage import MemoryStorage
+from app.services.version_service import VersionService, BOOK_VERSION
+from app.utils import compression
+from app.utils.compression import choose_encoding, compress, SnapshotCache, get_snapshot_cache
+from app.utils.decorators import compressed
+
+
+def accept_encoding(value):
+    """Parse an Accept-Encoding header"""
+    return parse_accept_header(value)
+
+
+class TestCompression(unittest.TestCase):
+    def test_choose_encoding_prefers_best_compressor(self):
+        """Test equal qualities go to the best available encoding"""
+        with patch.object(compression, 'zstandard', None), patch.object(compression, 'brotli', None):
+            self.assertEqual(choose_encoding(accept_encoding('gzip, br, zstd')), 'gzip')
+        
+        self.assertEqual(choose_encoding(accept_encoding('gzip, br;q=0.5')), 'gzip')
+        self.assertIsNone(choose_encoding(accept_encoding('identity')))
+        self.assertIsNone(choose_encoding(accept_encoding('')))
+    
+    def test_gzip_is_deterministic(self):
+        """Test equal bodies compress to equal bytes"""
+        data = b'{"offers": []}' * 100
+        
+        self.assertEqual(compress(data, 'gzip'), compress(data, 'gzip'))
+        self.assertEqual(gzip.decompress(compress(data, 'gzip', snapshot=True)), data)
+    
+    def test_snapshot_cache_keeps_newest_tag(self):
+        """Test a new tag drops the bodies of the previous one"""
+        cache = SnapshotCache()
+        cache.put('e-1', ('application/json', 'gzip'), b'one', {})
+        
+        self.assertEqual(cache.get('e-1', ('application/json', 'gzip')), (b'one', {}))
+        self.assertIsNone(cache.get('e-1', ('application/json', None)))
+        
+        cache.put('e-2', ('application/json', None), b'two', {})
+        
+        self.assertIsNone(cache.get('e-1', ('application/json', 'gzip')))
+        self.assertEqual(cache.stats(), {'entries': 1, 'hits': 1, 'misses': 2})
+    
+    def test_snapshot_cache_drops_late_put_of_older_tag(self):
+        """Test a body built for an older version does not replace newer ones"""
+        cache = SnapshotCache()
+        cache.put('e-2', ('application/json', None), b'two', {}, current_tag=lambda: 'e-2')
+        
+        cache.put('e-1', ('application/json', None), b'one', {}, current_tag=lambda: 'e-2')
+        
+        self.assertEqual(cache.get('e-2', ('application/json', None)), (b'two', {}))
+        self.assertIsNone(cache.get('e-1', ('application/json', None)))
+    
+    def test_snapshot_cache_reads_current_tag_outside_lock(self):
+        """Test the current tag is read before the cache lock is taken"""
+        cache = SnapshotCache()
+        held = []
+        
+        def current_tag():
+            held.append(cache._lock.locked())
+            return 'e-1'
+        
+        cache.put('e-1', ('application/json', None), b'one', {}, current_tag=current_tag)
+        
+        self.assertEqual(held, [False])
+        self.assertEqual(cache.get('e-1', ('application/json', None)), (b'one', {}))
+
+
+class TestCompressedDecorator(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.calls = 0
+        self.offers = [{'from_currency': 'USD', 'to_currency': 'EUR', 'to_value': 85.0}] * 100
+        self.versions = VersionService(db=MemoryStorage(), shared=False)
+        self.app = Flask(__name__)
+        
+        @self.app.route('/offers')
+        @compressed(snapshot_version=BOOK_VERSION)
+        def offers():
+            self.calls += 1
+            return jsonify(self.offers), 200
+        
+        @self.app.route('/small')
+        @compressed()
+        def small():
+            return jsonify([]), 200
+        
+        self.patcher = patch('app.utils.decorators.get_version_service', return_value=self.versions)
+        self.patcher.start()
+        get_snapshot_cache(BOOK_VERSION).clear()
+        self.client = self.app.test_client()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.patcher.stop()
+        get_snapshot_cache(BOOK_VERSION).clear()
+    
+    def test_large_response_is_compressed(self):
+        """Test a large body is sent gzip-encoded"""
+        response = self.client.get('/offers', headers={'Accept-Encoding': 'gzip'})
+        
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(self.app.json.loads(gzip.decompress(response.data)), self.offers)
+    
+    def test_small_or_unaccepted_response_is_not_compressed(self):
+        """Test bodies under the threshold, or without Accept-Encoding, go out as is"""
+        small = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        plain = self.client.get('/offers')
+        
+        self.assertNotIn('Content-Encoding', small.headers)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.get_json(), self.offers)
+    
+    def test_snapshot_is_shared_until_version_changes(self):
+        """Test the book is built once per version and encoding"""
+        headers = {'Accept-Encoding': 'gzip'}
+        first = self.client.get('/offers', headers=headers)
+        second = self.client.get('/offers', headers=headers)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.headers['Content-Encoding'], 'gzip')
+        
+        self.versions.bump(BOOK_VERSION)
+        self.client.get('/offers', headers=headers)
+        
+        self.assertEqual(self.calls, 2)
+    
+    def test_body_of_superseded_version_is_not_stored(self):
+        """Test a body whose version changed while it was built is not cached"""
+        @self.app.route('/moving')
+        @compressed(snapshot_version=BOOK_VERSION)
+        def moving():
+            self.versions.bump(BOOK_VERSION)
+            return jsonify(self.offers), 200
+        
+        response = self.client.get('/moving', headers={'Accept-Encoding': 'gzip'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_snapshot_cache(BOOK_VERSION).stats()['entries'], 0)
+    
+    def test_disabled_by_config(self):
+        """Test COMPRESSION_ENABLED switches compression off"""
+        self.app.config['COMPRESSION_ENABLED'] = False
+        
+        response = self.client.get('/offers', headers={'Accept-Encoding': 'gzip'})
+        
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Unit tests for application configuration
+"""
+import unittest
+from unittest.mock import patch
+from app.config.config import (
+    Config,
+    DevelopmentConfig,
+    ProductionConfig,
+    get_mongo_client_options,
+    _env_int,
+    _env_bool,
+    _env_list
+)
+
+
+class TestConfig(unittest.TestCase):
+    def test_env_helpers(self):
+        """Test typed environment helpers"""
+        env = {
+            'INT_VALUE': '25',
+            'BOOL_VALUE': 'false',
+            'LIST_VALUE': 'zstd, snappy,,zlib',
+            'EMPTY_VALUE': ''
+        }
+        with patch.dict('os.environ', env):
+            self.assertEqual(_env_int('INT_VALUE'), 25)
+            self.assertEqual(_env_int('EMPTY_VALUE', 7), 7)
+            self.assertFalse(_env_bool('BOOL_VALUE', True))
+            self.assertIsNone(_env_bool('MISSING_VALUE'))
+            self.assertEqual(_env_list('LIST_VALUE'), ['zstd', 'snappy', 'zlib'])
+            self.assertEqual(_env_list('MISSING_VALUE', ['zlib']), ['zlib'])
+
+    def test_mongo_options_skip_unset(self):
+        """Test unset options are left to pymongo defaults"""
+        class BareConfig(Config):
+            MONGO_MAX_POOL_SIZE = None
+            MONGO_MIN_POOL_SIZE = None
+            MONGO_MAX_IDLE_TIME_MS = None
+            MONGO_WAIT_QUEUE_TIMEOUT_MS = None
+            MONGO_SERVER_SELECTION_TIMEOUT_MS = None
+            MONGO_CONNECT_TIMEOUT_MS = None
+            MONGO_SOCKET_TIMEOUT_MS = None
+            MONGO_RETRY_WRITES = None
+            MONGO_RETRY_READS = None
+            MONGO_COMPRESSORS = None
+            MONGO_ZLIB_COMPRESSION_LEVEL = None
+
+        self.assertEqual(get_mongo_client_options(BareConfig), {})
+
+    def test_mongo_options_production_presets(self):
+        """Test production presets map to MongoClient options"""
+        class PresetConfig(ProductionConfig):
+            MONGO_MAX_POOL_SIZE = 50
+            MONGO_WAIT_QUEUE_TIMEOUT_MS = 2000
+            MONGO_RETRY_WRITES = True
+            MONGO_COMPRESSORS = ['zstd', 'snappy']
+
+        options = get_mongo_client_options(PresetConfig)
+
+        self.assertEqual(options['maxPoolSize'], 50)
+        self.assertEqual(options['waitQueueTimeoutMS'], 2000)
+        self.assertTrue(options['retryWrites'])
+        self.assertEqual(options['compressors'], 'zstd,snappy')
+
+    def test_mongo_options_default_config(self):
+        """Test the default config passes only explicitly set options"""
+        options = get_mongo_client_options(DevelopmentConfig)
+
+        for option in options:
+            self.assertIn(option, (
+                'maxPoolSize', 'minPoolSize', 'maxIdleTimeMS',
+                'waitQueueTimeoutMS', 'serverSelectionTimeoutMS',
+                'connectTimeoutMS', 'socketTimeoutMS', 'retryWrites',
+                'retryReads', 'compressors', 'zlibCompressionLevel'
+            ))
+
+
+if __name__ == '__main__':
+    unittest.main()
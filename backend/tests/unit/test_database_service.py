@@ -4,8 +4,17 @@ Unit tests for DatabaseService
 import unittest
 from unittest.mock import patch, MagicMock
 import os
-from app.services.database import DatabaseService
+from datetime import datetime, timedelta
+from app.services.database import (
+    DatabaseService,
+    REQUIRED_INDEXES,
+    USER_IDENTITY_PROJECTION,
+    WALLET_BALANCES_PROJECTION
+)
+from app.services.pool_monitor import PoolGauges
+from app.config.config import get_mongo_client_options
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 
 class TestDatabaseService(unittest.TestCase):
@@ -27,9 +36,72 @@ class TestDatabaseService(unittest.TestCase):
         # Assert they are the same instance
         self.assertIs(db1, db2)
         
+        # Touch the connection through both instances
+        db1.users
+        db2.offers
+        
         # Mongo client should be created only once
         mock_mongo_client.assert_called_once()
     
+    @patch('app.services.database.MongoClient')
+    def test_lazy_connection(self, mock_mongo_client):
+        """Test the connection is only opened on first use"""
+        db = DatabaseService()
+        
+        # Constructing the service must not connect
+        mock_mongo_client.assert_not_called()
+        self.assertFalse(db.is_connected)
+        
+        # First collection access connects
+        db.users
+        mock_mongo_client.assert_called_once()
+        self.assertTrue(db.is_connected)
+    
+    @patch('app.services.database.MongoClient')
+    def test_reset_after_fork(self, mock_mongo_client):
+        """Test a forked child opens its own client"""
+        parent_client = MagicMock()
+        child_client = MagicMock()
+        mock_mongo_client.side_effect = [parent_client, child_client]
+        
+        db = DatabaseService()
+        self.assertIs(db.client, parent_client)
+        
+        # Simulate the post-fork hook in the child
+        DatabaseService._reset_after_fork()
+        self.assertFalse(db.is_connected)
+        
+        # The inherited client is dropped, not closed, and a new one is made
+        self.assertIs(db.client, child_client)
+        parent_client.close.assert_not_called()
+        self.assertEqual(mock_mongo_client.call_count, 2)
+    
+    @patch('app.services.database.MongoClient')
+    def test_connect_in_other_process(self, mock_mongo_client):
+        """Test a client created by another pid is never reused"""
+        db = DatabaseService()
+        db.connect()
+        
+        # Pretend the client belongs to the parent process
+        db._pid = -1
+        self.assertFalse(db.is_connected)
+        
+        db.connect()
+        self.assertEqual(mock_mongo_client.call_count, 2)
+    
+    def test_init_app(self):
+        """Test binding the service to an application"""
+        app = MagicMock()
+        app.extensions = {}
+        
+        with patch('app.services.database.atexit.register') as mock_register:
+            db = DatabaseService()
+            db.init_app(app)
+            db.init_app(app)
+        
+        self.assertIs(app.extensions['database'], db)
+        mock_register.assert_called_once_with(db.close)
+    
     @patch('app.services.database.MongoClient')
     @patch('app.services.database.os.getenv')
     def test_init_with_uri(self, mock_getenv, mock_mongo_client):
@@ -45,9 +117,14 @@ class TestDatabaseService(unittest.TestCase):
         
         # Create instance
         db = DatabaseService()
+        db.connect()
         
         # Assert correct connection
-        mock_mongo_client.assert_called_once_with('mongodb://test:27017')
+        mock_mongo_client.assert_called_once_with(
+            'mongodb://test:27017',
+            event_listeners=[DatabaseService.pool_gauges],
+            **get_mongo_client_options()
+        )
         mock_client.get_database.assert_called_once_with('test_db')
     
     @patch('app.services.database.MongoClient')
@@ -65,11 +142,67 @@ class TestDatabaseService(unittest.TestCase):
         
         # Create instance
         db = DatabaseService()
+        db.connect()
         
         # Assert correct connection to localhost
-        mock_mongo_client.assert_called_once_with('localhost', 27017)
+        mock_mongo_client.assert_called_once_with(
+            'localhost',
+            27017,
+            event_listeners=[DatabaseService.pool_gauges],
+            **get_mongo_client_options()
+        )
         mock_client.get_database.assert_called_once_with('test_db')
     
+    @patch('app.services.database.MongoClient')
+    @patch('app.services.database.get_mongo_client_options')
+    def test_init_with_pool_options(self, mock_options, mock_mongo_client):
+        """Test pool and compression options are passed to MongoClient"""
+        # Setup mocks
+        mock_options.return_value = {
+            'maxPoolSize': 50,
+            'waitQueueTimeoutMS': 2000,
+            'compressors': 'zstd,snappy'
+        }
+        
+        # Create instance
+        DatabaseService().connect()
+        
+        # Assert options forwarded
+        args, kwargs = mock_mongo_client.call_args
+        self.assertEqual(kwargs['maxPoolSize'], 50)
+        self.assertEqual(kwargs['waitQueueTimeoutMS'], 2000)
+        self.assertEqual(kwargs['compressors'], 'zstd,snappy')
+        self.assertEqual(kwargs['event_listeners'], [DatabaseService.pool_gauges])
+    
+    def test_pool_gauges(self):
+        """Test pool gauges follow checkout and checkin events"""
+        gauges = PoolGauges()
+        address = ('localhost', 27017)
+        event = MagicMock(address=address)
+        
+        gauges.pool_created(event)
+        gauges.connection_created(event)
+        gauges.connection_created(event)
+        gauges.connection_check_out_started(event)
+        gauges.connection_checked_out(event)
+        gauges.connection_check_out_started(event)
+        gauges.connection_checked_out(event)
+        gauges.connection_checked_in(event)
+        gauges.connection_check_out_started(event)
+        gauges.connection_check_out_failed(event)
+        
+        pool = gauges.snapshot()['localhost:27017']
+        self.assertEqual(pool['open'], 2)
+        self.assertEqual(pool['checked_out'], 1)
+        self.assertEqual(pool['max_checked_out'], 2)
+        self.assertEqual(pool['waiting'], 0)
+        self.assertEqual(pool['checkouts'], 2)
+        self.assertEqual(pool['checkout_failures'], 1)
+        
+        # Closing the pool drops its gauges
+        gauges.pool_closed(event)
+        self.assertEqual(gauges.snapshot(), {})
+    
     @patch('app.services.database.MongoClient')
     def test_close(self, mock_mongo_client):
         """Test closing database connection"""
@@ -85,6 +218,7 @@ class TestDatabaseService(unittest.TestCase):
         
         # Assert client was closed
         mock_client.close.assert_called_once()
+        self.assertFalse(db.is_connected)
     
     @patch('app.services.database.MongoClient')
     def test_get_user_by_email(self, mock_mongo_client):
@@ -103,7 +237,7 @@ class TestDatabaseService(unittest.TestCase):
         db.get_user_by_email('test@example.com')
         
         # Assert query
-        mock_users.find_one.assert_called_once_with({'email': 'test@example.com'})
+        mock_users.find_one.assert_called_once_with({'email': 'test@example.com'}, None)
     
     @patch('app.services.database.MongoClient')
     def test_get_user_by_id(self, mock_mongo_client):
@@ -123,7 +257,29 @@ class TestDatabaseService(unittest.TestCase):
         db.get_user_by_id(user_id)
         
         # Assert query
-        mock_users.find_one.assert_called_once_with({'_id': ObjectId(user_id)})
+        mock_users.find_one.assert_called_once_with({'_id': ObjectId(user_id)}, None)
+    
+    @patch('app.services.database.MongoClient')
+    def test_get_user_by_email_with_projection(self, mock_mongo_client):
+        """Test getting user by email limited to a projection"""
+        # Setup mocks
+        mock_users = MagicMock()
+        
+        # Create instance
+        db = DatabaseService()
+        db.users = mock_users
+        
+        # Call method
+        db.get_user_by_email(
+            'test@example.com',
+            projection=USER_IDENTITY_PROJECTION
+        )
+        
+        # Assert the password hash is not fetched
+        mock_users.find_one.assert_called_once_with(
+            {'email': 'test@example.com'},
+            {'_id': 1, 'email': 1}
+        )
     
     @patch('app.services.database.MongoClient')
     def test_create_user(self, mock_mongo_client):
@@ -169,7 +325,27 @@ class TestDatabaseService(unittest.TestCase):
         db.get_wallet_by_user_id(user_id)
         
         # Assert query
-        mock_wallets.find_one.assert_called_once_with({'user': user_id})
+        mock_wallets.find_one.assert_called_once_with({'user': user_id}, None)
+    
+    @patch('app.services.database.MongoClient')
+    def test_get_wallet_by_user_id_with_projection(self, mock_mongo_client):
+        """Test getting wallet balances only"""
+        # Setup mocks
+        mock_wallets = MagicMock()
+        
+        # Create instance
+        db = DatabaseService()
+        db.wallets = mock_wallets
+        
+        # Call method
+        user_id = '60f1e5b5c358f3b8a9f3b3a1'
+        db.get_wallet_by_user_id(user_id, projection=WALLET_BALANCES_PROJECTION)
+        
+        # Assert query
+        mock_wallets.find_one.assert_called_once_with(
+            {'user': user_id},
+            {'_id': 0, 'user': 1, 'currencies': 1}
+        )
     
     @patch('app.services.database.MongoClient')
     def test_update_wallet(self, mock_mongo_client):
@@ -222,7 +398,7 @@ class TestDatabaseService(unittest.TestCase):
         db.get_offer_by_id(offer_id)
         
         # Assert query
-        mock_offers.find_one.assert_called_once_with({'_id': ObjectId(offer_id)})
+        mock_offers.find_one.assert_called_once_with({'_id': ObjectId(offer_id)}, None)
     
     @patch('app.services.database.MongoClient')
     def test_find_matching_offers(self, mock_mongo_client):
@@ -251,6 +427,211 @@ class TestDatabaseService(unittest.TestCase):
         self.assertEqual(query['from_currency'], 'USD')
         self.assertEqual(query['to_currency'], 'EUR')
         self.assertIn('to_value', query)
+        
+        # Expired offers are excluded
+        self.assertEqual(query['$or'][0], {'expires_at': None})
+        self.assertIn('$gt', query['$or'][1]['expires_at'])
+    
+    @patch('app.services.database.MongoClient')
+    def test_increment_wallet_balances(self, mock_mongo_client):
+        """Test aggregated wallet increments use one bulk write"""
+        # Setup mocks
+        mock_wallets = MagicMock()
+        mock_wallets.bulk_write.return_value = MagicMock(modified_count=2)
+        
+        # Create instance
+        db = DatabaseService()
+        db.wallets = mock_wallets
+        
+        # Call method
+        result = db.increment_wallet_balances({
+            'user1': {'USD': 100.0, 'EUR': 5.0},
+            'user2': {'PLN': 40.0}
+        })
+        
+        # Assert a single unordered bulk write
+        self.assertEqual(result, 2)
+        mock_wallets.bulk_write.assert_called_once()
+        operations = mock_wallets.bulk_write.call_args[0][0]
+        self.assertEqual(len(operations), 2)
+        self.assertEqual(operations[0]._filter, {'user': 'user1'})
+        self.assertEqual(operations[0]._doc, {'$inc': {
+            'currencies.$[c0].value': 100.0,
+            'currencies.$[c1].value': 5.0
+        }})
+        self.assertEqual(operations[0]._array_filters, [
+            {'c0.currency': 'USD'},
+            {'c1.currency': 'EUR'}
+        ])
+        self.assertFalse(mock_wallets.bulk_write.call_args[1]['ordered'])
+    
+    @patch('app.services.database.MongoClient')
+    def test_increment_wallet_balances_empty(self, mock_mongo_client):
+        """Test no round trip is made without increments"""
+        mock_wallets = MagicMock()
+        
+        db = DatabaseService()
+        db.wallets = mock_wallets
+        
+        self.assertEqual(db.increment_wallet_balances({}), 0)
+        mock_wallets.bulk_write.assert_not_called()
+    
+    @patch('app.services.database.MongoClient')
+    def test_claim_expired_offers(self, mock_mongo_client):
+        """Test expired offers are claimed through the expiry index"""
+        # Setup mocks
+        mock_offers = MagicMock()
+        offer_ids = [ObjectId(), ObjectId()]
+        cursor = MagicMock()
+        cursor.sort.return_value.limit.return_value = [{'_id': oid} for oid in offer_ids]
+        claimed = [{'_id': offer_ids[0], 'expiry_claim': 'token'}]
+        mock_offers.find.side_effect = [cursor, claimed]
+        
+        # Create instance
+        db = DatabaseService()
+        db.offers = mock_offers
+        
+        # Call method
+        now = datetime(2023, 1, 1, 12, 0, 0)
+        result = db.claim_expired_offers(now=now, limit=10, claim='token', lease_seconds=600)
+        
+        # Assertions
+        self.assertEqual(result, claimed)
+        claimable = {'$not': {'$gt': now - timedelta(seconds=600)}}
+        first_query = mock_offers.find.call_args_list[0][0][0]
+        self.assertEqual(first_query['expires_at'], {'$lte': now})
+        self.assertEqual(first_query['expiry_claimed_at'], claimable)
+        cursor.sort.assert_called_once_with([('expires_at', 1)])
+        cursor.sort.return_value.limit.assert_called_once_with(10)
+        mock_offers.update_many.assert_called_once_with(
+            {'_id': {'$in': offer_ids}, 'expiry_claimed_at': claimable},
+            {'$set': {'expiry_claim': 'token', 'expiry_claimed_at': now}}
+        )
+    
+    @patch('app.services.database.MongoClient')
+    def test_ensure_indexes(self, mock_mongo_client):
+        """Test the expiry index is sparse"""
+        mock_offers = MagicMock()
+        
+        db = DatabaseService()
+        db.offers = mock_offers
+        db.ensure_indexes()
+        
+        mock_offers.create_index.assert_any_call(
+            [('expires_at', 1)],
+            name='offers_expires_at',
+            sparse=True
+        )
+    
+    @patch('app.services.database.MongoClient')
+    def test_record_transaction_summaries(self, mock_mongo_client):
+        """Test summaries are upserted unless the trade is already applied"""
+        mock_summaries = MagicMock()
+        transaction = {
+            '_id': ObjectId(),
+            'from_user': 'a@example.com',
+            'to_user': 'b@example.com',
+            'from_value': 100.0,
+            'from_currency': 'USD',
+            'to_value': 90.0,
+            'to_currency': 'EUR',
+            'date': datetime(2024, 5, 1)
+        }
+        
+        db = DatabaseService()
+        db.transaction_summaries = mock_summaries
+        db.record_transaction_summaries([transaction])
+        
+        requests = mock_summaries.bulk_write.call_args[0][0]
+        self.assertEqual(
+            [request._filter for request in requests],
+            [
+                {'_id': 'a@example.com', 'applied_ids': {'$ne': transaction['_id']}},
+                {'_id': 'b@example.com', 'applied_ids': {'$ne': transaction['_id']}}
+            ]
+        )
+        self.assertEqual(requests[0]._doc['$inc']['volume.USD.sent'], 100.0)
+        self.assertEqual(requests[1]._doc['$inc']['volume.EUR.sent'], 90.0)
+        self.assertEqual(
+            requests[0]._doc['$push']['applied_ids'],
+            {'$each': [transaction['_id']], '$slice': -1000}
+        )
+        self.assertTrue(requests[0]._upsert)
+        
+        # A duplicate key error is retried as a plain update: it applies the
+        # trade if a concurrent upsert created the summary, and is a no-op if
+        # the trade was already applied
+        mock_summaries.reset_mock()
+        mock_summaries.bulk_write.side_effect = [
+            BulkWriteError({'writeErrors': [{'index': 0, 'code': 11000}]}),
+            None
+        ]
+        db.record_transaction_summaries([transaction])
+        
+        retried_filter, retried_update = mock_summaries.update_one.call_args[0]
+        self.assertEqual(retried_filter['_id'], 'a@example.com')
+        self.assertEqual(retried_update['$inc']['volume.USD.sent'], 100.0)
+        self.assertNotIn('upsert', mock_summaries.update_one.call_args[1])
+        self.assertEqual(
+            [request._filter['_id'] for request in mock_summaries.bulk_write.call_args[0][0]],
+            ['b@example.com']
+        )
+    
+    @patch('app.services.database.MongoClient')
+    def test_report_pipelines(self, mock_mongo_client):
+        """Test reports start with an indexed date match and may use disk"""
+        start = datetime(2024, 5, 1)
+        end = datetime(2024, 6, 1)
+        mock_transactions = MagicMock()
+        mock_ledger = MagicMock()
+        mock_ledger.aggregate.return_value = [
+            {'_id': 'offer_lock', 'offers': 4},
+            {'_id': 'trade', 'offers': 1}
+        ]
+        
+        db = DatabaseService()
+        db.transactions = mock_transactions
+        db.ledger = mock_ledger
+        db.get_pair_volume_by_day(start, end)
+        db.get_top_traders(start, None, 5)
+        outcomes = db.get_offer_outcomes(start, end)
+        
+        for call in mock_transactions.aggregate.call_args_list + mock_ledger.aggregate.call_args_list:
+            self.assertEqual(call.kwargs, {'allowDiskUse': True})
+        pair_volume, top_traders = [call.args[0] for call in mock_transactions.aggregate.call_args_list]
+        self.assertEqual(pair_volume[0], {'$match': {'date': {'$gte': start, '$lt': end}}})
+        self.assertEqual(top_traders[0], {'$match': {'date': {'$gte': start}}})
+        self.assertEqual(top_traders[-2], {'$limit': 5})
+        self.assertEqual(outcomes, {'posted': 4, 'filled': 1, 'cancelled': 0})
+    
+    @patch('app.services.database.MongoClient')
+    def test_acquire_lease(self, mock_mongo_client):
+        """Test a lease held by another owner is not taken"""
+        mock_leases = MagicMock()
+        
+        db = DatabaseService()
+        db.leases = mock_leases
+        
+        self.assertTrue(db.acquire_lease('scheduler', 'owner', 30))
+        query, update = mock_leases.update_one.call_args[0]
+        self.assertEqual(query['_id'], 'scheduler')
+        self.assertIn({'owner': 'owner'}, query['$or'])
+        self.assertEqual(update[0]['$set']['expires_at'], {'$add': ['$$NOW', 30000]})
+        
+        mock_leases.update_one.side_effect = DuplicateKeyError('held')
+        self.assertFalse(db.acquire_lease('scheduler', 'other', 30))
+    
+    @patch('app.services.database.MongoClient')
+    def test_missing_indexes(self, mock_mongo_client):
+        """Test required indexes not on the server are reported"""
+        db = DatabaseService()
+        for collection, names in REQUIRED_INDEXES.items():
+            getattr(db, collection).index_information.return_value = {
+                '_id_': {}, **{name: {} for name in names}
+            }
+        db.offers.index_information.return_value = {'_id_': {}}
+        
+        self.assertEqual(db.missing_indexes(), ['offers.offers_expires_at'])
 
 
 if __name__ == '__main__':
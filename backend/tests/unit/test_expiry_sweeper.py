@@ -0,0 +1,42 @@
+"""
+Unit tests for the offer expiry sweeper
+"""
+import unittest
+from unittest.mock import MagicMock
+from app.services.expiry_sweeper import OfferExpirySweeper
+
+
+class TestOfferExpirySweeper(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.mock_offer_service = MagicMock()
+        self.sweeper = OfferExpirySweeper(
+            offer_service=self.mock_offer_service,
+            batch_size=2
+        )
+    
+    def test_run_once_drains_backlog(self):
+        """Test full batches are followed by another batch"""
+        self.mock_offer_service.expire_offers.side_effect = [2, 2, 1]
+        
+        result = self.sweeper.run_once()
+        
+        self.assertEqual(result, 5)
+        self.assertEqual(self.mock_offer_service.expire_offers.call_count, 3)
+        self.mock_offer_service.expire_offers.assert_called_with(batch_size=2)
+    
+    def test_stop_between_batches(self):
+        """Test a stopped sweeper does not start another batch"""
+        def expire_full_batch(batch_size):
+            self.sweeper.stop()
+            return batch_size
+        self.mock_offer_service.expire_offers.side_effect = expire_full_batch
+        
+        result = self.sweeper.run_once()
+        
+        self.assertEqual(result, 2)
+        self.mock_offer_service.expire_offers.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
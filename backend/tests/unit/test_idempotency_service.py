@@ -0,0 +1,149 @@
+"""
+Unit tests for idempotency keys
+"""
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch, MagicMock
+from flask import Flask, jsonify, session
+from app.services.idempotency_service import (
+    IdempotencyService,
+    PROCEED,
+    REPLAY,
+    IN_PROGRESS,
+    MISMATCH
+)
+from app.utils.decorators import idempotent
+
+
+class TestIdempotencyService(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.mock_db = MagicMock()
+        self.service = IdempotencyService(
+            db=self.mock_db,
+            cache_size=2,
+            lock_seconds=60,
+            ttl_seconds=3600
+        )
+    
+    def test_first_request_proceeds(self):
+        """Test a new key is reserved as pending"""
+        self.mock_db.reserve_idempotency_key.return_value = True
+        
+        result = self.service.begin('user1:add_offer:key1', 'abc')
+        
+        self.assertEqual(result['outcome'], PROCEED)
+        record = self.mock_db.reserve_idempotency_key.call_args[0][0]
+        self.assertEqual(record['_id'], 'user1:add_offer:key1')
+        self.assertEqual(record['status'], 'pending')
+    
+    def test_finished_request_replayed_from_memory(self):
+        """Test a completed result is replayed without the database"""
+        self.service.complete('user1:add_offer:key1', 'abc', 201, {'message': 'ok'})
+        self.mock_db.reset_mock()
+        
+        result = self.service.begin('user1:add_offer:key1', 'abc')
+        
+        self.assertEqual(result, {'outcome': REPLAY, 'status_code': 201, 'body': {'message': 'ok'}})
+        self.mock_db.reserve_idempotency_key.assert_not_called()
+    
+    def test_finished_request_replayed_from_database(self):
+        """Test results stored by another process are replayed"""
+        self.mock_db.reserve_idempotency_key.return_value = False
+        self.mock_db.get_idempotency_record.return_value = {
+            'fingerprint': 'abc',
+            'status': 'done',
+            'status_code': 400,
+            'body': {'message': 'Insufficient funds'},
+            'created_at': datetime.utcnow()
+        }
+        
+        result = self.service.begin('user1:add_offer:key1', 'abc')
+        
+        self.assertEqual(result['outcome'], REPLAY)
+        self.assertEqual(result['status_code'], 400)
+    
+    def test_reused_key_with_other_request(self):
+        """Test a key cannot be reused for a different request"""
+        self.service.complete('user1:add_offer:key1', 'abc', 201, {'message': 'ok'})
+        
+        result = self.service.begin('user1:add_offer:key1', 'other')
+        
+        self.assertEqual(result['outcome'], MISMATCH)
+    
+    def test_pending_request_in_progress(self):
+        """Test a concurrent retry waits for the first request"""
+        self.mock_db.reserve_idempotency_key.return_value = False
+        self.mock_db.get_idempotency_record.return_value = {
+            'fingerprint': 'abc',
+            'status': 'pending',
+            'created_at': datetime.utcnow()
+        }
+        self.mock_db.take_over_idempotency_key.return_value = False
+        
+        result = self.service.begin('user1:add_offer:key1', 'abc')
+        
+        self.assertEqual(result['outcome'], IN_PROGRESS)
+    
+    def test_cache_is_bounded_and_expires(self):
+        """Test the LRU evicts old results and drops expired ones"""
+        for index in range(3):
+            self.service.complete(f'key{index}', 'abc', 200, {})
+        self.service._cache['key2']['created_at'] = datetime.utcnow() - timedelta(hours=2)
+        
+        self.assertNotIn('key0', self.service._cache)
+        self.assertIsNotNone(self.service._cache_get('key1'))
+        self.assertIsNone(self.service._cache_get('key2'))
+
+
+class TestIdempotentDecorator(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.calls = 0
+        self.app = Flask(__name__)
+        self.app.secret_key = 'test'
+        
+        @self.app.route('/login')
+        def login():
+            session['user_id'] = 'user1'
+            return ''
+        
+        @self.app.route('/add', methods=['POST'])
+        @idempotent
+        def add():
+            self.calls += 1
+            return jsonify({'message': 'created'}), 201
+        
+        self.service = IdempotencyService(db=MagicMock(), cache_size=10, lock_seconds=60, ttl_seconds=60)
+        self.service.db.reserve_idempotency_key.return_value = True
+        self.patcher = patch('app.utils.decorators.get_idempotency_service', return_value=self.service)
+        self.patcher.start()
+        self.client = self.app.test_client()
+        self.client.get('/login')
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.patcher.stop()
+    
+    def test_retry_replays_stored_response(self):
+        """Test a retried request returns the first response without running again"""
+        headers = {'Idempotency-Key': 'key1'}
+        
+        first = self.client.post('/add', json={'a': 1}, headers=headers)
+        second = self.client.post('/add', json={'a': 1}, headers=headers)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+    
+    def test_requests_without_key_always_run(self):
+        """Test requests without the header are not deduplicated"""
+        self.client.post('/add', json={'a': 1})
+        self.client.post('/add', json={'a': 1})
+        
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+Unit tests for the journaled order store
+"""
+import shutil
+import threading
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from app.services.journaled_store import JournaledStore, OFFER_OPEN_EVENT
+from app.services.order_journal import OrderJournal
+
+
+class TestJournaledStore(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.directory = tempfile.mkdtemp()
+        self.mock_db = MagicMock()
+        self.mock_db.get_book_offers.return_value = []
+        self.mock_db.get_wallet_by_user_id.return_value = {
+            'user': 'user1',
+            'currencies': [{'currency': 'USD', 'value': 100.0}]
+        }
+        self.store = self._store()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.store.close(timeout=1)
+        shutil.rmtree(self.directory)
+    
+    def _store(self):
+        """Create a store on the test journal directory"""
+        return JournaledStore(
+            db=self.mock_db,
+            journal=OrderJournal(self.directory, group_commit_ms=0)
+        )
+    
+    def _offer(self, **fields):
+        """Build an offer document"""
+        offer = {
+            'from_user': 'seller@example.com',
+            'from_value': 85.0,
+            'from_currency': 'EUR',
+            'to_value': 100.0,
+            'to_currency': 'USD'
+        }
+        offer.update(fields)
+        return offer
+    
+    def test_offers_served_from_memory(self):
+        """Test created offers are matched without querying the database"""
+        offer_id = self.store.create_offer(self._offer())
+        self.store.create_offer(self._offer(to_value=90.0))
+        self.store.create_offer(self._offer(to_value=150.0))
+        self.store.create_offer(self._offer(
+            expires_at=datetime.utcnow() - timedelta(minutes=1)
+        ))
+        
+        matches = self.store.find_matching_offers('EUR', 'USD', 100.0)
+        
+        self.assertEqual([offer['to_value'] for offer in matches], [100.0, 90.0])
+        self.assertEqual(
+            self.store.get_offer_by_id(offer_id, projection={'from_currency': 1}),
+            {'_id': ObjectId(offer_id), 'from_currency': 'EUR'}
+        )
+        self.assertEqual(len(self.store.get_all_offers()), 3)
+        self.mock_db.find_matching_offers.assert_not_called()
+    
+    def test_returned_documents_are_copies(self):
+        """Test callers cannot change the book by mutating results"""
+        offer_id = self.store.create_offer(self._offer())
+        
+        self.store.get_all_offers()[0]['_id'] = str(offer_id)
+        wallet = self.store.get_wallet_by_user_id('user1')
+        wallet['currencies'][0]['value'] = 0.0
+        
+        self.assertIsInstance(self.store.get_all_offers()[0]['_id'], ObjectId)
+        self.assertEqual(
+            self.store.get_wallet_by_user_id('user1')['currencies'][0]['value'],
+            100.0
+        )
+    
+    def test_changes_persisted_from_journal(self):
+        """Test durable records are applied to the database in order"""
+        self.store.update_wallet('user1', {'currencies': [{'currency': 'USD', 'value': 50.0}]})
+        offer_id = self.store.create_offer(self._offer())
+        self.store.delete_offer(offer_id)
+        self.assertTrue(self.store.wait_durable(self.store.last_seq, timeout=5))
+        
+        self.store.close(timeout=5)
+        
+        self.mock_db.update_wallet.assert_called_once_with(
+            'user1',
+            {'currencies': [{'currency': 'USD', 'value': 50.0}]}
+        )
+        self.mock_db.upsert_documents.assert_called_once()
+        self.mock_db.delete_offers.assert_called_once_with([ObjectId(offer_id)])
+        self.assertEqual(self.store.persisted_seq, 3)
+        self.assertEqual(self.store.journal.checkpointed_seq, 3)
+    
+    def test_callback_runs_once_persisted(self):
+        """Test a persisted callback waits for the persister to apply earlier records"""
+        gate = threading.Event()
+        self.mock_db.update_wallet.side_effect = lambda user_id, wallet: gate.wait(5)
+        ran = threading.Event()
+        
+        self.store.update_wallet('user1', {'currencies': []})
+        self.store.when_persisted(ran.set)
+        
+        self.assertFalse(ran.wait(0.1))
+        gate.set()
+        self.assertTrue(ran.wait(5))
+        self.assertEqual(self.store.persisted_seq, self.store.last_seq)
+    
+    def test_increment_wallet_balances(self):
+        """Test increments change cached wallets and journal the result"""
+        modified = self.store.increment_wallet_balances({'user1': {'USD': 25.0}})
+        
+        self.assertEqual(modified, 1)
+        self.assertEqual(
+            self.store.get_wallet_by_user_id('user1')['currencies'][0]['value'],
+            125.0
+        )
+    
+    def test_claim_expired_offers_once(self):
+        """Test an expired offer is only claimed by one sweep"""
+        now = datetime.utcnow()
+        self.store.create_offer(self._offer(expires_at=now - timedelta(minutes=1)))
+        
+        first = self.store.claim_expired_offers(now, 10, 'claim1', 600)
+        second = self.store.claim_expired_offers(now, 10, 'claim2', 600)
+        lapsed = self.store.claim_expired_offers(now + timedelta(minutes=11), 10, 'claim3', 600)
+        
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+        self.assertEqual(len(lapsed), 1)
+    
+    def test_recovery_replays_unpersisted_records(self):
+        """Test records after the checkpoint are re-applied on startup"""
+        self.store.start()
+        # Simulate a crash: records are durable but the persister never ran
+        self.store.journal.on_durable = None
+        offer = self._offer(_id=ObjectId())
+        self.store.create_offer(offer)
+        self.store.wait_durable(self.store.last_seq, timeout=5)
+        self.store.journal.close()
+        self.store._pid = None
+        
+        self.mock_db.get_book_offers.return_value = [offer]
+        self.store = self._store()
+        self.store.start()
+        
+        self.mock_db.upsert_documents.assert_called_once_with('offers', [offer])
+        self.assertEqual(self.store.persisted_seq, 1)
+        self.assertEqual(self.store.get_offer_by_id(str(offer['_id']))['to_value'], 100.0)
+        records = list(self.store.journal.read_after(0))
+        self.assertEqual(records[0]['type'], OFFER_OPEN_EVENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
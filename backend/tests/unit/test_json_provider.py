@@ -0,0 +1,59 @@
+"""
+Unit tests for the JSON provider
+"""
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from flask import Flask, jsonify
+from app.utils import json_provider
+from app.utils.json_provider import FastJSONProvider
+
+
+class TestFastJSONProvider(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.app = Flask(__name__)
+        self.app.json = FastJSONProvider(self.app)
+        self.offer_id = ObjectId()
+        self.document = {
+            '_id': self.offer_id,
+            'date': datetime(2024, 5, 1, 12, 30, 15),
+            'value': Decimal128('12.5'),
+            'rate': Decimal('1.25')
+        }
+        self.expected = {
+            '_id': str(self.offer_id),
+            'date': '2024-05-01T12:30:15Z',
+            'value': 12.5,
+            'rate': 1.25
+        }
+    
+    def test_bson_types_encoded(self):
+        """Test documents serialize without converting fields first"""
+        with self.app.app_context():
+            response = jsonify([self.document])
+        
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_json(), [self.expected])
+    
+    def test_standard_library_fallback_matches(self):
+        """Test output is the same without orjson"""
+        with patch.object(json_provider, 'orjson', None):
+            with self.app.app_context():
+                fallback = jsonify(self.document).get_json()
+            dumped = self.app.json.loads(self.app.json.dumps(self.document))
+        
+        self.assertEqual(fallback, self.expected)
+        self.assertEqual(dumped, self.expected)
+    
+    def test_unknown_types_rejected(self):
+        """Test unsupported objects still raise TypeError"""
+        with self.assertRaises(TypeError):
+            self.app.json.dumps({'value': object()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Unit tests for LedgerEntry model
+"""
+import unittest
+from datetime import datetime
+from app.models.ledger import LedgerEntry
+from bson.objectid import ObjectId
+
+
+class TestLedgerEntryModel(unittest.TestCase):
+    def test_to_dict(self):
+        """Test converting an entry to dictionary"""
+        test_date = datetime(2023, 1, 1, 12, 0, 0)
+        entry = LedgerEntry(
+            user_id='user1',
+            deltas={'USD': -100, 'EUR': 85},
+            reason=LedgerEntry.TRADE,
+            reference='offer1',
+            date=test_date
+        )
+        
+        entry_dict = entry.to_dict()
+        
+        self.assertEqual(entry_dict['user'], 'user1')
+        self.assertEqual(entry_dict['deltas'], {'USD': -100.0, 'EUR': 85.0})
+        self.assertEqual(entry_dict['reason'], 'trade')
+        self.assertEqual(entry_dict['ref'], 'offer1')
+        self.assertEqual(entry_dict['date'], test_date)
+        self.assertNotIn('_id', entry_dict)
+    
+    def test_from_dict(self):
+        """Test creating an entry from dictionary"""
+        entry_dict = {
+            '_id': ObjectId('60f1e5b5c358f3b8a9f3b3a1'),
+            'user': 'user1',
+            'deltas': {'USD': 10.0},
+            'reason': LedgerEntry.OPEN
+        }
+        
+        entry = LedgerEntry.from_dict(entry_dict)
+        
+        self.assertEqual(entry.entry_id, '60f1e5b5c358f3b8a9f3b3a1')
+        self.assertEqual(entry.deltas, {'USD': 10.0})
+        self.assertIsNone(entry.reference)
+    
+    def test_apply(self):
+        """Test applying deltas to balances"""
+        balances = {'USD': 100.0}
+        
+        LedgerEntry.apply(balances, {'USD': -40.0, 'EUR': 5.0})
+        
+        self.assertEqual(balances, {'USD': 60.0, 'EUR': 5.0})
+    
+    def test_is_empty(self):
+        """Test detecting deltas that change nothing"""
+        self.assertTrue(LedgerEntry.is_empty({}))
+        self.assertTrue(LedgerEntry.is_empty({'USD': 0}))
+        self.assertFalse(LedgerEntry.is_empty({'USD': 0, 'EUR': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
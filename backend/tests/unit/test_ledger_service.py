@@ -0,0 +1,154 @@
+"""
+Unit tests for LedgerService
+"""
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, timedelta
+from app.models.ledger import LedgerEntry
+from app.services.ledger_service import LedgerService
+from app.services.memory_storage import MemoryStorage
+from bson.objectid import ObjectId
+
+
+class TestLedgerService(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.mock_db = MagicMock()
+        self.ledger = LedgerService(
+            self.mock_db,
+            snapshot_interval=3,
+            snapshot_lag_seconds=5
+        )
+    
+    def _entry(self, when, deltas):
+        """Build a stored ledger entry created at a given time"""
+        return {
+            '_id': ObjectId.from_datetime(when),
+            'user': 'user1',
+            'deltas': deltas,
+            'reason': LedgerEntry.TRADE
+        }
+    
+    def test_record_skips_empty_deltas(self):
+        """Test nothing is written when balances do not change"""
+        result = self.ledger.record('user1', {'USD': 0}, LedgerEntry.TRADE)
+        
+        self.assertIsNone(result)
+        self.mock_db.append_ledger_entries.assert_not_called()
+    
+    def test_record(self):
+        """Test appending a balance change"""
+        self.mock_db.append_ledger_entries.return_value = ['entry1']
+        
+        result = self.ledger.record(
+            'user1',
+            {'USD': -100.0},
+            LedgerEntry.OFFER_LOCK,
+            reference='offer1'
+        )
+        
+        self.assertEqual(result, 'entry1')
+        entries = self.mock_db.append_ledger_entries.call_args[0][0]
+        self.assertEqual(entries[0]['deltas'], {'USD': -100.0})
+        self.assertEqual(entries[0]['ref'], 'offer1')
+    
+    def test_replay_from_snapshot(self):
+        """Test only entries after the snapshot cutoff are replayed"""
+        now = datetime(2023, 1, 1, 12, 0, 0)
+        cutoff = ObjectId.from_datetime(now)
+        self.mock_db.get_latest_wallet_snapshot.return_value = {
+            'user': 'user1',
+            'balances': {'USD': 100.0},
+            'cutoff': cutoff
+        }
+        self.mock_db.get_ledger_entries.return_value = [
+            self._entry(now + timedelta(seconds=1), {'USD': -10.0}),
+            self._entry(now + timedelta(seconds=2), {'EUR': 5.0})
+        ]
+        
+        result = self.ledger.replay('user1')
+        
+        self.assertEqual(result['balances'], {'USD': 90.0, 'EUR': 5.0})
+        self.assertEqual(result['replayed'], 2)
+        self.mock_db.get_ledger_entries.assert_called_once_with('user1', since_id=cutoff)
+    
+    def test_snapshot_leaves_recent_entries_out(self):
+        """Test snapshots only cover entries older than the lag"""
+        now = datetime(2023, 1, 1, 12, 0, 0)
+        self.mock_db.get_latest_wallet_snapshot.return_value = None
+        self.mock_db.get_ledger_entries.return_value = [
+            self._entry(now - timedelta(minutes=1), {'USD': 100.0}),
+            self._entry(now - timedelta(seconds=1), {'USD': -30.0})
+        ]
+        
+        snapshot = self.ledger.snapshot_wallet('user1', now=now)
+        
+        self.assertEqual(snapshot['balances'], {'USD': 100.0})
+        self.assertEqual(snapshot['cutoff'], ObjectId.from_datetime(now - timedelta(seconds=5)))
+        self.mock_db.create_wallet_snapshot.assert_called_once_with(snapshot)
+    
+    def test_snapshot_wallets_every_interval(self):
+        """Test the snapshot job only covers wallets with enough new entries"""
+        old = datetime.utcnow() - timedelta(minutes=1)
+        entries = {
+            'user1': [self._entry(old, {'USD': 1.0}) for _ in range(3)],
+            'user2': [self._entry(old, {'USD': 1.0}) for _ in range(2)]
+        }
+        self.mock_db.get_ledger_user_ids.return_value = ['user1', 'user2']
+        self.mock_db.get_latest_wallet_snapshot.return_value = None
+        self.mock_db.get_ledger_entries.side_effect = lambda user_id, since_id=None: entries[user_id]
+        
+        # Appending never snapshots in the request
+        for _ in range(3):
+            self.ledger.record('user1', {'USD': 1.0}, LedgerEntry.TRADE)
+        self.mock_db.create_wallet_snapshot.assert_not_called()
+        
+        self.assertEqual(self.ledger.snapshot_wallets(), 1)
+        
+        snapshot = self.mock_db.create_wallet_snapshot.call_args[0][0]
+        self.assertEqual(snapshot['user'], 'user1')
+        self.assertEqual(snapshot['balances'], {'USD': 3.0})
+    
+    def test_snapshot_wallets_only_replays_wallets_with_new_entries(self):
+        """Test a run only looks at wallets with entries since the previous run's cutoff"""
+        db = MemoryStorage()
+        ledger = LedgerService(db, snapshot_interval=2, snapshot_lag_seconds=0)
+        for user_id in ('user1', 'user1', 'user2'):
+            ledger.record(user_id, {'USD': 1.0}, LedgerEntry.TRADE)
+        first = datetime.utcnow() + timedelta(seconds=2)
+        
+        self.assertEqual(ledger.snapshot_wallets(now=first), 1)
+        self.assertEqual(db.get_ledger_snapshot_watermark(), ObjectId.from_datetime(first))
+        
+        db.get_ledger_entries = MagicMock(wraps=db.get_ledger_entries)
+        self.assertEqual(ledger.snapshot_wallets(now=first + timedelta(seconds=1)), 0)
+        db.get_ledger_entries.assert_not_called()
+        
+        # user2 reaches the interval with an entry after the watermark
+        entry = LedgerEntry('user2', {'USD': 1.0}, LedgerEntry.TRADE).to_dict()
+        db.append_ledger_entries([{**entry, '_id': ObjectId.from_datetime(first + timedelta(seconds=2))}])
+        self.assertEqual(ledger.snapshot_wallets(now=first + timedelta(seconds=3)), 1)
+        self.assertEqual(db.get_latest_wallet_snapshot('user2')['balances'], {'USD': 2.0})
+    
+    def test_verify_wallet(self):
+        """Test differences between stored and rebuilt balances"""
+        self.mock_db.get_latest_wallet_snapshot.return_value = None
+        self.mock_db.get_ledger_entries.return_value = [
+            self._entry(datetime(2023, 1, 1), {'USD': 100.0, 'EUR': 50.0})
+        ]
+        self.mock_db.get_wallet_by_user_id.return_value = {
+            'user': 'user1',
+            'currencies': [
+                {'currency': 'USD', 'value': 100.0},
+                {'currency': 'EUR', 'value': 40.0}
+            ]
+        }
+        
+        result = self.ledger.verify_wallet('user1')
+        
+        self.assertFalse(result['consistent'])
+        self.assertEqual(result['differences'], {'EUR': -10.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Unit tests for the sharded matching engine
+"""
+import threading
+import unittest
+from app.services.matching_engine import (
+    MatchingEngine,
+    MatchingShard,
+    EngineBusyError,
+    EngineTimeoutError
+)
+
+
+class TestMatchingEngine(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.engine = MatchingEngine(shards=4, queue_size=10, request_timeout=5)
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.engine.stop(timeout=1)
+    
+    def test_pair_key_is_symmetric(self):
+        """Test both sides of a pair share a routing key"""
+        self.assertEqual(
+            MatchingEngine.pair_key('USD', 'EUR'),
+            MatchingEngine.pair_key('EUR', 'USD')
+        )
+        self.assertEqual(MatchingEngine.pair_key('USD', 'EUR'), 'EUR/USD')
+    
+    def test_shard_index_is_stable(self):
+        """Test a pair always maps to the same shard in range"""
+        index = self.engine.shard_index('USD', 'EUR')
+        
+        self.assertEqual(index, self.engine.shard_index('EUR', 'USD'))
+        self.assertEqual(index, MatchingEngine(shards=4).shard_index('USD', 'EUR'))
+        self.assertTrue(0 <= index < 4)
+    
+    def test_call_runs_on_shard(self):
+        """Test calls run on the owning shard thread and return results"""
+        result = self.engine.call(('USD', 'EUR'), lambda a, b=0: (threading.current_thread().name, a + b), 1, b=2)
+        
+        expected = f"matching-shard-{self.engine.shard_index('USD', 'EUR')}"
+        self.assertEqual(result, (expected, 3))
+    
+    def test_call_propagates_exceptions(self):
+        """Test exceptions raised on the shard reach the caller"""
+        def fail():
+            raise ValueError('boom')
+        
+        with self.assertRaises(ValueError):
+            self.engine.call(('USD', 'EUR'), fail)
+        
+        shard_stats = self.engine.stats()[self.engine.shard_index('USD', 'EUR')]
+        self.assertEqual(shard_stats['failed'], 1)
+    
+    def test_same_pair_runs_serially(self):
+        """Test requests for one pair never overlap"""
+        active = []
+        overlaps = []
+        lock = threading.Lock()
+        
+        def work():
+            with lock:
+                active.append(1)
+                if len(active) > 1:
+                    overlaps.append(1)
+            threading.Event().wait(0.005)
+            with lock:
+                active.pop()
+        
+        threads = [
+            threading.Thread(target=self.engine.call, args=(('USD', 'EUR'), work))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(overlaps, [])
+        self.assertEqual(sum(s['processed'] for s in self.engine.stats()), 8)
+    
+    def test_nested_call_runs_inline(self):
+        """Test a call made from a shard thread does not deadlock"""
+        def outer():
+            self.assertTrue(MatchingEngine.on_shard())
+            return self.engine.call(('GBP', 'PLN'), lambda: 'inner')
+        
+        self.assertFalse(MatchingEngine.on_shard())
+        self.assertEqual(self.engine.call(('USD', 'EUR'), outer), 'inner')
+    
+    def test_timeout_cancels_queued_request(self):
+        """Test a request still queued at the timeout is dropped, one running is not"""
+        engine = MatchingEngine(shards=1, request_timeout=0.05)
+        release = threading.Event()
+        calls = []
+        try:
+            with self.assertRaises(EngineTimeoutError) as running:
+                engine.call(('USD', 'EUR'), lambda: calls.append('first') or release.wait(5))
+            with self.assertRaises(EngineBusyError):
+                engine.call(('USD', 'EUR'), lambda: calls.append('second'))
+            
+            release.set()
+            self.assertTrue(running.exception.future.result(timeout=5))
+            self.assertEqual(engine.call(('USD', 'EUR'), lambda: 'next'), 'next')
+        finally:
+            release.set()
+            engine.stop(timeout=1)
+        
+        self.assertEqual(calls, ['first'])
+    
+    def test_full_queue_raises_busy(self):
+        """Test a full shard queue rejects new requests"""
+        shard = MatchingShard(0, queue_size=1)
+        shard.submit(lambda: None, (), {}, timeout=0)
+        
+        with self.assertRaises(EngineBusyError):
+            shard.submit(lambda: None, (), {}, timeout=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+"""
+Unit tests for MemoryStorage
+"""
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from app.services.database import DatabaseService, USER_IDENTITY_PROJECTION, WALLET_BALANCES_PROJECTION
+from app.models.transaction import Transaction
+from app.services.memory_storage import MemoryStorage
+from app.services.offer_service import OfferService
+from app.services.storage_backend import StorageBackend
+
+
+def make_offer(to_value, from_currency='EUR', to_currency='USD', **fields):
+    """Offer document with the given to_value"""
+    return {
+        'from_user': 'a@example.com',
+        'from_value': 5.0,
+        'from_currency': from_currency,
+        'to_value': to_value,
+        'to_currency': to_currency,
+        **fields
+    }
+
+
+class TestMemoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.db = MemoryStorage()
+
+    def test_implements_backend(self):
+        """Test both backends share the storage interface"""
+        self.assertIsInstance(self.db, StorageBackend)
+        self.assertTrue(issubclass(DatabaseService, StorageBackend))
+
+    def test_users_by_email_and_id(self):
+        """Test users are found by email and ID, with projections"""
+        user = {'email': 'a@example.com', 'name': 'A', 'password': 'hash'}
+        user_id = self.db.create_user(user)
+
+        # insert_one sets the _id on the caller's document
+        self.assertEqual(user['_id'], ObjectId(user_id))
+        self.assertEqual(
+            self.db.get_user_by_email('a@example.com', projection=USER_IDENTITY_PROJECTION),
+            {'_id': ObjectId(user_id), 'email': 'a@example.com'}
+        )
+        self.assertEqual(self.db.get_user_by_id(user_id)['name'], 'A')
+        self.assertEqual(
+            self.db.get_user_ids_by_email(['a@example.com', 'b@example.com']),
+            {'a@example.com': user_id}
+        )
+        self.assertIsNone(self.db.get_user_by_email('b@example.com'))
+
+    def test_reads_are_copies(self):
+        """Test changing a returned document leaves the stored one alone"""
+        self.db.create_wallet({'user': 'u1', 'currencies': [{'currency': 'USD', 'value': 10.0}]})
+
+        wallet = self.db.get_wallet_by_user_id('u1')
+        wallet['currencies'][0]['value'] = 0.0
+
+        self.assertEqual(self.db.get_wallet_by_user_id('u1')['currencies'][0]['value'], 10.0)
+
+    def test_wallet_updates(self):
+        """Test update and increment results match the MongoDB counts"""
+        self.db.create_wallet({'user': 'u1', 'currencies': [
+            {'currency': 'USD', 'value': 10.0},
+            {'currency': 'EUR', 'value': 5.0}
+        ]})
+        currencies = [{'currency': 'USD', 'value': 20.0}, {'currency': 'EUR', 'value': 5.0}]
+
+        self.assertTrue(self.db.update_wallet('u1', {'currencies': currencies}))
+        # Setting the same values modifies nothing
+        self.assertFalse(self.db.update_wallet('u1', {'currencies': currencies}))
+        self.assertEqual(self.db.update_wallets({'u1': {'currencies': currencies}, 'u2': {}}), 1)
+        self.assertEqual(
+            self.db.increment_wallet_balances({'u1': {'USD': -5.0, 'EUR': 1.0}, 'u2': {'USD': 1.0}}),
+            1
+        )
+        self.assertEqual(
+            self.db.get_wallet_by_user_id('u1', projection=WALLET_BALANCES_PROJECTION),
+            {'user': 'u1', 'currencies': [
+                {'currency': 'USD', 'value': 15.0},
+                {'currency': 'EUR', 'value': 6.0}
+            ]}
+        )
+
+    def test_matching_order(self):
+        """Test matches come largest to_value first, ties in insertion order"""
+        ids = {}
+        for name, to_value in (('a', 10.0), ('b', 30.0), ('c', 20.0), ('d', 50.0), ('e', 30.0)):
+            ids[name] = self.db.create_offer(make_offer(to_value))
+        self.db.create_offer(make_offer(15.0, from_currency='GBP'))
+
+        matches = self.db.find_matching_offers(
+            to_currency='EUR', from_currency='USD', from_value=30.0
+        )
+
+        self.assertEqual(
+            [str(offer['_id']) for offer in matches],
+            [ids['b'], ids['e'], ids['c'], ids['a']]
+        )
+
+    def test_expired_offers_are_not_live(self):
+        """Test expired offers are hidden from listings and matching but kept in the book"""
+        now = datetime.utcnow()
+        live_id = self.db.create_offer(make_offer(10.0, expires_at=now + timedelta(hours=1)))
+        self.db.create_offer(make_offer(10.0, expires_at=now - timedelta(hours=1)))
+
+        self.assertEqual([str(offer['_id']) for offer in self.db.get_all_offers()], [live_id])
+        self.assertEqual(len(self.db.find_matching_offers('EUR', 'USD', 10.0)), 1)
+        self.assertEqual(len(self.db.get_book_offers()), 2)
+
+    def test_claim_expired_offers(self):
+        """Test sweeps claim the oldest unclaimed expired offers once"""
+        now = datetime.utcnow()
+        first = self.db.create_offer(make_offer(10.0, expires_at=now - timedelta(minutes=1)))
+        second = self.db.create_offer(make_offer(10.0, expires_at=now - timedelta(minutes=2)))
+        self.db.create_offer(make_offer(10.0, expires_at=now + timedelta(minutes=1)))
+
+        claimed = self.db.claim_expired_offers(now, limit=1, claim='sweep-1', lease_seconds=600)
+        self.assertEqual([str(offer['_id']) for offer in claimed], [second])
+        self.assertEqual(claimed[0]['expiry_claim'], 'sweep-1')
+
+        claimed = self.db.claim_expired_offers(now, limit=10, claim='sweep-2', lease_seconds=600)
+        self.assertEqual([str(offer['_id']) for offer in claimed], [first])
+        self.assertEqual(self.db.claim_expired_offers(now, limit=10, claim='sweep-3', lease_seconds=600), [])
+
+        # A sweep that died leaves its claims to lapse
+        later = now + timedelta(minutes=11)
+        claimed = self.db.claim_expired_offers(later, limit=10, claim='sweep-4', lease_seconds=600)
+        self.assertTrue({first, second} <= {str(offer['_id']) for offer in claimed})
+        self.assertEqual({offer['expiry_claim'] for offer in claimed}, {'sweep-4'})
+
+        self.assertEqual(self.db.delete_offers([ObjectId(first), ObjectId(second)]), 2)
+        self.assertFalse(self.db.delete_offer(first))
+
+    def test_user_transactions(self):
+        """Test transactions are found by either participant in insertion order"""
+        first = self.db.create_transaction(Transaction('a@example.com', 'b@example.com', 1.0, 'USD', 2.0, 'EUR').to_dict())
+        self.db.create_transaction(Transaction('c@example.com', 'd@example.com', 1.0, 'USD', 2.0, 'EUR').to_dict())
+        third = self.db.create_transaction(Transaction('b@example.com', 'a@example.com', 1.0, 'USD', 2.0, 'EUR').to_dict())
+
+        transactions = self.db.get_user_transactions('a@example.com', projection={'_id': 1})
+
+        self.assertEqual(transactions, [{'_id': ObjectId(first)}, {'_id': ObjectId(third)}])
+        self.assertEqual(len(self.db.get_all_transactions()), 3)
+
+    def test_ledger_entries(self):
+        """Test ledger entries replay per user in _id order from since_id"""
+        ids = self.db.append_ledger_entries([
+            {'user': 'u1', 'currency': 'USD', 'amount': 1.0},
+            {'user': 'u2', 'currency': 'USD', 'amount': 2.0},
+            {'user': 'u1', 'currency': 'USD', 'amount': 3.0}
+        ])
+
+        entries = self.db.get_ledger_entries('u1', since_id=ObjectId(ids[2]))
+
+        self.assertEqual([entry['amount'] for entry in self.db.get_ledger_entries('u1')], [1.0, 3.0])
+        self.assertEqual([entry['amount'] for entry in entries], [3.0])
+        self.assertEqual(sorted(self.db.get_ledger_user_ids()), ['u1', 'u2'])
+
+    def test_latest_wallet_snapshot(self):
+        """Test the snapshot with the latest cutoff is returned"""
+        old, new = ObjectId(), ObjectId()
+        self.db.create_wallet_snapshot({'user': 'u1', 'cutoff': new, 'balances': {'USD': 2.0}})
+        self.db.create_wallet_snapshot({'user': 'u1', 'cutoff': old, 'balances': {'USD': 1.0}})
+
+        self.assertEqual(self.db.get_latest_wallet_snapshot('u1')['balances'], {'USD': 2.0})
+        self.assertIsNone(self.db.get_latest_wallet_snapshot('u2'))
+
+    def test_idempotency_keys(self):
+        """Test reservation, take over, completion and expiry of idempotency records"""
+        now = datetime.utcnow()
+        record = {'_id': 'key', 'status': 'pending', 'created_at': now - timedelta(minutes=5)}
+
+        self.assertTrue(self.db.reserve_idempotency_key(dict(record)))
+        self.assertFalse(self.db.reserve_idempotency_key(dict(record)))
+        self.assertFalse(self.db.take_over_idempotency_key('key', now - timedelta(minutes=10), now))
+        self.assertTrue(self.db.take_over_idempotency_key('key', now - timedelta(minutes=1), now))
+        self.assertTrue(self.db.complete_idempotency_key('key', {'status_code': 201}))
+        self.assertEqual(self.db.get_idempotency_record('key')['status'], 'done')
+        self.assertTrue(self.db.delete_idempotency_key('key'))
+        self.assertFalse(self.db.delete_idempotency_key('key'))
+
+        # Records past the TTL are gone, as the TTL index would remove them
+        expired = {'_id': 'old', 'status': 'done', 'created_at': now - timedelta(days=30)}
+        self.assertTrue(self.db.reserve_idempotency_key(dict(expired)))
+        self.assertIsNone(self.db.get_idempotency_record('old'))
+
+    def test_rate_limit_tokens(self):
+        """Test buckets start full, refill over time and refuse when empty"""
+        now = datetime(2026, 1, 1)
+
+        first = self.db.consume_rate_limit_tokens('k', rate=1.0, burst=2.0, cost=1.0, now=now)
+        self.db.consume_rate_limit_tokens('k', rate=1.0, burst=2.0, cost=1.0, now=now)
+        refused = self.db.consume_rate_limit_tokens('k', rate=1.0, burst=2.0, cost=1.0, now=now)
+        refilled = self.db.consume_rate_limit_tokens(
+            'k', rate=1.0, burst=2.0, cost=1.0, now=now + timedelta(milliseconds=1500)
+        )
+
+        self.assertEqual((first['tokens'], first['allowed']), (1.0, True))
+        self.assertEqual((refused['tokens'], refused['allowed']), (0.0, False))
+        self.assertEqual(refilled['allowed'], True)
+        self.assertAlmostEqual(refilled['tokens'], 0.5)
+
+    def test_versions(self):
+        """Test versions start at 0 and count bumps"""
+        self.assertEqual(self.db.get_version('book'), 0)
+        self.assertEqual(self.db.bump_versions(['book', 'transactions']), 2)
+        self.db.bump_versions(['book'])
+
+        self.assertEqual(self.db.get_version('book'), 2)
+
+    def test_upsert_documents_reindexes(self):
+        """Test replayed documents replace earlier copies and their index entries"""
+        offer_id = ObjectId()
+        self.db.upsert_documents('offers', [{'_id': offer_id, **make_offer(10.0)}])
+
+        self.assertEqual(self.db.upsert_documents('offers', [{'_id': offer_id, **make_offer(20.0)}]), 1)
+        self.assertEqual(self.db.count('offers'), 1)
+        self.assertEqual(
+            [offer['to_value'] for offer in self.db.find_matching_offers('EUR', 'USD', 100.0)],
+            [20.0]
+        )
+        with self.assertRaises(AttributeError):
+            self.db.upsert_documents('unknown', [{'_id': 1}])
+
+    def test_offer_service_round_trip(self):
+        """Test the offer service matches and settles on the memory backend"""
+        service = OfferService(db=self.db)
+        for email in ('a@example.com', 'b@example.com'):
+            user_id = self.db.create_user({'email': email, 'name': email, 'password': ''})
+            self.db.create_wallet({'user': user_id, 'currencies': [
+                {'currency': 'USD', 'value': 100.0},
+                {'currency': 'EUR', 'value': 100.0}
+            ]})
+
+        service.create_offer('a@example.com', 10.0, 'EUR', 11.0, 'USD')
+        result = service.create_offer('b@example.com', 11.0, 'USD', 10.0, 'EUR')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(self.db.count('offers'), 0)
+        self.assertEqual(self.db.count('transactions'), 1)
+
+    def test_database_service_uses_memory_backend(self):
+        """Test DATABASE_BACKEND=memory and use_backend select the memory backend"""
+        previous = DatabaseService.use_backend(None)
+        try:
+            with patch('app.services.database.get_config') as mock_get_config:
+                mock_get_config.return_value.DATABASE_BACKEND = 'memory'
+                self.assertIsInstance(DatabaseService(), MemoryStorage)
+
+            DatabaseService.use_backend(self.db)
+            self.assertIs(DatabaseService(), self.db)
+        finally:
+            DatabaseService.use_backend(previous)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Unit tests for MessagePack responses
+"""
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from bson.objectid import ObjectId
+from flask import Flask
+from app.utils import msgpack_response
+from app.utils.msgpack_response import negotiated_response, MSGPACK_MIMETYPE
+from app.utils.json_provider import FastJSONProvider
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class TestMsgpackResponse(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.offer_id = ObjectId()
+        self.date = datetime(2024, 5, 1, 12, 30, 15)
+        self.app = Flask(__name__)
+        self.app.json = FastJSONProvider(self.app)
+        
+        @self.app.route('/offers')
+        def offers():
+            return negotiated_response([{'_id': self.offer_id, 'date': self.date, 'to_value': 85.0}])
+        
+        self.client = self.app.test_client()
+    
+    def test_msgpack_when_requested(self):
+        """Test ids are raw bytes and dates are timestamps"""
+        response = self.client.get('/offers', headers={'Accept': MSGPACK_MIMETYPE})
+        
+        self.assertEqual(response.mimetype, MSGPACK_MIMETYPE)
+        self.assertIn('Accept', response.headers['Vary'])
+        offers = msgpack.unpackb(response.data, timestamp=3)
+        self.assertEqual(offers[0]['_id'], self.offer_id.binary)
+        self.assertEqual(offers[0]['date'], self.date.replace(tzinfo=timezone.utc))
+        self.assertEqual(offers[0]['to_value'], 85.0)
+    
+    def test_json_by_default(self):
+        """Test browsers and clients without a preference get JSON"""
+        for accept in (None, 'application/json', '*/*'):
+            headers = {'Accept': accept} if accept else {}
+            response = self.client.get('/offers', headers=headers)
+            
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertEqual(response.get_json()[0]['_id'], str(self.offer_id))
+    
+    def test_json_without_msgpack_installed(self):
+        """Test the format falls back to JSON when msgpack is missing"""
+        with patch.object(msgpack_response, 'msgpack', None):
+            response = self.client.get('/offers', headers={'Accept': MSGPACK_MIMETYPE})
+        
+        self.assertEqual(response.mimetype, 'application/json')
+
+
+if __name__ == '__main__':
+    unittest.main()
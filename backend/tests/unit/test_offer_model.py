@@ -3,7 +3,7 @@ Unit tests for Offer model
 """
 import unittest
 from unittest.mock import patch
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.models.offer import Offer
 from bson.objectid import ObjectId
 
@@ -182,6 +182,55 @@ class TestOfferModel(unittest.TestCase):
         self.assertFalse(result['is_valid'])
         self.assertIn('currency', result['errors'])
 
+    
+    def test_to_dict_with_expiry(self):
+        """Test expiry is stored only when set"""
+        expires_at = datetime(2023, 1, 1, 13, 0, 0)
+        offer = Offer(
+            from_user="user1@example.com",
+            from_value=100.0,
+            from_currency="USD",
+            to_value=85.0,
+            to_currency="EUR",
+            expires_at=expires_at
+        )
+        
+        self.assertEqual(offer.to_dict()['expires_at'], expires_at)
+        self.assertEqual(Offer.from_dict(offer.to_dict()).expires_at, expires_at)
+        
+        offer.expires_at = None
+        self.assertNotIn('expires_at', offer.to_dict())
+    
+    def test_is_expired(self):
+        """Test expiry checks against a reference time"""
+        now = datetime(2023, 1, 1, 12, 0, 0)
+        offer = Offer(
+            from_user="user1@example.com",
+            from_value=100.0,
+            from_currency="USD",
+            to_value=85.0,
+            to_currency="EUR",
+            expires_at=now
+        )
+        
+        self.assertTrue(offer.is_expired(now))
+        self.assertFalse(offer.is_expired(now - timedelta(seconds=1)))
+        self.assertFalse(Offer.is_expired_record({'from_user': 'a'}, now))
+        self.assertTrue(Offer.is_expired_record({'expires_at': now}, now))
+    
+    def test_validate_offer_expiry_in_past(self):
+        """Test validating an offer that is already expired"""
+        result = Offer.validate_offer(
+            from_value=100.0,
+            from_currency="USD",
+            to_value=85.0,
+            to_currency="EUR",
+            expires_at=datetime.utcnow() - timedelta(minutes=1)
+        )
+        
+        self.assertFalse(result['is_valid'])
+        self.assertIn('expires_at', result['errors'])
+
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -1,13 +1,23 @@
 """
 Unit tests for OfferService
 """
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock, ANY
+from flask import Flask
+from app.routes.offer_routes import offer_bp
 from app.services.offer_service import OfferService
+from app.services.idempotency_service import IdempotencyService
+from app.services.matching_engine import MatchingEngine, EngineBusyError
+from app.services.memory_storage import MemoryStorage
+from app.services.version_service import BOOK_VERSION
+from app.services.database import USER_IDENTITY_PROJECTION, WALLET_BALANCES_PROJECTION
 from app.models.offer import Offer
 from app.models.transaction import Transaction
 from app.models.wallet import Wallet
 from bson.objectid import ObjectId
+from datetime import datetime, timedelta
 
 
 class TestOfferService(unittest.TestCase):
@@ -19,14 +29,23 @@ class TestOfferService(unittest.TestCase):
         
         # Create a mock instance
         self.mock_db = MagicMock()
+        self.mock_db.when_persisted.side_effect = lambda callback: callback()
         self.mock_db_class.return_value = self.mock_db
         
+        # Listing versions are checked separately
+        self.versions_patcher = patch('app.services.offer_service.get_version_service')
+        self.mock_versions = self.versions_patcher.start().return_value
+        self.depth_patcher = patch('app.services.offer_service.get_book_depth')
+        self.mock_depth = self.depth_patcher.start().return_value
+        
         # Create the service
         self.offer_service = OfferService()
     
     def tearDown(self):
         """Clean up after tests"""
         self.db_patcher.stop()
+        self.versions_patcher.stop()
+        self.depth_patcher.stop()
     
     @patch('app.models.offer.Offer.validate_offer')
     def test_create_offer_invalid(self, mock_validate):
@@ -185,6 +204,38 @@ class TestOfferService(unittest.TestCase):
             # Check that the currency was deducted from the wallet
             self.assertEqual(wallet['currencies'][0]['value'], 100.0)  # 200 - 100
     
+    def test_create_offer_uses_projections(self):
+        """Test creating an offer only fetches the fields it needs"""
+        user_id = str(ObjectId())
+        self.mock_db.get_user_by_email.return_value = {
+            '_id': ObjectId(user_id),
+            'email': 'user1@example.com'
+        }
+        self.mock_db.get_wallet_by_user_id.return_value = {
+            'user': user_id,
+            'currencies': [{'currency': 'USD', 'value': 200.0}]
+        }
+        self.mock_db.find_matching_offers.return_value = []
+        
+        # Call the method
+        self.offer_service.create_offer(
+            from_user_email='user1@example.com',
+            from_value=100.0,
+            from_currency='USD',
+            to_value=85.0,
+            to_currency='EUR'
+        )
+        
+        # The password hash and wallet id are never fetched
+        self.mock_db.get_user_by_email.assert_called_once_with(
+            'user1@example.com',
+            projection=USER_IDENTITY_PROJECTION
+        )
+        self.mock_db.get_wallet_by_user_id.assert_called_once_with(
+            user_id,
+            projection=WALLET_BALANCES_PROJECTION
+        )
+    
     def test_get_all_offers(self):
         """Test getting all offers"""
         # Setup mocks
@@ -203,8 +254,8 @@ class TestOfferService(unittest.TestCase):
         
         # Assertions
         self.assertEqual(len(result), 2)
-        self.assertEqual(result[0]['_id'], str(offer1_id))
-        self.assertEqual(result[1]['_id'], str(offer2_id))
+        self.assertEqual(result[0]['_id'], offer1_id)
+        self.assertEqual(result[1]['_id'], offer2_id)
         
         # Verify the correct methods were called
         self.mock_db.get_all_offers.assert_called_once()
@@ -283,6 +334,8 @@ class TestOfferService(unittest.TestCase):
         self.mock_db.get_offer_by_id.assert_called_once_with(str(offer['_id']))
         self.mock_db.update_wallet.assert_called_once()
         self.mock_db.delete_offer.assert_called_once_with(str(offer['_id']))
+        self.mock_versions.bump.assert_called_once_with(BOOK_VERSION)
+        self.mock_depth.remove.assert_called_once_with(str(offer['_id']))
         
         # Check that the wallet update was called with the expected data
         call_args = self.mock_db.update_wallet.call_args
@@ -297,6 +350,39 @@ class TestOfferService(unittest.TestCase):
                 break
         
         self.assertTrue(usd_found, "USD currency not found in updated wallet")
+        
+        # The refund is appended to the ledger
+        entries = self.mock_db.append_ledger_entries.call_args[0][0]
+        self.assertEqual(entries[0]['user'], user_id)
+        self.assertEqual(entries[0]['deltas'], {'USD': 100.0})
+        self.assertEqual(entries[0]['reason'], 'offer_cancel')
+        self.assertEqual(entries[0]['ref'], str(offer['_id']))
+    
+    def test_wallet_updates_hold_user_lock(self):
+        """Test a wallet is read and written under its user's lock"""
+        user_id = str(ObjectId())
+        offer = {
+            '_id': ObjectId(),
+            'from_user': 'user1@example.com',
+            'from_value': 100.0,
+            'from_currency': 'USD'
+        }
+        locked = []
+        
+        def held(*args, **kwargs):
+            locked.append(any(lock.locked() for lock in self.offer_service._wallet_locks))
+            return {'user': user_id, 'currencies': [{'currency': 'USD', 'value': 50.0}]}
+        
+        self.mock_db.get_offer_by_id.return_value = offer
+        self.mock_db.get_user_by_email.return_value = {'_id': ObjectId(user_id)}
+        self.mock_db.get_wallet_by_user_id.side_effect = held
+        self.mock_db.update_wallet.side_effect = held
+        
+        result = self.offer_service.cancel_offer(str(offer['_id']), 'user1@example.com')
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(locked, [True, True])
+        self.assertFalse(any(lock.locked() for lock in self.offer_service._wallet_locks))
     
     def test_execute_transaction_offer_not_found(self):
         """Test executing a transaction with non-existent offer"""
@@ -337,6 +423,241 @@ class TestOfferService(unittest.TestCase):
         self.assertFalse(result['success'])
         self.assertEqual(result['message'], 'Cannot execute your own offer')
 
+    
+    def test_expire_offers_aggregates_refunds(self):
+        """Test expired offers are refunded per wallet in one bulk update"""
+        # Setup mocks
+        expired = [
+            {'_id': ObjectId(), 'from_user': 'a@example.com', 'from_currency': 'USD', 'from_value': 10.0},
+            {'_id': ObjectId(), 'from_user': 'a@example.com', 'from_currency': 'USD', 'from_value': 5.0},
+            {'_id': ObjectId(), 'from_user': 'a@example.com', 'from_currency': 'EUR', 'from_value': 1.0},
+            {'_id': ObjectId(), 'from_user': 'b@example.com', 'from_currency': 'PLN', 'from_value': 7.0}
+        ]
+        self.mock_db.claim_expired_offers.return_value = expired
+        self.mock_db.get_user_ids_by_email.return_value = {
+            'a@example.com': 'user-a',
+            'b@example.com': 'user-b'
+        }
+        
+        # Call the method
+        now = datetime(2023, 1, 1, 12, 0, 0)
+        result = self.offer_service.expire_offers(batch_size=100, now=now)
+        
+        # Assertions
+        self.assertEqual(result, 4)
+        claim_kwargs = self.mock_db.claim_expired_offers.call_args[1]
+        self.assertEqual(claim_kwargs['now'], now)
+        self.assertEqual(claim_kwargs['limit'], 100)
+        self.assertEqual(claim_kwargs['lease_seconds'], self.offer_service.claim_lease_seconds)
+        self.mock_db.increment_wallet_balances.assert_called_once_with({
+            'user-a': {'USD': 15.0, 'EUR': 1.0},
+            'user-b': {'PLN': 7.0}
+        })
+        self.mock_db.delete_offers.assert_called_once_with(
+            [offer['_id'] for offer in expired]
+        )
+    
+    def test_expire_offers_nothing_to_do(self):
+        """Test a sweep without expired offers makes no writes"""
+        self.mock_db.claim_expired_offers.return_value = []
+        
+        self.assertEqual(self.offer_service.expire_offers(), 0)
+        self.mock_db.increment_wallet_balances.assert_not_called()
+        self.mock_db.delete_offers.assert_not_called()
+    
+    def test_match_skips_expired_offers(self):
+        """Test expired offers never match"""
+        stale = {
+            '_id': ObjectId(),
+            'from_user': 'seller@example.com',
+            'from_value': 90.0,
+            'from_currency': 'EUR',
+            'to_value': 100.0,
+            'to_currency': 'USD',
+            'expires_at': datetime.utcnow() - timedelta(minutes=1)
+        }
+        
+        result = self.offer_service._match_with_existing_offers(
+            matching_offers=[stale],
+            from_user={'_id': ObjectId(), 'email': 'buyer@example.com'},
+            from_currency='USD',
+            to_currency='EUR',
+            to_value=85.0
+        )
+        
+        self.assertFalse(result['matched'])
+        self.mock_db.delete_offer.assert_not_called()
+    
+    def test_execute_transaction_expired_offer(self):
+        """Test executing an expired offer is rejected"""
+        offer = {
+            '_id': ObjectId(),
+            'from_user': 'seller@example.com',
+            'from_value': 100.0,
+            'from_currency': 'USD',
+            'to_value': 85.0,
+            'to_currency': 'EUR',
+            'expires_at': datetime.utcnow() - timedelta(minutes=1)
+        }
+        self.mock_db.get_offer_by_id.return_value = offer
+        
+        result = self.offer_service.execute_transaction(
+            offer_id=str(offer['_id']),
+            user_email='buyer@example.com'
+        )
+        
+        self.assertFalse(result['success'])
+        self.assertEqual(result['message'], 'Offer has expired')
+        self.mock_db.update_wallet.assert_not_called()
+    
+    def test_create_offer_routed_through_engine(self):
+        """Test offers are created on the shard owning their pair"""
+        engine = MagicMock()
+        engine.call.return_value = {'success': True, 'message': 'Offer created'}
+        offer_service = OfferService(engine=engine)
+        
+        result = offer_service.create_offer(
+            from_user_email='test@example.com',
+            from_value=100.0,
+            from_currency='USD',
+            to_value=85.0,
+            to_currency='EUR'
+        )
+        
+        self.assertTrue(result['success'])
+        engine.call.assert_called_once_with(
+            ('USD', 'EUR'),
+            offer_service._create_offer,
+            from_user_email='test@example.com',
+            from_value=100.0,
+            from_currency='USD',
+            to_value=85.0,
+            to_currency='EUR',
+            expires_at=None
+        )
+    
+    def test_cancel_offer_routed_by_offer_pair(self):
+        """Test cancellations are routed by the stored offer's pair"""
+        engine = MagicMock()
+        engine.call.side_effect = EngineBusyError('full')
+        offer_service = OfferService(engine=engine)
+        offer_id = str(ObjectId())
+        self.mock_db.get_offer_by_id.return_value = {
+            'from_currency': 'USD',
+            'to_currency': 'EUR'
+        }
+        
+        result = offer_service.cancel_offer(offer_id, 'test@example.com')
+        
+        self.assertFalse(result['success'])
+        self.assertEqual(result['message'], 'Matching engine busy, please retry')
+        self.mock_db.get_offer_by_id.assert_called_once_with(
+            offer_id,
+            projection={'from_currency': 1, 'to_currency': 1}
+        )
+        self.assertEqual(engine.call.call_args[0][0], ('USD', 'EUR'))
+    
+    def test_journaled_result_waits_for_journal(self):
+        """Test results are only acknowledged once the journal is durable"""
+        self.offer_service.store = MagicMock()
+        self.offer_service.store.last_seq = 7
+        self.offer_service.store.wait_durable.side_effect = [False, True]
+        
+        result = self.offer_service._route(None, lambda: {'success': True})
+        
+        # The operation ran, so it is settled later rather than retried
+        self.assertFalse(result['success'])
+        self.assertNotIn('retryable', result)
+        self.assertEqual(result['pending'].result(timeout=5), {'success': True})
+        self.assertEqual(self.offer_service.store.wait_durable.call_args_list[0][0], (7,))
+
+
+class TestOfferRoutes(unittest.TestCase):
+    def setUp(self):
+        """Set up an app with the offer routes and a mocked service"""
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config.update(RATE_LIMIT_ENABLED=False)
+        app.register_blueprint(offer_bp)
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_id'] = 'id'
+            session['email'] = 'user@example.com'
+
+        self.service_patcher = patch('app.routes.offer_routes.get_offer_service')
+        self.mock_service = self.service_patcher.start().return_value
+        self.mock_service.create_offer.return_value = {'success': True, 'message': 'Offer added successfully'}
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.service_patcher.stop()
+
+    def add_offer(self, expires_in, headers=None):
+        """Post an offer with the given expiresIn"""
+        return self.client.post('/add_offer', json={
+            'fromValue': 100.0,
+            'fromCurrency': 'USD',
+            'toValue': 85.0,
+            'toCurrency': 'EUR',
+            'expiresIn': expires_in
+        }, headers=headers)
+
+    def test_add_offer_with_expiry(self):
+        """Test a good-till-time offer expires expiresIn seconds from now"""
+        before = datetime.utcnow()
+        response = self.add_offer(60)
+
+        self.assertEqual(response.status_code, 201)
+        expires_at = self.mock_service.create_offer.call_args[1]['expires_at']
+        self.assertGreaterEqual(expires_at, before + timedelta(seconds=60))
+
+    def test_add_offer_rejects_invalid_expiry(self):
+        """Test non-finite, non-positive and overly long expiries are rejected"""
+        for expires_in in ('nan', 'inf', '-inf', 1e20, 0, -5, 'soon'):
+            with self.subTest(expires_in=expires_in):
+                self.assertEqual(self.add_offer(expires_in).status_code, 400)
+        self.mock_service.create_offer.assert_not_called()
+
+    
+    def test_timed_out_offer_is_not_run_twice(self):
+        """Test a retry of an offer still running after the engine wait does not run it again"""
+        engine = MatchingEngine(shards=1, request_timeout=0.05)
+        service = OfferService(engine=engine, db=MemoryStorage())
+        release = threading.Event()
+        calls = []
+        
+        def create_offer(**kwargs):
+            calls.append(kwargs)
+            release.wait(5)
+            return {'success': True, 'message': 'Offer added successfully'}
+            
+        self.mock_service.create_offer.side_effect = \
+            lambda **kwargs: service._route(('USD', 'EUR'), create_offer, **kwargs)
+        idempotency = IdempotencyService(db=MemoryStorage(), cache_size=10, lock_seconds=60, ttl_seconds=60)
+        headers = {'Idempotency-Key': 'key1'}
+        
+        with patch('app.utils.decorators.get_idempotency_service', return_value=idempotency):
+            try:
+                first = self.add_offer(60, headers)
+                retry = self.add_offer(60, headers)
+                release.set()
+                
+                # The outcome is stored once the operation finishes
+                for _ in range(100):
+                    replay = self.add_offer(60, headers)
+                    if replay.status_code != 409:
+                        break
+                    time.sleep(0.05)
+            finally:
+                release.set()
+                engine.stop(timeout=1)
+                
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(retry.status_code, 409)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(calls), 1)
+
 
 if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    unittest.main()
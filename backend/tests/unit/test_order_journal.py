@@ -0,0 +1,109 @@
+"""
+Unit tests for the order journal
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from bson.objectid import ObjectId
+from app.services.order_journal import OrderJournal, JournalLockedError
+
+
+class TestOrderJournal(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.directory = tempfile.mkdtemp()
+        self.durable = []
+        self.journal = self._open()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.journal.close(timeout=1)
+        shutil.rmtree(self.directory)
+    
+    def _open(self, **kwargs):
+        """Open a journal on the test directory"""
+        journal = OrderJournal(
+            self.directory,
+            group_commit_ms=0,
+            on_durable=self.durable.extend,
+            **kwargs
+        )
+        journal.open()
+        return journal
+    
+    def test_append_and_read_back(self):
+        """Test durable records are read back with their BSON types"""
+        offer_id = ObjectId()
+        seq = self.journal.append('offer_open', {'offer': {'_id': offer_id}})
+        
+        self.assertTrue(self.journal.wait_durable(seq, timeout=5))
+        records = list(self.journal.read_after(0))
+        
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['type'], 'offer_open')
+        self.assertEqual(records[0]['data']['offer']['_id'], offer_id)
+        self.assertEqual([record['seq'] for record in self.durable], [seq])
+    
+    def test_group_commit_batches_fsyncs(self):
+        """Test concurrent appends share fsyncs"""
+        self.journal.close()
+        self.journal = self._open()
+        self.journal.group_commit = 0.02
+        
+        def append():
+            seq = self.journal.append('fill', {})
+            self.journal.wait_durable(seq, timeout=5)
+        
+        threads = [threading.Thread(target=append) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.journal.durable_seq, 20)
+        self.assertLess(self.journal.fsyncs, 20)
+    
+    def test_reopen_continues_sequence_and_drops_torn_tail(self):
+        """Test a partial record left by a crash is cut off on open"""
+        self.journal.wait_durable(self.journal.append('fill', {}), timeout=5)
+        self.journal.close()
+        
+        segment = os.path.join(self.directory, sorted(
+            name for name in os.listdir(self.directory) if name.startswith('segment-')
+        )[0])
+        with open(segment, 'ab') as f:
+            f.write(b'{"seq": 2, "ty')
+        
+        self.journal = self._open()
+        
+        self.assertEqual(self.journal.last_seq, 1)
+        self.assertEqual(self.journal.append('fill', {}), 2)
+        self.journal.wait_durable(2, timeout=5)
+        self.assertEqual([record['seq'] for record in self.journal.read_after(0)], [1, 2])
+    
+    def test_checkpoint_removes_persisted_segments(self):
+        """Test segments fully covered by the checkpoint are deleted"""
+        self.journal.close()
+        self.journal = self._open(segment_bytes=1)
+        for _ in range(3):
+            self.journal.wait_durable(self.journal.append('fill', {}), timeout=5)
+        self.assertEqual(self.journal.stats()['segments'], 3)
+        
+        self.journal.checkpoint(2)
+        
+        self.assertEqual(self.journal.checkpointed_seq, 2)
+        self.assertEqual(self.journal.stats()['segments'], 1)
+        self.assertEqual([record['seq'] for record in self.journal.read_after(2)], [3])
+    
+    def test_second_writer_is_rejected(self):
+        """Test only one process may own the journal directory"""
+        other = OrderJournal(self.directory)
+        
+        with self.assertRaises(JournalLockedError):
+            other._acquire_lock()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Unit tests for the persistence pipeline
+"""
+import threading
+import unittest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from app.services.persistence_pipeline import PersistencePipeline
+from app.services.database import WALLET_BALANCES_PROJECTION
+
+
+class TestPersistencePipeline(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.mock_db = MagicMock()
+        self.pipeline = PersistencePipeline(
+            db=self.mock_db,
+            batch_size=100,
+            flush_interval_ms=50
+        )
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.pipeline.close(timeout=1)
+    
+    def test_writes_batched_per_kind(self):
+        """Test queued writes are flushed with one bulk call per kind"""
+        offer_id = ObjectId()
+        self.pipeline.update_wallet('user1', {'currencies': [{'currency': 'USD', 'value': 1.0}]})
+        self.pipeline.update_wallet('user1', {'currencies': [{'currency': 'USD', 'value': 2.0}]})
+        self.pipeline.update_wallet('user2', {'currencies': []})
+        self.pipeline.delete_offer(str(offer_id))
+        transaction_id = self.pipeline.create_transaction({'from_user': 'a@example.com'})
+        self.pipeline.append_ledger_entries([{'user': 'user1'}, {'user': 'user2'}])
+        
+        self.pipeline.flush()
+        
+        self.mock_db.update_wallets.assert_called_once_with({
+            'user1': {'currencies': [{'currency': 'USD', 'value': 2.0}]},
+            'user2': {'currencies': []}
+        })
+        self.mock_db.delete_offers.assert_called_once_with([offer_id])
+        self.mock_db.upsert_documents.assert_any_call(
+            'transactions',
+            [{'_id': ObjectId(transaction_id), 'from_user': 'a@example.com'}]
+        )
+        self.assertEqual(self.pipeline.stats()['batches'], 1)
+        self.assertEqual(self.pipeline.stats()['pending_wallets'], 0)
+    
+    def test_reads_see_queued_writes(self):
+        """Test wallet updates and deletions are overlaid before they are written"""
+        gate = threading.Event()
+        self.mock_db.update_wallets.side_effect = lambda wallets: gate.wait(5)
+        offer = {'_id': ObjectId(), 'to_value': 10.0}
+        self.mock_db.find_matching_offers.return_value = [offer]
+        self.mock_db.get_offer_by_id.return_value = offer
+        self.mock_db.get_wallet_by_user_id.return_value = {
+            'user': 'user1',
+            'currencies': [{'currency': 'USD', 'value': 100.0}]
+        }
+        
+        self.pipeline.update_wallet('user1', {'currencies': [{'currency': 'USD', 'value': 40.0}]})
+        self.pipeline.delete_offer(str(offer['_id']))
+        
+        wallet = self.pipeline.get_wallet_by_user_id('user1', projection=WALLET_BALANCES_PROJECTION)
+        self.assertEqual(wallet['currencies'][0]['value'], 40.0)
+        self.assertEqual(self.pipeline.find_matching_offers('EUR', 'USD', 100.0), [])
+        self.assertIsNone(self.pipeline.get_offer_by_id(str(offer['_id'])))
+        
+        gate.set()
+        self.pipeline.flush()
+        self.assertEqual(self.pipeline.find_matching_offers('EUR', 'USD', 100.0), [offer])
+    
+    def test_increment_flushes_queued_wallets_first(self):
+        """Test an increment is not overwritten by an older queued update"""
+        self.pipeline.update_wallet('user1', {'currencies': []})
+        
+        self.pipeline.increment_wallet_balances({'user1': {'USD': 5.0}})
+        
+        self.mock_db.update_wallets.assert_called_once()
+        self.mock_db.increment_wallet_balances.assert_called_once_with({'user1': {'USD': 5.0}})
+    
+    def test_callback_runs_after_queued_writes(self):
+        """Test a persisted callback waits for the writes queued before it"""
+        gate = threading.Event()
+        self.mock_db.upsert_documents.side_effect = lambda collection, documents: gate.wait(5)
+        ran = threading.Event()
+        
+        self.pipeline.create_transaction({'from_user': 'a@example.com'})
+        self.pipeline.when_persisted(ran.set)
+        
+        self.assertFalse(ran.wait(0.1))
+        gate.set()
+        self.pipeline.flush()
+        self.assertTrue(ran.is_set())
+    
+    def test_failed_batch_is_retried(self):
+        """Test a batch is written again after a database error"""
+        self.mock_db.upsert_documents.side_effect = [Exception('down'), 1]
+        
+        self.pipeline.create_transaction({'from_user': 'a@example.com'})
+        self.pipeline.flush()
+        
+        self.assertEqual(self.mock_db.upsert_documents.call_count, 2)
+    
+    def test_close_flushes_queue(self):
+        """Test shutdown writes everything still queued"""
+        self.pipeline.create_transaction({'from_user': 'a@example.com'})
+        
+        self.pipeline.close(timeout=5)
+        
+        self.mock_db.upsert_documents.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
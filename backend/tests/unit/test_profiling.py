@@ -0,0 +1,143 @@
+"""
+Unit tests for request profiling
+"""
+import unittest
+import os
+import pstats
+import sys
+import tempfile
+import time
+from collections import Counter
+from flask import Flask, jsonify
+from app.routes.admin_routes import admin_bp
+from app.utils import profiling
+from app.utils.profiling import (
+    Profiler,
+    StackSampler,
+    collapse_stack,
+    format_collapsed,
+    PROFILE_HEADER,
+    PROFILE_ID_HEADER
+)
+
+
+def busy_handler(seconds=0.05):
+    """Spin for a while, so the sampler catches this frame"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+    return jsonify({'message': 'ok'}), 200
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = Profiler(interval_ms=1, window_seconds=60, max_profiles=2)
+        self.previous = profiling._profiler
+        profiling._profiler = self.profiler
+
+        self.app = Flask(__name__)
+        self.app.secret_key = 'test'
+        self.app.config['ADMIN_EMAILS'] = ['admin@example.com']
+        self.app.register_blueprint(admin_bp)
+        self.app.add_url_rule('/busy', 'busy', busy_handler)
+        self.profiler.init_app(self.app)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        profiling._profiler = self.previous
+
+    def login(self, email='admin@example.com'):
+        with self.client.session_transaction() as session:
+            session['user_id'] = '1'
+            session['email'] = email
+
+    def test_collapse_stack(self):
+        """Test stacks collapse outermost frame first"""
+        stack = collapse_stack(sys._getframe())
+
+        self.assertTrue(stack.endswith(f'{__name__}:test_collapse_stack'))
+        self.assertEqual(format_collapsed(Counter({'a;b': 3, 'a': 1})), 'a;b 3\na 1\n')
+
+    def test_cprofile_request(self):
+        """Test an admin's cProfile request is served as a report and a pstats dump"""
+        self.login()
+
+        response = self.client.get('/busy', headers={PROFILE_HEADER: 'cprofile'})
+        profile_id = response.headers[PROFILE_ID_HEADER]
+
+        report = self.client.get(f'/admin/profiling/requests/{profile_id}')
+        self.assertEqual(report.status_code, 200)
+        self.assertIn('busy_handler', report.get_data(as_text=True))
+
+        dump = self.client.get(f'/admin/profiling/requests/{profile_id}?format=pstats')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'profile.pstats')
+            with open(path, 'wb') as output:
+                output.write(dump.data)
+            functions = [function for _, _, function in pstats.Stats(path).stats]
+        self.assertIn('busy_handler', functions)
+
+        wrong = self.client.get(f'/admin/profiling/requests/{profile_id}?format=collapsed')
+        self.assertEqual(wrong.status_code, 400)
+
+    def test_sampling_request(self):
+        """Test a sampled request is served as collapsed stacks"""
+        self.login()
+
+        response = self.client.get('/busy', headers={PROFILE_HEADER: 'sampling'})
+        profile_id = response.headers[PROFILE_ID_HEADER]
+        stacks = self.client.get(f'/admin/profiling/requests/{profile_id}').get_data(as_text=True)
+
+        self.assertIn(f'{__name__}:busy_handler', stacks)
+        self.assertGreater(self.client.get('/admin/profiling').get_json()['requests'][0]['samples'], 0)
+
+    def test_non_admins_cannot_profile(self):
+        """Test the header is ignored and admin endpoints refused for other users"""
+        self.assertEqual(self.client.get('/admin/profiling').status_code, 401)
+        self.login('user@example.com')
+
+        response = self.client.get('/busy', headers={PROFILE_HEADER: 'cprofile'})
+
+        self.assertNotIn(PROFILE_ID_HEADER, response.headers)
+        self.assertEqual(self.client.get('/admin/profiling').status_code, 403)
+
+    def test_rolling_window(self):
+        """Test every request is sampled into the window while it is enabled"""
+        self.login()
+        self.assertEqual(
+            self.client.post('/admin/profiling', json={'window': True}).get_json()['window_enabled'],
+            True
+        )
+
+        self.client.get('/busy')
+        stacks = self.client.get('/admin/profiling/window?seconds=30').get_data(as_text=True)
+        self.assertIn(f'{__name__}:busy_handler', stacks)
+
+        self.client.post('/admin/profiling', json={'window': False})
+        self.assertEqual(self.client.get('/admin/profiling/window').get_data(as_text=True), '')
+        self.assertEqual(self.client.post('/admin/profiling', json={'window': 'yes'}).status_code, 400)
+
+    def test_oldest_profiles_dropped(self):
+        """Test only max_profiles request profiles are kept"""
+        self.login()
+        profile_ids = [
+            self.client.get('/busy', headers={PROFILE_HEADER: 'cprofile'}).headers[PROFILE_ID_HEADER]
+            for _ in range(3)
+        ]
+
+        listed = [profile['id'] for profile in self.client.get('/admin/profiling').get_json()['requests']]
+
+        self.assertEqual(listed, list(reversed(profile_ids[1:])))
+        self.assertEqual(self.client.get(f'/admin/profiling/requests/{profile_ids[0]}').status_code, 404)
+
+    def test_window_expiry(self):
+        """Test window buckets older than the window are dropped"""
+        sampler = StackSampler(window_seconds=2)
+        now = int(time.monotonic())
+        sampler._window.extend([(now - 5, Counter({'old': 1})), (now, Counter({'new': 1}))])
+
+        self.assertEqual(sampler.window(), {'new': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
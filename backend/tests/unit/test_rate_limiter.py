@@ -0,0 +1,118 @@
+"""
+Unit tests for rate limiting
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask, jsonify
+from app.services.rate_limiter import (
+    RateLimiter,
+    LocalRateLimitBackend,
+    MongoRateLimitBackend
+)
+from app.utils.decorators import rate_limit
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.backend = LocalRateLimitBackend()
+        self.limiter = RateLimiter(self.backend)
+    
+    @patch('app.services.rate_limiter.time.monotonic')
+    def test_bucket_allows_burst_then_refills(self, mock_monotonic):
+        """Test a bucket empties after its burst and refills at its rate"""
+        mock_monotonic.return_value = 100.0
+        
+        results = [self.backend.consume('key', rate=2, burst=3)[0] for _ in range(4)]
+        allowed, retry_after = self.backend.consume('key', rate=2, burst=3)
+        
+        self.assertEqual(results, [True, True, True, False])
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+        
+        mock_monotonic.return_value = 100.5
+        self.assertTrue(self.backend.consume('key', rate=2, burst=3)[0])
+    
+    def test_check_stops_at_first_empty_bucket(self):
+        """Test the global bucket is only checked once the user bucket allows"""
+        limits = {'user:1:add': (1, 1), 'global:add': (100, 100)}
+        
+        self.assertEqual(self.limiter.check(limits), (True, 0.0))
+        allowed, retry_after = self.limiter.check(limits)
+        
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+        self.assertEqual(self.limiter.rejected, 1)
+    
+    def test_rejected_request_refunds_earlier_buckets(self):
+        """Test a request rejected by the global bucket keeps the user's token"""
+        self.limiter.check({'global:add': (0.001, 1)})
+        limits = {'user:1:add': (0.001, 2), 'global:add': (0.001, 1)}
+        
+        self.assertFalse(self.limiter.check(limits)[0])
+        self.assertFalse(self.limiter.check(limits)[0])
+        
+        # Both tokens of the user's bucket are still there
+        self.assertTrue(self.limiter.check({'user:1:add': (0.001, 2)})[0])
+        self.assertTrue(self.limiter.check({'user:1:add': (0.001, 2)})[0])
+    
+    def test_backend_errors_fail_open(self):
+        """Test an unavailable backend does not reject requests"""
+        backend = MagicMock()
+        backend.consume.side_effect = Exception('down')
+        
+        self.assertTrue(RateLimiter(backend).check({'key': (1, 1)})[0])
+    
+    def test_mongo_backend_uses_atomic_bucket(self):
+        """Test the shared backend reports the remaining wait"""
+        mock_db = MagicMock()
+        mock_db.consume_rate_limit_tokens.return_value = {'allowed': False, 'tokens': 0.5}
+        
+        allowed, retry_after = MongoRateLimitBackend(mock_db).consume('key', rate=1, burst=5)
+        
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+
+
+class TestRateLimitDecorator(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.app = Flask(__name__)
+        self.app.secret_key = 'test'
+        
+        @self.app.route('/offers')
+        @rate_limit(1, burst=2)
+        def offers():
+            return jsonify([]), 200
+        
+        self.patcher = patch(
+            'app.utils.decorators.get_rate_limiter',
+            return_value=RateLimiter(LocalRateLimitBackend())
+        )
+        self.patcher.start()
+        self.client = self.app.test_client()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.patcher.stop()
+    
+    def test_excess_requests_get_429(self):
+        """Test requests beyond the burst are rejected with Retry-After"""
+        statuses = [self.client.get('/offers').status_code for _ in range(3)]
+        response = self.client.get('/offers')
+        
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+    
+    def test_disabled_limit(self):
+        """Test the limit can be switched off in configuration"""
+        self.app.config['RATE_LIMIT_ENABLED'] = False
+        
+        statuses = [self.client.get('/offers').status_code for _ in range(5)]
+        
+        self.assertEqual(statuses, [200] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
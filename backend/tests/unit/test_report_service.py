@@ -0,0 +1,190 @@
+"""
+Unit tests for the reports
+"""
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from flask import Flask
+from app.models.ledger import LedgerEntry
+from app.models.transaction import Transaction
+from app.routes.report_routes import report_bp
+from app.services import report_service
+from app.services.memory_storage import MemoryStorage
+from app.services.report_service import ReportService
+from app.services.version_service import VersionService, TRANSACTIONS_VERSION
+
+START = datetime(2024, 5, 1)
+# Within TRANSACTION_ARCHIVE_DAYS, so never archived
+RECENT = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+
+
+def trade(from_user, to_user, from_value, from_currency, to_value, to_currency, date):
+    """Build a transaction document"""
+    return Transaction(from_user, to_user, from_value, from_currency, to_value, to_currency, date=date).to_dict()
+
+
+def ledger_entry(reason, offer_id, date):
+    """Build a ledger entry referencing an offer"""
+    return LedgerEntry('user', {'USD': 1.0}, reason, reference=offer_id, date=date).to_dict()
+
+
+class TestReportService(unittest.TestCase):
+    def setUp(self):
+        """Set up a few days of trades and offer outcomes in memory"""
+        self.db = MemoryStorage()
+        for transaction in (
+            trade('a@example.com', 'b@example.com', 100.0, 'USD', 90.0, 'EUR', START),
+            trade('b@example.com', 'c@example.com', 300.0, 'USD', 240.0, 'EUR', START + timedelta(hours=1)),
+            trade('c@example.com', 'a@example.com', 50.0, 'EUR', 60.0, 'USD', START + timedelta(days=1)),
+            trade('a@example.com', 'c@example.com', 10.0, 'USD', 9.0, 'EUR', START + timedelta(days=5))
+        ):
+            self.db.create_transaction(transaction)
+
+        offers = [str(ObjectId()) for _ in range(4)]
+        self.db.append_ledger_entries([
+            ledger_entry(LedgerEntry.OFFER_LOCK, offer_id, START) for offer_id in offers
+        ] + [
+            # Both parties of a fill get an entry, the offer counts once
+            ledger_entry(LedgerEntry.TRADE, offers[0], START + timedelta(hours=1)),
+            ledger_entry(LedgerEntry.TRADE, offers[0], START + timedelta(hours=1)),
+            ledger_entry(LedgerEntry.OFFER_CANCEL, offers[1], START + timedelta(hours=2)),
+            ledger_entry(LedgerEntry.TRADE, offers[2], START + timedelta(days=5))
+        ])
+
+        self.versions = VersionService(db=self.db, shared=False)
+        self.service = ReportService(db=self.db, versions=self.versions, cache_size=2)
+        self.end = START + timedelta(days=2)
+
+    def test_pair_volume(self):
+        """Test trades are grouped per UTC day and pair"""
+        result = self.service.pair_volume(START, self.end)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['rows'], [
+            {'day': '2024-05-01', 'from_currency': 'USD', 'to_currency': 'EUR',
+             'trades': 2, 'from_volume': 400.0, 'to_volume': 330.0},
+            {'day': '2024-05-02', 'from_currency': 'EUR', 'to_currency': 'USD',
+             'trades': 1, 'from_volume': 50.0, 'to_volume': 60.0}
+        ])
+
+    def test_top_traders(self):
+        """Test users are ranked by trades, with what they sent per currency"""
+        rows = self.service.top_traders(START, self.end, limit=2)['rows']
+
+        self.assertEqual(rows, [
+            {'email': 'a@example.com', 'trades': 2, 'sent': {'USD': 160.0}},
+            {'email': 'b@example.com', 'trades': 2, 'sent': {'EUR': 90.0, 'USD': 300.0}}
+        ])
+
+    def test_average_rates(self):
+        """Test the plain and volume-weighted average rate per pair"""
+        rows = self.service.average_rates(START, self.end)['rows']
+
+        usd_eur = rows[1]
+        self.assertEqual((usd_eur['from_currency'], usd_eur['to_currency']), ('USD', 'EUR'))
+        self.assertEqual(usd_eur['trades'], 2)
+        self.assertAlmostEqual(usd_eur['avg_rate'], 0.85)
+        self.assertAlmostEqual(usd_eur['weighted_rate'], 330.0 / 400.0)
+        self.assertEqual((usd_eur['min_rate'], usd_eur['max_rate']), (0.8, 0.9))
+
+    def test_fill_ratio(self):
+        """Test offers posted, filled and cancelled in the range"""
+        rows = self.service.fill_ratio(START, self.end)['rows']
+
+        self.assertEqual(rows, {'posted': 4, 'filled': 1, 'cancelled': 1, 'fill_ratio': 0.25})
+        self.assertEqual(self.service.fill_ratio(START, None)['rows']['filled'], 2)
+
+    def test_closed_range_is_cached(self):
+        """Test a past range is computed once, whatever the versions"""
+        db = MagicMock()
+        db.get_pair_rates.return_value = []
+        service = ReportService(db=db, versions=self.versions)
+        start, end = RECENT, RECENT + timedelta(days=1)
+
+        service.average_rates(start, end)
+        self.versions.bump(TRANSACTIONS_VERSION)
+        service.average_rates(start, end)
+
+        db.get_pair_rates.assert_called_once_with(start, end)
+        self.assertEqual(service.stats()['hits'], 1)
+
+    def test_open_range_follows_versions(self):
+        """Test an open range is recomputed once the transactions change"""
+        db = MagicMock()
+        db.get_pair_rates.return_value = []
+        service = ReportService(db=db, versions=self.versions)
+
+        service.average_rates(RECENT, None)
+        service.average_rates(RECENT, None)
+        self.versions.bump(TRANSACTIONS_VERSION)
+        service.average_rates(RECENT, None)
+
+        self.assertEqual(db.get_pair_rates.call_count, 2)
+
+    def test_range_past_archive_horizon_is_partial(self):
+        """Test a range reaching into archived days is flagged and never cached"""
+        db = MagicMock()
+        db.get_pair_rates.return_value = []
+        service = ReportService(db=db, versions=self.versions)
+
+        first = service.average_rates(START, self.end)
+        service.average_rates(START, self.end)
+        recent = service.average_rates(RECENT, None)
+
+        self.assertTrue(first['partial'])
+        self.assertGreater(first['archived_before'], datetime.utcnow() - timedelta(days=91))
+        self.assertEqual(db.get_pair_rates.call_count, 3)
+        self.assertEqual(service.stats()['entries'], 1)
+        self.assertFalse(recent['partial'])
+        self.assertIsNone(recent['archived_before'])
+        # Offer outcomes come from the ledger, which is not archived
+        self.assertFalse(self.service.fill_ratio(START, self.end)['partial'])
+
+    def test_routes(self):
+        """Test the range arguments and the response"""
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config.update(
+            RATE_LIMIT_ENABLED=False,
+            REPORT_DEFAULT_DAYS=30,
+            REPORT_MAX_DAYS=366,
+            ADMIN_EMAILS=['a@example.com']
+        )
+        app.register_blueprint(report_bp)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 'id'
+            session['email'] = 'a@example.com'
+        non_admin = app.test_client()
+        with non_admin.session_transaction() as session:
+            session['user_id'] = 'id2'
+            session['email'] = 'b@example.com'
+
+        previous = report_service._service
+        report_service._service = self.service
+        try:
+            response = client.get('/reports/fill_ratio?from=2024-05-01&to=2024-05-03T00:00:00Z')
+            invalid = client.get('/reports/pair_volume?from=2024-05-03&to=2024-05-01')
+            too_long = client.get('/reports/average_rates?from=2020-01-01&to=2024-01-01')
+            bad_limit = client.get('/reports/top_traders?limit=0')
+            forbidden = non_admin.get('/reports/top_traders')
+            anonymous = app.test_client().get('/reports/pair_volume')
+        finally:
+            report_service._service = previous
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['from'], '2024-05-01T00:00:00Z')
+        self.assertEqual(response.get_json()['to'], '2024-05-03T00:00:00Z')
+        self.assertEqual(response.get_json()['rows']['fill_ratio'], 0.25)
+        self.assertFalse(response.get_json()['partial'])
+        self.assertIsNone(response.get_json()['archived_before'])
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(too_long.status_code, 400)
+        self.assertEqual(bad_limit.status_code, 400)
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertEqual(anonymous.status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Unit tests for the job scheduler
+"""
+import unittest
+import threading
+import time
+from app.services.maintenance import register_jobs
+from app.services.memory_storage import MemoryStorage
+from app.services.scheduler import Scheduler, LEADER_LEASE
+
+
+def wait_idle(job, timeout=5):
+    """Wait for a job's run to finish"""
+    deadline = time.monotonic() + timeout
+    while job.is_running and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        """Set up a scheduler over in-memory storage"""
+        self.db = MemoryStorage()
+        self.scheduler = Scheduler(db=self.db, lease_seconds=30, tick=0.01)
+
+    def tearDown(self):
+        self.scheduler.stop(timeout=1)
+
+    def test_runs_due_jobs_with_jitter(self):
+        """Test a job runs once its jittered interval has passed"""
+        job = self.scheduler.register('count', lambda: 42, interval=10, jitter=0.1)
+
+        self.scheduler.run_pending(now=0)
+        self.assertTrue(9 <= job.next_run <= 11)
+        self.assertEqual(self.scheduler.run_pending(now=5), [])
+
+        self.assertEqual(self.scheduler.run_pending(now=12), ['count'])
+        wait_idle(job)
+
+        stats = self.scheduler.stats()['jobs']['count']
+        self.assertEqual((stats['runs'], stats['failures'], stats['last_result']), (1, 0, 42))
+        self.assertTrue(21 <= job.next_run <= 23)
+
+    def test_failure_metrics(self):
+        """Test a failing job is counted and keeps its schedule"""
+        def fail():
+            raise RuntimeError('boom')
+        job = self.scheduler.register('fail', fail, interval=1, jitter=0)
+
+        self.scheduler.run_pending(now=0)
+        self.scheduler.run_pending(now=1)
+        wait_idle(job)
+
+        stats = job.stats(now=1)
+        self.assertEqual((stats['runs'], stats['failures'], stats['last_error']), (1, 1, 'boom'))
+        self.assertEqual(job.next_run, 2)
+
+    def test_no_overlap_and_timeout(self):
+        """Test a run past its timeout is reported and not started again"""
+        release = threading.Event()
+        job = self.scheduler.register('slow', release.wait, interval=1, jitter=0, timeout=1.5)
+
+        self.scheduler.run_pending(now=0)
+        self.assertEqual(self.scheduler.run_pending(now=1), ['slow'])
+        self.assertEqual(self.scheduler.run_pending(now=2), [])
+        self.assertEqual(self.scheduler.run_pending(now=3), [])
+        release.set()
+        wait_idle(job)
+
+        self.assertEqual((job.runs, job.skipped, job.timeouts), (1, 2, 1))
+
+    def test_single_leader(self):
+        """Test leader-only jobs run in the process holding the lease"""
+        other = Scheduler(db=self.db, lease_seconds=30)
+        ran = []
+        job = self.scheduler.register('job', lambda: ran.append('first'), interval=1, jitter=0)
+        other_job = other.register('job', lambda: ran.append('second'), interval=1, jitter=0)
+
+        self.assertTrue(self.scheduler.is_leader(now=0))
+        for scheduler in (self.scheduler, other):
+            scheduler.run_pending(now=0)
+            scheduler.run_pending(now=1)
+        wait_idle(job)
+
+        self.assertEqual(ran, ['first'])
+        self.assertEqual(other_job.skipped, 1)
+
+        # Stopping gives the lease up, so the other process takes over
+        self.scheduler.stop()
+        self.assertTrue(other.is_leader(now=100))
+        self.assertFalse(self.db.acquire_lease(LEADER_LEASE, 'third', 30))
+
+    def test_expired_lease_is_taken_over(self):
+        """Test a lease nobody renewed can be taken by another owner"""
+        self.assertTrue(self.db.acquire_lease(LEADER_LEASE, 'first', 0))
+        self.assertTrue(self.db.acquire_lease(LEADER_LEASE, 'second', 30))
+        self.assertFalse(self.db.acquire_lease(LEADER_LEASE, 'first', 30))
+        self.assertFalse(self.db.release_lease(LEADER_LEASE, 'first'))
+
+    def test_thread_runs_jobs(self):
+        """Test the scheduler thread starts once and runs due jobs"""
+        ran = threading.Event()
+        self.scheduler.register('job', ran.set, interval=0.01, jitter=0)
+
+        self.scheduler.ensure_started()
+        thread = self.scheduler._thread
+        self.scheduler.ensure_started()
+
+        self.assertIs(self.scheduler._thread, thread)
+        self.assertTrue(ran.wait(5))
+        self.scheduler.stop(timeout=1)
+        self.assertFalse(self.scheduler.is_running)
+
+    def test_register_jobs(self):
+        """Test only the enabled maintenance jobs are registered"""
+        config = {
+            'SCHEDULER_JITTER_PERCENT': 10,
+            'SCHEDULER_JOB_TIMEOUT_SECONDS': 60,
+            'OFFER_SWEEP_INTERVAL_SECONDS': 30,
+            'OFFER_SWEEP_BATCH_SIZE': 500,
+            'LEDGER_SNAPSHOT_JOB_SECONDS': 300,
+            'TRANSACTION_ARCHIVE_INTERVAL_SECONDS': 0
+        }
+
+        register_jobs(self.scheduler, config)
+
+        self.assertEqual([job.name for job in self.scheduler.jobs], ['offer_expiry', 'ledger_snapshots'])
+        self.assertTrue(all(job.leader_only and job.jitter == 0.1 for job in self.scheduler.jobs))
+        with self.assertRaises(ValueError):
+            self.scheduler.register('offer_expiry', lambda: None, interval=1)
+
+    def test_archive_job_needs_shared_directory(self):
+        """Test the archive job is only registered for a shared archive directory"""
+        config = {
+            'SCHEDULER_JITTER_PERCENT': 10,
+            'SCHEDULER_JOB_TIMEOUT_SECONDS': 60,
+            'OFFER_SWEEP_INTERVAL_SECONDS': 0,
+            'LEDGER_SNAPSHOT_JOB_SECONDS': 0,
+            'TRANSACTION_ARCHIVE_INTERVAL_SECONDS': 3600,
+            'TRANSACTION_ARCHIVE_SHARED': False
+        }
+
+        register_jobs(self.scheduler, config)
+        self.assertEqual(self.scheduler.jobs, [])
+
+        register_jobs(self.scheduler, {**config, 'TRANSACTION_ARCHIVE_SHARED': True})
+        self.assertEqual([job.name for job in self.scheduler.jobs], ['transaction_archive'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Unit tests for the transaction archive
+"""
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from app.models.transaction import Transaction
+from app.services.memory_storage import MemoryStorage
+from app.services import transaction_archive
+from app.services.transaction_archive import (
+    Partition,
+    TransactionArchive,
+    archive_transactions,
+    encode_partition,
+    merge_transactions
+)
+
+
+def make_transaction(from_user, to_user, date, from_value=100.0, to_value=90.5):
+    """Build a stored transaction document"""
+    transaction = Transaction(from_user, to_user, from_value, 'USD', to_value, 'EUR', date=date)
+    return {'_id': ObjectId(), **transaction.to_dict()}
+
+
+class TestTransactionArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive = TransactionArchive(self.directory, cache_partitions=2)
+        self.start = datetime(2024, 5, 1, 23, 59, 59, 123000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Test every field survives encoding, with either codec"""
+        transactions = [
+            make_transaction('a@example.com', 'b@example.com', self.start),
+            make_transaction('b@example.com', 'c@example.com', self.start + timedelta(seconds=1), 0.1, 1e9)
+        ]
+        codecs = ['zlib'] + (['zstd'] if transaction_archive.zstandard is not None else [])
+
+        for codec in codecs:
+            partition = Partition(encode_partition(transactions, codec))
+            self.assertEqual(partition.documents(), transactions)
+
+        self.assertEqual(partition.documents('c@example.com'), transactions[1:])
+        self.assertEqual(partition.documents('d@example.com'), [])
+
+    def test_files_per_day(self):
+        """Test transactions are written one file per day and read back in order"""
+        transactions = [
+            make_transaction('a@example.com', 'b@example.com', self.start + timedelta(seconds=offset))
+            for offset in range(3)
+        ]
+
+        paths = self.archive.write(transactions)
+
+        self.assertEqual(
+            [os.path.basename(os.path.dirname(path)) for path in paths],
+            ['date=2024-05-01', 'date=2024-05-02']
+        )
+        self.assertEqual(self.archive.read(), transactions)
+        self.assertEqual(self.archive.read('b@example.com'), transactions)
+        self.assertEqual(self.archive.stats()['files'], 2)
+
+    def test_user_read_skips_other_files(self):
+        """Test a user's read decodes only the files and columns it needs"""
+        transactions = [
+            make_transaction('a@example.com', 'b@example.com', self.start),
+            make_transaction('c@example.com', 'd@example.com', self.start + timedelta(days=1))
+        ]
+        self.archive.write(transactions)
+
+        self.assertEqual(self.archive.read('c@example.com'), transactions[1:])
+        self.assertEqual(self.archive.stats()['cached_files'], 1)
+
+        partition = Partition(encode_partition(transactions))
+        self.assertEqual(partition.documents('e@example.com'), [])
+        self.assertEqual(set(partition.columns), {'from_user', 'to_user'})
+
+    def test_archive_job(self):
+        """Test only transactions past the cutoff leave the database"""
+        db = MemoryStorage()
+        now = datetime.utcnow()
+        old = [
+            make_transaction('a@example.com', 'b@example.com', now - timedelta(days=100, minutes=minutes))
+            for minutes in range(5)
+        ]
+        recent = make_transaction('a@example.com', 'c@example.com', now)
+        for transaction in old + [recent]:
+            db.create_transaction(transaction)
+
+        result = archive_transactions(db, self.archive, now - timedelta(days=90), batch_size=2)
+
+        self.assertEqual(result['transactions'], 5)
+        self.assertEqual(db.document_ids('transactions'), [recent['_id']])
+        merged = merge_transactions(self.archive.read('a@example.com'), db.get_user_transactions('a@example.com'))
+        self.assertEqual(
+            [transaction['_id'] for transaction in merged],
+            [transaction['_id'] for transaction in reversed(old)] + [recent['_id']]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Unit tests for the per-user transaction summaries
+"""
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from app.models.transaction import Transaction
+from app.models.transaction_summary import TransactionSummary
+from app.services.memory_storage import MemoryStorage
+
+
+def make_transaction(from_user, to_user, from_value, to_value, date):
+    """Build a stored USD/EUR transaction document"""
+    transaction = Transaction(from_user, to_user, from_value, 'USD', to_value, 'EUR', date=date)
+    return {'_id': ObjectId(), **transaction.to_dict()}
+
+
+class TestTransactionSummary(unittest.TestCase):
+    def setUp(self):
+        start = datetime(2024, 5, 1)
+        self.transactions = [
+            make_transaction('a@example.com', 'b@example.com', 100.0, 90.0, start),
+            make_transaction('b@example.com', 'a@example.com', 50.0, 40.0, start + timedelta(seconds=1)),
+            make_transaction('a@example.com', 'c@example.com', 10.0, 8.0, start + timedelta(seconds=2))
+        ]
+
+    def test_build_and_present(self):
+        """Test totals, rate statistics and recent trades of each party"""
+        summaries = TransactionSummary.build(self.transactions, trades=2)
+
+        summary = TransactionSummary.present(summaries['a@example.com'])
+        self.assertEqual(summary['trade_count'], 3)
+        self.assertEqual(summary['volume'], {
+            'USD': {'sent': 110.0, 'received': 50.0},
+            'EUR': {'received': 98.0, 'sent': 40.0}
+        })
+        rates = summary['rates']['USD/EUR']
+        self.assertEqual(rates['count'], 3)
+        self.assertEqual((rates['min'], rates['max'], rates['last']), (0.8, 0.9, 0.8))
+        self.assertAlmostEqual(rates['avg'], 2.5 / 3)
+        self.assertEqual(
+            [trade['_id'] for trade in summary['last_trades']],
+            [self.transactions[2]['_id'], self.transactions[1]['_id']]
+        )
+        self.assertEqual(summaries['c@example.com']['trade_count'], 1)
+
+    def test_empty_summary(self):
+        """Test a user without trades gets an empty summary"""
+        self.assertEqual(TransactionSummary.present(None), {
+            'trade_count': 0,
+            'volume': {},
+            'rates': {},
+            'last_trades': []
+        })
+
+    def test_create_transaction_updates_both_parties(self):
+        """Test storing a transaction updates its parties' summaries, once"""
+        db = MemoryStorage()
+        for transaction in self.transactions:
+            db.create_transaction(transaction)
+
+        # A replayed transaction is not counted again
+        db.record_transaction_summaries(self.transactions[2:])
+
+        expected = TransactionSummary.build(self.transactions, trades=10)
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            self.assertEqual(db.get_transaction_summary(email), expected[email])
+        self.assertIsNone(db.get_transaction_summary('d@example.com'))
+
+    def test_replay_longer_than_recent_trades_counts_once(self):
+        """Test a replay of more trades than a summary keeps is not counted again"""
+        db = MemoryStorage()
+        with patch('app.services.memory_storage.get_config') as mock_config:
+            mock_config.return_value.TRANSACTION_SUMMARY_TRADES = 1
+            mock_config.return_value.TRANSACTION_SUMMARY_APPLIED_IDS = 10
+            db.record_transaction_summaries(self.transactions)
+            db.record_transaction_summaries(self.transactions)
+
+        self.assertEqual(db.get_transaction_summary('a@example.com')['trade_count'], 3)
+        self.assertEqual(len(db.get_transaction_summary('a@example.com')['last_trades']), 1)
+
+    def test_out_of_order_ids_count_once(self):
+        """Test a trade persisted after one with a higher _id still counts, once"""
+        db = MemoryStorage()
+        late, early = self.transactions[0], self.transactions[1]
+        self.assertLess(late['_id'], early['_id'])
+
+        # Another process's trade with a lower _id lands second
+        db.record_transaction_summaries([early])
+        db.record_transaction_summaries([late])
+        db.record_transaction_summaries([late, early])
+
+        for email in ('a@example.com', 'b@example.com'):
+            summary = db.get_transaction_summary(email)
+            self.assertEqual(summary['trade_count'], 2)
+            self.assertEqual(summary['applied_ids'], [early['_id'], late['_id']])
+
+
+if __name__ == '__main__':
+    unittest.main()
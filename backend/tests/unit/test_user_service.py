@@ -4,6 +4,12 @@ Unit tests for UserService
 import unittest
 from unittest.mock import patch, MagicMock
 from app.services.user_service import UserService
+from app.services.database import (
+    USER_ID_PROJECTION,
+    USER_IDENTITY_PROJECTION,
+    USER_AUTH_PROJECTION,
+    WALLET_BALANCES_PROJECTION
+)
 from app.models.user import User
 from app.models.wallet import Wallet
 from bson.objectid import ObjectId
@@ -20,12 +26,18 @@ class TestUserService(unittest.TestCase):
         self.mock_db = MagicMock()
         self.mock_db_class.return_value = self.mock_db
         
+        # Nothing archived unless a test says so
+        self.archive_patcher = patch('app.services.user_service.get_transaction_archive')
+        self.mock_archive = self.archive_patcher.start().return_value
+        self.mock_archive.read.return_value = []
+        
         # Create the service
         self.user_service = UserService()
     
     def tearDown(self):
         """Clean up after tests"""
         self.db_patcher.stop()
+        self.archive_patcher.stop()
     
     @patch('app.models.user.User.validate_registration')
     @patch('app.models.user.User.hash_password')
@@ -63,7 +75,10 @@ class TestUserService(unittest.TestCase):
             name='Test User'
         )
         mock_hash_password.assert_called_once_with('password123')
-        self.mock_db.get_user_by_email.assert_called_once_with('test@example.com')
+        self.mock_db.get_user_by_email.assert_called_once_with(
+            'test@example.com',
+            projection=USER_ID_PROJECTION
+        )
         self.mock_db.create_user.assert_called_once()
         mock_create_wallet.assert_called_once_with(user_id)
         self.mock_db.create_wallet.assert_called_once_with(mock_wallet.to_dict())
@@ -138,7 +153,10 @@ class TestUserService(unittest.TestCase):
         self.assertEqual(result['user']['email'], 'test@example.com')
         
         # Verify the mocks were called correctly
-        self.mock_db.get_user_by_email.assert_called_once_with('test@example.com')
+        self.mock_db.get_user_by_email.assert_called_once_with(
+            'test@example.com',
+            projection=USER_AUTH_PROJECTION
+        )
         mock_check_password.assert_called_once_with(b'hashed_password', 'password123')
     
     def test_login_user_not_found(self):
@@ -194,13 +212,18 @@ class TestUserService(unittest.TestCase):
                 {'currency': 'USD', 'value': 100.0}
             ]
         }
-        transactions = [
-            {'_id': ObjectId(), 'from_user': 'test@example.com'}
-        ]
+        trade = {'_id': ObjectId(), 'from_user': 'test@example.com'}
+        summary = {
+            '_id': 'test@example.com',
+            'trade_count': 1,
+            'volume': {'USD': {'sent': 100.0}},
+            'rates': {'USD/EUR': {'count': 1, 'sum': 0.9, 'min': 0.9, 'max': 0.9, 'last': 0.9}},
+            'last_trades': [trade]
+        }
         
         self.mock_db.get_wallet_by_user_id.return_value = wallet_data
         self.mock_db.get_user_by_id.return_value = user_data
-        self.mock_db.get_user_transactions.return_value = transactions
+        self.mock_db.get_transaction_summary.return_value = summary
         
         # Call the method
         result = self.user_service.get_user_wallet(user_id)
@@ -208,13 +231,34 @@ class TestUserService(unittest.TestCase):
         # Assertions
         self.assertTrue(result['success'])
         self.assertEqual(result['wallet'], wallet_data)
-        self.assertEqual(result['transactions'], transactions)
+        self.assertEqual(result['transactions'], [trade])
+        self.assertEqual(result['summary']['trade_count'], 1)
+        self.assertEqual(result['summary']['rates']['USD/EUR']['avg'], 0.9)
         self.assertEqual(result['email'], 'test@example.com')
         
         # Verify the mocks were called correctly
-        self.mock_db.get_wallet_by_user_id.assert_called_once_with(user_id)
-        self.mock_db.get_user_by_id.assert_called_once_with(user_id)
-        self.mock_db.get_user_transactions.assert_called_once_with('test@example.com')
+        self.mock_db.get_wallet_by_user_id.assert_called_once_with(
+            user_id,
+            projection=WALLET_BALANCES_PROJECTION
+        )
+        self.mock_db.get_user_by_id.assert_called_once_with(
+            user_id,
+            projection=USER_IDENTITY_PROJECTION
+        )
+        self.mock_db.get_transaction_summary.assert_called_once_with('test@example.com')
+        self.mock_db.get_user_transactions.assert_not_called()
+    
+    def test_get_user_wallet_with_session_email(self):
+        """Test the user lookup is skipped when the email is known"""
+        self.mock_db.get_wallet_by_user_id.return_value = {'user': 'id', 'currencies': []}
+        self.mock_db.get_transaction_summary.return_value = None
+        
+        result = self.user_service.get_user_wallet('id', email='test@example.com')
+        
+        self.assertTrue(result['success'])
+        self.assertEqual(result['summary']['trade_count'], 0)
+        self.assertEqual(result['transactions'], [])
+        self.mock_db.get_user_by_id.assert_not_called()
     
     def test_get_user_wallet_not_found(self):
         """Test getting non-existent wallet"""
@@ -249,6 +293,20 @@ class TestUserService(unittest.TestCase):
         self.mock_db.get_all_transactions.assert_called_once()
         self.mock_db.get_user_transactions.assert_not_called()
     
+    def test_get_transactions_merges_archive(self):
+        """Test archived transactions come first and are not repeated"""
+        archived = {'_id': ObjectId(), 'from_user': 'test@example.com'}
+        moved = {'_id': ObjectId(), 'from_user': 'test@example.com'}
+        recent = {'_id': ObjectId(), 'to_user': 'test@example.com'}
+        # An archive run that stopped before deleting left one in both
+        self.mock_archive.read.return_value = [archived, dict(moved)]
+        self.mock_db.get_user_transactions.return_value = [moved, recent]
+        
+        result = self.user_service.get_transactions('test@example.com')
+        
+        self.assertEqual(result['transactions'], [archived, moved, recent])
+        self.mock_archive.read.assert_called_once_with(user_email='test@example.com')
+    
     def test_get_transactions_user_specific(self):
         """Test getting user-specific transactions"""
         # Setup mocks
@@ -0,0 +1,132 @@
+"""
+Unit tests for listing versions and conditional GET
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta
+from flask import Flask, jsonify
+from app.models.offer import Offer
+from app.services.memory_storage import MemoryStorage
+from app.services.version_service import (
+    VersionService,
+    BOOK_VERSION,
+    user_transactions_version
+)
+from app.utils.decorators import conditional
+
+
+def version_db() -> MagicMock:
+    """Mock database whose book has no expiring offers"""
+    db = MagicMock()
+    db.get_next_offer_expiry.return_value = None
+    return db
+
+
+class TestVersionService(unittest.TestCase):
+    def test_local_versions(self):
+        """Test in-memory versions only change when bumped"""
+        versions = VersionService(db=version_db(), shared=False)
+        
+        first = versions.etag(BOOK_VERSION)
+        self.assertEqual(versions.etag(BOOK_VERSION), first)
+        
+        versions.bump(BOOK_VERSION, user_transactions_version('a@example.com'))
+        
+        self.assertNotEqual(versions.etag(BOOK_VERSION), first)
+        self.assertEqual(versions.get('transactions:a@example.com'), 1)
+        versions.db.bump_versions.assert_not_called()
+    
+    def test_local_tags_differ_between_processes(self):
+        """Test restarted counters never reuse an earlier tag"""
+        self.assertNotEqual(
+            VersionService(db=version_db(), shared=False).etag(BOOK_VERSION),
+            VersionService(db=version_db(), shared=False).etag(BOOK_VERSION)
+        )
+    
+    def test_shared_versions(self):
+        """Test shared versions are kept in the database"""
+        mock_db = version_db()
+        mock_db.get_version.return_value = 7
+        versions = VersionService(db=mock_db, shared=True)
+        
+        versions.bump(BOOK_VERSION)
+        
+        mock_db.bump_versions.assert_called_once_with([BOOK_VERSION])
+        self.assertEqual(versions.etag(BOOK_VERSION), 'shared-7')
+    
+    def test_unreadable_version_has_no_tag(self):
+        """Test a database error disables caching instead of failing"""
+        mock_db = MagicMock()
+        mock_db.get_version.side_effect = Exception('down')
+        
+        self.assertIsNone(VersionService(db=mock_db, shared=True).etag(BOOK_VERSION))
+    
+    def test_book_tag_changes_when_an_offer_expires(self):
+        """Test an offer dropping out of the book changes its tag without a bump"""
+        db = MemoryStorage()
+        now = datetime.utcnow()
+        db.create_offer(Offer('a@example.com', 10.0, 'USD', 9.0, 'EUR', expires_at=now + timedelta(hours=1)).to_dict())
+        db.create_offer(Offer('a@example.com', 10.0, 'USD', 9.0, 'EUR', expires_at=now + timedelta(hours=2)).to_dict())
+        versions = VersionService(db=db, shared=False)
+        
+        first = versions.etag(BOOK_VERSION)
+        self.assertEqual(versions.etag(BOOK_VERSION), first)
+        
+        with patch('app.services.version_service.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = now + timedelta(hours=1, seconds=1)
+            expired = versions.etag(BOOK_VERSION)
+            mock_datetime.utcnow.return_value = now + timedelta(hours=3)
+            empty = versions.etag(BOOK_VERSION)
+        
+        self.assertNotEqual(expired, first)
+        self.assertNotIn(empty, (first, expired))
+        self.assertEqual(empty, f'{versions.epoch}-0')
+
+
+class TestConditionalDecorator(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.calls = 0
+        self.versions = VersionService(db=version_db(), shared=False)
+        self.app = Flask(__name__)
+        
+        @self.app.route('/offers')
+        @conditional(BOOK_VERSION)
+        def offers():
+            self.calls += 1
+            return jsonify([]), 200
+        
+        self.patcher = patch('app.utils.decorators.get_version_service', return_value=self.versions)
+        self.patcher.start()
+        self.client = self.app.test_client()
+    
+    def tearDown(self):
+        """Clean up after tests"""
+        self.patcher.stop()
+    
+    def test_unchanged_listing_returns_304(self):
+        """Test a matching If-None-Match skips the view"""
+        first = self.client.get('/offers')
+        etag = first.headers['ETag']
+        
+        second = self.client.get('/offers', headers={'If-None-Match': etag})
+        
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers['ETag'], etag)
+        self.assertEqual(self.calls, 1)
+    
+    def test_changed_listing_is_sent_again(self):
+        """Test a bump invalidates the previous tag"""
+        etag = self.client.get('/offers').headers['ETag']
+        self.versions.bump(BOOK_VERSION)
+        
+        response = self.client.get('/offers', headers={'If-None-Match': etag})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Unit tests for warm-up and the health probes
+"""
+import unittest
+import time
+from unittest.mock import MagicMock
+from flask import Flask
+from app.routes.health_routes import health_bp
+from app.services.memory_storage import MemoryStorage
+from app.services.offer_service import OfferService
+from app.services.warmup import WarmUp
+from app.models.offer import Offer
+
+
+class TestWarmUp(unittest.TestCase):
+    def setUp(self):
+        """Set up a warm-up over in-memory storage"""
+        self.db = MemoryStorage()
+        self.offer_service = OfferService(db=self.db)
+        self.warmup = WarmUp(db=self.db, offer_service=self.offer_service, retry_interval=0.01)
+
+        self.app = Flask(__name__)
+        self.app.register_blueprint(health_bp)
+        self.app.extensions['warmup'] = self.warmup
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.warmup.stop(timeout=1)
+
+    def test_warm_up_loads_order_book(self):
+        """Test every step passes and the depth levels are loaded"""
+        offer = Offer('a@example.com', 100, 'USD', 90, 'EUR')
+        self.db.create_offer(offer.to_dict())
+
+        self.assertTrue(self.warmup.run_once())
+
+        status = self.warmup.status()
+        self.assertTrue(status['ready'])
+        self.assertEqual(list(status['steps']), ['database', 'indexes', 'order_book'])
+        self.assertEqual(status['steps']['order_book']['details'], {'pairs': 1, 'offers': 1})
+
+    def test_failed_step_stops_warm_up(self):
+        """Test a failing ping keeps the process unready and skips later steps"""
+        db = MagicMock()
+        db.ping.side_effect = ConnectionError('no server')
+        warmup = WarmUp(db=db, offer_service=self.offer_service)
+
+        self.assertFalse(warmup.run_once())
+
+        status = warmup.status()
+        self.assertFalse(status['ready'])
+        self.assertEqual(status['steps']['database']['error'], 'no server')
+        self.assertNotIn('indexes', status['steps'])
+        db.ensure_indexes.assert_not_called()
+
+    def test_missing_indexes(self):
+        """Test indexes that could not be created keep the process unready"""
+        db = MagicMock()
+        db.missing_indexes.return_value = ['offers.offers_expires_at']
+        warmup = WarmUp(db=db, offer_service=self.offer_service)
+
+        self.assertFalse(warmup.run_once())
+        self.assertIn('offers.offers_expires_at', warmup.status()['steps']['indexes']['error'])
+
+    def test_lost_database_is_not_ready(self):
+        """Test a warmed up process stops reporting ready when the ping fails"""
+        db = MagicMock()
+        db.missing_indexes.return_value = []
+        warmup = WarmUp(db=db, offer_service=self.offer_service)
+        self.assertTrue(warmup.run_once())
+
+        db.ping.side_effect = ConnectionError('lost')
+
+        self.assertFalse(warmup.status()['ready'])
+
+    def test_probes(self):
+        """Test /healthz always answers and /readyz once warmed up"""
+        self.assertEqual(self.client.get('/healthz').status_code, 200)
+
+        # The first probe starts the warm-up
+        response = self.client.get('/readyz')
+        deadline = time.monotonic() + 5
+        while response.status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+            response = self.client.get('/readyz')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['ready'])
+
+    def test_not_ready_probe(self):
+        """Test /readyz answers 503 while a step fails"""
+        db = MagicMock()
+        db.ping.side_effect = ConnectionError('no server')
+        self.app.extensions['warmup'] = WarmUp(db=db, offer_service=self.offer_service)
+        self.app.extensions['warmup'].run_once()
+
+        response = self.client.get('/readyz')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.get_json()['ready'])
+        self.app.extensions['warmup'].stop(timeout=1)
+
+
+if __name__ == '__main__':
+    unittest.main()